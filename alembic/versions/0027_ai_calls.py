@@ -0,0 +1,38 @@
+"""add ai_calls table for AI provider cost / latency accounting
+
+Revision ID: 0027_ai_calls
+Revises: 0026_drop_nudge_unique
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0027_ai_calls'
+down_revision = '0026_drop_nudge_unique'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(sa.text("""
+        CREATE TABLE IF NOT EXISTS ai_calls (
+            id            BIGSERIAL PRIMARY KEY,
+            called_at     TIMESTAMPTZ NOT NULL DEFAULT now(),
+            feature       TEXT NOT NULL,          -- 'insight' | 'coach' | 'body_insight' | 'habit_picks' | 'step_goal'
+            provider      TEXT NOT NULL,
+            model         TEXT,
+            input_tokens  INTEGER,
+            output_tokens INTEGER,
+            latency_ms    INTEGER,
+            cache_hit     BOOLEAN NOT NULL DEFAULT false,
+            outcome       TEXT NOT NULL           -- 'ok' | 'fallback' | 'error'
+        )
+    """))
+    op.execute(sa.text(
+        "CREATE INDEX IF NOT EXISTS ix_ai_calls_called_at "
+        "ON ai_calls (called_at DESC)"
+    ))
+
+
+def downgrade():
+    op.drop_table('ai_calls')
@@ -0,0 +1,34 @@
+"""add ws_presence table — cross-worker WebSocket presence registry
+
+Revision ID: 0028_ws_presence
+Revises: 0027_ai_calls
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0028_ws_presence'
+down_revision = '0027_ai_calls'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # UNLOGGED: heartbeat rows are rewritten every 15 s and worthless after a
+    # crash, so skip the WAL. No FK to users — rows live for seconds.
+    op.execute(sa.text("""
+        CREATE UNLOGGED TABLE IF NOT EXISTS ws_presence (
+            user_id    UUID NOT NULL,
+            worker_id  TEXT NOT NULL,
+            last_seen  TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (user_id, worker_id)
+        )
+    """))
+    op.execute(sa.text(
+        "CREATE INDEX IF NOT EXISTS ix_ws_presence_last_seen "
+        "ON ws_presence (last_seen)"
+    ))
+
+
+def downgrade():
+    op.drop_table('ws_presence')
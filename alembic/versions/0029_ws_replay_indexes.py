@@ -0,0 +1,30 @@
+"""add (user, id) indexes for WebSocket reconnect replay
+
+Revision ID: 0029_ws_replay_indexes
+Revises: 0028_ws_presence
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0029_ws_replay_indexes'
+down_revision = '0028_ws_presence'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ws_replay.replay_since: WHERE receiver_id / user_id = :uid AND id > :cursor ORDER BY id
+    op.execute(sa.text(
+        "CREATE INDEX IF NOT EXISTS ix_partner_messages_receiver_id "
+        "ON partner_messages (receiver_id, id)"
+    ))
+    op.execute(sa.text(
+        "CREATE INDEX IF NOT EXISTS ix_inbox_user_id_id "
+        "ON notification_inbox (user_id, id)"
+    ))
+
+
+def downgrade():
+    op.execute(sa.text("DROP INDEX IF EXISTS ix_inbox_user_id_id"))
+    op.execute(sa.text("DROP INDEX IF EXISTS ix_partner_messages_receiver_id"))
@@ -0,0 +1,53 @@
+"""add partner_queue table and partial indexes on active partner pairs
+
+Revision ID: 0030_partner_queue_table
+Revises: 0029_ws_replay_indexes
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0030_partner_queue_table'
+down_revision = '0029_ws_replay_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # One row per user waiting in /partners/find-random (app/services/partner_queue.py)
+    op.execute(sa.text("""
+        CREATE TABLE IF NOT EXISTS partner_queue (
+            user_id        UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            department_id  UUID NOT NULL REFERENCES departments(id) ON DELETE CASCADE,
+            enqueued_at    TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """))
+    op.execute(sa.text(
+        "CREATE INDEX IF NOT EXISTS ix_partner_queue_dept_enqueued "
+        "ON partner_queue (department_id, enqueued_at)"
+    ))
+
+    # "Has an active pair?" probes — only approved / pending rows are indexed
+    op.execute(sa.text(
+        "CREATE INDEX IF NOT EXISTS ix_partners_active_requester "
+        "ON accountability_partners (requester_id) WHERE status IN ('approved', 'pending')"
+    ))
+    op.execute(sa.text(
+        "CREATE INDEX IF NOT EXISTS ix_partners_active_partner "
+        "ON accountability_partners (partner_id) WHERE status IN ('approved', 'pending')"
+    ))
+
+    # Carry over users already waiting under the old users.seeking_partner flag
+    op.execute(sa.text("""
+        INSERT INTO partner_queue (user_id, department_id, enqueued_at)
+        SELECT id, department_id, COALESCE(seeking_since, now())
+        FROM users
+        WHERE seeking_partner = true
+        ON CONFLICT (user_id) DO NOTHING
+    """))
+
+
+def downgrade():
+    op.execute(sa.text("DROP INDEX IF EXISTS ix_partners_active_partner"))
+    op.execute(sa.text("DROP INDEX IF EXISTS ix_partners_active_requester"))
+    op.drop_table('partner_queue')
@@ -0,0 +1,57 @@
+"""add partner_chat_reads (per-pair read watermark + unread counter) and (pair_id, id) index
+
+Revision ID: 0031_partner_chat_reads
+Revises: 0030_partner_queue_table
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0031_partner_chat_reads'
+down_revision = '0030_partner_queue_table'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keyset pagination: WHERE pair_id = :pid AND id < :before ORDER BY id DESC
+    op.execute(sa.text(
+        "CREATE INDEX IF NOT EXISTS ix_partner_messages_pair_id "
+        "ON partner_messages (pair_id, id)"
+    ))
+
+    # One row per (pair, member): everything up to last_read_id has been seen;
+    # unread_count is bumped by send_message and recomputed when the chat is opened.
+    op.execute(sa.text("""
+        CREATE TABLE IF NOT EXISTS partner_chat_reads (
+            pair_id       BIGINT      NOT NULL REFERENCES accountability_partners(id) ON DELETE CASCADE,
+            user_id       UUID        NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            last_read_id  BIGINT      NOT NULL DEFAULT 0,
+            unread_count  INTEGER     NOT NULL DEFAULT 0,
+            updated_at    TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (pair_id, user_id)
+        )
+    """))
+
+    # Seed from the per-row read_at receipts
+    op.execute(sa.text("""
+        INSERT INTO partner_chat_reads (pair_id, user_id, last_read_id, unread_count)
+        SELECT pair_id, receiver_id,
+               COALESCE(MAX(id) FILTER (WHERE read_at IS NOT NULL), 0),
+               COUNT(*) FILTER (WHERE read_at IS NULL)
+        FROM partner_messages
+        GROUP BY pair_id, receiver_id
+        ON CONFLICT (pair_id, user_id) DO NOTHING
+    """))
+
+    # read_at is no longer written — this partial index would grow with every message
+    op.execute(sa.text("DROP INDEX IF EXISTS ix_partner_messages_receiver_read"))
+
+
+def downgrade():
+    op.execute(sa.text(
+        "CREATE INDEX IF NOT EXISTS ix_partner_messages_receiver_read "
+        "ON partner_messages (receiver_id, read_at) WHERE read_at IS NULL"
+    ))
+    op.drop_table('partner_chat_reads')
+    op.execute(sa.text("DROP INDEX IF EXISTS ix_partner_messages_pair_id"))
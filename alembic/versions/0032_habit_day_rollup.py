@@ -0,0 +1,43 @@
+"""add habit_day_rollup (completed habits per challenge per day)
+
+Revision ID: 0032_habit_day_rollup
+Revises: 0031_partner_chat_reads
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0032_habit_day_rollup'
+down_revision = '0031_partner_chat_reads'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # One row per challenge per day with any log. done = completed logs that day,
+    # total = the challenge's commitments. Maintained by app/services/habit_rollup.py.
+    op.execute(sa.text("""
+        CREATE TABLE IF NOT EXISTS habit_day_rollup (
+            challenge_id  INTEGER     NOT NULL REFERENCES habit_challenges(id) ON DELETE CASCADE,
+            day           DATE        NOT NULL,
+            done          INTEGER     NOT NULL DEFAULT 0,
+            total         INTEGER     NOT NULL DEFAULT 0,
+            updated_at    TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (challenge_id, day)
+        )
+    """))
+
+    op.execute(sa.text("""
+        INSERT INTO habit_day_rollup (challenge_id, day, done, total)
+        SELECT hcm.challenge_id, dl.logged_date,
+               COUNT(*) FILTER (WHERE dl.completed),
+               (SELECT COUNT(*) FROM habit_commitments t WHERE t.challenge_id = hcm.challenge_id)
+        FROM daily_logs dl
+        JOIN habit_commitments hcm ON hcm.id = dl.commitment_id
+        GROUP BY hcm.challenge_id, dl.logged_date
+        ON CONFLICT (challenge_id, day) DO NOTHING
+    """))
+
+
+def downgrade():
+    op.drop_table('habit_day_rollup')
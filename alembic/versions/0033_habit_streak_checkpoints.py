@@ -0,0 +1,31 @@
+"""add habit_streak_checkpoints (shield-streak simulation state per challenge)
+
+Revision ID: 0033_habit_streak_checkpoints
+Revises: 0032_habit_day_rollup
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0033_habit_streak_checkpoints'
+down_revision = '0032_habit_day_rollup'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Written lazily by app/services/habit_streak.py — no backfill needed
+    op.execute(sa.text("""
+        CREATE TABLE IF NOT EXISTS habit_streak_checkpoints (
+            challenge_id  INTEGER     PRIMARY KEY REFERENCES habit_challenges(id) ON DELETE CASCADE,
+            as_of         DATE        NOT NULL,
+            min_required  INTEGER     NOT NULL,
+            good_digest   TEXT        NOT NULL,
+            state         JSONB       NOT NULL,
+            updated_at    TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """))
+
+
+def downgrade():
+    op.drop_table('habit_streak_checkpoints')
@@ -0,0 +1,30 @@
+"""add habit_cycle_cache (history summary / detail of closed habit cycles)
+
+Revision ID: 0034_habit_cycle_cache
+Revises: 0033_habit_streak_checkpoints
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0034_habit_cycle_cache'
+down_revision = '0033_habit_streak_checkpoints'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled lazily by the history endpoints (app/services/habits_service.py);
+    # detail stays NULL until the cycle's detail is first requested
+    op.execute(sa.text("""
+        CREATE TABLE IF NOT EXISTS habit_cycle_cache (
+            challenge_id  INTEGER     PRIMARY KEY REFERENCES habit_challenges(id) ON DELETE CASCADE,
+            summary       JSONB       NOT NULL,
+            detail        JSONB,
+            updated_at    TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """))
+
+
+def downgrade():
+    op.drop_table('habit_cycle_cache')
@@ -0,0 +1,59 @@
+"""add habit_pack_ranks (stored habit pack leaderboard)
+
+Revision ID: 0035_habit_pack_ranks
+Revises: 0034_habit_cycle_cache
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0035_habit_pack_ranks'
+down_revision = '0034_habit_cycle_cache'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # One row per active challenge with a pack_id. Maintained by
+    # app/services/habit_pack_ranks.py (habit writes + nightly freeze).
+    op.execute(sa.text("""
+        CREATE TABLE IF NOT EXISTS habit_pack_ranks (
+            pack_id         VARCHAR(64) NOT NULL,
+            user_id         UUID        NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            challenge_id    INTEGER     NOT NULL REFERENCES habit_challenges(id) ON DELETE CASCADE,
+            good_days       INTEGER     NOT NULL DEFAULT 0,
+            rank            INTEGER,
+            rank_yesterday  INTEGER,
+            updated_at      TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (pack_id, user_id)
+        )
+    """))
+    op.execute(sa.text("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_habit_pack_ranks_challenge
+        ON habit_pack_ranks (challenge_id)
+    """))
+
+    op.execute(sa.text("""
+        INSERT INTO habit_pack_ranks (pack_id, user_id, challenge_id, good_days, rank, rank_yesterday)
+        SELECT pack_id, user_id, challenge_id, good_days,
+               ROW_NUMBER() OVER (PARTITION BY pack_id ORDER BY good_days DESC,      user_id ASC),
+               ROW_NUMBER() OVER (PARTITION BY pack_id ORDER BY good_days_yest DESC, user_id ASC)
+        FROM (
+            SELECT DISTINCT ON (hc.pack_id, hc.user_id)
+                   hc.pack_id, hc.user_id, hc.id AS challenge_id,
+                   COUNT(r.day) FILTER (WHERE r.done >= GREATEST(1, CEIL(t.total::numeric / 2))) AS good_days,
+                   COUNT(r.day) FILTER (WHERE r.done >= GREATEST(1, CEIL(t.total::numeric / 2))
+                                          AND r.day < CURRENT_DATE) AS good_days_yest
+            FROM habit_challenges hc
+            CROSS JOIN LATERAL (SELECT COUNT(*) AS total FROM habit_commitments WHERE challenge_id = hc.id) t
+            LEFT JOIN habit_day_rollup r ON r.challenge_id = hc.id
+            WHERE hc.status = 'active' AND hc.pack_id IS NOT NULL AND t.total > 0
+            GROUP BY hc.pack_id, hc.user_id, hc.id, t.total
+            ORDER BY hc.pack_id, hc.user_id, hc.id DESC
+        ) m
+        ON CONFLICT (pack_id, user_id) DO NOTHING
+    """))
+
+
+def downgrade():
+    op.drop_table('habit_pack_ranks')
@@ -0,0 +1,50 @@
+"""notify "ref_cache" when reference tables change
+
+Revision ID: 0036_ref_cache_notify
+Revises: 0035_habit_pack_ranks
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0036_ref_cache_notify'
+down_revision = '0035_habit_pack_ranks'
+branch_labels = None
+depends_on = None
+
+# table → catalog in app/services/ref_cache.py
+_TABLES = {
+    "habits":                "habits",
+    "goal_definitions":      "goal_definitions",
+    "departments":           "departments",
+    "challenges":            "challenges",
+    "challenge_metrics":     "challenges",
+    "challenge_departments": "challenges",
+}
+
+
+def upgrade():
+    # Statement-level: one NOTIFY per write statement, delivered on commit
+    # (and folded with identical ones in the same transaction)
+    op.execute(sa.text("""
+        CREATE OR REPLACE FUNCTION notify_ref_cache()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            PERFORM pg_notify('ref_cache', TG_ARGV[0]);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+    for table, catalog in _TABLES.items():
+        op.execute(sa.text(f"DROP TRIGGER IF EXISTS ref_cache_notify ON {table}"))
+        op.execute(sa.text(f"""
+            CREATE TRIGGER ref_cache_notify
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_ref_cache('{catalog}')
+        """))
+
+
+def downgrade():
+    for table in _TABLES:
+        op.execute(sa.text(f"DROP TRIGGER IF EXISTS ref_cache_notify ON {table}"))
+    op.execute(sa.text("DROP FUNCTION IF EXISTS notify_ref_cache()"))
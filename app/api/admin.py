@@ -1,11 +1,10 @@
 # backend/routes/admin.py
 
-import random
 import logging
 from datetime import date, timedelta
 from typing import List
 
-from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi import APIRouter, Depends, status, HTTPException, Query
 from pydantic import BaseModel
 from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -14,7 +13,8 @@ from app.auth.deps import get_current_user
 from app.core.security import hash_password
 from app.db.deps import get_db
 from app.models import User
-from app.services.notification_service import write_inbox
+from app.services import partner_queue, partner_rotation
+from app.services.notification_service import write_inbox, write_inbox_many
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -298,119 +298,161 @@ async def admin_shuffle_partners(
     Activity check: user is "active" if they have step/habit data in last 7 days
     OR joined within 7 days (new user treated as active).
 
-    Algorithm:
-      1. Partition users into active / inactive pools
-      2. Shuffle active pool randomly
-      3. Pair active users: [0,1], [2,3], ...
-      4. Odd active: last active gets paired with first inactive
-      5. Remaining inactive: pair among themselves
+    Algorithm (app/services/partner_rotation.compute_matching):
+      1. Partition users into active / inactive pools, shuffle each
+      2. Pair active users with each other first, then the rest
+      3. Avoid anyone's partners from the last 8 weeks unless there is no other choice
+      4. Odd user out is returned as unmatched
     """
     require_admin(current_user)
     dept_id = str(current_user.department_id)
+    await partner_queue.lock_department(db, dept_id)  # no find-random pairing mid-shuffle
 
     # Fetch all users in dept
-    users_rows = (await db.execute(text("""
-        SELECT u.id, u.name, u.created_at,
-               EXISTS (
-                   SELECT 1 FROM daily_steps ds
-                   WHERE ds.user_id = u.id AND ds.day >= current_date - 7
-               ) OR EXISTS (
-                   SELECT 1 FROM daily_logs dl
-                   JOIN   habit_commitments hcm ON hcm.id = dl.commitment_id
-                   JOIN   habit_challenges  hc  ON hc.id  = hcm.challenge_id
-                   WHERE  hc.user_id = u.id AND dl.logged_date >= current_date - 7
-               ) OR u.created_at >= now() - INTERVAL '7 days' AS is_active
+    users_rows = (await db.execute(text(f"""
+        SELECT u.id, u.name, {partner_rotation.ACTIVE_SQL} AS is_active
         FROM users u
         WHERE u.department_id = :dept
-        ORDER BY u.created_at
     """), {"dept": dept_id})).mappings().all()
 
     if len(users_rows) < 2:
         raise HTTPException(400, "Need at least 2 users in department to shuffle")
 
-    active   = [dict(r) for r in users_rows if r["is_active"]]
-    inactive = [dict(r) for r in users_rows if not r["is_active"]]
+    user_ids = [str(r["id"]) for r in users_rows]
+    names = {str(r["id"]): (r["name"] or "Someone").split()[0] for r in users_rows}
+    recent = await partner_rotation.load_recent_pairs(db, user_ids)
+    pairs_to_create, unmatched_ids = partner_rotation.compute_matching(users_rows, recent)
 
-    random.shuffle(active)
-    random.shuffle(inactive)
-
-    pairs_to_create: list[tuple[str, str]] = []
-    unmatched_ids: list[str] = []
-
-    # Pair active users
-    i = 0
-    while i + 1 < len(active):
-        pairs_to_create.append((str(active[i]["id"]), str(active[i + 1]["id"])))
-        i += 2
-
-    # Odd active user gets first inactive
-    if i < len(active):
-        if inactive:
-            pairs_to_create.append((str(active[i]["id"]), str(inactive.pop(0)["id"])))
-        else:
-            unmatched_ids.append(str(active[i]["id"]))
+    # Close all existing pairs + create new ones
+    closed = (await db.execute(text("""
+        UPDATE accountability_partners
+        SET status = 'reshuffled'
+        WHERE status IN ('approved', 'pending')
+          AND (requester_id = ANY(CAST(:ids AS uuid[])) OR partner_id = ANY(CAST(:ids AS uuid[])))
+        RETURNING id
+    """), {"ids": user_ids})).scalars().all()
+    await partner_rotation.expire_pair_messages(db, list(closed))
 
-    # Pair remaining inactive among themselves
-    j = 0
-    while j + 1 < len(inactive):
-        pairs_to_create.append((str(inactive[j]["id"]), str(inactive[j + 1]["id"])))
-        j += 2
-    if j < len(inactive):
-        unmatched_ids.append(str(inactive[j]["id"]))
+    pairs_to_create = await partner_rotation.insert_pairs(db, pairs_to_create, _this_monday(), assigned_by=str(current_user.id))
+    await partner_queue.leave_queue(db, *[uid for pair in pairs_to_create for uid in pair])
 
-    # Close all existing pairs + create new ones
-    reshuffled_count = 0
+    # Notify both
     admin_name = (current_user.name or "Admin").split()[0]
-    week_start = _this_monday()
-
-    for uid in [str(r["id"]) for r in users_rows]:
-        result = await db.execute(text("""
-            UPDATE accountability_partners
-            SET status = 'reshuffled'
-            WHERE status IN ('approved', 'pending')
-              AND (requester_id = :uid OR partner_id = :uid)
-            RETURNING id
-        """), {"uid": uid})
-        for row in result.fetchall():
-            reshuffled_count += 1
-            await db.execute(text("""
-                UPDATE partner_messages
-                SET expires_at = now() + INTERVAL '30 days'
-                WHERE pair_id = :pid AND expires_at IS NULL
-            """), {"pid": row[0]})
-
-    for (uid_a, uid_b) in pairs_to_create:
-        pair_id = (await db.execute(text("""
-            INSERT INTO accountability_partners
-                (requester_id, partner_id, status, assignment_type, assigned_by, approved_at, week_start)
-            VALUES (:a, :b, 'approved', 'auto', :admin, now(), :ws)
-            ON CONFLICT (requester_id, partner_id) DO UPDATE
-                SET status = 'approved', assignment_type = 'auto',
-                    assigned_by = :admin, approved_at = now(), week_start = :ws
-            RETURNING id
-        """), {"a": uid_a, "b": uid_b, "admin": str(current_user.id), "ws": week_start})).scalar()
-
-        # Notify both
-        for uid in (uid_a, uid_b):
-            other_id = uid_b if uid == uid_a else uid_a
-            other_user = (await db.execute(select(User).where(User.id == other_id))).scalar_one_or_none()
-            other_name = (other_user.name or "Someone").split()[0] if other_user else "Someone"
-            await write_inbox(
-                db,
-                user_id=uid,
-                type="partner_assigned",
-                template_key="partner_assigned_v1",
-                payload={"partner_name": other_name, "partner_id": other_id, "assigned_by": admin_name},
-                action_url="/socialapp/partners",
-                actor_user_id=str(current_user.id),
-                actor_name=admin_name,
-            )
+    await write_inbox_many(db, [
+        {
+            "user_id":       uid,
+            "type":          "partner_assigned",
+            "template_key":  "partner_assigned_v1",
+            "payload":       {"partner_name": names[other_id], "partner_id": other_id, "assigned_by": admin_name},
+            "action_url":    "/socialapp/partners",
+            "actor_user_id": str(current_user.id),
+            "actor_name":    admin_name,
+        }
+        for uid_a, uid_b in pairs_to_create
+        for uid, other_id in ((uid_a, uid_b), (uid_b, uid_a))
+    ])
 
     await db.commit()
 
     return {
         "status": "ok",
         "pairs_created": len(pairs_to_create),
-        "reshuffled_old": reshuffled_count // 2,  # approximate unique pairs
+        "reshuffled_old": len(closed),
         "unmatched": unmatched_ids,
-    }
\ No newline at end of file
+    }
+
+@router.get("/ai-calls")
+async def admin_ai_calls(
+    days: int = Query(default=14, ge=1, le=90),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    AI cost / latency dashboard — aggregates ai_calls per IST day and feature.
+
+    Per row: provider calls, cache hits (served from our DB cache, no provider
+    call), errors, fallbacks, token totals and latency (avg / p95, provider
+    calls only). Use it to see which feature burns tokens and where caching
+    or batching would pay off.
+
+    GET /api/admin/ai-calls          → last 14 days
+    GET /api/admin/ai-calls?days=30  → last 30 days
+    """
+    require_admin(current_user)
+
+    # Rows buffered in memory haven't reached the table yet
+    from app.services.ai_calls import flush_ai_calls
+    await flush_ai_calls()
+
+    rows = (await db.execute(text("""
+        SELECT
+            (called_at AT TIME ZONE 'Asia/Kolkata')::date              AS day,
+            feature,
+            COUNT(*) FILTER (WHERE NOT cache_hit)                      AS calls,
+            COUNT(*) FILTER (WHERE cache_hit)                          AS cache_hits,
+            COUNT(*) FILTER (WHERE outcome = 'error')                  AS errors,
+            COUNT(*) FILTER (WHERE outcome = 'fallback')               AS fallbacks,
+            COALESCE(SUM(input_tokens), 0)                             AS input_tokens,
+            COALESCE(SUM(output_tokens), 0)                            AS output_tokens,
+            AVG(latency_ms) FILTER (WHERE NOT cache_hit)               AS avg_latency_ms,
+            percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms)
+                FILTER (WHERE NOT cache_hit)                           AS p95_latency_ms,
+            array_agg(DISTINCT provider)                               AS providers
+        FROM ai_calls
+        WHERE called_at >= now() - make_interval(days => :days)
+        GROUP BY 1, 2
+        ORDER BY day DESC, feature
+    """), {"days": days})).mappings().all()
+
+    def _pct(part: int, whole: int) -> int:
+        return round(part / whole * 100) if whole else 0
+
+    by_day = [
+        {
+            "day":            str(r["day"]),
+            "feature":        r["feature"],
+            "providers":      r["providers"],
+            "calls":          r["calls"],
+            "cache_hits":     r["cache_hits"],
+            "cache_hit_pct":  _pct(r["cache_hits"], r["calls"] + r["cache_hits"]),
+            "errors":         r["errors"],
+            "fallbacks":      r["fallbacks"],
+            "fallback_pct":   _pct(r["errors"] + r["fallbacks"], r["calls"]),
+            "input_tokens":   r["input_tokens"],
+            "output_tokens":  r["output_tokens"],
+            "avg_latency_ms": round(r["avg_latency_ms"]) if r["avg_latency_ms"] is not None else None,
+            "p95_latency_ms": round(r["p95_latency_ms"]) if r["p95_latency_ms"] is not None else None,
+        }
+        for r in rows
+    ]
+
+    # Period totals per feature
+    totals: dict[str, dict] = {}
+    for r in by_day:
+        t = totals.setdefault(r["feature"], {
+            "feature": r["feature"], "calls": 0, "cache_hits": 0, "errors": 0,
+            "fallbacks": 0, "input_tokens": 0, "output_tokens": 0,
+        })
+        for k in ("calls", "cache_hits", "errors", "fallbacks", "input_tokens", "output_tokens"):
+            t[k] += r[k]
+    for t in totals.values():
+        t["cache_hit_pct"] = _pct(t["cache_hits"], t["calls"] + t["cache_hits"])
+        t["fallback_pct"]  = _pct(t["errors"] + t["fallbacks"], t["calls"])
+        t["tokens_per_call"] = round((t["input_tokens"] + t["output_tokens"]) / t["calls"]) if t["calls"] else 0
+
+    return {
+        "period_days": days,
+        "by_feature":  sorted(totals.values(), key=lambda t: t["input_tokens"] + t["output_tokens"], reverse=True),
+        "by_day":      by_day,
+    }
+
+
+@router.get("/ws-stats")
+async def admin_ws_stats(current_user: User = Depends(get_current_user)):
+    """
+    WebSocket gauges for this worker — connected users / sockets, outbound
+    queue depth, and counters for dropped messages and slow-consumer disconnects.
+    """
+    require_admin(current_user)
+    from app.api.ws import ws_stats
+    return ws_stats()
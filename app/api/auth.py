@@ -1,5 +1,6 @@
 import hashlib
 import logging
+import uuid
 from datetime import datetime, timedelta, timezone
 
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -17,6 +18,7 @@ from app.db.deps import get_db
 from app.models import Department, User, RefreshToken
 
 from app.schemas.auth import RefreshIn, SignupIn, LoginIn, AuthOut
+from app.services import ref_cache
 
 
 # Import allowed emails list from separate file
@@ -46,12 +48,18 @@ async def signup(payload: SignupIn, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Get or create department by name (auto-creates if not in DB yet)
-    dept_q = await db.execute(select(Department).where(Department.name == dept_name))
-    department = dept_q.scalar_one_or_none()
-    if not department:
-        department = Department(name=dept_name)
-        db.add(department)
-        await db.flush()  # Get department.id
+    cached = await ref_cache.department_by_name(db, dept_name)
+    if cached:
+        department_id = uuid.UUID(cached["id"])
+    else:
+        # Not cached yet — may still be new in the DB (another worker's signup)
+        dept_q = await db.execute(select(Department).where(Department.name == dept_name))
+        department = dept_q.scalar_one_or_none()
+        if not department:
+            department = Department(name=dept_name)
+            db.add(department)
+            await db.flush()  # Get department.id
+        department_id = department.id
 
     # Hash password
     hashed = hash_password(payload.password)
@@ -61,7 +69,7 @@ async def signup(payload: SignupIn, db: AsyncSession = Depends(get_db)):
         name=payload.name,
         email=email_lc,
         password_hash=hashed,
-        department_id=department.id
+        department_id=department_id
     )
 
     db.add(user)
@@ -84,6 +92,8 @@ async def signup(payload: SignupIn, db: AsyncSession = Depends(get_db)):
     )
 
     await db.commit()
+    if not cached:
+        ref_cache.invalidate("departments")  # /me right after signup shouldn't wait for the NOTIFY
     return AuthOut(access_token=access, refresh_token=refresh_raw)
 
 
@@ -15,7 +15,11 @@ from app.db.deps import get_db
 from app.auth.deps import get_current_user
 from app.models import User, BodyMetrics, AiRecommendation
 from app.schemas.body_metrics import BodyMetricCreate, BodyMetricOut, HistoryResponse, HistoryResponse          # adjust import path if needed
-from app.services.ai_recommendations import get_body_insight
+from app.services.ai_recommendations import (
+    get_body_insight,
+    get_body_insight_status,
+    schedule_body_insight,
+)
 from sqlalchemy import delete
 
 router = APIRouter(prefix="/api/body-metrics", tags=["Body Metrics"])
@@ -37,7 +41,9 @@ async def save_scan(
 ):
     """
     Save a new body composition scan.
-    Returns the saved record + a fresh AI insight (cached insight is invalidated on every save).
+    Returns the saved record immediately. The AI insight is regenerated in the
+    background — poll GET /api/body-metrics/insight (status "pending" → insight)
+    or wait for the {"type": "body_insight_ready"} WebSocket event.
     """
 
     # Use override height or fall back to user's stored height
@@ -91,10 +97,8 @@ async def save_scan(
         )
         db.add(record)
     
-    await db.commit()
-    await db.refresh(record)
-
-    # Invalidate cached body insight — new scan data means stale analysis
+    # Invalidate cached body insight — new scan data means stale analysis.
+    # Same transaction as the scan so a poll can never see the old insight.
     await db.execute(
         delete(AiRecommendation).where(
             AiRecommendation.user_id == str(current_user.id),
@@ -102,13 +106,15 @@ async def save_scan(
         )
     )
     await db.commit()
+    await db.refresh(record)
 
-    # Generate fresh AI insight (runs synchronously — typically <3s)
-    ai_insight = await get_body_insight(db, str(current_user.id))
+    # Generate fresh AI insight off the request path (coalesced per user)
+    job = schedule_body_insight(str(current_user.id))
 
     return {
-        "scan":       BodyMetricOut.model_validate(record),
-        "ai_insight": ai_insight,
+        "scan":              BodyMetricOut.model_validate(record),
+        "ai_insight":        None,
+        "ai_insight_status": job["status"],
     }
 
 @router.get("/latest", response_model=BodyMetricOut)
@@ -180,7 +186,15 @@ async def body_ai_insight(
 
     Cached 7 days. Use ?refresh=true to force regeneration.
     Returns 404 if no body scans have been logged yet.
+
+    While a background regeneration is in flight (after a scan save) this returns
+    {"status": "pending"|"running", "since": ...} — poll again or wait for the
+    "body_insight_ready" WebSocket event. Ready responses carry "status": "ready".
     """
+    job = get_body_insight_status(str(current_user.id))
+    if job:
+        return job
+
     if refresh:
         from sqlalchemy import delete
         from app.models import AiRecommendation
@@ -195,4 +209,4 @@ async def body_ai_insight(
     result = await get_body_insight(db, str(current_user.id))
     if result is None:
         raise HTTPException(404, "No body scans found — log at least one measurement first.")
-    return result
\ No newline at end of file
+    return {**result, "status": "ready"}
\ No newline at end of file
@@ -1,15 +1,16 @@
 from datetime import date, timedelta
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import func, select, and_, or_, text
+from sqlalchemy import func, select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 
 from app.db.deps import get_db
 from app.db.session import AsyncSessionLocal
 from app.auth.deps import get_current_user
-from app.models import Challenge, ChallengeDepartment, ChallengeMetrics, ChallengeParticipant, User
+from app.models import ChallengeParticipant, User
 from app.services.challenges import ChallengesService
+from app.services import ref_cache
 from app.schemas.challenges import (
     AvailableChallengeResponse,
     ChallengeCreateRequest,
@@ -36,93 +37,54 @@ async def get_available_challenges(
     """
     today = date.today()
     # Department filter: challenges explicitly assigned to user's dept OR company-wide (no dept assignment)
-    dept_subquery = select(ChallengeDepartment.challenge_id).where(
-        ChallengeDepartment.department_id == current_user.department_id
-    )
-    company_wide_subquery = (
-        select(Challenge.id)
-        .outerjoin(ChallengeDepartment, Challenge.id == ChallengeDepartment.challenge_id)
-        .where(ChallengeDepartment.id.is_(None))
-    )
-    stmt = select(Challenge).where(
-        and_(
-            or_(
-                Challenge.id.in_(dept_subquery),
-                Challenge.id.in_(company_wide_subquery)
-            ),
-            Challenge.status == 'active'
+    dept = str(current_user.department_id) if current_user.department_id else None
+    challenges = [
+        c for c in await ref_cache.get(db, "challenges")
+        if c["status"] == 'active' and (not c["department_ids"] or dept in c["department_ids"])
+    ]
+    if not challenges:
+        return []
+
+    # Participant counts and the user's own participation — one query for all of them
+    part_stmt = (
+        select(
+            ChallengeParticipant.challenge_id,
+            func.count(ChallengeParticipant.id),
+            func.max(ChallengeParticipant.selected_daily_target).filter(ChallengeParticipant.user_id == current_user.id),
+            func.bool_or(ChallengeParticipant.user_id == current_user.id),
         )
-    ).order_by(Challenge.start_date)
+        .where(
+            ChallengeParticipant.challenge_id.in_([c["id"] for c in challenges]),
+            ChallengeParticipant.left_at.is_(None),
+        )
+        .group_by(ChallengeParticipant.challenge_id)
+    )
+    participation = {str(cid): (n, target, joined) for cid, n, target, joined in (await db.execute(part_stmt)).all()}
 
-    result = await db.execute(stmt)
-    challenges = result.scalars().all()
-    
     # Build response for each challenge
     response = []
     for challenge in challenges:
-        # Get metrics
-        metrics_stmt = select(ChallengeMetrics).where(
-            ChallengeMetrics.challenge_id == challenge.id
-        )
-        metrics_result = await db.execute(metrics_stmt)
-        metrics = metrics_result.scalars().all()
-        
-        # Get department IDs
-        dept_stmt = select(ChallengeDepartment.department_id).where(
-            ChallengeDepartment.challenge_id == challenge.id
-        )
-        dept_result = await db.execute(dept_stmt)
-        department_ids = [str(dept_id) for dept_id in dept_result.scalars().all()]
-        
-        # Get participant count
-        count_stmt = select(func.count(ChallengeParticipant.id)).where(
-            and_(
-                ChallengeParticipant.challenge_id == challenge.id,
-                ChallengeParticipant.left_at.is_(None)
-            )
-        )
-        count_result = await db.execute(count_stmt)
-        participant_count = count_result.scalar() or 0
-        
-        # Check if user already joined
-        part_stmt = select(ChallengeParticipant).where(
-            and_(*[
-                ChallengeParticipant.challenge_id == challenge.id,
-                ChallengeParticipant.user_id == current_user.id,
-                ChallengeParticipant.left_at.is_(None)
-            ])
-        )
-        part_result = await db.execute(part_stmt)
-        participant = part_result.scalar_one_or_none()
-        
+        participant_count, user_target, joined = participation.get(challenge["id"], (0, None, False))
         response.append(AvailableChallengeResponse(
-            id=str(challenge.id),
-            title=challenge.title,
-            description=challenge.description,  # ✅ add this
-            period=challenge.period,
-            scope=challenge.scope,
-            start_date=challenge.start_date,
-            end_date=challenge.end_date,
-            status=challenge.status,
-            min_goals_required=challenge.min_goals_required,
-            created_by=str(challenge.created_by) if challenge.created_by else None,
-            created_at=challenge.created_at,
-            metrics=[
-                ChallengeMetricResponse(
-                    id=str(m.id),
-                    challenge_id=str(m.challenge_id),
-                    metric_key=m.metric_key,
-                    target_value=m.target_value,
-                    rule_type=m.rule_type
-                ) for m in metrics
-            ],
-            department_ids=department_ids,
+            id=challenge["id"],
+            title=challenge["title"],
+            description=challenge["description"],  # ✅ add this
+            period=challenge["period"],
+            scope=challenge["scope"],
+            start_date=challenge["start_date"],
+            end_date=challenge["end_date"],
+            status=challenge["status"],
+            min_goals_required=challenge["min_goals_required"],
+            created_by=challenge["created_by"],
+            created_at=challenge["created_at"],
+            metrics=[ChallengeMetricResponse(**m) for m in challenge["metrics"]],
+            department_ids=list(challenge["department_ids"]),
             participant_count=participant_count,
-            user_joined=participant is not None,
-            user_daily_target=participant.selected_daily_target if participant else None,
-            days_remaining=(challenge.end_date - today).days + 1 if challenge.end_date >= today else 0
+            user_joined=bool(joined),
+            user_daily_target=user_target,
+            days_remaining=(challenge["end_date"] - today).days + 1 if challenge["end_date"] >= today else 0
         ))
-    
+
     return response
 
 @router.post("", response_model=ChallengeDetailResponse, status_code=201)
@@ -307,6 +269,8 @@ async def get_challenge_leaderboard(
     """
     Get leaderboard for a specific challenge.
     Shows all participants ranked by total steps or completion percentage.
+    Fetch once, then subscribe over /ws ({"type": "subscribe", "topic": "challenge:<id>"})
+    for live leaderboard_delta messages instead of polling this endpoint.
     """
     
     # Get challenge info
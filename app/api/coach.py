@@ -7,20 +7,29 @@ Returns a structured coaching analysis:
   - improve     : list of gaps with specific actionable suggestions
   - focus       : the single most impactful next action
   - generated_at: when the report was generated
-  - cached      : whether this was served from cache (< 7 days old)
+  - cached      : whether this was served from cache
+  - stale       : cached report is older than 7 days; a refresh is running in the
+                  background and the next call will return the new report
 
 Cached per user for 7 days. First call may take a few seconds (AI generation).
-Subsequent calls within 7 days return instantly from DB.
+Every later call returns instantly from DB (stale-while-revalidate).
 
 Force refresh: GET /api/coach?refresh=true  (bypasses cache)
+
+Streaming: GET /api/coach/stream[?refresh=true] — same report as Server-Sent Events,
+one event per section as soon as the model has written it.
 """
+import json
+
 from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.deps import get_current_user
 from app.db.deps import get_db
+from app.db.session import AsyncSessionLocal
 from app.models import User
-from app.services.ai_coach import get_coach_report
+from app.services.ai_coach import get_coach_report, stream_coach_report
 
 router = APIRouter(prefix="/api/coach", tags=["coach"])
 
@@ -50,7 +59,8 @@ async def coach(
       ],
       "focus": "Hit your 8,000 step goal at least 5 days this week.",
       "generated_at": "2026-04-03T18:30:00+00:00",
-      "cached": false
+      "cached": false,
+      "stale": false
     }
     """
     if refresh:
@@ -63,3 +73,37 @@ async def coach(
         await db.commit()
 
     return await get_coach_report(db, str(user.id))
+
+
+@router.get("/stream")
+async def coach_stream(
+    refresh: bool = Query(default=False, description="Force regenerate even if cached"),
+    user: User = Depends(get_current_user),
+):
+    """
+    Streaming variant of GET /api/coach (text/event-stream).
+
+    Event sequence:
+      event: summary    data: "You've been consistently active..."
+      event: went_well  data: {"title": "...", "body": "..."}          (one per item)
+      event: improve    data: {"title": "...", "body": "...", "suggestion": "..."}
+      event: focus      data: "Hit your 8,000 step goal 5 days this week."
+      event: done       data: {full report — same shape as GET /api/coach}
+
+    "done" is authoritative: if generation fails mid-stream it carries the
+    fallback report, and the client should replace whatever it has rendered.
+    The finished report is persisted exactly like the non-streaming endpoint.
+    """
+    user_id = str(user.id)
+
+    async def _events():
+        # Own session: the request-scoped one is closed before the body streams
+        async with AsyncSessionLocal() as db:
+            async for event, data in stream_coach_report(db, user_id, refresh=refresh):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
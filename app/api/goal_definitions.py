@@ -1,25 +1,26 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 from app.db.deps import get_db
-from app.models import GoalDefinition
 from app.schemas.goal_definitions import GoalDefinitionResponse
+from app.services import ref_cache
 
 router = APIRouter(prefix="/goal-definitions", tags=["goal-definitions"])
 
 
 @router.get("", response_model=List[GoalDefinitionResponse])
 async def list_goal_definitions(
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
 ):
     """
     Get all available goal definitions with their descriptions.
     Use this to show users what goals they can track.
+    Sends an ETag — repeat with If-None-Match to get 304 while unchanged.
     """
-    stmt = select(GoalDefinition).order_by(GoalDefinition.key)
-    result = await db.execute(stmt)
-    goals = result.scalars().all()
-    
-    return goals
\ No newline at end of file
+    goals = await ref_cache.get(db, "goal_definitions")
+    if unchanged := await ref_cache.not_modified(db, "goal_definitions", request, response):
+        return unchanged
+    return goals
@@ -9,6 +9,7 @@ from app.db.deps import get_db
 from app.schemas.goals import SetDailyTargetRequest, SetDailyTargetResponse, CurrentGoalResponse
 from app.models import ChallengeParticipant, Challenge, User
 from app.auth.deps import get_current_user
+from app.services import ref_cache
 
 router = APIRouter(prefix="/api/goals", tags=["goals"])  # ✅ Changed from /goals to /api/goals
 
@@ -34,13 +35,10 @@ async def set_daily_target(
     today = datetime.now(tz).date()
 
     # Find active challenge
-    c_stmt = select(Challenge).where(
-        Challenge.status == 'active',
-        Challenge.start_date <= today,
-        Challenge.end_date >= today,
-    )
-    c_res = await db.execute(c_stmt)
-    challenge = c_res.scalar_one_or_none()
+    challenge = next((
+        c for c in await ref_cache.get(db, "challenges")
+        if c["status"] == 'active' and c["start_date"] <= today <= c["end_date"]
+    ), None)
 
     if not challenge:
         raise HTTPException(
@@ -50,7 +48,7 @@ async def set_daily_target(
 
     # Check existing participation
     p_stmt = select(ChallengeParticipant).where(
-        ChallengeParticipant.challenge_id == challenge.id,
+        ChallengeParticipant.challenge_id == challenge["id"],
         ChallengeParticipant.user_id == user.id,
         ChallengeParticipant.left_at.is_(None),
     )
@@ -69,7 +67,7 @@ async def set_daily_target(
     else:
         # Join challenge with target
         participant = ChallengeParticipant(
-            challenge_id=str(challenge.id),
+            challenge_id=challenge["id"],
             user_id=str(user.id),
             selected_daily_target=payload.daily_target,
         )
@@ -80,16 +78,16 @@ async def set_daily_target(
 
     # Calculate weekly_target based on join date (today)
     join_date = datetime.now(ZoneInfo(user.timezone or "Asia/Kolkata")).date()
-    days_left = (challenge.end_date - join_date).days + 1
+    days_left = (challenge["end_date"] - join_date).days + 1
     days_left = max(days_left, 0)  # Prevent negative if joined after end
     weekly_target = participant.selected_daily_target * days_left if participant.selected_daily_target else 0
     return {
-        "challenge_id": str(challenge.id),
-        "challenge_title": challenge.title,
+        "challenge_id": challenge["id"],
+        "challenge_title": challenge["title"],
         "daily_target": participant.selected_daily_target,
         "weekly_target": weekly_target,
-        "challenge_start": challenge.start_date,
-        "challenge_end": challenge.end_date,
+        "challenge_start": challenge["start_date"],
+        "challenge_end": challenge["end_date"],
     }
 
 
@@ -1,5 +1,6 @@
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 
+import httpx
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from sqlalchemy import select
@@ -9,6 +10,7 @@ from app.auth.deps import get_current_user
 from app.core.security import encrypt_token
 from app.db.deps import get_db
 from app.models import User, UserGoogleFitToken
+from app.services import google_fit
 
 router = APIRouter(prefix="/api/googlefit", tags=["Google Fit"])
 
@@ -19,6 +21,14 @@ class ConnectRequest(BaseModel):
     expires_in: int  # seconds until access_token expires
 
 
+class BackfillRequest(BaseModel):
+    start_date: date
+    end_date: date | None = None  # defaults to today
+
+
+_BACKFILL_MAX_DAYS = 90
+
+
 @router.get("/status")
 async def google_fit_status(
     db: AsyncSession = Depends(get_db),
@@ -114,3 +124,58 @@ async def disconnect_google_fit(
         await db.commit()
 
     return {"status": "disconnected"}
+
+
+@router.post("/backfill", status_code=200)
+async def backfill_google_fit(
+    payload: BackfillRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Pull step counts for start_date..end_date (inclusive, IST days, at most
+    90) from Google Fit and save them — one Google request, one transaction.
+    Days Google reports as 0 are left as they are.
+
+    Response:
+      { "start_date": "...", "end_date": "...", "days_fetched": 30, "days_saved": 12,
+        "steps": { "2026-10-01": 8412, ... } }
+    """
+    end = payload.end_date or date.today()
+    if payload.start_date > end or end > date.today():
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="start_date must be on or before end_date, and end_date not in the future",
+        )
+    if (end - payload.start_date).days + 1 > _BACKFILL_MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Backfill at most {_BACKFILL_MAX_DAYS} days at a time",
+        )
+
+    result = await db.execute(
+        select(UserGoogleFitToken).where(
+            UserGoogleFitToken.user_id == str(current_user.id)
+        )
+    )
+    token_row = result.scalar_one_or_none()
+    if not token_row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Google Fit is not connected")
+
+    try:
+        out = await google_fit.backfill_user(db, token_row, payload.start_date, end)
+    except google_fit.GoogleFitRevoked:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Google Fit access was revoked — please reconnect",
+        )
+    except httpx.HTTPError as exc:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Google Fit request failed: {exc}")
+
+    return {
+        "start_date": payload.start_date.isoformat(),
+        "end_date": end.isoformat(),
+        "days_fetched": out["days_fetched"],
+        "days_saved": out["days_saved"],
+        "steps": {d.isoformat(): n for d, n in out["steps"].items()},
+    }
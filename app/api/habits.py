@@ -2,19 +2,20 @@
 from typing import Optional
 from datetime import date, timedelta
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.deps import get_db
 from app.auth.deps import get_current_user
-from app.models import Habit, HabitChallenge, HabitCommitment, UserHabit, ChallengeStatus, User
+from app.models import HabitChallenge, HabitCommitment, UserHabit, ChallengeStatus, User
 from app.schemas.habits import (
-    HabitOut, ChallengeCreate, ChallengeOut, LogCreate, LogOut, LogWithStreakOut,
-    TodayOut, StreakOut, ChallengeHistoryOut, LeaderboardOut,
+    HabitOut, ChallengeCreate, ChallengeOut, LogCreate, LogBatchCreate, LogOut, LogWithStreakOut,
+    TodayOut, StreakOut, ChallengeHistoryOut, ChallengeHistoryPage, LeaderboardOut,
     CustomHabitCreate, CustomHabitOut, AnyHabitOut,
 )
 from app.services import habits_service as svc
+from app.services import habit_pack_ranks, habit_rollup, ref_cache
 
 # ── Habit library ─────────────────────────────────────────────────────────────
 habits_router = APIRouter(prefix="/api/habits", tags=["habits"])
@@ -22,25 +23,29 @@ habits_router = APIRouter(prefix="/api/habits", tags=["habits"])
 
 @habits_router.get("", response_model=list[HabitOut])
 async def list_habits(
+    request: Request,
+    response: Response,
     category: Optional[str] = Query(None),
     tier: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_db),
 ):
-    q = select(Habit)
-    if category:
-        q = q.where(Habit.category == category)
-    if tier:
-        q = q.where(Habit.tier == tier)
-    result = await db.execute(q.order_by(Habit.id))
-    return result.scalars().all()
+    """Habit library. Sends an ETag — repeat with If-None-Match to get 304 while unchanged."""
+    habits = await ref_cache.get(db, "habits")
+    if unchanged := await ref_cache.not_modified(db, "habits", request, response):
+        return unchanged
+    return [
+        h for h in habits
+        if (not category or h["category"] == category) and (not tier or h["tier"] == tier)
+    ]
 
 
 @habits_router.get("/{slug}", response_model=HabitOut)
-async def get_habit(slug: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Habit).where(Habit.slug == slug))
-    h = result.scalar_one_or_none()
+async def get_habit(slug: str, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    h = await ref_cache.habit_by_slug(db, slug)
     if not h:
         raise HTTPException(404, f"Habit '{slug}' not found")
+    if unchanged := await ref_cache.not_modified(db, "habits", request, response):
+        return unchanged
     return h
 
 
@@ -79,35 +84,60 @@ async def today(
 @challenges_router.get("/leaderboard", response_model=LeaderboardOut)
 async def leaderboard(
     days: int = Query(7, ge=1, le=90, description="Look-back window in days"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size (default: whole board)"),
+    offset: int = Query(0, ge=0),
+    around_me: Optional[int] = Query(None, ge=0, le=50, description="Rows either side of my rank (overrides limit/offset)"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """
     Habit leaderboard for the current user's department.
     Returns rank, completion %, completed/possible habit counts, streak and rank change.
+    Ranks are board-wide; total and my_rank describe the whole board even when
+    entries is a page (limit/offset) or a window around the caller (around_me).
     """
     today = date.today()
-    entries = await svc.get_leaderboard(
+    board = await svc.get_leaderboard(
         db,
         days=days,
         department_id=str(current_user.department_id),
         current_user_id=str(current_user.id),
+        limit=limit,
+        offset=offset,
+        around_me=around_me,
     )
     return {
         "period_days":  days,
         "period_start": today - timedelta(days=days - 1),
         "period_end":   today,
-        "entries":      entries,
+        "total":        board["total"],
+        "my_rank":      board["my_rank"],
+        "entries":      board["entries"],
     }
 
 
-@challenges_router.get("/history", response_model=list[ChallengeHistoryOut])
+@challenges_router.get("/history", response_model=ChallengeHistoryPage)
 async def challenge_history(
+    limit: int = Query(10, ge=1, le=50),
+    before_id: Optional[int] = Query(None, description="next_before_id from the previous page"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Challenge cycles for the current user — past and present, newest first —
+    with overall stats. Per-habit and per-day detail: GET /history/{challenge_id}.
+    """
+    return await svc.get_challenge_history(db, str(current_user.id), limit, before_id)
+
+
+@challenges_router.get("/history/{challenge_id}", response_model=ChallengeHistoryOut)
+async def challenge_history_detail(
+    challenge_id: int,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    """All challenge cycles for the current user — past and present — with per-habit and overall stats."""
-    return await svc.get_challenge_history(db, str(current_user.id))
+    """One cycle with per-habit stats and the per-day × per-habit breakdown."""
+    return await svc.get_challenge_detail(db, str(current_user.id), challenge_id)
 
 
 @challenges_router.post("/logs", response_model=LogWithStreakOut, status_code=201)
@@ -122,6 +152,24 @@ async def log_habit(
     )
 
 
+@challenges_router.post("/logs/batch", response_model=list[LogWithStreakOut], status_code=201)
+async def log_habits_batch(
+    body: LogBatchCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Several habit logs in one request (e.g. ticking off the day at once).
+    Same per-log semantics and response items as POST /logs, applied in one
+    transaction — the streak is computed once and at most one celebration
+    push is sent. All commitments must be the caller's, or nothing is saved.
+    """
+    return await svc.upsert_logs(
+        db, str(current_user.id),
+        [(l.commitment_id, l.logged_date, l.completed, l.value) for l in body.logs],
+    )
+
+
 @challenges_router.get("/{challenge_id}/streak", response_model=StreakOut)
 async def streak(
     challenge_id: int,
@@ -147,6 +195,7 @@ async def abandon(
     if not c:
         raise HTTPException(404, "Challenge not found")
     c.status = ChallengeStatus.abandoned
+    await habit_pack_ranks.refresh(db, [c.id])
     await db.commit()
 
 
@@ -165,6 +214,9 @@ async def hard_delete(
     c = result.scalar_one_or_none()
     if not c:
         raise HTTPException(404, "Challenge not found")
+    # Leave the pack board first so the remaining members are re-ranked
+    c.status = ChallengeStatus.abandoned
+    await habit_pack_ranks.refresh(db, [c.id])
     await db.delete(c)
     await db.commit()
 
@@ -297,5 +349,13 @@ async def delete_custom_habit(
     if in_use:
         raise HTTPException(409, "Cannot delete a habit that is part of your active challenge")
 
+    # The delete cascades into past challenges' commitments and logs — their
+    # day rollups (done and total) have to follow
+    affected = (await db.execute(
+        select(HabitCommitment.challenge_id).where(HabitCommitment.user_habit_id == habit_id)
+    )).scalars().all()
+
     await db.delete(uh)
+    if affected:
+        await habit_rollup.rebuild_habit_rollup(db, list(set(affected)))
     await db.commit()
@@ -11,6 +11,7 @@ from app.auth.deps import get_current_user
 from app.db.deps import get_db
 from app.models import User
 from app.services.ai_insight import get_home_insight
+from app.services import habit_pack_ranks
 from app.services.habits_service import get_streak
 
 router = APIRouter(prefix="/api/home", tags=["home"])
@@ -109,11 +110,11 @@ async def home(
             hc.started_at,
             hc.ends_at,
             COUNT(DISTINCT hcm.id)   AS total_habits,
-            COALESCE(SUM(CASE WHEN dl.logged_date = :today     AND dl.completed THEN 1 ELSE 0 END), 0) AS done_today,
-            COALESCE(SUM(CASE WHEN dl.logged_date = :yesterday AND dl.completed THEN 1 ELSE 0 END), 0) AS done_yesterday
+            COALESCE(MAX(r.done) FILTER (WHERE r.day = :today),     0) AS done_today,
+            COALESCE(MAX(r.done) FILTER (WHERE r.day = :yesterday), 0) AS done_yesterday
         FROM habit_challenges hc
         JOIN habit_commitments hcm ON hcm.challenge_id = hc.id
-        LEFT JOIN daily_logs dl ON dl.commitment_id = hcm.id
+        LEFT JOIN habit_day_rollup r ON r.challenge_id = hc.id AND r.day IN (:today, :yesterday)
         WHERE hc.user_id = :uid AND hc.status = 'active'
         GROUP BY hc.id
         LIMIT 1
@@ -149,71 +150,12 @@ async def home(
 
         # ── Habit ranking among pack members ─────────────────────────────
         try:
-            hrank_row = await db.execute(text("""
-                WITH my_challenge AS (
-                    SELECT hc.id, hc.pack_id, COUNT(DISTINCT hcm.id) AS total_habits
-                    FROM habit_challenges hc
-                    JOIN habit_commitments hcm ON hcm.challenge_id = hc.id
-                    WHERE hc.id = :cid
-                    GROUP BY hc.id
-                ),
-                pack_challenges AS (
-                    SELECT hc.user_id, hc.id AS challenge_id,
-                           COUNT(DISTINCT hcm.id) AS total_habits
-                    FROM habit_challenges hc
-                    JOIN habit_commitments hcm ON hcm.challenge_id = hc.id
-                    JOIN my_challenge mc ON hc.pack_id = mc.pack_id
-                    WHERE hc.status = 'active'
-                    GROUP BY hc.user_id, hc.id
-                ),
-                daily_counts AS (
-                    SELECT hcm.challenge_id, dl.logged_date,
-                           COUNT(*) FILTER (WHERE dl.completed) AS done
-                    FROM daily_logs dl
-                    JOIN habit_commitments hcm ON hcm.id = dl.commitment_id
-                    GROUP BY hcm.challenge_id, dl.logged_date
-                ),
-                user_scores AS (
-                    SELECT pc.user_id,
-                           COUNT(DISTINCT CASE
-                               WHEN dc.done >= GREATEST(1, CEIL(pc.total_habits::numeric / 2))
-                               THEN dc.logged_date END) AS good_days
-                    FROM pack_challenges pc
-                    LEFT JOIN daily_counts dc ON dc.challenge_id = pc.challenge_id
-                    GROUP BY pc.user_id
-                ),
-                -- yesterday snapshot: exclude today from good_days
-                daily_counts_yest AS (
-                    SELECT hcm.challenge_id, dl.logged_date,
-                           COUNT(*) FILTER (WHERE dl.completed) AS done
-                    FROM daily_logs dl
-                    JOIN habit_commitments hcm ON hcm.id = dl.commitment_id
-                    WHERE dl.logged_date < :today
-                    GROUP BY hcm.challenge_id, dl.logged_date
-                ),
-                user_scores_yest AS (
-                    SELECT pc.user_id,
-                           COUNT(DISTINCT CASE
-                               WHEN dc.done >= GREATEST(1, CEIL(pc.total_habits::numeric / 2))
-                               THEN dc.logged_date END) AS good_days
-                    FROM pack_challenges pc
-                    LEFT JOIN daily_counts_yest dc ON dc.challenge_id = pc.challenge_id
-                    GROUP BY pc.user_id
-                ),
-                ranked      AS (SELECT user_id, ROW_NUMBER() OVER (ORDER BY good_days DESC, user_id ASC) AS rnk FROM user_scores),
-                ranked_yest AS (SELECT user_id, ROW_NUMBER() OVER (ORDER BY good_days DESC, user_id ASC) AS rnk FROM user_scores_yest)
-                SELECT
-                    (SELECT rnk FROM ranked      WHERE user_id = :uid) AS habit_rank,
-                    (SELECT rnk FROM ranked_yest WHERE user_id = :uid) AS habit_rank_yesterday,
-                    (SELECT COUNT(*) FROM user_scores)                  AS total_participants,
-                    (SELECT pack_id FROM my_challenge)                  AS pack_id
-            """), {"cid": challenge_id, "uid": uid, "today": today})
-            hr2 = hrank_row.mappings().first()
-            if hr2 and hr2["pack_id"] and hr2["habit_rank"]:
-                habit_rank              = int(hr2["habit_rank"])
+            hr2 = await habit_pack_ranks.get_rank(db, challenge_id)
+            if hr2 and hr2["rank"]:
+                habit_rank              = int(hr2["rank"])
                 habit_total_participants = int(hr2["total_participants"] or 0)
-                if hr2["habit_rank_yesterday"]:
-                    habit_rank_change = int(hr2["habit_rank_yesterday"]) - habit_rank
+                if hr2["rank_yesterday"]:
+                    habit_rank_change = int(hr2["rank_yesterday"]) - habit_rank
         except Exception:
             pass
 
@@ -1,13 +1,13 @@
 from fastapi import APIRouter, Depends
 from app.auth.deps import get_current_user
 from app.db.deps import get_db
-from app.models import User, Department
+from app.models import User
 from typing import Optional
 from pydantic import BaseModel
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas.profile import ProfileOut, ProfileUpdate
+from app.services import ref_cache
 
 
 class MePatch(BaseModel):
@@ -51,12 +51,9 @@ async def me(
     """
     dept = None
     if user.department_id:
-        dept_result = await db.execute(
-            select(Department).where(Department.id == user.department_id)
-        )
-        dept_row = dept_result.scalar_one_or_none()
+        dept_row = await ref_cache.department(db, user.department_id)
         if dept_row:
-            dept = DepartmentOut(id=str(dept_row.id), name=dept_row.name)
+            dept = DepartmentOut(id=dept_row["id"], name=dept_row["name"])
 
     return MeOut(
         id             = str(user.id),
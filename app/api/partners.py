@@ -27,7 +27,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.deps import get_db
 from app.auth.deps import get_current_user
 from app.models import User, PushSubscription
+from app.services import partner_queue
 from app.services.notification_service import write_inbox
+from app.services.step_streak import live_streak
 from app.services.push_notify import send_web_push, PushResult
 from app.api.ws import is_online, notify_user
 
@@ -126,7 +128,9 @@ async def list_partners(
             CASE WHEN ap.requester_id = :uid THEN 'sent'
                  ELSE 'received' END       AS direction,
             pu.name                        AS partner_name,
-            pu.profile_pic_url             AS partner_pic
+            pu.profile_pic_url             AS partner_pic,
+            pu.global_current_streak       AS partner_streak,
+            pu.last_streak_update          AS partner_streak_day
         FROM accountability_partners ap
         JOIN users pu ON pu.id = CASE WHEN ap.requester_id = :uid
                                        THEN ap.partner_id
@@ -152,33 +156,21 @@ async def list_partners(
     """), {"ids": partner_ids, "today": today})).mappings().all()
     steps_map = {str(r["user_id"]): r["steps"] for r in steps_rows}
 
-    streak_rows = (await db.execute(text("""
-        SELECT user_id, COUNT(*) AS streak
-        FROM (
-            SELECT user_id, day,
-                   day - ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day)::int AS grp
-            FROM daily_steps
-            WHERE user_id = ANY(CAST(:ids AS uuid[])) AND steps > 0 AND day >= current_date - 60
-        ) g
-        WHERE grp = (
-            SELECT day - ROW_NUMBER() OVER (ORDER BY day)::int AS grp
-            FROM daily_steps
-            WHERE user_id = g.user_id AND steps > 0 AND day >= current_date - 60
-            ORDER BY day DESC LIMIT 1
-        )
-        GROUP BY user_id
-    """), {"ids": partner_ids})).mappings().all()
-    streak_map = {str(r["user_id"]): r["streak"] for r in streak_rows}
+    # Step streak: stored on users, maintained on every step write (step_streak.py)
+    streak_map = {
+        str(p["partner_id"]): live_streak(p["partner_streak"], p["partner_streak_day"], today)
+        for p in pairs
+    }
 
     habit_rows = (await db.execute(text("""
         SELECT
             hc.user_id,
             COUNT(hcm.id)                                    AS total_habits,
-            COUNT(dl.id) FILTER (WHERE dl.completed = true)  AS done_habits
+            COALESCE(MAX(r.done), 0)                         AS done_habits
         FROM habit_challenges hc
         JOIN habit_commitments hcm ON hcm.challenge_id = hc.id
-        LEFT JOIN daily_logs dl
-            ON dl.commitment_id = hcm.id AND dl.logged_date = :today
+        LEFT JOIN habit_day_rollup r
+            ON r.challenge_id = hc.id AND r.day = :today
         WHERE hc.user_id = ANY(CAST(:ids AS uuid[]))
           AND hc.status = 'active' AND hc.ends_at >= :today
         GROUP BY hc.user_id
@@ -187,24 +179,14 @@ async def list_partners(
 
     # Habit streak: consecutive days where ALL active habits were completed
     habit_streak_rows = (await db.execute(text("""
-        WITH daily_completion AS (
-            SELECT
-                hc.user_id,
-                dl.logged_date,
-                COUNT(hcm.id)                                   AS total,
-                COUNT(dl.id) FILTER (WHERE dl.completed = true) AS done
+        WITH perfect_days AS (
+            SELECT hc.user_id, r.day AS logged_date
             FROM habit_challenges hc
-            JOIN habit_commitments hcm ON hcm.challenge_id = hc.id
-            LEFT JOIN daily_logs dl ON dl.commitment_id = hcm.id
+            JOIN habit_day_rollup r ON r.challenge_id = hc.id
             WHERE hc.user_id = ANY(CAST(:ids AS uuid[]))
               AND hc.status = 'active'
-              AND dl.logged_date >= current_date - 60
-            GROUP BY hc.user_id, dl.logged_date
-        ),
-        perfect_days AS (
-            SELECT user_id, logged_date
-            FROM daily_completion
-            WHERE total > 0 AND done = total
+              AND r.day >= current_date - 60
+              AND r.total > 0 AND r.done >= r.total
         ),
         streaks AS (
             SELECT user_id, logged_date,
@@ -224,13 +206,11 @@ async def list_partners(
     habit_streak_map = {str(r["user_id"]): r["habit_streak"] for r in habit_streak_rows}
 
     unread_rows = (await db.execute(text("""
-        SELECT pair_id, COUNT(*) AS unread
-        FROM partner_messages
-        WHERE receiver_id = :uid AND read_at IS NULL
-          AND pair_id = ANY(CAST(:pair_ids AS bigint[]))
-        GROUP BY pair_id
+        SELECT pair_id, unread_count
+        FROM partner_chat_reads
+        WHERE user_id = :uid AND pair_id = ANY(CAST(:pair_ids AS bigint[]))
     """), {"uid": uid, "pair_ids": [p["id"] for p in pairs]})).mappings().all()
-    unread_map = {r["pair_id"]: r["unread"] for r in unread_rows}
+    unread_map = {r["pair_id"]: r["unread_count"] for r in unread_rows}
 
     # Habit challenge details for partners (pack_id, started_at, ends_at)
     habit_challenge_rows = (await db.execute(text("""
@@ -385,34 +365,22 @@ async def find_random_partner(
     uid     = str(user.id)
     dept_id = str(user.department_id)
 
+    # Department lock first (shared with the weekly rotation and admin shuffle):
+    # the checks below and the pair we insert can't interleave with another
+    # matcher in this department, so nobody ends up with two pairs.
+    await partner_queue.lock_department(db, dept_id)
+    await partner_queue.leave_queue(db, uid)
+
     # 1. Check user doesn't already have an active partner
-    existing = (await db.execute(text("""
-        SELECT id FROM accountability_partners
-        WHERE  status IN ('approved', 'pending')
-          AND  (requester_id = :uid OR partner_id = :uid)
-        LIMIT 1
-    """), {"uid": uid})).scalar_one_or_none()
-    if existing:
+    if await partner_queue.has_active_pair(db, uid):
         raise HTTPException(409, "already_have_partner")
 
+    # 2. Claim the oldest waiter from the same dept (FIFO — see partner_queue.py)
+    waiter = await partner_queue.claim_waiter(db, dept_id, uid)
+
     # Clear opt-out — user is actively seeking
     user.partner_opt_out = False
 
-    # 2. Check if someone from same dept is waiting in the queue (FIFO — oldest first)
-    waiter = (await db.execute(text("""
-        SELECT id, name FROM users
-        WHERE  seeking_partner   = true
-          AND  department_id     = :dept
-          AND  id               != :uid
-          AND  id NOT IN (
-              SELECT requester_id FROM accountability_partners WHERE status IN ('approved','pending')
-              UNION
-              SELECT partner_id   FROM accountability_partners WHERE status IN ('approved','pending')
-          )
-        ORDER BY seeking_since ASC
-        LIMIT 1
-    """), {"dept": dept_id, "uid": uid})).mappings().first()
-
     if waiter:
         # Match immediately
         partner_id   = str(waiter["id"])
@@ -422,9 +390,7 @@ async def find_random_partner(
         week_start   = today - timedelta(days=today.weekday())
 
         # Clear waiter's queue flag
-        await db.execute(text("""
-            UPDATE users SET seeking_partner = false, seeking_since = NULL WHERE id = :pid
-        """), {"pid": partner_id})
+        await partner_queue.leave_queue(db, partner_id)
 
         pair_id = (await db.execute(text("""
             INSERT INTO accountability_partners
@@ -499,9 +465,8 @@ async def find_random_partner(
             content={"status": "matched", "pair_id": pair_id, "partner": {"id": partner_id, "name": waiter["name"]}},
         )
 
-    # 3. No one waiting — enter queue
-    user.seeking_partner = True
-    user.seeking_since   = datetime.now(_IST)
+    # 3. No one waiting — enter queue (commit releases the department lock)
+    await partner_queue.enqueue(db, uid, dept_id)
     await db.commit()
 
     from fastapi.responses import JSONResponse
@@ -520,10 +485,8 @@ async def cancel_partner_queue(
     user: User = Depends(get_current_user),
 ):
     """Cancel waiting in the partner queue."""
-    if not user.seeking_partner:
+    if not await partner_queue.leave_queue(db, str(user.id)):
         raise HTTPException(400, "You are not in the queue")
-    user.seeking_partner = False
-    user.seeking_since   = None
     await db.commit()
     return {"status": "ok", "message": "You've been removed from the partner queue"}
 
@@ -562,6 +525,7 @@ async def respond_to_request(
 
     # Notify requester on acceptance
     if body.action == "accept":
+        await partner_queue.leave_queue(db, str(rec["requester_id"]), str(user.id))
         responder_name = (user.name or "Someone").split()[0]
         await write_inbox(
             db,
@@ -758,56 +722,113 @@ async def get_messages(
     user: User = Depends(get_current_user),
 ):
     """
-    Fetch chat messages for a partner pair.
-    Pagination: pass before_id to get messages older than that id.
-    Also marks all received messages as read.
+    Fetch chat messages for a partner pair, newest page first (returned oldest first).
+    Pagination: pass next_before_id from the previous response as before_id.
+
+    Read receipts are a per-member watermark (partner_chat_reads), not per-row
+    flags: opening the latest page moves your watermark to the newest message,
+    and a message of yours is read once its id <= partner_last_read_id.
+    read_at is kept for older clients: the row's own read_at where one was
+    stamped before watermarks, otherwise the reader's watermark updated_at
+    (when it last advanced past that message, so an upper bound).
     """
-    # Verify user belongs to this pair
+    uid = str(user.id)
+
+    # 1. Pair + both members' names + both read watermarks — one PK lookup
     pair = (await db.execute(text("""
-        SELECT id, requester_id, partner_id, status
-        FROM accountability_partners WHERE id = :pid
+        SELECT ap.id, ap.requester_id, ap.partner_id,
+               ur.name AS requester_name, up.name AS partner_name,
+               COALESCE(rr.last_read_id, 0) AS requester_last_read,
+               COALESCE(rp.last_read_id, 0) AS partner_last_read,
+               rr.updated_at AS requester_read_at, rp.updated_at AS partner_read_at
+        FROM accountability_partners ap
+        JOIN users ur ON ur.id = ap.requester_id
+        JOIN users up ON up.id = ap.partner_id
+        LEFT JOIN partner_chat_reads rr ON rr.pair_id = ap.id AND rr.user_id = ap.requester_id
+        LEFT JOIN partner_chat_reads rp ON rp.pair_id = ap.id AND rp.user_id = ap.partner_id
+        WHERE ap.id = :pid
     """), {"pid": partner_id})).mappings().first()
 
     if not pair:
         raise HTTPException(404, "Partnership not found")
 
-    uid = str(user.id)
     if uid not in (str(pair["requester_id"]), str(pair["partner_id"])):
         raise HTTPException(403, "Not your partnership")
 
-    # Mark received messages as read
-    await db.execute(text("""
-        UPDATE partner_messages
-        SET read_at = now()
-        WHERE pair_id = :pid AND receiver_id = :uid AND read_at IS NULL
-    """), {"pid": partner_id, "uid": uid})
+    me_requester = uid == str(pair["requester_id"])
+    names = {str(pair["requester_id"]): pair["requester_name"], str(pair["partner_id"]): pair["partner_name"]}
+    my_last_read      = pair["requester_last_read"] if me_requester else pair["partner_last_read"]
+    partner_last_read = pair["partner_last_read"] if me_requester else pair["requester_last_read"]
+    my_read_at        = pair["requester_read_at"] if me_requester else pair["partner_read_at"]
+    partner_read_at   = pair["partner_read_at"] if me_requester else pair["requester_read_at"]
+    other_id          = str(pair["partner_id"]) if me_requester else str(pair["requester_id"])
 
+    # 2. One page — range scan on (pair_id, id), same key for sort and cursor
+    lim = min(limit, 100)
     cursor_clause = "AND id < :before_id" if before_id else ""
     rows = (await db.execute(text(f"""
-        SELECT pm.id, pm.sender_id, pm.receiver_id, pm.body, pm.sent_at, pm.read_at,
-               u.name AS sender_name
-        FROM   partner_messages pm
-        JOIN   users u ON u.id = pm.sender_id
-        WHERE  pm.pair_id = :pid
+        SELECT id, sender_id, body, sent_at, read_at
+        FROM   partner_messages
+        WHERE  pair_id = :pid
           {cursor_clause}
-        ORDER  BY pm.sent_at DESC
+        ORDER  BY id DESC
         LIMIT  :lim
-    """), {"pid": partner_id, "before_id": before_id, "lim": min(limit, 100)})).mappings().all()
+    """), {"pid": partner_id, "before_id": before_id, "lim": lim + 1})).mappings().all()
+    has_more = len(rows) > lim
+    rows = rows[:lim]
+
+    # Mark read: advance my watermark to the newest message on the first page
+    newest = rows[0]["id"] if rows else 0
+    if not before_id and newest > my_last_read:
+        res = await db.execute(text("""
+            INSERT INTO partner_chat_reads (pair_id, user_id, last_read_id, unread_count, updated_at)
+            VALUES (:pid, :uid, :newest,
+                    (SELECT COUNT(*) FROM partner_messages
+                     WHERE pair_id = :pid AND id > :newest AND receiver_id = :uid),
+                    now())
+            ON CONFLICT (pair_id, user_id) DO UPDATE
+                SET last_read_id = GREATEST(partner_chat_reads.last_read_id, EXCLUDED.last_read_id),
+                    unread_count = EXCLUDED.unread_count,
+                    updated_at   = now()
+            RETURNING updated_at
+        """), {"pid": partner_id, "uid": uid, "newest": newest})
+        my_read_at = res.scalar()
+        my_last_read = newest
+        if is_online(other_id):
+            # Live read receipt for the sender's open chat
+            await db.execute(text("SELECT pg_notify(:ch, :payload)"), {
+                "ch": f"user_{other_id}",
+                "payload": json.dumps({"type": "chat_read", "pair_id": partner_id, "last_read_id": newest}),
+            })
+        await db.commit()
+
+    def _read_at(r) -> str | None:
+        if r["read_at"]:
+            return r["read_at"].isoformat()
+        mine = str(r["sender_id"]) == uid
+        last_read, read_at = (partner_last_read, partner_read_at) if mine else (my_last_read, my_read_at)
+        return read_at.isoformat() if read_at and r["id"] <= last_read else None
 
-    await db.commit()
     messages = [
         {
             "id":          r["id"],
             "sender_id":   str(r["sender_id"]),
-            "sender_name": r["sender_name"],
+            "sender_name": names.get(str(r["sender_id"])),
             "body":        r["body"],
             "sent_at":     r["sent_at"].isoformat(),
-            "read_at":     r["read_at"].isoformat() if r["read_at"] else None,
             "is_mine":     str(r["sender_id"]) == uid,
+            "is_read":     r["id"] <= (partner_last_read if str(r["sender_id"]) == uid else my_last_read),
+            "read_at":     _read_at(r),
         }
         for r in reversed(rows)   # oldest first for display
     ]
-    return {"pair_id": partner_id, "messages": messages}
+    return {
+        "pair_id":              partner_id,
+        "messages":             messages,
+        "has_more":             has_more,
+        "next_before_id":       rows[-1]["id"] if has_more else None,
+        "partner_last_read_id": partner_last_read,
+    }
 
 
 @router.post("/{partner_id}/messages", status_code=201)
@@ -854,6 +875,14 @@ async def send_message(
         RETURNING id
     """), {"pid": partner_id, "sender": uid, "receiver": receiver_id, "body": body.body.strip()})).scalar()
 
+    # Unread badge for the receiver (list_partners reads this, no COUNT)
+    await db.execute(text("""
+        INSERT INTO partner_chat_reads (pair_id, user_id, unread_count)
+        VALUES (:pid, :receiver, 1)
+        ON CONFLICT (pair_id, user_id) DO UPDATE
+            SET unread_count = partner_chat_reads.unread_count + 1
+    """), {"pid": partner_id, "receiver": receiver_id})
+
     sender_name = (user.name or "Partner").split()[0]
 
     # Deliver: WebSocket if online, push if offline
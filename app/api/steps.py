@@ -8,6 +8,8 @@ from typing import Optional
 from app.db.deps import get_db
 from app.auth.deps import get_current_user
 from app.models import User, DailySteps, ChallengeParticipant, Challenge
+from app.services.leaderboard_live import leaderboard_changed
+from app.services.step_streak import update_global_streak
 from app.schemas.steps import (
     StepsAddRequest,
     StepsAddResponse,
@@ -19,11 +21,12 @@ from app.schemas.steps import (
 async def calculate_challenge_streak(
     user_id: str,
     challenge_id: str,
-    db: AsyncSession
+    db: AsyncSession,
+    commit: bool = True,
 ) -> dict:
     """
     Calculate streak from all saved data for this challenge.
-    NOW SAVES TO DATABASE!
+    NOW SAVES TO DATABASE! (commit=False leaves the commit to the caller)
     """
     from datetime import timedelta
     
@@ -181,7 +184,8 @@ async def calculate_challenge_streak(
         }
     )
     
-    await db.commit()
+    if commit:
+        await db.commit()
     # ======================================
     
     return {
@@ -193,6 +197,63 @@ async def calculate_challenge_streak(
         "completion_rate": round((days_met_goal / ((last_logged_date - start_date).days + 1)) * 100, 1) if last_logged_date >= start_date else 0
     }
     
+# ─── Rank snapshot (shared with the Google Fit upsert) ───────────────────────
+
+_AFFECTED_CHALLENGES_SQL = """
+    SELECT DISTINCT c.id, c.start_date, LEAST(c.end_date, :today) AS end_cap
+    FROM challenges c
+    JOIN challenge_participants cp ON cp.challenge_id = c.id
+    WHERE cp.user_id = :uid
+      AND cp.left_at IS NULL
+      AND EXISTS (SELECT 1 FROM unnest(CAST(:days AS date[])) d WHERE d BETWEEN c.start_date AND c.end_date)
+"""
+
+# Live rank in each challenge, before the new steps land (baseline for rank_change).
+# Ties break on user_id, as on the leaderboards.
+_SNAPSHOT_RANKS_SQL = """
+    WITH ch AS (
+        SELECT * FROM unnest(CAST(:cids AS uuid[]), CAST(:starts AS date[]), CAST(:caps AS date[]))
+            AS ch(id, start_date, end_cap)
+    ),
+    ranked AS (
+        SELECT ch.id AS challenge_id, cp.user_id,
+               ROW_NUMBER() OVER (PARTITION BY ch.id
+                                  ORDER BY COALESCE(SUM(ds.steps), 0) DESC, cp.user_id ASC) AS live_rank
+        FROM ch
+        JOIN challenge_participants cp ON cp.challenge_id = ch.id AND cp.left_at IS NULL
+        LEFT JOIN daily_steps ds
+            ON ds.user_id = cp.user_id AND ds.day >= ch.start_date AND ds.day <= ch.end_cap
+        GROUP BY ch.id, cp.user_id
+    )
+    UPDATE challenge_participants p
+    SET previous_rank = r.live_rank
+    FROM ranked r
+    WHERE r.user_id = :uid AND p.challenge_id = r.challenge_id AND p.user_id = r.user_id
+"""
+
+
+async def affected_challenges(db: AsyncSession, user_id: str, days: list[date]) -> list:
+    """The user's challenges containing any of these days: {id, start_date, end_cap}."""
+    return (await db.execute(text(_AFFECTED_CHALLENGES_SQL), {
+        "uid": user_id, "days": days, "today": date.today(),
+    })).mappings().all()
+
+
+async def snapshot_ranks(db: AsyncSession, user_id: str, challenges: list) -> None:
+    """
+    Store the user's live rank in each challenge as previous_rank. Call before
+    the new steps are written. The caller commits.
+    """
+    if not challenges:
+        return
+    await db.execute(text(_SNAPSHOT_RANKS_SQL), {
+        "uid":    user_id,
+        "cids":   [str(ch["id"]) for ch in challenges],
+        "starts": [ch["start_date"] for ch in challenges],
+        "caps":   [ch["end_cap"] for ch in challenges],
+    })
+
+
 router = APIRouter(prefix="/api/steps", tags=["Steps"])
 
 @router.post("/add", response_model=StepsAddResponse)
@@ -204,7 +265,7 @@ async def add_steps(
     """
     Add steps for a specific date.
     Creates or updates the daily_steps record.
-    Recalculates streaks for all active challenges.
+    Recalculates streaks for all active challenges and the global step streak.
     """
     log_date = payload.day or date.today()
     
@@ -219,6 +280,7 @@ async def add_steps(
     daily_steps = result.scalar_one_or_none()
     
     steps_changed = False
+    prev_steps = daily_steps.steps if daily_steps else 0
     
     if daily_steps:
         if daily_steps.steps != payload.steps:  # Only if changed
@@ -236,51 +298,12 @@ async def add_steps(
     
     # ========== SNAPSHOT RANK + RECALCULATE STREAKS IF STEPS CHANGED ==========
     if steps_changed:
-        # Find all active challenges that include this date
-        challenges_query = text("""
-            SELECT DISTINCT c.id, c.start_date, LEAST(c.end_date, :today) AS end_cap
-            FROM challenges c
-            JOIN challenge_participants cp ON cp.challenge_id = c.id
-            WHERE cp.user_id = :user_id
-            AND cp.left_at IS NULL
-            AND :log_date BETWEEN c.start_date AND c.end_date
-        """)
-        result = await db.execute(
-            challenges_query,
-            {"user_id": str(current_user.id), "log_date": log_date, "today": date.today()}
-        )
-        active_challenges = result.mappings().all()
-
-        for ch in active_challenges:
-            challenge_id = str(ch["id"])
+        # Challenges that include this date; snapshot live rank BEFORE committing
+        # the new steps (baseline for rank_change)
+        active_challenges = await affected_challenges(db, str(current_user.id), [log_date])
+        await snapshot_ranks(db, str(current_user.id), active_challenges)
 
-            # Snapshot live rank BEFORE committing new steps (baseline for rank_change)
-            rank_row = await db.execute(text("""
-                WITH totals AS (
-                    SELECT cp.user_id,
-                           COALESCE(SUM(ds.steps), 0) AS total_steps
-                    FROM challenge_participants cp
-                    LEFT JOIN daily_steps ds
-                        ON ds.user_id = cp.user_id
-                        AND ds.day >= :start AND ds.day <= :end_cap
-                    WHERE cp.challenge_id = :cid AND cp.left_at IS NULL
-                    GROUP BY cp.user_id
-                )
-                SELECT ROW_NUMBER() OVER (ORDER BY total_steps DESC) AS live_rank
-                FROM totals WHERE user_id = :uid
-            """), {
-                "cid":     challenge_id,
-                "start":   ch["start_date"],
-                "end_cap": ch["end_cap"],
-                "uid":     str(current_user.id),
-            })
-            rr = rank_row.mappings().first()
-            if rr and rr["live_rank"]:
-                await db.execute(text("""
-                    UPDATE challenge_participants
-                    SET previous_rank = :rank
-                    WHERE challenge_id = :cid AND user_id = :uid
-                """), {"rank": int(rr["live_rank"]), "cid": challenge_id, "uid": str(current_user.id)})
+        await update_global_streak(db, str(current_user.id), log_date, payload.steps, prev_steps)
 
         await db.commit()
         await db.refresh(daily_steps)
@@ -292,6 +315,9 @@ async def add_steps(
                 challenge_id=str(ch["id"]),
                 db=db
             )
+
+        # Push rank deltas to clients watching these leaderboards (debounced)
+        leaderboard_changed(ch["id"] for ch in active_challenges)
     else:
         await db.commit()
         await db.refresh(daily_steps)
@@ -4,54 +4,302 @@ WebSocket endpoint — real-time partner chat delivery via PostgreSQL LISTEN/NOT
 Flow:
   1. Client connects: WS /ws?token=<JWT>
   2. JWT validated → user_id extracted
-  3. User registered in _online dict
-  4. asyncpg connection starts LISTEN on channel "user_<user_id>"
-  5. Any pg_notify on that channel → forwarded to WebSocket
-  6. On disconnect: UNLISTEN, removed from _online
+  3. Socket registered in _online (user_id → set of sockets; a user may have
+     several tabs / devices open). Each socket gets a bounded send queue and
+     its own writer task, so one slow client never blocks anyone else.
+  4. The process-wide listener connection LISTENs on channel "user_<user_id>"
+     (first socket for that user only)
+  5. Any pg_notify on that channel → queued to every socket of that user
+  6. On disconnect: socket removed; UNLISTEN once the user's last socket is gone
+
+Reconnect replay: WS /ws?token=<JWT>&since=<cursor> — chat messages and inbox
+notifications written while the client was away are sent first (oldest first,
+"replay": true), then {"type": "replay_done", "cursor", "truncated"}, then live
+traffic. Without ?since the client gets {"type": "cursor"} to store instead.
+Live messages arriving during the replay are held and de-duplicated against
+it (app/services/ws_replay.py).
+
+Topics: a socket may also subscribe to "challenge:<id>" — the worker LISTENs on
+"challenge_<id>" while it has subscribers and forwards leaderboard_delta
+messages (app/services/leaderboard_live.py).
+
+Slow consumers: see _SEND_QUEUE_MAX / _SLOW_DROPS_MAX / _SEND_TIMEOUT_S.
+Gauges (queue depth, drops, slow disconnects): ws_stats() → GET /api/admin/ws-stats.
+
+One listener connection per process (not per socket): a thousand open app
+sessions cost one Postgres backend, not a thousand. Senders are unchanged —
+they still pg_notify('user_<id>', payload). If the listener connection drops
+it is re-opened with backoff and every channel re-LISTENed.
 
 Online check:
   partners.py uses `is_online(user_id)` before deciding push vs WS delivery.
+  It is true if the user has a socket on this worker or on any other worker
+  (app/services/presence.py — heartbeat table + "ws_presence" NOTIFYs).
 """
 from __future__ import annotations
 
 import asyncio
 import json
 import logging
-from typing import Dict
+import uuid
+from typing import Callable, Dict, Set
 
 import asyncpg
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from jose import JWTError, jwt
 
 from app.core.config import settings
+from app.services import leaderboard_live, presence, ref_cache, ws_replay
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# user_id (str) → active WebSocket
-_online: Dict[str, WebSocket] = {}
+_CHANNEL_PREFIX = "user_"
+_KEEPALIVE_S = 60
+_RECONNECT_MAX_S = 30
+
+# Per-socket outbound queue. Slow-consumer policy: when a socket's queue is
+# full the new message is dropped (counted); after _SLOW_DROPS_MAX drops in a
+# row, or one send blocking longer than _SEND_TIMEOUT_S, the socket is closed
+# with 4008 so the client reconnects instead of silently falling behind.
+_SEND_QUEUE_MAX = 100
+_SLOW_DROPS_MAX = 20
+_SEND_TIMEOUT_S = 10
+_CLOSE_SLOW_CONSUMER = 4008
+
+_counters = {"dropped": 0, "slow_disconnects": 0, "send_errors": 0}
+
+
+class _Socket:
+    """One open WebSocket with its own bounded send queue and writer task."""
+
+    def __init__(self, user_id: str, ws: WebSocket):
+        self.user_id = user_id
+        self.ws = ws
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=_SEND_QUEUE_MAX)
+        self.dropped = 0
+        self.topics: Set[str] = set()  # topic channels this socket subscribed to
+        self._drops_in_row = 0
+        self._held: list[str] | None = None  # live messages parked during replay
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, text: str) -> bool:
+        """Non-blocking. Returns False if the message was dropped."""
+        if self._held is not None:
+            self._held.append(text)
+            return True
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self._drops_in_row += 1
+            _counters["dropped"] += 1
+            if self._drops_in_row >= _SLOW_DROPS_MAX:
+                self._disconnect_slow("queue full")
+            return False
+        self._drops_in_row = 0
+        return True
+
+    async def send(self, text: str) -> None:
+        """Waits for queue space instead of dropping — replay only."""
+        await self.queue.put(text)
+
+    def hold(self) -> None:
+        self._held = []
+
+    def release(self, skip: Callable[[str], bool] = lambda text: False) -> None:
+        """Stop holding; queue the parked live messages except those skip() rejects."""
+        held, self._held = self._held or [], None
+        for text in held:
+            if not skip(text):
+                self.enqueue(text)
+
+    async def _write_loop(self) -> None:
+        try:
+            while True:
+                text = await self.queue.get()
+                try:
+                    await asyncio.wait_for(self.ws.send_text(text), _SEND_TIMEOUT_S)
+                except asyncio.TimeoutError:
+                    self._disconnect_slow("send timeout")
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket already closed — the receive loop in ws_endpoint cleans up
+            _counters["send_errors"] += 1
+            _unregister(self)
+
+    def _disconnect_slow(self, reason: str) -> None:
+        _counters["slow_disconnects"] += 1
+        logger.warning("WS slow consumer: user=%s  %s — closing", self.user_id, reason)
+        _unregister(self)
+        asyncio.create_task(self._close(_CLOSE_SLOW_CONSUMER))
+
+    async def _close(self, code: int) -> None:
+        try:
+            await self.ws.close(code=code)
+        except Exception:
+            pass
+
+    def stop(self) -> None:
+        if asyncio.current_task() is not self._writer:
+            self._writer.cancel()
+
+
+# user_id (str) → open sockets (a user may have several tabs / devices)
+_online: Dict[str, Set[_Socket]] = {}
+
+# Topic subscriptions — client sends {"type": "subscribe", "topic": "challenge:<id>"}.
+# topic kind → NOTIFY channel prefix; channel → subscribed local sockets
+_TOPIC_KINDS = {"challenge": leaderboard_live.CHANNEL_PREFIX}
+_topics: Dict[str, Set[_Socket]] = {}
 
 
 def is_online(user_id: str) -> bool:
-    """Return True if the user currently has an open WebSocket connection."""
-    return user_id in _online
+    """Return True if the user currently has an open WebSocket connection (any worker)."""
+    return bool(_online.get(user_id)) or presence.is_online_elsewhere(user_id)
+
+
+def _is_local(user_id: str) -> bool:
+    return bool(_online.get(user_id))
 
 
 async def notify_user(user_id: str, payload: dict) -> bool:
     """
-    Deliver a message to a connected user via WebSocket.
-    Returns True if delivered, False if user not online.
+    Queue a message for every socket of a connected user (never blocks on the socket).
+    Returns True if queued for at least one socket, False if user not online here.
     """
-    ws = _online.get(user_id)
-    if ws is None:
-        return False
+    return _fan_out(user_id, json.dumps(payload)) > 0
+
+
+def _fan_out(user_id: str, text: str) -> int:
+    return sum(sock.enqueue(text) for sock in list(_online.get(user_id, ())))
+
+
+def _register(user_id: str, ws: WebSocket) -> _Socket:
+    if not _is_local(user_id):
+        presence.set_local(user_id, True)
+    sock = _Socket(user_id, ws)
+    _online.setdefault(user_id, set()).add(sock)
+    return sock
+
+
+def _unregister(sock: _Socket) -> None:
+    """Idempotent — called from the writer (errors / slow consumer) and the endpoint."""
+    sock.stop()
+    sockets = _online.get(sock.user_id)
+    if sockets is None or sock not in sockets:
+        return
+    sockets.discard(sock)
+    if not sockets:
+        _online.pop(sock.user_id, None)
+        presence.set_local(sock.user_id, False)
+    # sock.topics is kept so ws_endpoint can UNLISTEN channels left without subscribers
+    for channel in sock.topics:
+        subscribers = _topics.get(channel)
+        if subscribers is not None:
+            subscribers.discard(sock)
+            if not subscribers:
+                _topics.pop(channel, None)
+
+
+def _topic_channel(topic: object) -> str | None:
+    """"challenge:<uuid>" → "challenge_<uuid>", or None if not a valid topic."""
+    if not isinstance(topic, str) or ":" not in topic:
+        return None
+    kind, _, ident = topic.partition(":")
+    prefix = _TOPIC_KINDS.get(kind)
+    if prefix is None:
+        return None
     try:
-        await ws.send_text(json.dumps(payload))
-        return True
-    except Exception:
-        _online.pop(user_id, None)
+        return prefix + str(uuid.UUID(ident))
+    except ValueError:
+        return None
+
+
+def _on_topic_notify(connection, pid, channel: str, payload: str) -> None:
+    for sock in list(_topics.get(channel, ())):
+        sock.enqueue(payload)
+
+
+async def _subscribe_topic(sock: _Socket, topic: object) -> None:
+    channel = _topic_channel(topic)
+    if channel is None:
+        sock.enqueue(json.dumps({"type": "error", "detail": "unknown topic", "topic": topic}))
+        return
+    sock.topics.add(channel)
+    _topics.setdefault(channel, set()).add(sock)
+    try:
+        await _listener.listen(channel, _on_topic_notify)
+    except Exception as exc:
+        logger.warning("LISTEN %s failed: %s", channel, exc)
+    sock.enqueue(json.dumps({"type": "subscribed", "topic": topic}))
+
+
+async def _unsubscribe_topic(sock: _Socket, topic: object) -> None:
+    channel = _topic_channel(topic)
+    if channel is None or channel not in sock.topics:
+        return
+    sock.topics.discard(channel)
+    subscribers = _topics.get(channel, set())
+    subscribers.discard(sock)
+    if not subscribers:
+        _topics.pop(channel, None)
+        await _listener.unlisten(channel, keep=lambda: bool(_topics.get(channel)))
+    sock.enqueue(json.dumps({"type": "unsubscribed", "topic": topic}))
+
+
+async def _catch_up(sock: _Socket, since: str) -> None:
+    """
+    Replay what the user missed since `since`, or hand out a fresh cursor.
+    The socket holds live messages meanwhile — LISTEN is already active, so
+    anything committed during the replay query arrives in both; those live
+    copies are dropped.
+    """
+    cursor = ws_replay.parse_cursor(since)
+    if cursor is None:
+        sock.enqueue(json.dumps({"type": "cursor",
+                                 "cursor": await ws_replay.current_cursor(sock.user_id)}))
+        return
+
+    events, new_cursor, truncated = await ws_replay.replay_since(sock.user_id, cursor)
+    for event in events:
+        await sock.send(json.dumps(event, default=str))
+    await sock.send(json.dumps({"type": "replay_done", "cursor": new_cursor, "truncated": truncated}))
+
+    msg_seen, inbox_seen = ws_replay.parse_cursor(new_cursor)
+
+    def replayed(text: str) -> bool:
+        try:
+            msg = json.loads(text)
+        except json.JSONDecodeError:
+            return False
+        if msg.get("type") == "chat_message":
+            return (msg.get("message_id") or 0) <= msg_seen
+        if msg.get("type") == "inbox":
+            return (msg.get("id") or 0) <= inbox_seen
         return False
 
+    sock.release(skip=replayed)
+
+
+def ws_stats() -> dict:
+    """Gauges for GET /api/admin/ws-stats."""
+    depths = [sock.queue.qsize() for socks in _online.values() for sock in socks]
+    return {
+        "users":                len(_online),
+        "sockets":              len(depths),
+        "listen_channels":      _listener.channel_count,
+        "topics":               len(_topics),
+        "queued_messages":      sum(depths),
+        "max_queue_depth":      max(depths, default=0),
+        "queue_capacity":       _SEND_QUEUE_MAX,
+        "dropped_total":        _counters["dropped"],
+        "slow_disconnects_total": _counters["slow_disconnects"],
+        "send_errors_total":    _counters["send_errors"],
+    }
+
 
 def _validate_token(token: str) -> str | None:
     """Decode JWT and return user_id (sub), or None if invalid."""
@@ -64,47 +312,154 @@ def _validate_token(token: str) -> str | None:
         return None
 
 
-async def _listen_and_forward(user_id: str, ws: WebSocket) -> None:
+# ── shared listener connection ────────────────────────────────────────────────
+
+class _Listener:
     """
-    Open a dedicated asyncpg connection, LISTEN on "user_<user_id>",
-    and forward every notification payload to the WebSocket.
-    Exits when the WebSocket closes or the listen loop breaks.
+    One asyncpg connection (outside the SQLAlchemy pool) holding a LISTEN per
+    online user, plus the presence and ref_cache channels. asyncpg connections don't allow
+    concurrent operations, so every LISTEN / UNLISTEN / keepalive goes
+    through _lock.
     """
-    dsn = settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
 
-    conn: asyncpg.Connection | None = None
-    try:
-        conn = await asyncpg.connect(dsn)
-        channel = f"user_{user_id}"
+    def __init__(self) -> None:
+        self._conn: asyncpg.Connection | None = None
+        self._channels: Dict[str, Callable] = {}  # channel → notify callback
+        self._lock = asyncio.Lock()
+        self._keepalive: asyncio.Task | None = None
+        self._reconnecting: asyncio.Task | None = None
+        self._closing = False
+
+    @property
+    def channel_count(self) -> int:
+        return len(self._channels)
+
+    async def listen(self, channel: str, callback: Callable) -> None:
+        async with self._lock:
+            if channel in self._channels:
+                return
+            conn = await self._connection()
+            await conn.add_listener(channel, callback)
+            self._channels[channel] = callback
+
+    async def subscribe(self, user_id: str) -> None:
+        await self.listen(_CHANNEL_PREFIX + user_id, self._on_notify)
+
+    async def unsubscribe(self, user_id: str) -> None:
+        # A new socket for the same user may have connected meanwhile
+        await self.unlisten(_CHANNEL_PREFIX + user_id, keep=lambda: _is_local(user_id))
+
+    async def unlisten(self, channel: str, keep: Callable[[], bool]) -> None:
+        """UNLISTEN unless keep() — checked under the lock — says it is needed again."""
+        async with self._lock:
+            if channel not in self._channels or keep():
+                return
+            callback = self._channels.pop(channel)
+            if self._conn is not None and not self._conn.is_closed():
+                try:
+                    await self._conn.remove_listener(channel, callback)
+                except Exception as exc:
+                    logger.warning("UNLISTEN %s failed: %s", channel, exc)
+
+    async def close(self) -> None:
+        self._closing = True
+        for task in (self._keepalive, self._reconnecting):
+            if task:
+                task.cancel()
+        async with self._lock:
+            if self._conn is not None:
+                try:
+                    await self._conn.close()
+                except Exception:
+                    pass
+            self._conn = None
+            self._channels.clear()
+
+    # ── internals (caller holds _lock) ────────────────────────────────────────
 
-        async def on_notify(connection, pid, channel, payload):
+    async def _connection(self) -> asyncpg.Connection:
+        """Current connection; a new one re-LISTENs every known channel."""
+        if self._conn is None or self._conn.is_closed():
+            dsn = settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
+            conn = await asyncpg.connect(dsn)
+            for channel, callback in self._channels.items():
+                await conn.add_listener(channel, callback)
+            conn.add_termination_listener(self._on_terminated)
+            self._conn = conn
+            if self._keepalive is None or self._keepalive.done():
+                self._keepalive = asyncio.create_task(self._keepalive_loop())
+            logger.info("WS listener connection opened: %d channels", len(self._channels))
+        return self._conn
+
+    def _on_notify(self, connection, pid, channel: str, payload: str) -> None:
+        _fan_out(channel[len(_CHANNEL_PREFIX):], payload)
+
+    def _on_terminated(self, connection) -> None:
+        if self._closing:
+            return
+        logger.warning("WS listener connection lost — reconnecting")
+        if self._reconnecting is None or self._reconnecting.done():
+            self._reconnecting = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = 1
+        while True:
             try:
-                await ws.send_text(payload)
-            except Exception:
-                pass  # ws already closed; outer loop will exit
+                async with self._lock:
+                    await self._connection()
+                return
+            except Exception as exc:
+                logger.warning("WS listener reconnect failed (retry in %ds): %s", delay, exc)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _RECONNECT_MAX_S)
 
-        await conn.add_listener(channel, on_notify)
+    async def _keepalive_loop(self) -> None:
+        # One process-wide check instead of a timer per socket — surfaces a
+        # silently dropped connection so the termination listener can fire.
+        while True:
+            await asyncio.sleep(_KEEPALIVE_S)
+            async with self._lock:
+                conn = self._conn
+                if conn is None or conn.is_closed():
+                    continue
+                try:
+                    await conn.execute("SELECT 1")
+                except Exception as exc:
+                    logger.warning("WS listener keepalive failed: %s", exc)
+                    conn.terminate()
 
-        # Keep alive until WebSocket disconnects (detected by receive loop)
-        while user_id in _online:
-            await asyncio.sleep(1)
 
+_listener = _Listener()
+
+
+async def start_presence() -> None:
+    """Called on app startup — follow other workers' presence and start heartbeating."""
+    presence.start_heartbeat()
+    try:
+        await _listener.listen(presence.PRESENCE_CHANNEL, presence.on_presence_notify)
     except Exception as exc:
-        logger.warning("LISTEN loop error for user %s: %s", user_id, exc)
-    finally:
-        if conn:
-            try:
-                await conn.remove_listener(f"user_{user_id}", on_notify)
-                await conn.close()
-            except Exception:
-                pass
+        logger.warning("LISTEN %s failed (heartbeat cache still applies): %s", presence.PRESENCE_CHANNEL, exc)
+
+
+async def start_ref_cache() -> None:
+    """Called on app startup — drop reference-data catalogs when another process changes them."""
+    try:
+        await _listener.listen(ref_cache.REF_CACHE_CHANNEL, ref_cache.on_ref_cache_notify)
+    except Exception as exc:
+        logger.warning("LISTEN %s failed (catalogs still expire): %s", ref_cache.REF_CACHE_CHANNEL, exc)
+
+
+async def close_listener() -> None:
+    """Called on app shutdown."""
+    await presence.stop_heartbeat()
+    await _listener.close()
 
 
 @router.websocket("/ws")
-async def ws_endpoint(ws: WebSocket, token: str = ""):
+async def ws_endpoint(ws: WebSocket, token: str = "", since: str = ""):
     """
-    WebSocket endpoint for real-time partner chat.
-    Query param: ?token=<JWT access token>
+    WebSocket endpoint for real-time partner chat and live leaderboards.
+    Query params: ?token=<JWT access token>&since=<cursor from the last session>
     """
     # 1. Validate JWT before accepting
     user_id = _validate_token(token)
@@ -113,27 +468,51 @@ async def ws_endpoint(ws: WebSocket, token: str = ""):
         return
 
     await ws.accept()
-    _online[user_id] = ws
+    sock = _register(user_id, ws)
+    sock.hold()
     logger.info("WS connected: user=%s  online=%d", user_id, len(_online))
 
-    # 2. Start LISTEN/NOTIFY forwarding in background
-    listen_task = asyncio.create_task(_listen_and_forward(user_id, ws))
-
     try:
-        # 3. Keep the connection open; receive loop for client messages (ping/pong)
+        # 2. LISTEN on the user's channel over the shared connection
+        try:
+            await _listener.subscribe(user_id)
+        except Exception as exc:
+            logger.warning("LISTEN failed for user %s: %s", user_id, exc)
+
+        # 3. Catch up on missed messages, then release live traffic
+        try:
+            await _catch_up(sock, since)
+        except Exception as exc:
+            logger.warning("WS replay failed for user %s: %s", user_id, exc)
+        sock.release()
+
+        # 4. Keep the connection open; receive loop for client messages:
+        #      {"type": "ping"}                                  → pong
+        #      {"type": "subscribe" | "unsubscribe", "topic": "challenge:<id>"}
+        #        → live leaderboard_delta messages for that challenge
         while True:
             data = await ws.receive_text()
-            # Clients may send {"type":"ping"} — respond with pong
             try:
                 msg = json.loads(data)
-                if msg.get("type") == "ping":
-                    await ws.send_text(json.dumps({"type": "pong"}))
+                kind = msg.get("type")
+                if kind == "ping":
+                    sock.enqueue(json.dumps({"type": "pong"}))
+                elif kind == "subscribe":
+                    await _subscribe_topic(sock, msg.get("topic"))
+                elif kind == "unsubscribe":
+                    await _unsubscribe_topic(sock, msg.get("topic"))
             except Exception:
                 pass
 
     except (WebSocketDisconnect, Exception):
         pass
     finally:
-        _online.pop(user_id, None)
-        listen_task.cancel()
+        _unregister(sock)
+        try:
+            if not _is_local(user_id):
+                await _listener.unsubscribe(user_id)
+            for channel in sock.topics:
+                await _listener.unlisten(channel, keep=lambda: bool(_topics.get(channel)))
+        except Exception:
+            pass
         logger.info("WS disconnected: user=%s  online=%d", user_id, len(_online))
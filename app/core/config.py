@@ -17,7 +17,7 @@ class Settings(BaseSettings):
     VAPID_PRIVATE_KEY: str = "CjkoYuaMHbxAkkXLWbwi6gxnWhMkbeCiWF-rNDQT1pE"
 
     # ── AI provider ───────────────────────────────────────────────────────────
-    # AI_PROVIDER: "anthropic" (default) | "azure"
+    # AI_PROVIDER: "anthropic" (default) | "azure" | "fake" (local, for load tests — see ai_fake.py)
     AI_PROVIDER: str = os.getenv("AI_PROVIDER", "azure")  # Change to "azure" to use Azure OpenAI instead of Anthropic
 
     # Anthropic (used when AI_PROVIDER=anthropic)
@@ -30,9 +30,20 @@ class Settings(BaseSettings):
     AZURE_OPENAI_DEPLOYMENT: str = "gpt-5.3-chat"
     AZURE_OPENAI_API_VERSION: str = "2025-04-01-preview"
 
+    # Fake provider (used when AI_PROVIDER=fake) — simulated latency / error injection
+    AI_FAKE_LATENCY_MS: int = 1200
+    AI_FAKE_LATENCY_JITTER_MS: int = 400
+    AI_FAKE_ERROR_RATE: float = 0.0
+    AI_FAKE_SEED: int = 0
+
     # Google OAuth (used for Google Fit sync)
     GOOGLE_CLIENT_ID: str = os.getenv("GOOGLE_CLIENT_ID", os.getenv("NEXT_PUBLIC_GOOGLE_CLIENT_ID", ""))
     GOOGLE_CLIENT_SECRET: str = os.getenv("GOOGLE_CLIENT_SECRET", "")
+
+    # Google Fit scheduled sync (app/services/google_fit.py)
+    GOOGLE_FIT_SYNC_CONCURRENCY: int = 16        # users in flight against Google at once
+    GOOGLE_FIT_SYNC_USER_TIMEOUT_S: float = 45   # token refresh + step fetches for one user
+    GOOGLE_FIT_SYNC_WRITE_BATCH: int = 50        # fetched users written per DB session
     
     class Config:
         env_file = BASE_DIR / ".env"
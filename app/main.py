@@ -70,12 +70,30 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.error(f"Scheduler startup failed: {e}", exc_info=True)
     
+    # Cross-worker WebSocket presence (heartbeat + NOTIFY) — see app/services/presence.py
+    from app.api.ws import start_presence
+    asyncio.create_task(start_presence())
+
+    # Reference-data cache invalidation (NOTIFY "ref_cache") — see app/services/ref_cache.py
+    from app.api.ws import start_ref_cache
+    asyncio.create_task(start_ref_cache())
+
     logger.info("App startup complete")
     
     yield
     
     # Shutdown
     logger.info("App shutting down")
+    try:
+        from app.api.ws import close_listener
+        await close_listener()
+    except Exception as e:
+        logger.error(f"WS listener close failed: {e}")
+    try:
+        from app.services.ai_calls import flush_ai_calls
+        await flush_ai_calls()
+    except Exception as e:
+        logger.error(f"ai_calls flush on shutdown failed: {e}")
     if SCHEDULER_AVAILABLE and scheduler:
         try:
             if scheduler.running:
@@ -550,6 +550,67 @@ class DailyLog(Base):
     commitment: Mapped["HabitCommitment"] = relationship(back_populates="logs")
 
 
+class HabitDayRollup(Base):
+    """
+    Completed habits per challenge per day — one row per day with any log.
+    Maintained with daily_logs by app/services/habit_rollup.py; days without
+    a row had nothing completed.
+    """
+    __tablename__ = "habit_day_rollup"
+
+    challenge_id: Mapped[int]      = mapped_column(Integer, ForeignKey("habit_challenges.id", ondelete="CASCADE"), primary_key=True)
+    day:          Mapped[date]     = mapped_column(Date, primary_key=True)
+    done:         Mapped[int]      = mapped_column(Integer, nullable=False, server_default=text("0"))
+    total:        Mapped[int]      = mapped_column(Integer, nullable=False, server_default=text("0"))
+    updated_at:   Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class HabitStreakCheckpoint(Base):
+    """
+    Shield-streak simulation state as of the last closed day of a challenge
+    (app/services/habit_streak.py). Ignored when good_digest no longer matches
+    the challenge's good days, i.e. after a back-dated log edit.
+    """
+    __tablename__ = "habit_streak_checkpoints"
+
+    challenge_id: Mapped[int]      = mapped_column(Integer, ForeignKey("habit_challenges.id", ondelete="CASCADE"), primary_key=True)
+    as_of:        Mapped[date]     = mapped_column(Date, nullable=False)
+    min_required: Mapped[int]      = mapped_column(Integer, nullable=False)
+    good_digest:  Mapped[str]      = mapped_column(Text, nullable=False)
+    state:        Mapped[dict]     = mapped_column(JSONB, nullable=False)
+    updated_at:   Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class HabitCycleCache(Base):
+    """
+    History payload of a closed habit cycle (not active, more than a day past
+    ends_at), which no longer changes. Rows are dropped by any log write to the
+    challenge and by rollup rebuilds, and recomputed on the next history read.
+    """
+    __tablename__ = "habit_cycle_cache"
+
+    challenge_id: Mapped[int]            = mapped_column(Integer, ForeignKey("habit_challenges.id", ondelete="CASCADE"), primary_key=True)
+    summary:      Mapped[dict]           = mapped_column(JSONB, nullable=False)
+    detail:       Mapped[dict | None]    = mapped_column(JSONB, nullable=True)
+    updated_at:   Mapped[datetime]       = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class HabitPackRank(Base):
+    """
+    Habit pack leaderboard row of a user's active challenge
+    (app/services/habit_pack_ranks.py). rank is live, rank_yesterday is frozen nightly.
+    """
+    __tablename__ = "habit_pack_ranks"
+
+    pack_id:        Mapped[str]         = mapped_column(String(64), primary_key=True)
+    user_id:        Mapped[str]         = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    challenge_id:   Mapped[int]         = mapped_column(Integer, ForeignKey("habit_challenges.id", ondelete="CASCADE"), nullable=False, unique=True)
+    good_days:      Mapped[int]         = mapped_column(Integer, nullable=False, default=0)
+    rank:           Mapped[int | None]  = mapped_column(Integer, nullable=True)
+    rank_yesterday: Mapped[int | None]  = mapped_column(Integer, nullable=True)
+    updated_at:     Mapped[datetime]    = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
 # Also add to your User model:
 # challenges: Mapped[list["Challenge"]] = relationship(back_populates="user")
 
@@ -755,10 +816,25 @@ class PartnerMessage(Base):
     receiver_id: Mapped[str]            = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     body:        Mapped[str]            = mapped_column(Text, nullable=False)
     sent_at:     Mapped[datetime]       = mapped_column(DateTime(timezone=True), server_default=func.now())
-    read_at:     Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    read_at:     Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)  # legacy — see PartnerChatRead
     expires_at:  Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
 
+class PartnerChatRead(Base):
+    """
+    Read watermark per (pair, member) — replaces per-row partner_messages.read_at.
+    Messages with id <= last_read_id have been seen. unread_count is bumped on
+    send and recomputed from the watermark when the chat is opened.
+    """
+    __tablename__ = "partner_chat_reads"
+
+    pair_id:      Mapped[int]      = mapped_column(Integer, ForeignKey("accountability_partners.id", ondelete="CASCADE"), primary_key=True)
+    user_id:      Mapped[str]      = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    last_read_id: Mapped[int]      = mapped_column(Integer, nullable=False, server_default=text("0"))
+    unread_count: Mapped[int]      = mapped_column(Integer, nullable=False, server_default=text("0"))
+    updated_at:   Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
 class PartnerNudgeEvent(Base):
     """
     One row per nudge sent. Unique constraint enforces:
@@ -2,7 +2,7 @@
 from datetime import date, datetime
 from typing import Optional
 
-from pydantic import BaseModel, model_validator
+from pydantic import BaseModel, Field, model_validator
 
 
 class HabitOut(BaseModel):
@@ -84,6 +84,10 @@ class LogCreate(BaseModel):
     value: Optional[int] = None
  
  
+class LogBatchCreate(BaseModel):
+    logs: list[LogCreate] = Field(..., min_length=1, max_length=50)
+
+
 class LogOut(BaseModel):
     id: int
     commitment_id: int
@@ -161,6 +165,8 @@ class LeaderboardOut(BaseModel):
     period_days: int
     period_start: date
     period_end: date
+    total: int = 0                # challenges on the whole board (entries may be a slice)
+    my_rank: Optional[int] = None # requesting user's board-wide rank, if on the board
     entries: list[LeaderboardEntry]
 
 
@@ -189,12 +195,14 @@ class DayEntry(BaseModel):
     total_count: int
 
 
-class ChallengeHistoryOut(BaseModel):
+class ChallengeSummaryOut(BaseModel):
+    """One habit cycle in GET /history — stats only, no per-habit / per-day breakdown."""
     id: int
     pack_id: Optional[str]
     status: str
     started_at: date
     ends_at: date
+    habit_count: int
     total_days: int
     days_elapsed: int
     perfect_days: int
@@ -205,6 +213,16 @@ class ChallengeHistoryOut(BaseModel):
     shields_used: int
     effective_streak: int
     shield_used_on_dates: list[date]
+
+
+class ChallengeHistoryPage(BaseModel):
+    items: list[ChallengeSummaryOut]
+    has_more: bool
+    next_before_id: Optional[int] = None   # pass as before_id for the next (older) page
+
+
+class ChallengeHistoryOut(ChallengeSummaryOut):
+    """One habit cycle in full — GET /history/{challenge_id}."""
     habits: list[HabitHistoryEntry]
     daily_logs: list[DayEntry]
-    model_config = {"from_attributes": True}
\ No newline at end of file
+    model_config = {"from_attributes": True}
@@ -0,0 +1,175 @@
+"""
+AI call accounting — one ai_calls row per provider call (or cache hit).
+
+Every provider request in ai_insight / ai_coach / ai_recommendations runs inside
+`async with ai_call(feature, provider, model):`, which records:
+
+  feature        "insight" | "coach" | "body_insight" | "habit_picks" | "step_goal"
+  provider/model what actually served the call
+  input/output   token counts from the SDK usage block (note_usage)
+  latency_ms     wall time of the provider request
+  cache_hit      True for rows written by record_cache_hit() — served from our
+                 DB cache, no provider call (tokens/latency are NULL)
+  outcome        "ok"       — provider answered and the output parsed
+                 "fallback" — provider answered but the output was unusable
+                              (mark_fallback(); the rule-based fallback was served)
+                 "error"    — the provider request raised
+
+Rows are appended to an in-memory buffer and written in batches by a
+background flush a few seconds later — the request path never waits on the
+insert. The buffer is bounded (oldest rows drop first) and a failed flush is
+logged and discarded — accounting never holds up or breaks a feature.
+Process-local (the API runs one worker);
+main.py flushes whatever is left on shutdown.
+
+Aggregates: GET /api/admin/ai-calls.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+_FLUSH_DELAY_S = 5.0
+_MAX_BUFFER = 5000
+
+_buffer: deque[dict] = deque(maxlen=_MAX_BUFFER)
+_flusher: asyncio.Task | None = None
+
+# Call currently in flight in this task (for note_usage), and the last one
+# recorded (for mark_fallback, which runs after the request returned).
+_current: ContextVar["AiCall | None"] = ContextVar("ai_call_current", default=None)
+_last_row: ContextVar[dict | None] = ContextVar("ai_call_last_row", default=None)
+
+
+class AiCall:
+    """Async context manager timing one provider request. See module docstring."""
+
+    def __init__(self, feature: str, provider: str, model: str | None = None):
+        self.feature = feature
+        self.provider = provider
+        self.model = model
+        self.input_tokens: int | None = None
+        self.output_tokens: int | None = None
+        self._t0 = 0.0
+        self._token = None
+
+    async def __aenter__(self) -> "AiCall":
+        self._t0 = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Exited from another context (e.g. a closed streaming generator)
+            _current.set(None)
+        row = _row(
+            feature=self.feature,
+            provider=self.provider,
+            model=self.model,
+            input_tokens=self.input_tokens,
+            output_tokens=self.output_tokens,
+            latency_ms=int((time.perf_counter() - self._t0) * 1000),
+            cache_hit=False,
+            outcome="error" if exc_type else "ok",
+        )
+        _last_row.set(row)
+        _enqueue(row)
+        return False
+
+
+def ai_call(feature: str, provider: str, model: str | None = None) -> AiCall:
+    return AiCall(feature, provider, model)
+
+
+def note_usage(response: object = None, *, model: str | None = None,
+               input_tokens: int | None = None, output_tokens: int | None = None) -> None:
+    """
+    Attach token usage to the call in flight. Accepts an Anthropic Message,
+    an OpenAI ChatCompletion / final stream chunk, or explicit counts.
+    """
+    call = _current.get()
+    if call is None:
+        return
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        # Anthropic: input_tokens/output_tokens — OpenAI: prompt_tokens/completion_tokens
+        call.input_tokens = getattr(usage, "input_tokens", None) or getattr(usage, "prompt_tokens", None)
+        call.output_tokens = getattr(usage, "output_tokens", None) or getattr(usage, "completion_tokens", None)
+        call.model = getattr(response, "model", None) or call.model
+    if model is not None:
+        call.model = model
+    if input_tokens is not None:
+        call.input_tokens = input_tokens
+    if output_tokens is not None:
+        call.output_tokens = output_tokens
+
+
+def mark_fallback() -> None:
+    """
+    The last provider call in this task returned output we couldn't use.
+    Call from parse-failure branches, before any further await.
+    """
+    row = _last_row.get()
+    if row is not None and row["outcome"] == "ok":
+        row["outcome"] = "fallback"
+
+
+def record_cache_hit(feature: str, provider: str) -> None:
+    """A request was served from the DB cache without calling the provider."""
+    _enqueue(_row(
+        feature=feature, provider=provider, model=None,
+        input_tokens=None, output_tokens=None, latency_ms=None,
+        cache_hit=True, outcome="ok",
+    ))
+
+
+# ── buffered writer ───────────────────────────────────────────────────────────
+
+def _row(**fields) -> dict:
+    return {"called_at": datetime.now(timezone.utc), **fields}
+
+
+def _enqueue(row: dict) -> None:
+    global _flusher
+    _buffer.append(row)
+    if _flusher is None or _flusher.done():
+        try:
+            _flusher = asyncio.get_running_loop().create_task(_flush_later())
+        except RuntimeError:
+            pass  # no running loop — picked up by the next flush
+
+
+async def _flush_later() -> None:
+    await asyncio.sleep(_FLUSH_DELAY_S)
+    await flush_ai_calls()
+
+
+async def flush_ai_calls() -> int:
+    """Write all buffered rows in one batch. Returns the number of rows written."""
+    if not _buffer:
+        return 0
+    rows = list(_buffer)
+    _buffer.clear()
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("""
+                INSERT INTO ai_calls (called_at, feature, provider, model, input_tokens,
+                                      output_tokens, latency_ms, cache_hit, outcome)
+                VALUES (:called_at, :feature, :provider, :model, :input_tokens,
+                        :output_tokens, :latency_ms, :cache_hit, :outcome)
+            """), rows)
+            await db.commit()
+        return len(rows)
+    except Exception as e:
+        logger.error(f"[ai_calls] flush of {len(rows)} rows failed: {e}")
+        return 0
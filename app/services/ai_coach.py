@@ -15,10 +15,15 @@ Output format:
     "focus": str,               # single most impactful next action (1 sentence)
     "generated_at": str,        # ISO timestamp
     "cached": bool,             # True if served from DB cache
+    "stale": bool,              # True if the cached report is past _CACHE_DAYS
   }
 
 Cache: one report per user, re-generated only if last report is older than 7 days.
-Provider: controlled by AI_PROVIDER env var: "azure" (default) | "anthropic"
+Streaming: stream_coach_report() yields sections as the model writes them (SSE).
+Stale-while-revalidate: an expired report is still served (stale=true) while a
+deduplicated background refresh generates the new one. A nightly pre-warm job
+regenerates reports for active users before they expire.
+Provider: controlled by AI_PROVIDER env var: "azure" (default) | "anthropic" | "fake"
 """
 import json
 import logging
@@ -29,6 +34,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.models import AiCoachReport
+from app.services.ai_calls import ai_call, mark_fallback, note_usage, record_cache_hit
+from app.services.background_refresh import refresh_in_background
+from app.services.step_streak import live_streak
 
 logger = logging.getLogger(__name__)
 
@@ -144,15 +152,16 @@ async def _collect_coach_stats(db: AsyncSession, user_id: str) -> dict:
     habit_row = await db.execute(text("""
         SELECT
             COUNT(DISTINCT hcm.id)                                              AS total_habits,
-            COALESCE(SUM(CASE WHEN dl.completed THEN 1 ELSE 0 END), 0)         AS done_30,
-            COALESCE(SUM(CASE WHEN dl.logged_date >= :start7
-                              AND dl.completed THEN 1 ELSE 0 END), 0)          AS done_7,
+            COALESCE((SELECT SUM(r.done) FROM habit_day_rollup r
+                      WHERE r.challenge_id = hc.id
+                        AND r.day >= :start  AND r.day <= :today), 0)          AS done_30,
+            COALESCE((SELECT SUM(r.done) FROM habit_day_rollup r
+                      WHERE r.challenge_id = hc.id
+                        AND r.day >= :start7 AND r.day <= :today), 0)          AS done_7,
             hc.started_at,
             hc.ends_at
         FROM habit_challenges hc
         JOIN habit_commitments hcm ON hcm.challenge_id = hc.id
-        LEFT JOIN daily_logs dl ON dl.commitment_id = hcm.id
-            AND dl.logged_date >= :start AND dl.logged_date <= :today
         WHERE hc.user_id = :uid AND hc.status = 'active'
         GROUP BY hc.id
         LIMIT 1
@@ -168,18 +177,12 @@ async def _collect_coach_stats(db: AsyncSession, user_id: str) -> dict:
 
     # Perfect days (all habits done) in last 30 days
     perfect_row = await db.execute(text("""
-        SELECT COUNT(*) AS perfect_days
-        FROM (
-            SELECT dl.logged_date
-            FROM habit_challenges hc
-            JOIN habit_commitments hcm ON hcm.challenge_id = hc.id
-            JOIN daily_logs dl ON dl.commitment_id = hcm.id
-            WHERE hc.user_id = :uid AND hc.status = 'active'
-              AND dl.logged_date >= :start AND dl.logged_date <= :today
-              AND dl.completed
-            GROUP BY dl.logged_date
-            HAVING COUNT(*) >= :total_habits
-        ) t
+        SELECT COUNT(DISTINCT r.day) AS perfect_days
+        FROM habit_challenges hc
+        JOIN habit_day_rollup r ON r.challenge_id = hc.id
+        WHERE hc.user_id = :uid AND hc.status = 'active'
+          AND r.day >= :start AND r.day <= :today
+          AND r.done >= :total_habits
     """), {"uid": user_id, "start": start_30, "today": today,
            "total_habits": max(total_habits, 1)})
     perfect_days = int(perfect_row.scalar() or 0)
@@ -206,7 +209,7 @@ async def _collect_coach_stats(db: AsyncSession, user_id: str) -> dict:
 
     # ── Streaks ───────────────────────────────────────────────────────────────
     streak_row = await db.execute(text(
-        "SELECT global_current_streak, global_longest_streak FROM users WHERE id = :uid"
+        "SELECT global_current_streak, global_longest_streak, last_streak_update FROM users WHERE id = :uid"
     ), {"uid": user_id})
     sr = streak_row.mappings().first() or {}
 
@@ -238,7 +241,7 @@ async def _collect_coach_stats(db: AsyncSession, user_id: str) -> dict:
         "habits_perfect_days":   perfect_days,
         "habit_breakdown":       habit_breakdown,
         # Streaks
-        "streak_current":        int(sr.get("global_current_streak") or 0),
+        "streak_current":        live_streak(sr.get("global_current_streak"), sr.get("last_streak_update"), today),
         "streak_longest":        int(sr.get("global_longest_streak") or 0),
         "step_streak":           int(cr.get("challenge_current_streak") or 0),
         # Rank
@@ -284,6 +287,7 @@ def _parse_coach_response(raw: str, stats: dict) -> dict:
         }
     except (json.JSONDecodeError, TypeError) as e:
         logger.error(f"Coach report parse error: {e} — raw={raw!r}")
+        mark_fallback()
         return _fallback_report(stats)
 
 
@@ -320,15 +324,17 @@ async def _ask_azure_coach(stats: dict) -> dict:
             api_key=settings.AZURE_OPENAI_API_KEY,
             api_version=settings.AZURE_OPENAI_API_VERSION,
         )
-        response = await client.chat.completions.create(
-            model=settings.AZURE_OPENAI_DEPLOYMENT,
-            messages=[
-                {"role": "system", "content": _SYSTEM + "\nRespond in valid JSON."},
-                {"role": "user",   "content": _build_user_message(stats)},
-            ],
-            max_completion_tokens=1500,
-            response_format={"type": "json_object"},
-        )
+        async with ai_call("coach", "azure", settings.AZURE_OPENAI_DEPLOYMENT):
+            response = await client.chat.completions.create(
+                model=settings.AZURE_OPENAI_DEPLOYMENT,
+                messages=[
+                    {"role": "system", "content": _SYSTEM + "\nRespond in valid JSON."},
+                    {"role": "user",   "content": _build_user_message(stats)},
+                ],
+                max_completion_tokens=1500,
+                response_format={"type": "json_object"},
+            )
+            note_usage(response)
         raw = response.choices[0].message.content or "{}"
         return _parse_coach_response(raw, stats)
     except Exception as e:
@@ -341,14 +347,16 @@ async def _ask_claude_coach(stats: dict) -> dict:
     try:
         from anthropic import AsyncAnthropic
         client = AsyncAnthropic()
-        async with client.messages.stream(
-            model="claude-opus-4-6",
-            max_tokens=1500,
-            thinking={"type": "adaptive"},
-            system=_SYSTEM,
-            messages=[{"role": "user", "content": _build_user_message(stats)}],
-        ) as stream:
-            message = await stream.get_final_message()
+        async with ai_call("coach", "anthropic", "claude-opus-4-6"):
+            async with client.messages.stream(
+                model="claude-opus-4-6",
+                max_tokens=1500,
+                thinking={"type": "adaptive"},
+                system=_SYSTEM,
+                messages=[{"role": "user", "content": _build_user_message(stats)}],
+            ) as stream:
+                message = await stream.get_final_message()
+            note_usage(message)
         raw = next((b.text for b in message.content if b.type == "text"), "{}")
         return _parse_coach_response(raw, stats)
     except anthropic.APIError as e:
@@ -356,13 +364,25 @@ async def _ask_claude_coach(stats: dict) -> dict:
         return _fallback_report(stats)
 
 
+async def _ask_fake_coach(stats: dict) -> dict:
+    from app.services.ai_fake import fake_complete
+    try:
+        async with ai_call("coach", "fake", "fake"):
+            raw = await fake_complete("coach", _build_user_message(stats))
+        return _parse_coach_response(raw, stats)
+    except Exception as e:
+        logger.error(f"Fake coach error: {e}")
+        return _fallback_report(stats)
+
+
 # ── public entry point ────────────────────────────────────────────────────────
 
 async def get_coach_report(db: AsyncSession, user_id: str) -> dict:
     """
     Return the user's coaching report.
     Serves from DB cache if last report is < 7 days old.
-    Generates fresh otherwise (on-demand, not scheduled).
+    Older reports are served as-is with stale=True while a background refresh
+    regenerates them. Generates inline only when the user has no report at all.
     """
     # Check cache
     cached = await db.execute(
@@ -374,26 +394,44 @@ async def get_coach_report(db: AsyncSession, user_id: str) -> dict:
     row = cached.scalar_one_or_none()
     if row:
         age_days = (datetime.now(timezone.utc) - row.created_at).days
-        if age_days < _CACHE_DAYS:
-            return {
-                "summary":      row.summary,
-                "went_well":    row.went_well,
-                "improve":      row.improve,
-                "focus":        row.focus,
-                "generated_at": row.created_at.isoformat(),
-                "cached":       True,
-            }
-
-    # Generate fresh
+        stale = age_days >= _CACHE_DAYS
+        record_cache_hit("coach", row.provider)
+        if stale:
+            refresh_in_background(
+                f"coach:{user_id}",
+                lambda session: generate_coach_report(session, user_id),
+            )
+        return {
+            "summary":      row.summary,
+            "went_well":    row.went_well,
+            "improve":      row.improve,
+            "focus":        row.focus,
+            "generated_at": row.created_at.isoformat(),
+            "cached":       True,
+            "stale":        stale,
+        }
+
+    return await generate_coach_report(db, user_id)
+
+
+async def generate_coach_report(db: AsyncSession, user_id: str) -> dict:
+    """Collect stats, call the provider and persist a new AiCoachReport row."""
     stats = await _collect_coach_stats(db, user_id)
     provider = settings.AI_PROVIDER.lower()
 
     if provider == "azure":
         report = await _ask_azure_coach(stats)
+    elif provider == "fake":
+        report = await _ask_fake_coach(stats)
     else:
         report = await _ask_claude_coach(stats)
 
-    # Persist
+    return await _save_report(db, user_id, provider, report, stats)
+
+
+async def _save_report(db: AsyncSession, user_id: str, provider: str,
+                       report: dict, stats: dict) -> dict:
+    """Persist a generated report and return it in API shape."""
     try:
         db.add(AiCoachReport(
             user_id=user_id,
@@ -405,17 +443,253 @@ async def get_coach_report(db: AsyncSession, user_id: str) -> dict:
             raw_stats=stats,
         ))
         await db.commit()
-        generated_at = datetime.now(timezone.utc).isoformat()
     except Exception as e:
         await db.rollback()
         logger.error(f"Coach report save error: {e}")
-        generated_at = datetime.now(timezone.utc).isoformat()
 
     return {
         "summary":      report["summary"],
         "went_well":    report["went_well"],
         "improve":      report["improve"],
         "focus":        report["focus"],
-        "generated_at": generated_at,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
         "cached":       False,
+        "stale":        False,
     }
+
+
+# ── streaming (SSE) ───────────────────────────────────────────────────────────
+# The model emits one JSON object. _SectionStream watches the growing text and
+# yields each top-level section as soon as it is syntactically complete:
+#   ("summary", str) · ("went_well", item) · ("improve", item) · ("focus", str)
+# Array sections yield per item, so the first win shows up before the last one
+# has been written. The final text is still parsed by _parse_coach_response —
+# that result is authoritative and is what gets persisted.
+
+_STREAM_ARRAYS = {"went_well": _validate_went_well, "improve": _validate_improve}
+_STREAM_SCALARS = {"summary", "focus"}
+
+
+class _SectionStream:
+    def __init__(self) -> None:
+        self._buf = ""
+        self._pos = 0
+        self._decoder = json.JSONDecoder()
+        self._started = False
+        self._key: str | None = None     # key whose value we are waiting for
+        self._in_array = False
+
+    def _skip(self, chars: str = " \t\r\n") -> None:
+        while self._pos < len(self._buf) and self._buf[self._pos] in chars:
+            self._pos += 1
+
+    def _decode(self):
+        """Decode one JSON value at _pos; None (position unchanged) if it is not complete yet."""
+        try:
+            value, end = self._decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            return None, False
+        self._pos = end
+        return value, True
+
+    def feed(self, chunk: str) -> list[tuple[str, object]]:
+        self._buf += chunk
+        out: list[tuple[str, object]] = []
+
+        if not self._started:
+            brace = self._buf.find("{", self._pos)
+            if brace < 0:
+                return out
+            self._pos = brace + 1
+            self._started = True
+
+        while True:
+            if self._in_array:
+                self._skip(" \t\r\n,")
+                if self._pos >= len(self._buf):
+                    return out
+                if self._buf[self._pos] == "]":
+                    self._pos += 1
+                    self._in_array = False
+                    self._key = None
+                    continue
+                item, ok = self._decode()
+                if not ok:
+                    return out
+                for valid in _STREAM_ARRAYS[self._key]([item]):
+                    out.append((self._key, valid))
+                continue
+
+            if self._key is None:
+                self._skip(" \t\r\n,")
+                if self._pos >= len(self._buf) or self._buf[self._pos] == "}":
+                    return out
+                start = self._pos
+                key, ok = self._decode()
+                if not ok:
+                    return out
+                self._skip()
+                if self._pos >= len(self._buf):
+                    self._pos = start        # wait for the ':' before committing to the key
+                    return out
+                self._pos += 1               # ':'
+                self._key = str(key)
+                continue
+
+            self._skip()
+            if self._pos >= len(self._buf):
+                return out
+            if self._key in _STREAM_ARRAYS and self._buf[self._pos] == "[":
+                self._pos += 1
+                self._in_array = True
+                continue
+            value, ok = self._decode()
+            if not ok:
+                return out
+            if self._key in _STREAM_SCALARS:
+                out.append((self._key, str(value)))
+            self._key = None
+
+
+async def _stream_azure_text(stats: dict):
+    from openai import AsyncAzureOpenAI
+    client = AsyncAzureOpenAI(
+        azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
+        api_key=settings.AZURE_OPENAI_API_KEY,
+        api_version=settings.AZURE_OPENAI_API_VERSION,
+    )
+    response = await client.chat.completions.create(
+        model=settings.AZURE_OPENAI_DEPLOYMENT,
+        messages=[
+            {"role": "system", "content": _SYSTEM + "\nRespond in valid JSON."},
+            {"role": "user",   "content": _build_user_message(stats)},
+        ],
+        max_completion_tokens=1500,
+        response_format={"type": "json_object"},
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    async for chunk in response:
+        if chunk.usage:
+            note_usage(chunk)
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def _stream_claude_text(stats: dict):
+    from anthropic import AsyncAnthropic
+    client = AsyncAnthropic()
+    async with client.messages.stream(
+        model="claude-opus-4-6",
+        max_tokens=1500,
+        thinking={"type": "adaptive"},
+        system=_SYSTEM,
+        messages=[{"role": "user", "content": _build_user_message(stats)}],
+    ) as stream:
+        async for piece in stream.text_stream:
+            yield piece
+        note_usage(await stream.get_final_message())
+
+
+async def _stream_fake_text(stats: dict):
+    from app.services.ai_fake import fake_stream
+    async for piece in fake_stream("coach", _build_user_message(stats)):
+        yield piece
+
+
+_STREAM_SOURCES = {"azure": _stream_azure_text, "fake": _stream_fake_text}
+
+
+async def stream_coach_report(db: AsyncSession, user_id: str, refresh: bool = False):
+    """
+    Async generator of (event, data) pairs for GET /api/coach/stream.
+
+    Events: "summary", "went_well", "improve", "focus" as each section completes,
+    then "done" with the full report (same shape as get_coach_report). Clients
+    should treat "done" as authoritative — on a parse/provider failure it carries
+    the rule-based fallback report.
+
+    A cached report (fresh or stale, unless refresh=True) is replayed as the same
+    event sequence; stale reports also trigger the usual background refresh.
+    """
+    if not refresh:
+        cached = await db.execute(
+            select(AiCoachReport.id)
+            .where(AiCoachReport.user_id == user_id)
+            .limit(1)
+        )
+        if cached.scalar_one_or_none() is not None:
+            report = await get_coach_report(db, user_id)
+            yield "summary", report["summary"]
+            for item in report["went_well"]:
+                yield "went_well", item
+            for item in report["improve"]:
+                yield "improve", item
+            yield "focus", report["focus"]
+            yield "done", report
+            return
+
+    stats = await _collect_coach_stats(db, user_id)
+    provider = settings.AI_PROVIDER.lower()
+    source = _STREAM_SOURCES.get(provider, _stream_claude_text)
+
+    sections = _SectionStream()
+    chunks: list[str] = []
+    try:
+        async with ai_call("coach", provider):  # model filled in from the stream's usage
+            async for piece in source(stats):
+                chunks.append(piece)
+                for event in sections.feed(piece):
+                    yield event
+        report = _parse_coach_response("".join(chunks) or "{}", stats)
+    except Exception as e:
+        logger.error(f"Coach stream error ({provider}): {e}", exc_info=True)
+        report = _fallback_report(stats)
+
+    yield "done", await _save_report(db, user_id, provider, report, stats)
+
+
+# ── nightly pre-warm ──────────────────────────────────────────────────────────
+
+async def prewarm_expiring_coach_reports(db: AsyncSession) -> int:
+    """
+    Nightly job — regenerate coach reports for active users whose latest report
+    expires within the next 24 hours, so nobody hits the stale path in the morning.
+    "Active" = steps logged in the last 7 days or an active habit challenge.
+    Returns count of reports generated.
+    """
+    now = datetime.now(timezone.utc)
+    rows = await db.execute(text("""
+        SELECT latest.user_id
+        FROM (
+            SELECT DISTINCT ON (user_id) user_id, created_at
+            FROM ai_coach_reports
+            ORDER BY user_id, created_at DESC
+        ) latest
+        WHERE latest.created_at >  :expired_before
+          AND latest.created_at <= :expires_soon
+          AND (
+              EXISTS (SELECT 1 FROM daily_steps ds
+                      WHERE ds.user_id = latest.user_id AND ds.day >= :since)
+           OR EXISTS (SELECT 1 FROM habit_challenges hc
+                      WHERE hc.user_id = latest.user_id AND hc.status = 'active')
+          )
+    """), {
+        "expired_before": now - timedelta(days=_CACHE_DAYS),
+        "expires_soon":   now - timedelta(days=_CACHE_DAYS - 1),
+        "since":          date.today() - timedelta(days=6),
+    })
+    user_ids = [str(r[0]) for r in rows.all()]
+    logger.info(f"Coach pre-warm: {len(user_ids)} reports expiring in the next 24h")
+
+    generated = 0
+    for uid in user_ids:
+        try:
+            await generate_coach_report(db, uid)
+            generated += 1
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"[coach pre-warm] {uid}: {e}", exc_info=True)
+
+    logger.info(f"Coach pre-warm: generated {generated} reports")
+    return generated
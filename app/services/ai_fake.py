@@ -0,0 +1,220 @@
+"""
+Fake AI provider — AI_PROVIDER=fake.
+
+Local stand-in for Anthropic / Azure so the AI pipelines (ai_insight, ai_coach,
+ai_recommendations) can be load-tested and profiled without network calls or
+token spend. Returns schema-valid JSON for each prompt type:
+
+  insight       — {badge, segments, detail, hook}
+  coach         — {summary, went_well, improve, focus}
+  body_insight  — {headline, focus, highlights, priority_habits, suggested_habits, next_milestone}
+  habit_picks   — {intro, picks}
+  step_goal     — {action, suggested_target, reason, confidence}
+
+Deterministic: output, latency and injected errors are seeded from
+(AI_FAKE_SEED, feature, prompt), so the same input always behaves the same.
+
+Tuning (env / .env):
+  AI_FAKE_LATENCY_MS         mean simulated provider latency   (default 1200)
+  AI_FAKE_LATENCY_JITTER_MS  ± uniform jitter around the mean  (default 400)
+  AI_FAKE_ERROR_RATE         0.0–1.0, share of calls that raise (default 0.0)
+  AI_FAKE_SEED               change to get a different deterministic run
+"""
+import asyncio
+import json
+import random
+
+from app.core.config import settings
+from app.services.ai_calls import note_usage
+
+_VALID_TARGETS = [3000, 5000, 7500, 8000, 9000, 10000]
+
+
+class FakeProviderError(RuntimeError):
+    """Injected provider failure (AI_FAKE_ERROR_RATE)."""
+
+
+def _rng(feature: str, prompt: str) -> random.Random:
+    return random.Random(f"{settings.AI_FAKE_SEED}:{feature}:{prompt}")
+
+
+def _latency_s(rng: random.Random) -> float:
+    jitter = rng.uniform(-settings.AI_FAKE_LATENCY_JITTER_MS, settings.AI_FAKE_LATENCY_JITTER_MS)
+    return max(0.0, settings.AI_FAKE_LATENCY_MS + jitter) / 1000
+
+
+def _embedded_json(prompt: str) -> dict:
+    """Best-effort: pull the stats JSON object the real prompts embed."""
+    start, end = prompt.find("{"), prompt.rfind("}")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        data = json.loads(prompt[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+# ── per-feature payloads ──────────────────────────────────────────────────────
+
+def _span(text: str, style: str = "normal", color: str | None = None) -> dict:
+    return {"text": text, "style": style, "color": color}
+
+
+def _insight(rng: random.Random, prompt: str) -> dict:
+    steps = rng.randrange(1500, 14000, 10)
+    habits = rng.randint(0, 5)
+    return {
+        "badge":    rng.choice(["Momentum building", "Best day this week", "Streak on the line"]),
+        "segments": [_span(f"{steps:,} steps", "stat", "purple"), _span(" yesterday —"),
+                     _span(f"{habits} habits", "highlight", "green"), _span(" done.")],
+        "detail":   [_span("Keep the rhythm going — "), _span("one more walk", "highlight", "teal"),
+                     _span(" closes the gap today.")],
+        "hook":     rng.choice(["Beat yesterday before lunch.", "Log one habit in the next hour."]),
+    }
+
+
+def _coach(rng: random.Random, prompt: str) -> dict:
+    stats = _embedded_json(prompt)
+    avg = int(stats.get("steps_avg_daily_30d") or rng.randrange(3000, 12000, 100))
+    target = int(stats.get("steps_daily_target") or 8000)
+    return {
+        "summary": f"You averaged {avg:,} steps a day this month. The consistency is there — now it's about the gap.",
+        "went_well": [
+            {"title": "Showing up most days", "body": f"You logged steps on {rng.randint(10, 30)} of 30 days."},
+            {"title": "Habit momentum", "body": f"Your best habit hit {rng.randint(50, 100)}% this month."},
+            {"title": "A standout day", "body": f"Your best day was {avg * 2:,} steps."},
+        ][:rng.randint(2, 3)],
+        "improve": [
+            {"title": "Closing the step gap",
+             "body": f"Your average is {max(target - avg, 0):,} steps short of your {target:,} target.",
+             "suggestion": "Add a 15-minute walk after lunch every day this week."},
+            {"title": "Evening habits slip",
+             "body": "Habits logged after 8 PM are missed twice as often.",
+             "suggestion": "Move your evening habit to right after dinner."},
+        ],
+        "focus": f"Hit {target:,} steps on 5 of the next 7 days.",
+    }
+
+
+def _body_insight(rng: random.Random, prompt: str) -> dict:
+    vf = rng.randint(6, 16)
+    bf = round(rng.uniform(14, 36), 1)
+    return {
+        "headline": f"Visceral fat at Level {vf} — one habit will change this",
+        "focus": {
+            "main_focus":       f"Visceral fat is at Level {vf}.",
+            "why_it_matters":   "It affects how your body burns fuel and your energy after meals.",
+            "best_next_move":   "Walk for 15 minutes after dinner, every day for 2 weeks.",
+            "expected_benefit": "Most people see a shift within 3–5 weeks.",
+        },
+        "highlights": [
+            {"metric": "Visceral fat", "value": f"Level {vf}", "direction": rng.choice(["up", "down", "stable"]),
+             "delta": None, "trend_label": "unchanged since last scan", "priority": "high",
+             "linked_habits": ["Walk after dinner", "Sleep by 10:30pm", "Cut added sugar"],
+             "linked_steps": "8,000+ steps/day directly supports visceral fat reduction",
+             "improvement_horizon": "3–6 weeks with daily walks"},
+            {"metric": "Body fat", "value": f"{bf}%", "direction": "stable",
+             "delta": None, "trend_label": "first scan", "priority": "medium",
+             "linked_habits": ["Strength training", "Protein at every meal"],
+             "linked_steps": None, "improvement_horizon": "6–10 weeks with strength 3×/week"},
+        ],
+        "priority_habits": {
+            "do_now":   "10-min walk after dinner tonight",
+            "do_daily": "Eat protein at every meal",
+            "avoid":    "Snacks after 9pm",
+        },
+        "suggested_habits": [
+            {"name": "Walk after dinner", "in_library": False, "slug": None, "category": "fitness",
+             "frequency": "daily", "duration": "15 min",
+             "why": "Blunts the post-meal glucose spike — fastest lever for visceral fat.",
+             "urgency": "Two consistent weeks and your next scan will look different.",
+             "first_step": "After dinner tonight, walk for 15 minutes."},
+            {"name": "Cut added sugar", "in_library": False, "slug": None, "category": "nutrition",
+             "frequency": "daily", "duration": None,
+             "why": "Removes the main dietary driver of body fat storage.",
+             "urgency": "Every week without this keeps body fat where it is.",
+             "first_step": "Skip the sugary drink at your next meal."},
+            {"name": "Sleep by 10:30pm", "in_library": False, "slug": None, "category": "sleep",
+             "frequency": "daily", "duration": None,
+             "why": "Lowers the cortisol that deposits fat around organs.",
+             "urgency": "Short sleep undoes the gains from the other two.",
+             "first_step": "Set a 10pm wind-down alarm tonight."},
+        ],
+        "next_milestone": f"Keep the walk habit — next scan could show visceral fat at Level {max(vf - 2, 1)}.",
+    }
+
+
+def _habit_picks(rng: random.Random, prompt: str) -> dict:
+    available = _embedded_json(prompt).get("available_habits") or []
+    pool = [h for h in available if isinstance(h, dict) and h.get("slug")]
+    chosen = rng.sample(pool, min(3, len(pool))) if pool else [
+        {"slug": f"fake-habit-{i}", "label": f"Fake habit {i}", "category": "Body", "tier": "core"}
+        for i in range(3)
+    ]
+    return {
+        "intro": "You've built a solid base — time to stack one new habit on top.",
+        "picks": [
+            {"slug": h["slug"], "label": h.get("label", h["slug"]), "category": h.get("category", "Body"),
+             "tier": h.get("tier", "core"), "why": "Fits your current routine and fills a gap in your history."}
+            for h in chosen
+        ],
+    }
+
+
+def _step_goal(rng: random.Random, prompt: str) -> dict:
+    current = int(_embedded_json(prompt).get("current_target") or 8000)
+    action = rng.choice(["raise", "lower", "keep"])
+    idx = _VALID_TARGETS.index(current) if current in _VALID_TARGETS else 3
+    if action == "raise":
+        idx = min(idx + 1, len(_VALID_TARGETS) - 1)
+    elif action == "lower":
+        idx = max(idx - 1, 0)
+    return {
+        "action":           action,
+        "suggested_target": _VALID_TARGETS[idx],
+        "reason":           f"Based on your last 30 days against a {current:,} step target.",
+        "confidence":       rng.choice(["high", "medium", "low"]),
+    }
+
+
+_BUILDERS = {
+    "insight":      _insight,
+    "coach":        _coach,
+    "body_insight": _body_insight,
+    "habit_picks":  _habit_picks,
+    "step_goal":    _step_goal,
+}
+
+
+def _note_usage(prompt: str, raw: str) -> None:
+    """Rough token estimate (~4 chars/token) so ai_calls accounting works in load tests."""
+    note_usage(model="fake", input_tokens=len(prompt) // 4, output_tokens=len(raw) // 4)
+
+
+# ── public API ────────────────────────────────────────────────────────────────
+
+async def fake_complete(feature: str, prompt: str) -> str:
+    """Return the raw JSON string a real provider would, after simulated latency."""
+    rng = _rng(feature, prompt)
+    await asyncio.sleep(_latency_s(rng))
+    if rng.random() < settings.AI_FAKE_ERROR_RATE:
+        raise FakeProviderError(f"injected fake provider error ({feature})")
+    raw = json.dumps(_BUILDERS[feature](rng, prompt))
+    _note_usage(prompt, raw)
+    return raw
+
+
+async def fake_stream(feature: str, prompt: str, chunk_chars: int = 24):
+    """Streaming variant — yields the same JSON in small chunks spread over the latency."""
+    rng = _rng(feature, prompt)
+    total = _latency_s(rng)
+    fail = rng.random() < settings.AI_FAKE_ERROR_RATE
+    raw = json.dumps(_BUILDERS[feature](rng, prompt))
+    chunks = [raw[i:i + chunk_chars] for i in range(0, len(raw), chunk_chars)]
+    for n, chunk in enumerate(chunks):
+        await asyncio.sleep(total / len(chunks))
+        if fail and n == len(chunks) // 2:
+            raise FakeProviderError(f"injected fake provider error mid-stream ({feature})")
+        yield chunk
+    _note_usage(prompt, raw)
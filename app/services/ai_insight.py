@@ -27,7 +27,7 @@ Cache:
   Re-uses cached result on repeat calls; regenerates the next calendar day.
 
 Provider:
-  Controlled by AI_PROVIDER env var: "anthropic" (default) | "azure"
+  Controlled by AI_PROVIDER env var: "anthropic" (default) | "azure" | "fake"
 """
 import logging
 import json
@@ -39,6 +39,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.models import AiInsight
+from app.services.ai_calls import ai_call, mark_fallback, note_usage, record_cache_hit
+from app.services import habit_pack_ranks
 from app.services.habits_service import get_streak as _get_habit_streak
 
 logger = logging.getLogger(__name__)
@@ -91,6 +93,7 @@ async def get_home_insight(db: AsyncSession, user_id: str) -> dict | None:
     )
     row = cached.scalar_one_or_none()
     if row:
+        record_cache_hit("insight", row.provider)
         return {
             "badge":    row.badge,
             "segments": row.segments,
@@ -219,14 +222,15 @@ async def _collect_stats(db: AsyncSession, user_id: str) -> dict:
     habit_row = await db.execute(text("""
         SELECT
             COUNT(DISTINCT hcm.id) AS total_habits,
-            COALESCE(SUM(CASE WHEN dl.logged_date = :yesterday AND dl.completed THEN 1 ELSE 0 END), 0) AS done_yesterday,
-            COALESCE(SUM(CASE WHEN dl.logged_date >= :week_start AND dl.completed THEN 1 ELSE 0 END), 0) AS done_week,
+            COALESCE((SELECT SUM(r.done) FROM habit_day_rollup r
+                      WHERE r.challenge_id = hc.id AND r.day = :yesterday), 0)   AS done_yesterday,
+            COALESCE((SELECT SUM(r.done) FROM habit_day_rollup r
+                      WHERE r.challenge_id = hc.id AND r.day >= :week_start), 0) AS done_week,
             hc.id AS challenge_id,
             hc.started_at,
             hc.ends_at
         FROM habit_challenges hc
         JOIN habit_commitments hcm ON hcm.challenge_id = hc.id
-        LEFT JOIN daily_logs dl ON dl.commitment_id = hcm.id
         WHERE hc.user_id = :uid AND hc.status = 'active'
         GROUP BY hc.id
         LIMIT 1
@@ -274,70 +278,12 @@ async def _collect_stats(db: AsyncSession, user_id: str) -> dict:
     habit_total_participants = None
     if habit_challenge_id:
         try:
-            hrank_row = await db.execute(text("""
-                WITH my_challenge AS (
-                    SELECT hc.id, hc.pack_id, COUNT(DISTINCT hcm.id) AS total_habits
-                    FROM habit_challenges hc
-                    JOIN habit_commitments hcm ON hcm.challenge_id = hc.id
-                    WHERE hc.id = :cid
-                    GROUP BY hc.id
-                ),
-                pack_challenges AS (
-                    SELECT hc.user_id, hc.id AS challenge_id,
-                           COUNT(DISTINCT hcm.id) AS total_habits
-                    FROM habit_challenges hc
-                    JOIN habit_commitments hcm ON hcm.challenge_id = hc.id
-                    JOIN my_challenge mc ON hc.pack_id = mc.pack_id
-                    WHERE hc.status = 'active'
-                    GROUP BY hc.user_id, hc.id
-                ),
-                daily_counts AS (
-                    SELECT hcm.challenge_id, dl.logged_date,
-                           COUNT(*) FILTER (WHERE dl.completed) AS done
-                    FROM daily_logs dl
-                    JOIN habit_commitments hcm ON hcm.id = dl.commitment_id
-                    GROUP BY hcm.challenge_id, dl.logged_date
-                ),
-                user_scores AS (
-                    SELECT pc.user_id,
-                           COUNT(DISTINCT CASE
-                               WHEN dc.done >= GREATEST(1, CEIL(pc.total_habits::numeric / 2))
-                               THEN dc.logged_date END) AS good_days
-                    FROM pack_challenges pc
-                    LEFT JOIN daily_counts dc ON dc.challenge_id = pc.challenge_id
-                    GROUP BY pc.user_id
-                ),
-                daily_counts_yest AS (
-                    SELECT hcm.challenge_id, dl.logged_date,
-                           COUNT(*) FILTER (WHERE dl.completed) AS done
-                    FROM daily_logs dl
-                    JOIN habit_commitments hcm ON hcm.id = dl.commitment_id
-                    WHERE dl.logged_date < :today
-                    GROUP BY hcm.challenge_id, dl.logged_date
-                ),
-                user_scores_yest AS (
-                    SELECT pc.user_id,
-                           COUNT(DISTINCT CASE
-                               WHEN dc.done >= GREATEST(1, CEIL(pc.total_habits::numeric / 2))
-                               THEN dc.logged_date END) AS good_days
-                    FROM pack_challenges pc
-                    LEFT JOIN daily_counts_yest dc ON dc.challenge_id = pc.challenge_id
-                    GROUP BY pc.user_id
-                ),
-                ranked      AS (SELECT user_id, ROW_NUMBER() OVER (ORDER BY good_days DESC, user_id ASC) AS rnk FROM user_scores),
-                ranked_yest AS (SELECT user_id, ROW_NUMBER() OVER (ORDER BY good_days DESC, user_id ASC) AS rnk FROM user_scores_yest)
-                SELECT
-                    (SELECT rnk FROM ranked      WHERE user_id = :uid) AS habit_rank,
-                    (SELECT rnk FROM ranked_yest WHERE user_id = :uid) AS habit_rank_yesterday,
-                    (SELECT COUNT(*) FROM user_scores)                  AS total_participants,
-                    (SELECT pack_id FROM my_challenge)                  AS pack_id
-            """), {"cid": habit_challenge_id, "uid": str(user_id), "today": today})
-            hr = hrank_row.mappings().first()
-            if hr and hr["pack_id"] and hr["habit_rank"]:
-                habit_rank               = int(hr["habit_rank"])
+            hr = await habit_pack_ranks.get_rank(db, habit_challenge_id)
+            if hr and hr["rank"]:
+                habit_rank               = int(hr["rank"])
                 habit_total_participants = int(hr["total_participants"] or 0)
-                if hr["habit_rank_yesterday"]:
-                    habit_rank_change = int(hr["habit_rank_yesterday"]) - habit_rank
+                if hr["rank_yesterday"]:
+                    habit_rank_change = int(hr["rank_yesterday"]) - habit_rank
         except Exception:
             pass
     steps_vs_target_pct = round(
@@ -369,17 +315,11 @@ async def _collect_stats(db: AsyncSession, user_id: str) -> dict:
     best = best_row.mappings().first()
 
     perfect_days_row = await db.execute(text("""
-        SELECT COUNT(*) AS perfect_days
-        FROM (
-            SELECT dl.logged_date
-            FROM habit_challenges hc
-            JOIN habit_commitments hcm ON hcm.challenge_id = hc.id
-            JOIN daily_logs dl ON dl.commitment_id = hcm.id
-            WHERE hc.user_id = :uid AND hc.status = 'active'
-              AND dl.logged_date >= :week_start AND dl.completed
-            GROUP BY dl.logged_date
-            HAVING COUNT(*) >= :total_habits
-        ) t
+        SELECT COUNT(DISTINCT r.day) AS perfect_days
+        FROM habit_challenges hc
+        JOIN habit_day_rollup r ON r.challenge_id = hc.id
+        WHERE hc.user_id = :uid AND hc.status = 'active'
+          AND r.day >= :week_start AND r.done >= :total_habits
     """), {"uid": str(user_id), "week_start": week_start, "total_habits": max(total, 1)})
     perfect_days = int(perfect_days_row.scalar() or 0)
 
@@ -728,6 +668,7 @@ def _parse_response(raw: str, stats: dict) -> dict:
         }
     except (json.JSONDecodeError, TypeError) as e:
         logger.error(f"AI insight parse error: {e} — raw={raw!r}")
+        mark_fallback()
         return _fallback(stats)
 
 
@@ -736,19 +677,23 @@ def _parse_response(raw: str, stats: dict) -> dict:
 async def _call_provider(stats: dict, provider: str) -> dict:
     if provider == "azure":
         return await _ask_azure(stats)
+    if provider == "fake":
+        return await _ask_fake(stats)
     return await _ask_claude(stats)
 
 
 async def _ask_claude(stats: dict) -> dict:
     try:
         client = _get_anthropic()
-        async with client.messages.stream(
-            model="claude-opus-4-6",
-            max_tokens=1024,
-            system=_SYSTEM,
-            messages=[{"role": "user", "content": _build_user_message(stats)}],
-        ) as stream:
-            message = await stream.get_final_message()
+        async with ai_call("insight", "anthropic", "claude-opus-4-6"):
+            async with client.messages.stream(
+                model="claude-opus-4-6",
+                max_tokens=1024,
+                system=_SYSTEM,
+                messages=[{"role": "user", "content": _build_user_message(stats)}],
+            ) as stream:
+                message = await stream.get_final_message()
+            note_usage(message)
 
         raw = next((b.text for b in message.content if b.type == "text"), "{}")
         return _parse_response(raw, stats)
@@ -761,15 +706,17 @@ async def _ask_claude(stats: dict) -> dict:
 async def _ask_azure(stats: dict) -> dict:
     try:
         client = _get_azure()
-        response = await client.chat.completions.create(
-            model=settings.AZURE_OPENAI_DEPLOYMENT,
-            messages=[
-                {"role": "system", "content": _SYSTEM + "\nRespond in valid JSON."},
-                {"role": "user",   "content": _build_user_message(stats)},
-            ],
-            max_completion_tokens=1024,
-            response_format={"type": "json_object"},
-        )
+        async with ai_call("insight", "azure", settings.AZURE_OPENAI_DEPLOYMENT):
+            response = await client.chat.completions.create(
+                model=settings.AZURE_OPENAI_DEPLOYMENT,
+                messages=[
+                    {"role": "system", "content": _SYSTEM + "\nRespond in valid JSON."},
+                    {"role": "user",   "content": _build_user_message(stats)},
+                ],
+                max_completion_tokens=1024,
+                response_format={"type": "json_object"},
+            )
+            note_usage(response)
         raw = response.choices[0].message.content or "{}"
         return _parse_response(raw, stats)
 
@@ -778,6 +725,18 @@ async def _ask_azure(stats: dict) -> dict:
         return _fallback(stats)
 
 
+async def _ask_fake(stats: dict) -> dict:
+    from app.services.ai_fake import fake_complete
+    try:
+        async with ai_call("insight", "fake", "fake"):
+            raw = await fake_complete("insight", _build_user_message(stats))
+        return _parse_response(raw, stats)
+
+    except Exception as e:
+        logger.error(f"Fake insight error: {e}")
+        return _fallback(stats)
+
+
 # ── fallback ──────────────────────────────────────────────────────────────────
 
 def _fallback(stats: dict) -> dict:
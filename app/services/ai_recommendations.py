@@ -14,19 +14,27 @@ AI Recommendations service — three independent on-demand AI features:
      Output: { action: "raise"|"lower"|"keep", suggested_target, reason, confidence }
 
 All three:
-  - Cache result in ai_recommendations table for 7 days
+  - Cache result in ai_recommendations table for 7 days; once expired the old
+    result is still served with "stale": true while a deduplicated background
+    refresh regenerates it (stale-while-revalidate)
   - Fall back to rule-based output if AI call fails
-  - Use AI_PROVIDER env var (azure / anthropic)
+  - Use AI_PROVIDER env var (azure / anthropic / fake)
+
+body_insight is also regenerated off the request path after every scan save —
+see schedule_body_insight() / get_body_insight_status().
 """
+import asyncio
 import json
 import logging
 from datetime import datetime, date, timedelta, timezone
 
-from sqlalchemy import select, text
+from sqlalchemy import delete, select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.models import AiRecommendation
+from app.services.ai_calls import ai_call, mark_fallback, note_usage, record_cache_hit
+from app.services.background_refresh import refresh_in_background
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +45,11 @@ _VALID_TARGETS = [3000, 5000, 7500, 8000, 9000, 10000]
 # ── cache helpers ─────────────────────────────────────────────────────────────
 
 async def _get_cached(db: AsyncSession, user_id: str, rec_type: str) -> dict | None:
+    """
+    Latest cached result of this type, or None if there is none.
+    Results older than _CACHE_DAYS are still returned, flagged "stale": True —
+    callers serve them and kick off _refresh_stale().
+    """
     row = await db.execute(
         select(AiRecommendation)
         .where(
@@ -47,11 +60,18 @@ async def _get_cached(db: AsyncSession, user_id: str, rec_type: str) -> dict | N
         .limit(1)
     )
     rec = row.scalar_one_or_none()
-    if rec and (datetime.now(timezone.utc) - rec.created_at).days < _CACHE_DAYS:
-        return {**rec.payload, "generated_at": rec.created_at.isoformat(), "cached": True}
+    if rec:
+        record_cache_hit(rec_type, rec.provider)
+        stale = (datetime.now(timezone.utc) - rec.created_at).days >= _CACHE_DAYS
+        return {**rec.payload, "generated_at": rec.created_at.isoformat(), "cached": True, "stale": stale}
     return None
 
 
+def _refresh_stale(user_id: str, rec_type: str, generate) -> None:
+    """Regenerate an expired recommendation in the background (one refresh per user+type)."""
+    refresh_in_background(f"rec:{rec_type}:{user_id}", generate)
+
+
 async def _save(db: AsyncSession, user_id: str, rec_type: str,
                 payload: dict, stats: dict) -> None:
     try:
@@ -70,10 +90,18 @@ async def _save(db: AsyncSession, user_id: str, rec_type: str,
 
 # ── shared AI call ────────────────────────────────────────────────────────────
 
-async def _ask_ai(system: str, user_msg: str) -> str:
-    """Returns raw JSON string from whichever provider is configured."""
+async def _ask_ai(system: str, user_msg: str, feature: str) -> str:
+    """
+    Returns raw JSON string from whichever provider is configured.
+    feature = recommendation type ("body_insight" | "habit_picks" | "step_goal").
+    """
     provider = settings.AI_PROVIDER.lower()
 
+    if provider == "fake":
+        from app.services.ai_fake import fake_complete
+        async with ai_call(feature, "fake", "fake"):
+            return await fake_complete(feature, user_msg)
+
     if provider == "azure":
         from openai import AsyncAzureOpenAI
         client = AsyncAzureOpenAI(
@@ -81,15 +109,17 @@ async def _ask_ai(system: str, user_msg: str) -> str:
             api_key=settings.AZURE_OPENAI_API_KEY,
             api_version=settings.AZURE_OPENAI_API_VERSION,
         )
-        response = await client.chat.completions.create(
-            model=settings.AZURE_OPENAI_DEPLOYMENT,
-            messages=[
-                {"role": "system", "content": system + "\nRespond in valid JSON."},
-                {"role": "user",   "content": user_msg},
-            ],
-            max_completion_tokens=3000,
-            response_format={"type": "json_object"},
-        )
+        async with ai_call(feature, "azure", settings.AZURE_OPENAI_DEPLOYMENT):
+            response = await client.chat.completions.create(
+                model=settings.AZURE_OPENAI_DEPLOYMENT,
+                messages=[
+                    {"role": "system", "content": system + "\nRespond in valid JSON."},
+                    {"role": "user",   "content": user_msg},
+                ],
+                max_completion_tokens=3000,
+                response_format={"type": "json_object"},
+            )
+            note_usage(response)
         finish_reason = response.choices[0].finish_reason
         if finish_reason == "length":
             logger.warning("_ask_ai: Azure response truncated (finish_reason=length) — increase max_completion_tokens")
@@ -99,13 +129,15 @@ async def _ask_ai(system: str, user_msg: str) -> str:
         import anthropic
         from anthropic import AsyncAnthropic
         client = AsyncAnthropic()
-        async with client.messages.stream(
-            model="claude-opus-4-6",
-            max_tokens=3000,
-            system=system,
-            messages=[{"role": "user", "content": user_msg}],
-        ) as stream:
-            message = await stream.get_final_message()
+        async with ai_call(feature, "anthropic", "claude-opus-4-6"):
+            async with client.messages.stream(
+                model="claude-opus-4-6",
+                max_tokens=3000,
+                system=system,
+                messages=[{"role": "user", "content": user_msg}],
+            ) as stream:
+                message = await stream.get_final_message()
+            note_usage(message)
         return next((b.text for b in message.content if b.type == "text"), "{}")
 
 
@@ -696,8 +728,14 @@ def _build_body_user_msg(stats: dict) -> str:
 async def get_body_insight(db: AsyncSession, user_id: str) -> dict | None:
     cached = await _get_cached(db, user_id, "body_insight")
     if cached:
+        if cached["stale"]:
+            _refresh_stale(user_id, "body_insight",
+                           lambda session: generate_body_insight(session, user_id))
         return cached
+    return await generate_body_insight(db, user_id)
 
+
+async def generate_body_insight(db: AsyncSession, user_id: str) -> dict | None:
     stats = await _collect_body_stats(db, user_id)
     if stats is None:
         return None
@@ -706,6 +744,7 @@ async def get_body_insight(db: AsyncSession, user_id: str) -> dict | None:
         raw = await _ask_ai(
             _BODY_SYSTEM,
             _build_body_user_msg(stats),
+            "body_insight",
         )
         data = json.loads(raw)
 
@@ -815,17 +854,97 @@ async def get_body_insight(db: AsyncSession, user_id: str) -> dict | None:
         # Guard: if AI returned empty content, don't cache bad data
         if not payload["headline"] or not highlights:
             logger.warning(f"Body insight AI returned empty output for user {user_id} — raw: {data}")
+            mark_fallback()
             return _fallback_body(stats)  # return but do NOT save to cache
 
     except json.JSONDecodeError as e:
         logger.error(f"Body insight JSON parse error for user {user_id}: {e}")
+        mark_fallback()
         return _fallback_body(stats)
     except Exception as e:
         logger.error(f"Body insight AI error for user {user_id}: {e}", exc_info=True)
+        mark_fallback()
         return _fallback_body(stats)
 
     await _save(db, user_id, "body_insight", payload, stats)
-    return {**payload, "generated_at": datetime.now(timezone.utc).isoformat(), "cached": False}
+    return {**payload, "generated_at": datetime.now(timezone.utc).isoformat(), "cached": False, "stale": False}
+
+
+# ── background regeneration after a scan save ────────────────────────────────
+# One in-flight job per user. Saves that land while a job is waiting or running
+# only mark the user dirty, so a burst of saves coalesces into one generation
+# (plus at most one re-run if new data arrived mid-generation).
+
+_BODY_DEBOUNCE_SECONDS = 2.0
+
+_body_jobs:   dict[str, asyncio.Task] = {}
+_body_dirty:  set[str]                = set()
+_body_status: dict[str, dict]         = {}
+
+
+def get_body_insight_status(user_id: str) -> dict | None:
+    """Return {"status": "pending"|"running", "since": iso} while a job is in flight, else None."""
+    task = _body_jobs.get(user_id)
+    if task is None or task.done():
+        return None
+    return _body_status.get(user_id)
+
+
+def schedule_body_insight(user_id: str) -> dict:
+    """
+    Queue a background body_insight regeneration for the user and return its status.
+    Safe to call on every save — concurrent calls coalesce into the same job.
+    """
+    task = _body_jobs.get(user_id)
+    if task is not None and not task.done():
+        _body_dirty.add(user_id)
+        return _body_status[user_id]
+
+    _body_status[user_id] = {"status": "pending", "since": datetime.now(timezone.utc).isoformat()}
+    _body_jobs[user_id] = asyncio.create_task(_run_body_insight_job(user_id))
+    return _body_status[user_id]
+
+
+async def _run_body_insight_job(user_id: str) -> None:
+    from app.db.session import AsyncSessionLocal
+    try:
+        while True:
+            await asyncio.sleep(_BODY_DEBOUNCE_SECONDS)
+            _body_dirty.discard(user_id)
+            _body_status[user_id] = {"status": "running", "since": datetime.now(timezone.utc).isoformat()}
+
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    delete(AiRecommendation).where(
+                        AiRecommendation.user_id == user_id,
+                        AiRecommendation.type == "body_insight",
+                    )
+                )
+                await db.commit()
+
+                result = await generate_body_insight(db, user_id)
+
+                if user_id not in _body_dirty:
+                    # Tell an open app session the insight is ready (no-op if nobody is listening)
+                    await db.execute(
+                        text("SELECT pg_notify(:ch, :payload)"),
+                        {"ch": f"user_{user_id}", "payload": json.dumps({
+                            "type":     "body_insight_ready",
+                            "fallback": not (result and "generated_at" in result),
+                        })},
+                    )
+                    await db.commit()
+
+            # A newer scan arrived while we were generating — run once more.
+            # No await between this check and the finally block, so no save can slip through.
+            if user_id not in _body_dirty:
+                break
+    except Exception as e:
+        logger.error(f"Body insight background job error for user {user_id}: {e}", exc_info=True)
+    finally:
+        _body_jobs.pop(user_id, None)
+        _body_status.pop(user_id, None)
+        _body_dirty.discard(user_id)
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -956,14 +1075,30 @@ def _fallback_habits(stats: dict) -> dict:
 async def get_habit_recommendations(db: AsyncSession, user_id: str, user: object) -> dict:
     cached = await _get_cached(db, user_id, "habit_picks")
     if cached:
+        if cached["stale"]:
+            _refresh_stale(user_id, "habit_picks",
+                           lambda session: _generate_habit_recommendations_for(session, user_id))
         return cached
+    return await generate_habit_recommendations(db, user_id, user)
+
+
+async def _generate_habit_recommendations_for(db: AsyncSession, user_id: str) -> dict | None:
+    """Background variant — re-loads the User in the refresh session."""
+    from app.models import User
+    user = (await db.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
+    if user is None:
+        return None
+    return await generate_habit_recommendations(db, user_id, user)
+
 
+async def generate_habit_recommendations(db: AsyncSession, user_id: str, user: object) -> dict:
     stats = await _collect_habit_stats(db, user_id, user)
 
     try:
         raw = await _ask_ai(
             _HABIT_SYSTEM,
-            f"User data:\n{json.dumps(stats, indent=2)}\n\nPick the best 3 habits."
+            f"User data:\n{json.dumps(stats, indent=2)}\n\nPick the best 3 habits.",
+            "habit_picks",
         )
         data = json.loads(raw)
         picks = []
@@ -983,10 +1118,11 @@ async def get_habit_recommendations(db: AsyncSession, user_id: str, user: object
         }
     except Exception as e:
         logger.error(f"Habit recommendation AI error for user {user_id}: {e}")
+        mark_fallback()
         payload = _fallback_habits(stats)
 
     await _save(db, user_id, "habit_picks", payload, stats)
-    return {**payload, "generated_at": datetime.now(timezone.utc).isoformat(), "cached": False}
+    return {**payload, "generated_at": datetime.now(timezone.utc).isoformat(), "cached": False, "stale": False}
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -1106,14 +1242,21 @@ def _fallback_goal(stats: dict) -> dict:
 async def get_step_goal_suggestion(db: AsyncSession, user_id: str) -> dict:
     cached = await _get_cached(db, user_id, "step_goal")
     if cached:
+        if cached["stale"]:
+            _refresh_stale(user_id, "step_goal",
+                           lambda session: generate_step_goal_suggestion(session, user_id))
         return cached
+    return await generate_step_goal_suggestion(db, user_id)
 
+
+async def generate_step_goal_suggestion(db: AsyncSession, user_id: str) -> dict:
     stats = await _collect_goal_stats(db, user_id)
 
     try:
         raw = await _ask_ai(
             _GOAL_SYSTEM,
-            f"Step data:\n{json.dumps(stats, indent=2)}\n\nGenerate the goal recommendation JSON."
+            f"Step data:\n{json.dumps(stats, indent=2)}\n\nGenerate the goal recommendation JSON.",
+            "step_goal",
         )
         data = json.loads(raw)
         suggested = int(data.get("suggested_target", stats["current_target"]))
@@ -1129,7 +1272,68 @@ async def get_step_goal_suggestion(db: AsyncSession, user_id: str) -> dict:
         }
     except Exception as e:
         logger.error(f"Step goal AI error for user {user_id}: {e}")
+        mark_fallback()
         payload = {**_fallback_goal(stats), "current_target": stats["current_target"]}
 
     await _save(db, user_id, "step_goal", payload, stats)
-    return {**payload, "generated_at": datetime.now(timezone.utc).isoformat(), "cached": False}
+    return {**payload, "generated_at": datetime.now(timezone.utc).isoformat(), "cached": False, "stale": False}
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# NIGHTLY PRE-WARM
+# ══════════════════════════════════════════════════════════════════════════════
+
+async def prewarm_expiring_recommendations(db: AsyncSession) -> int:
+    """
+    Nightly job — regenerate recommendations for active users whose latest row
+    (per type) expires within the next 24 hours. Mirrors ai_coach's pre-warm.
+    "Active" = steps logged in the last 7 days or an active habit challenge.
+    Returns count of recommendations generated.
+    """
+    from app.models import User
+
+    now = datetime.now(timezone.utc)
+    rows = await db.execute(text("""
+        SELECT latest.user_id, latest.type
+        FROM (
+            SELECT DISTINCT ON (user_id, type) user_id, type, created_at
+            FROM ai_recommendations
+            ORDER BY user_id, type, created_at DESC
+        ) latest
+        WHERE latest.created_at >  :expired_before
+          AND latest.created_at <= :expires_soon
+          AND (
+              EXISTS (SELECT 1 FROM daily_steps ds
+                      WHERE ds.user_id = latest.user_id AND ds.day >= :since)
+           OR EXISTS (SELECT 1 FROM habit_challenges hc
+                      WHERE hc.user_id = latest.user_id AND hc.status = 'active')
+          )
+    """), {
+        "expired_before": now - timedelta(days=_CACHE_DAYS),
+        "expires_soon":   now - timedelta(days=_CACHE_DAYS - 1),
+        "since":          date.today() - timedelta(days=6),
+    })
+    due = [(str(r[0]), r[1]) for r in rows.all()]
+    logger.info(f"Recommendation pre-warm: {len(due)} rows expiring in the next 24h")
+
+    generated = 0
+    for uid, rec_type in due:
+        try:
+            if rec_type == "body_insight":
+                await generate_body_insight(db, uid)
+            elif rec_type == "step_goal":
+                await generate_step_goal_suggestion(db, uid)
+            elif rec_type == "habit_picks":
+                user = (await db.execute(select(User).where(User.id == uid))).scalar_one_or_none()
+                if user is None:
+                    continue
+                await generate_habit_recommendations(db, uid, user)
+            else:
+                continue
+            generated += 1
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"[rec pre-warm] {uid} {rec_type}: {e}", exc_info=True)
+
+    logger.info(f"Recommendation pre-warm: generated {generated} recommendations")
+    return generated
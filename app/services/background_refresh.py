@@ -0,0 +1,49 @@
+"""
+Deduplicated background refresh for cached AI output (stale-while-revalidate).
+
+The coach report and ai_recommendations getters serve an expired cache row
+immediately and hand regeneration to refresh_in_background(). Each refresh
+runs in its own DB session; a second request for the same key while a refresh
+is in flight is a no-op, so a burst of page loads costs one AI call.
+
+Keys are plain strings, e.g. "coach:<user_id>" or "rec:step_goal:<user_id>".
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# key → running refresh task (process-local; the API runs a single worker)
+_inflight: dict[str, asyncio.Task] = {}
+
+
+def is_refreshing(key: str) -> bool:
+    task = _inflight.get(key)
+    return task is not None and not task.done()
+
+
+def refresh_in_background(key: str, generate: Callable[[AsyncSession], Awaitable[object]]) -> bool:
+    """
+    Start `generate(db)` in the background unless a refresh for `key` is already running.
+    Returns True if a new refresh was started.
+    """
+    if is_refreshing(key):
+        return False
+    _inflight[key] = asyncio.create_task(_run(key, generate))
+    return True
+
+
+async def _run(key: str, generate: Callable[[AsyncSession], Awaitable[object]]) -> None:
+    try:
+        async with AsyncSessionLocal() as db:
+            await generate(db)
+        logger.info(f"[refresh] {key}: done")
+    except Exception as e:
+        logger.error(f"[refresh] {key}: failed — {e}", exc_info=True)
+    finally:
+        _inflight.pop(key, None)
@@ -14,6 +14,7 @@ from app.models import (
     Team,
     Department
 )
+from app.services import ref_cache
 from app.schemas.challenges import (
     ChallengeCreateRequest,
     ChallengeUpdateRequest,
@@ -85,6 +86,7 @@ class ChallengesService:
                 db.add(challenge_dept)
         
         await db.commit()
+        ref_cache.invalidate("challenges")  # don't wait for this worker's NOTIFY
         await db.refresh(new_challenge)
         
         return await ChallengesService.get_challenge_detail(db, str(new_challenge.id))
@@ -96,10 +98,8 @@ class ChallengesService:
     ) -> ChallengeDetailResponse:
         """Get challenge details with metrics and departments"""
         
-        # Get challenge
-        challenge_stmt = select(Challenge).where(Challenge.id == challenge_id)
-        challenge_result = await db.execute(challenge_stmt)
-        challenge = challenge_result.scalar_one_or_none()
+        # Challenge, metrics and departments — reference data (app/services/ref_cache.py)
+        challenge = await ref_cache.challenge(db, challenge_id)
         
         if not challenge:
             raise HTTPException(
@@ -107,20 +107,6 @@ class ChallengesService:
                 detail="Challenge not found"
             )
         
-        # Get metrics
-        metrics_stmt = select(ChallengeMetrics).where(
-            ChallengeMetrics.challenge_id == challenge_id
-        )
-        metrics_result = await db.execute(metrics_stmt)
-        metrics = metrics_result.scalars().all()
-        
-        # Get departments
-        dept_stmt = select(ChallengeDepartment.department_id).where(
-            ChallengeDepartment.challenge_id == challenge_id
-        )
-        dept_result = await db.execute(dept_stmt)
-        department_ids = [str(dept_id) for dept_id in dept_result.scalars().all()]
-        
         # Get participant count
         participant_stmt = select(func.count(ChallengeParticipant.id)).where(
             and_(
@@ -132,18 +118,18 @@ class ChallengesService:
         participant_count = participant_result.scalar() or 0
         
         return ChallengeDetailResponse(
-            id=str(challenge.id),
-            title=challenge.title,
-            period=challenge.period,
-            scope=challenge.scope,
-            start_date=challenge.start_date,
-            end_date=challenge.end_date,
-            status=challenge.status,
-            min_goals_required=challenge.min_goals_required,
-            created_by=str(challenge.created_by) if challenge.created_by else None,
-            created_at=challenge.created_at,
-            metrics=[ChallengeMetricResponse.model_validate(m) for m in metrics],
-            department_ids=department_ids,
+            id=challenge["id"],
+            title=challenge["title"],
+            period=challenge["period"],
+            scope=challenge["scope"],
+            start_date=challenge["start_date"],
+            end_date=challenge["end_date"],
+            status=challenge["status"],
+            min_goals_required=challenge["min_goals_required"],
+            created_by=challenge["created_by"],
+            created_at=challenge["created_at"],
+            metrics=[ChallengeMetricResponse(**m) for m in challenge["metrics"]],
+            department_ids=list(challenge["department_ids"]),
             participant_count=participant_count
         )
     
@@ -252,6 +238,7 @@ class ChallengesService:
             challenge.min_goals_required = update_data.min_goals_required
         
         await db.commit()
+        ref_cache.invalidate("challenges")  # don't wait for this worker's NOTIFY
         
         return await ChallengesService.get_challenge_detail(db, challenge_id)
     
@@ -1,30 +1,49 @@
 """
 Google Fit daily step sync service.
 
-Called by the scheduler every day at 08:00 IST.
-For every user with a stored refresh_token:
+Called by the scheduler at 08:05, 13:05, 18:05 and 23:05 IST.
+For every user with a stored refresh_token (users processed concurrently):
   1. Refresh the access_token via Google OAuth.
-  2. Fetch today's step count from the Fitness REST API.
-  3. Upsert daily_steps (same logic as POST /api/steps/add).
+  2. Fetch the day's step counts from the Fitness REST API (one request,
+     bucketed by day).
+  3. Upsert daily_steps (same logic as POST /api/steps/add), one transaction
+     per user.
   4. Persist the new access_token + expires_at.
   5. On token-revoked errors, delete the stored row.
+
+backfill_user() does the same for one user over a date range
+(POST /api/googlefit/backfill).
 """
 from __future__ import annotations
 
+import asyncio
 import logging
+import time
 from datetime import date, datetime, timezone, timedelta
+from typing import Awaitable, Callable
 
 import httpx
-from sqlalchemy import select, and_, text
+from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.security import decrypt_token, encrypt_token
 from app.db.session import AsyncSessionLocal
-from app.models import DailySteps, UserGoogleFitToken
+from app.models import UserGoogleFitToken
+from app.services.leaderboard_live import leaderboard_changed
+from app.services.step_streak import update_global_streak_days
 
 logger = logging.getLogger(__name__)
 
+# HTTP/2 needs the h2 package (httpx[http2]); fall back to HTTP/1.1 keep-alive without it
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+_IST = timezone(timedelta(hours=5, minutes=30))
+
 _GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
 _GOOGLE_FIT_AGGREGATE_URL = (
     "https://www.googleapis.com/fitness/v1/users/me/dataset:aggregate"
@@ -62,6 +81,60 @@ async def _refresh_access_token(
 
 # ─── Google Fit step fetch ────────────────────────────────────────────────────
 
+# Days per aggregate request — longer ranges are split (keeps responses small)
+_MAX_RANGE_DAYS = 90
+
+
+def _ist_ms(d: date) -> int:
+    """00:00:00 IST on d, in epoch milliseconds."""
+    return int(datetime(d.year, d.month, d.day, tzinfo=_IST).timestamp() * 1000)
+
+
+async def _fetch_steps_range(
+    client: httpx.AsyncClient,
+    access_token: str,
+    start: date,
+    end: date,
+) -> dict[date, int]:
+    """
+    Fetch daily step totals for every calendar day (IST) from start to end
+    inclusive — one aggregate request bucketed by day (per _MAX_RANGE_DAYS).
+    Returns {day: steps} with an entry (possibly 0) for every day in the range.
+    """
+    steps = {start + timedelta(days=i): 0 for i in range((end - start).days + 1)}
+
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(end, chunk_start + timedelta(days=_MAX_RANGE_DAYS - 1))
+        resp = await client.post(
+            _GOOGLE_FIT_AGGREGATE_URL,
+            headers={"Authorization": f"Bearer {access_token}"},
+            json={
+                "aggregateBy": [{"dataTypeName": "com.google.step_count.delta"}],
+                "bucketByTime": {"durationMillis": 86400000},
+                "startTimeMillis": _ist_ms(chunk_start),
+                "endTimeMillis": _ist_ms(chunk_end + timedelta(days=1)),
+            },
+            timeout=15,
+        )
+        resp.raise_for_status()
+
+        for i, bucket in enumerate(resp.json().get("bucket", [])):
+            if "startTimeMillis" in bucket:
+                day = datetime.fromtimestamp(int(bucket["startTimeMillis"]) / 1000, _IST).date()
+            else:
+                day = chunk_start + timedelta(days=i)
+            if day not in steps:
+                continue
+            for dataset in bucket.get("dataset", []):
+                for point in dataset.get("point", []):
+                    for val in point.get("value", []):
+                        steps[day] += val.get("intVal", 0)
+        chunk_start = chunk_end + timedelta(days=1)
+
+    return steps
+
+
 async def _fetch_steps_for_date(
     client: httpx.AsyncClient,
     access_token: str,
@@ -69,208 +142,297 @@ async def _fetch_steps_for_date(
 ) -> int:
     """
     Fetch total steps for a specific calendar day (IST) from Google Fit.
-    Window: 00:00:00 IST on target_date → 00:00:00 IST on target_date+1
     Returns the sum of all step data points, or 0 if none.
     """
-    _IST = timezone(timedelta(hours=5, minutes=30))
-    start_dt = datetime(target_date.year, target_date.month, target_date.day, 0, 0, 0, tzinfo=_IST)
-    next_day  = target_date + timedelta(days=1)
-    end_dt    = datetime(next_day.year, next_day.month, next_day.day, 0, 0, 0, tzinfo=_IST)
-
-    start_ms = int(start_dt.timestamp() * 1000)
-    end_ms = int(end_dt.timestamp() * 1000)
-
-    resp = await client.post(
-        _GOOGLE_FIT_AGGREGATE_URL,
-        headers={"Authorization": f"Bearer {access_token}"},
-        json={
-            "aggregateBy": [{"dataTypeName": "com.google.step_count.delta"}],
-            "bucketByTime": {"durationMillis": 86400000},
-            "startTimeMillis": start_ms,
-            "endTimeMillis": end_ms,
-        },
-        timeout=15,
-    )
-    resp.raise_for_status()
-
-    total = 0
-    for bucket in resp.json().get("bucket", []):
-        for dataset in bucket.get("dataset", []):
-            for point in dataset.get("point", []):
-                for val in point.get("value", []):
-                    total += val.get("intVal", 0)
-    return total
+    return (await _fetch_steps_range(client, access_token, target_date, target_date))[target_date]
 
 
 # ─── Steps upsert (mirrors POST /api/steps/add logic) ────────────────────────
 
-async def _upsert_steps(db: AsyncSession, user_id: str, steps: int, target_date: date | None = None) -> None:
+_UPSERT_DAYS_SQL = """
+    INSERT INTO daily_steps (user_id, day, steps)
+    SELECT CAST(:uid AS uuid), d.day, d.steps
+    FROM unnest(CAST(:days AS date[]), CAST(:steps AS int[])) AS d(day, steps)
+    ON CONFLICT (user_id, day) DO UPDATE
+        SET steps = EXCLUDED.steps, updated_at = now()
+"""
+
+async def _upsert_steps_bulk(db: AsyncSession, user_id: str, steps_by_day: dict[date, int]) -> list[date]:
     """
-    Insert or update daily_steps for the given date (defaults to today), then recalculate challenge streaks.
-    Mirrors the core logic of the add_steps API endpoint.
+    Write several days of steps for one user in one transaction: upsert the
+    changed days, snapshot ranks and recalculate challenge streaks for the
+    challenges those days fall in, update the global streak, commit.
+    Days with 0 steps are skipped (a sync never erases logged steps).
+    Returns the days that changed.
     """
-    from app.api.steps import calculate_challenge_streak  # local import to avoid circular deps
+    from app.api.steps import affected_challenges, calculate_challenge_streak, snapshot_ranks  # local import to avoid circular deps
 
-    today = target_date or date.today()
+    wanted = {d: s for d, s in steps_by_day.items() if s > 0}
+    if not wanted:
+        return []
 
-    result = await db.execute(
-        select(DailySteps).where(
-            and_(DailySteps.user_id == user_id, DailySteps.day == today)
-        )
-    )
-    daily_steps = result.scalar_one_or_none()
-
-    if daily_steps:
-        if daily_steps.steps == steps:
-            return  # nothing changed, skip streak recalc
-        daily_steps.steps = steps
-    else:
-        daily_steps = DailySteps(user_id=user_id, day=today, steps=steps)
-        db.add(daily_steps)
-
-    # Snapshot ranks for active challenges covering today
-    challenges_result = await db.execute(
-        text("""
-            SELECT DISTINCT c.id, c.start_date, LEAST(c.end_date, :today) AS end_cap
-            FROM challenges c
-            JOIN challenge_participants cp ON cp.challenge_id = c.id
-            WHERE cp.user_id = :user_id
-              AND cp.left_at IS NULL
-              AND :today BETWEEN c.start_date AND c.end_date
-        """),
-        {"user_id": user_id, "today": today},
-    )
-    active_challenges = challenges_result.mappings().all()
+    existing = dict((await db.execute(
+        text("SELECT day, steps FROM daily_steps WHERE user_id = :uid AND day = ANY(CAST(:days AS date[]))"),
+        {"uid": user_id, "days": list(wanted)},
+    )).all())
+    changed = sorted(d for d, s in wanted.items() if existing.get(d) != s)
+    if not changed:
+        return []  # nothing changed, skip streak recalc
 
-    for ch in active_challenges:
-        challenge_id = str(ch["id"])
-        rank_row = await db.execute(
-            text("""
-                WITH totals AS (
-                    SELECT cp.user_id,
-                           COALESCE(SUM(ds.steps), 0) AS total_steps
-                    FROM challenge_participants cp
-                    LEFT JOIN daily_steps ds
-                        ON ds.user_id = cp.user_id
-                        AND ds.day >= :start AND ds.day <= :end_cap
-                    WHERE cp.challenge_id = :cid AND cp.left_at IS NULL
-                    GROUP BY cp.user_id
-                )
-                SELECT ROW_NUMBER() OVER (ORDER BY total_steps DESC) AS live_rank
-                FROM totals WHERE user_id = :uid
-            """),
-            {
-                "cid": challenge_id,
-                "start": ch["start_date"],
-                "end_cap": ch["end_cap"],
-                "uid": user_id,
-            },
-        )
-        rr = rank_row.mappings().first()
-        if rr and rr["live_rank"]:
-            await db.execute(
-                text("""
-                    UPDATE challenge_participants
-                    SET previous_rank = :rank
-                    WHERE challenge_id = :cid AND user_id = :uid
-                """),
-                {"rank": int(rr["live_rank"]), "cid": challenge_id, "uid": user_id},
-            )
+    active_challenges = await affected_challenges(db, user_id, changed)
+    await snapshot_ranks(db, user_id, active_challenges)
 
-    await db.commit()
-    await db.refresh(daily_steps)
+    await db.execute(text(_UPSERT_DAYS_SQL), {
+        "uid": user_id, "days": changed, "steps": [wanted[d] for d in changed],
+    })
+
+    await update_global_streak_days(db, user_id, {d: (existing.get(d, 0), wanted[d]) for d in changed})
 
     for ch in active_challenges:
         await calculate_challenge_streak(
             user_id=user_id,
             challenge_id=str(ch["id"]),
             db=db,
+            commit=False,
         )
 
+    await db.commit()
+    leaderboard_changed(ch["id"] for ch in active_challenges)
+    return changed
+
+
+async def _upsert_steps(db: AsyncSession, user_id: str, steps: int, target_date: date | None = None) -> None:
+    """
+    Insert or update daily_steps for the given date (defaults to today), then recalculate
+    challenge streaks and the user's global streak.
+    Mirrors the core logic of the add_steps API endpoint.
+    """
+    await _upsert_steps_bulk(db, user_id, {target_date or date.today(): steps})
+
+
+# ─── User-triggered backfill ─────────────────────────────────────────────────
+
+class GoogleFitRevoked(Exception):
+    """Google rejected the stored refresh_token — the user has to reconnect."""
+
+
+async def backfill_user(db: AsyncSession, token_row: UserGoogleFitToken, start: date, end: date) -> dict:
+    """
+    Fetch start..end from Google Fit for one user and write it in one
+    transaction, together with the refreshed access_token.
+    Returns {"days_fetched", "days_saved", "steps": {day: steps}}.
+    Raises GoogleFitRevoked (after deleting the stored row) on 400/401 from
+    Google; other HTTP errors propagate as httpx errors.
+    """
+    user_id = str(token_row.user_id)
+    try:
+        async with _http_client() as client:
+            access_token, expires_at = await _refresh_access_token(client, decrypt_token(token_row.refresh_token))
+            steps = await _fetch_steps_range(client, access_token, start, end)
+    except httpx.HTTPStatusError as exc:
+        if exc.response.status_code in (400, 401):
+            logger.warning(f"Google Fit backfill: token revoked for user={user_id}, removing stored tokens")
+            await db.delete(token_row)
+            await db.commit()
+            raise GoogleFitRevoked() from exc
+        raise
+
+    token_row.access_token = encrypt_token(access_token)
+    token_row.expires_at = expires_at
+    token_row.updated_at = datetime.now(timezone.utc)
+    changed = await _upsert_steps_bulk(db, user_id, steps)
+    if not changed:
+        await db.commit()  # still persist the refreshed token
+
+    logger.info(f"Google Fit backfill: user={user_id} {start}..{end} saved {len(changed)} day(s)")
+    return {"days_fetched": len(steps), "days_saved": len(changed), "steps": steps}
+
 
 # ─── Main sync entry-point ────────────────────────────────────────────────────
+#
+# Two stages, pipelined:
+#   fetch — every user's token refresh + step fetches run concurrently on one
+#           shared HTTP client, at most GOOGLE_FIT_SYNC_CONCURRENCY users in
+#           flight, each bounded by GOOGLE_FIT_SYNC_USER_TIMEOUT_S so a slow
+#           account can't stall the run.
+#   write — finished users are written in batches of GOOGLE_FIT_SYNC_WRITE_BATCH,
+#           one DB session per batch: tokens persisted and revoked rows deleted
+#           in one statement each, then the step upserts.
+# The sync dates are fixed once at the start, so every user in a run is synced
+# for the same day(s).
+
+_PERSIST_TOKENS_SQL = """
+    UPDATE user_google_fit_tokens t
+    SET access_token = v.access_token, expires_at = v.expires_at, updated_at = now()
+    FROM unnest(CAST(:uids AS uuid[]), CAST(:tokens AS text[]), CAST(:expires AS timestamptz[]))
+         AS v(user_id, access_token, expires_at)
+    WHERE t.user_id = v.user_id
+"""
 
-async def sync_all_users() -> None:
+# Only the row the sync used — a user who reconnected meanwhile keeps the new one
+_DELETE_REVOKED_SQL = """
+    DELETE FROM user_google_fit_tokens t
+    USING unnest(CAST(:uids AS uuid[]), CAST(:refresh AS text[])) AS v(user_id, refresh_token)
+    WHERE t.user_id = v.user_id AND t.refresh_token = v.refresh_token
+"""
+
+
+def _sync_dates(now_ist: datetime | None = None) -> list[date]:
     """
-    Scheduled job: refresh tokens + fetch + upsert steps for every connected user.
+    Dates a run syncs: today, and yesterday too on the morning run (08:05 IST)
+    to catch any steps walked after the previous night's 23:05 sync.
     """
-    if not settings.GOOGLE_CLIENT_ID or not settings.GOOGLE_CLIENT_SECRET:
-        logger.warning(
-            "GOOGLE_CLIENT_ID or GOOGLE_CLIENT_SECRET not configured — skipping Google Fit sync"
-        )
-        return
+    now_ist = now_ist or datetime.now(_IST)
+    today = date.today()
+    if now_ist.hour < 10:
+        return [today - timedelta(days=1), today]
+    return [today]
+
+
+def _http_client() -> httpx.AsyncClient:
+    """One client for the whole run — HTTP/2 multiplexes the users over a few connections."""
+    n = settings.GOOGLE_FIT_SYNC_CONCURRENCY
+    return httpx.AsyncClient(
+        http2=_HTTP2,
+        limits=httpx.Limits(max_connections=n, max_keepalive_connections=n),
+        timeout=15,
+    )
 
-    async with AsyncSessionLocal() as db:
-        rows_result = await db.execute(select(UserGoogleFitToken))
-        token_rows: list[UserGoogleFitToken] = list(rows_result.scalars().all())
 
-    logger.info(f"Google Fit sync: processing {len(token_rows)} connected user(s)")
+async def _fetch_user(
+    client: httpx.AsyncClient,
+    user_id: str,
+    refresh_token_enc: str,
+    dates: list[date],
+) -> dict:
+    """
+    Refresh one user's access_token and fetch their steps for the dates (one request).
+    Never raises — the outcome is in the returned dict:
+        status         "ok" | "revoked" | "error"
+        steps          {date: steps} (ok)
+        access_token   new token, encrypted (ok)
+        expires_at     (ok)
+    """
+    result = {"user_id": user_id, "refresh_token": refresh_token_enc, "status": "error"}
+    try:
+        refresh_token = decrypt_token(refresh_token_enc)
+        access_token, expires_at = await _refresh_access_token(client, refresh_token)
+        result.update(
+            status="ok",
+            steps=await _fetch_steps_range(client, access_token, dates[0], dates[-1]),
+            access_token=encrypt_token(access_token),
+            expires_at=expires_at,
+        )
+    except httpx.HTTPStatusError as exc:
+        # 400/401 from Google → token revoked; the write stage cleans up
+        if exc.response.status_code in (400, 401):
+            logger.warning(f"Google Fit sync: token revoked for user={user_id}, removing stored tokens")
+            result["status"] = "revoked"
+        else:
+            logger.error(f"Google Fit sync: HTTP error for user={user_id}: {exc}")
+    except Exception as exc:
+        logger.error(f"Google Fit sync: unexpected error for user={user_id}: {exc}", exc_info=True)
+    return result
+
+
+async def _fetch_all(
+    client: httpx.AsyncClient,
+    tokens: list[tuple[str, str]],
+    dates: list[date],
+    write_batch: Callable[[list[dict]], Awaitable[None]],
+) -> dict[str, int]:
+    """
+    Fetch every (user_id, encrypted refresh_token) with bounded concurrency and
+    hand finished users to write_batch as they complete, in batches of
+    GOOGLE_FIT_SYNC_WRITE_BATCH. Returns a count per status (plus "timeout").
+    """
+    sem = asyncio.Semaphore(settings.GOOGLE_FIT_SYNC_CONCURRENCY)
+    timeout = settings.GOOGLE_FIT_SYNC_USER_TIMEOUT_S
 
-    async with httpx.AsyncClient() as client:
-        for row in token_rows:
-            user_id = str(row.user_id)
+    async def one(user_id: str, refresh_token_enc: str) -> dict:
+        async with sem:  # the timeout starts once the user is in flight
             try:
-                # 1. Decrypt stored refresh_token
-                refresh_token = decrypt_token(row.refresh_token)
-
-                # 2. Refresh access_token
-                new_access_token, new_expires_at = await _refresh_access_token(
-                    client, refresh_token
+                return await asyncio.wait_for(
+                    _fetch_user(client, user_id, refresh_token_enc, dates), timeout
                 )
+            except asyncio.TimeoutError:
+                logger.warning(f"Google Fit sync: user={user_id} timed out after {timeout}s, skipped")
+                return {"user_id": user_id, "refresh_token": refresh_token_enc, "status": "timeout"}
+
+    counts = {"ok": 0, "revoked": 0, "error": 0, "timeout": 0}
+    batch: list[dict] = []
+    for fut in asyncio.as_completed([one(uid, rt) for uid, rt in tokens]):
+        res = await fut
+        counts[res["status"]] += 1
+        if res["status"] in ("ok", "revoked"):
+            batch.append(res)
+        if len(batch) >= settings.GOOGLE_FIT_SYNC_WRITE_BATCH:
+            await write_batch(batch)
+            batch = []
+    if batch:
+        await write_batch(batch)
+    return counts
+
+
+async def _write_batch(results: list[dict]) -> None:
+    """Persist one batch of fetched users in a single session."""
+    ok = [r for r in results if r["status"] == "ok"]
+    revoked = [r for r in results if r["status"] == "revoked"]
 
-                # 3. Determine which dates to sync.
-                # Morning run (08:05 IST) also back-fills yesterday to catch
-                # any steps walked after the previous night's 23:05 sync.
-                now_ist = datetime.now(timezone(timedelta(hours=5, minutes=30)))
-                today = date.today()
-                dates_to_sync = [today]
-                if now_ist.hour < 10:  # morning run (08:05) → also sync yesterday
-                    dates_to_sync.insert(0, today - timedelta(days=1))
-
-                for sync_date in dates_to_sync:
-                    steps = await _fetch_steps_for_date(client, new_access_token, sync_date)
-                    logger.info(f"Google Fit sync: user={user_id} date={sync_date} steps={steps}")
-                    if steps > 0:
-                        async with AsyncSessionLocal() as db:
-                            await _upsert_steps(db, user_id, steps, target_date=sync_date)
-
-                # 5. Persist updated access_token + expires_at
-                async with AsyncSessionLocal() as db:
-                    result = await db.execute(
-                        select(UserGoogleFitToken).where(
-                            UserGoogleFitToken.user_id == user_id
-                        )
-                    )
-                    stored = result.scalar_one_or_none()
-                    if stored:
-                        stored.access_token = encrypt_token(new_access_token)
-                        stored.expires_at = new_expires_at
-                        stored.updated_at = datetime.now(timezone.utc)
-                        await db.commit()
-
-            except httpx.HTTPStatusError as exc:
-                # 400/401 from Google → token revoked; clean up
-                if exc.response.status_code in (400, 401):
-                    logger.warning(
-                        f"Google Fit sync: token revoked for user={user_id}, removing stored tokens"
-                    )
-                    async with AsyncSessionLocal() as db:
-                        result = await db.execute(
-                            select(UserGoogleFitToken).where(
-                                UserGoogleFitToken.user_id == user_id
-                            )
-                        )
-                        stored = result.scalar_one_or_none()
-                        if stored:
-                            await db.delete(stored)
-                            await db.commit()
-                else:
-                    logger.error(
-                        f"Google Fit sync: HTTP error for user={user_id}: {exc}",
-                        exc_info=True,
-                    )
+    async with AsyncSessionLocal() as db:
+        if ok:
+            await db.execute(text(_PERSIST_TOKENS_SQL), {
+                "uids":    [r["user_id"] for r in ok],
+                "tokens":  [r["access_token"] for r in ok],
+                "expires": [r["expires_at"] for r in ok],
+            })
+        if revoked:
+            await db.execute(text(_DELETE_REVOKED_SQL), {
+                "uids":    [r["user_id"] for r in revoked],
+                "refresh": [r["refresh_token"] for r in revoked],
+            })
+        await db.commit()
+
+        for r in ok:
+            logger.info(
+                f"Google Fit sync: user={r['user_id']} "
+                + " ".join(f"{d}={n}" for d, n in r["steps"].items())
+            )
+            try:
+                await _upsert_steps_bulk(db, r["user_id"], r["steps"])
             except Exception as exc:
+                await db.rollback()
                 logger.error(
-                    f"Google Fit sync: unexpected error for user={user_id}: {exc}",
+                    f"Google Fit sync: step upsert failed for user={r['user_id']}: {exc}",
                     exc_info=True,
                 )
+
+
+async def sync_all_users() -> None:
+    """
+    Scheduled job: refresh tokens + fetch + upsert steps for every connected user.
+    """
+    if not settings.GOOGLE_CLIENT_ID or not settings.GOOGLE_CLIENT_SECRET:
+        logger.warning(
+            "GOOGLE_CLIENT_ID or GOOGLE_CLIENT_SECRET not configured — skipping Google Fit sync"
+        )
+        return
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(UserGoogleFitToken.user_id, UserGoogleFitToken.refresh_token)
+        )).all()
+    tokens = [(str(uid), rt) for uid, rt in rows]
+    dates = _sync_dates()
+
+    logger.info(
+        f"Google Fit sync: processing {len(tokens)} connected user(s) for {', '.join(map(str, dates))} "
+        f"(concurrency={settings.GOOGLE_FIT_SYNC_CONCURRENCY}, http2={_HTTP2})"
+    )
+    started = time.monotonic()
+    async with _http_client() as client:
+        counts = await _fetch_all(client, tokens, dates, _write_batch)
+    logger.info(
+        f"Google Fit sync: done in {time.monotonic() - started:.1f}s — "
+        + ", ".join(f"{k}={v}" for k, v in counts.items())
+    )
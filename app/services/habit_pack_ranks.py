@@ -0,0 +1,177 @@
+"""
+Habit pack ranks — habit_pack_ranks (pack_id, user_id, challenge_id, good_days, rank, rank_yesterday).
+
+The habit pack leaderboard ranks the active challenges sharing a pack_id by
+good days (done >= 50% of habits, min 1 — same floor as the shield streak),
+ties broken by user_id. /api/home and the AI insight stats only need the
+caller's rank, yesterday's rank and the pack size, so the ranking is stored
+instead of re-aggregated per request:
+
+    good_days       good days of the member's active challenge so far
+    rank            position in the pack by good_days (live)
+    rank_yesterday  rank by good days before today, frozen nightly
+
+Maintenance:
+  - habit log writes and membership changes (new / abandoned / completed
+    challenge) → refresh(): compare the member rows of those challenges with
+    their good days first — most taps don't move a day across the floor, and
+    those stop there, without a lock or a write. Otherwise lock the pack
+    (advisory lock, so concurrent re-ranks of one pack can't deadlock),
+    rewrite the rows in the writer's transaction and re-rank the pack.
+  - nightly → freeze(): rebuild every row from habit_day_rollup, with
+    rank_yesterday from the good days before today.
+"""
+import logging
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# good_days of challenge hc: rollup days at or above the 50% floor
+_GOOD_DAYS = """
+    (SELECT COUNT(*) FROM habit_day_rollup r
+     WHERE r.challenge_id = hc.id AND r.done >= GREATEST(1, CEIL(t.total::numeric / 2)) {day_filter})
+"""
+
+_MEMBERS = """
+    SELECT DISTINCT ON (hc.pack_id, hc.user_id)
+           hc.pack_id, hc.user_id, hc.id AS challenge_id,
+           {good_days} AS good_days {extra}
+    FROM habit_challenges hc
+    CROSS JOIN LATERAL (SELECT COUNT(*) AS total FROM habit_commitments WHERE challenge_id = hc.id) t
+    WHERE hc.status = 'active' AND hc.pack_id IS NOT NULL AND t.total > 0 {where}
+    ORDER BY hc.pack_id, hc.user_id, hc.id DESC
+"""
+
+_CUR = _MEMBERS.format(
+    good_days=_GOOD_DAYS.format(day_filter=""), extra="",
+    where="AND hc.id = ANY(CAST(:ids AS int[]))",
+)
+
+_CHANGED_SQL = f"""
+    WITH cur AS ({_CUR})
+    SELECT EXISTS (
+        SELECT 1 FROM cur
+        LEFT JOIN habit_pack_ranks p ON p.pack_id = cur.pack_id AND p.user_id = cur.user_id
+        WHERE p.good_days    IS DISTINCT FROM cur.good_days
+           OR p.challenge_id IS DISTINCT FROM cur.challenge_id
+    ) OR EXISTS (
+        SELECT 1 FROM habit_pack_ranks p
+        WHERE p.challenge_id = ANY(CAST(:ids AS int[]))
+          AND NOT EXISTS (SELECT 1 FROM cur WHERE cur.pack_id = p.pack_id AND cur.user_id = p.user_id)
+    )
+"""
+
+_LOCK_PACKS_SQL = """
+    SELECT pack_id, pg_advisory_xact_lock(hashtext('habit_pack_ranks:' || pack_id))
+    FROM (
+        SELECT DISTINCT pack_id FROM (
+            SELECT pack_id FROM habit_challenges WHERE id = ANY(CAST(:ids AS int[]))
+            UNION
+            SELECT pack_id FROM habit_pack_ranks WHERE challenge_id = ANY(CAST(:ids AS int[]))
+        ) s
+        WHERE pack_id IS NOT NULL
+        ORDER BY pack_id
+    ) p
+"""
+
+_REFRESH_SQL = f"""
+    WITH cur AS ({_CUR}),
+    upserted AS (
+        INSERT INTO habit_pack_ranks (pack_id, user_id, challenge_id, good_days)
+        SELECT pack_id, user_id, challenge_id, good_days FROM cur
+        ON CONFLICT (pack_id, user_id) DO UPDATE
+            SET good_days      = EXCLUDED.good_days,
+                challenge_id   = EXCLUDED.challenge_id,
+                rank_yesterday = CASE WHEN habit_pack_ranks.challenge_id = EXCLUDED.challenge_id
+                                      THEN habit_pack_ranks.rank_yesterday END,
+                updated_at     = now()
+            WHERE habit_pack_ranks.good_days    IS DISTINCT FROM EXCLUDED.good_days
+               OR habit_pack_ranks.challenge_id IS DISTINCT FROM EXCLUDED.challenge_id
+        RETURNING pack_id
+    ),
+    removed AS (
+        -- no longer an active member (abandoned / completed), and not replaced by one above
+        DELETE FROM habit_pack_ranks p
+        WHERE p.challenge_id = ANY(CAST(:ids AS int[]))
+          AND NOT EXISTS (SELECT 1 FROM cur WHERE cur.pack_id = p.pack_id AND cur.user_id = p.user_id)
+        RETURNING pack_id
+    )
+    SELECT pack_id FROM upserted UNION SELECT pack_id FROM removed
+"""
+
+_RERANK_SQL = """
+    UPDATE habit_pack_ranks p
+    SET rank = r.rnk, updated_at = now()
+    FROM (
+        SELECT pack_id, user_id,
+               ROW_NUMBER() OVER (PARTITION BY pack_id ORDER BY good_days DESC, user_id ASC) AS rnk
+        FROM habit_pack_ranks
+        WHERE pack_id = ANY(CAST(:packs AS text[]))
+    ) r
+    WHERE p.pack_id = r.pack_id AND p.user_id = r.user_id
+      AND p.rank IS DISTINCT FROM r.rnk
+"""
+
+_FREEZE_SQL = f"""
+    INSERT INTO habit_pack_ranks (pack_id, user_id, challenge_id, good_days, rank, rank_yesterday)
+    SELECT pack_id, user_id, challenge_id, good_days,
+           ROW_NUMBER() OVER (PARTITION BY pack_id ORDER BY good_days DESC,      user_id ASC),
+           ROW_NUMBER() OVER (PARTITION BY pack_id ORDER BY good_days_yest DESC, user_id ASC)
+    FROM ({_MEMBERS.format(
+        good_days=_GOOD_DAYS.format(day_filter=""),
+        extra=", " + _GOOD_DAYS.format(day_filter="AND r.day < :today") + " AS good_days_yest",
+        where="",
+    )}) m
+"""
+
+
+async def refresh(db: AsyncSession, challenge_ids: list[int]) -> None:
+    """
+    Bring the pack rows of these challenges up to date after a habit log write
+    or a status change, and re-rank the packs that changed. The caller commits.
+    """
+    if not challenge_ids:
+        return
+    await db.flush()  # pending status / commitment changes must be visible
+    params = {"ids": list(set(challenge_ids))}
+    if not (await db.execute(text(_CHANGED_SQL), params)).scalar():
+        return
+    packs = (await db.execute(text(_LOCK_PACKS_SQL), params)).scalars().all()
+    if not packs:
+        return
+    changed = (await db.execute(text(_REFRESH_SQL), params)).scalars().all()
+    if changed:
+        await rerank(db, list(set(changed)))
+
+
+async def rerank(db: AsyncSession, packs: list[str]) -> None:
+    """Recompute rank within the given packs. The caller commits."""
+    await db.execute(text(_RERANK_SQL), {"packs": packs})
+
+
+async def freeze(db: AsyncSession, today: date | None = None) -> int:
+    """
+    Rebuild every pack row from habit_day_rollup and freeze rank_yesterday
+    (good days before today). Returns rows written. The caller commits.
+    """
+    today = today or date.today()
+    # Writers hold row locks until commit; the table lock waits them out and
+    # keeps new refreshes from landing between the delete and the insert
+    await db.execute(text("LOCK TABLE habit_pack_ranks IN EXCLUSIVE MODE"))
+    await db.execute(text("DELETE FROM habit_pack_ranks"))
+    result = await db.execute(text(_FREEZE_SQL), {"today": today})
+    return result.rowcount
+
+
+async def get_rank(db: AsyncSession, challenge_id: int) -> dict | None:
+    """{pack_id, rank, rank_yesterday, total_participants} for a challenge on a pack board."""
+    row = (await db.execute(text("""
+        SELECT p.pack_id, p.rank, p.rank_yesterday,
+               (SELECT COUNT(*) FROM habit_pack_ranks t WHERE t.pack_id = p.pack_id) AS total_participants
+        FROM habit_pack_ranks p
+        WHERE p.challenge_id = :cid
+    """), {"cid": challenge_id})).mappings().first()
+    return dict(row) if row else None
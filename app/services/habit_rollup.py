@@ -0,0 +1,82 @@
+"""
+Habit day rollup — habit_day_rollup (challenge_id, day, done, total).
+
+"How many habits were done on each day of a challenge" is the input to streaks,
+shields, perfect days, pack rankings, partner cards and the cycle summary. The
+rollup stores it as one row per challenge per day that has any log:
+
+    done   completed logs that day
+    total  the challenge's commitment count
+
+so readers fetch one row per day instead of aggregating daily_logs per habit
+per day. Days without a row had nothing completed.
+The habit pack leaderboard (habit_pack_ranks) is in turn derived from it.
+
+Maintenance, always in the writer's transaction:
+  - habit log write (upsert_log) → bump_day(): done moves by the change in the
+    log's completed flag. The upsert is an atomic increment, so concurrent taps
+    on different habits of the same day can't lose an update.
+  - commitment set changes (a custom-habit delete cascades into past
+    challenges) → rebuild_habit_rollup() for the affected challenges.
+
+Bulk rebuild / drift check: scripts/rebuild_habit_rollup.py
+"""
+import logging
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+async def bump_day(db: AsyncSession, challenge_id: int, day: date, delta: int) -> None:
+    """
+    Record one log write: delta is +1 (now completed), -1 (un-completed) or 0
+    (new uncompleted log / value-only edit — still creates the day's row).
+    The caller commits.
+    """
+    await db.execute(text("""
+        INSERT INTO habit_day_rollup (challenge_id, day, done, total)
+        VALUES (:cid, :day, GREATEST(:delta, 0),
+                (SELECT COUNT(*) FROM habit_commitments WHERE challenge_id = :cid))
+        ON CONFLICT (challenge_id, day) DO UPDATE
+            SET done       = GREATEST(habit_day_rollup.done + :delta, 0),
+                total      = EXCLUDED.total,
+                updated_at = now()
+    """), {"cid": challenge_id, "day": day, "delta": delta})
+
+
+async def done_by_date(db: AsyncSession, challenge_id: int) -> dict[date, int]:
+    """{day: completed habits} for every day of the challenge with anything done."""
+    rows = (await db.execute(text("""
+        SELECT day, done FROM habit_day_rollup
+        WHERE challenge_id = :cid AND done > 0
+    """), {"cid": challenge_id})).all()
+    return {d: n for d, n in rows}
+
+
+async def rebuild_habit_rollup(db: AsyncSession, challenge_ids: list[int] | None = None) -> int:
+    """
+    Recompute rollup rows from daily_logs — some challenges, or all of them —
+    and drop their cached history (habit_cycle_cache). Returns rows written.
+    The caller commits.
+    """
+    where = "WHERE challenge_id = ANY(CAST(:ids AS int[]))" if challenge_ids is not None else ""
+    where_hcm = "WHERE hcm.challenge_id = ANY(CAST(:ids AS int[]))" if challenge_ids is not None else ""
+    params = {"ids": list(challenge_ids)} if challenge_ids is not None else {}
+
+    await db.flush()  # pending log / commitment changes must be visible to the scan
+    await db.execute(text(f"DELETE FROM habit_day_rollup {where}"), params)
+    await db.execute(text(f"DELETE FROM habit_cycle_cache {where}"), params)  # history built from the old rows
+    result = await db.execute(text(f"""
+        INSERT INTO habit_day_rollup (challenge_id, day, done, total)
+        SELECT hcm.challenge_id, dl.logged_date,
+               COUNT(*) FILTER (WHERE dl.completed),
+               (SELECT COUNT(*) FROM habit_commitments t WHERE t.challenge_id = hcm.challenge_id)
+        FROM daily_logs dl
+        JOIN habit_commitments hcm ON hcm.id = dl.commitment_id
+        {where_hcm}
+        GROUP BY hcm.challenge_id, dl.logged_date
+    """), params)
+    return result.rowcount
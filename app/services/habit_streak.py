@@ -0,0 +1,216 @@
+"""
+Habit shield streak — the forward simulation behind get_streak() and history.
+
+Rules:
+- A day "counts" if completed habits >= min_required (50% floor, min 1).
+- Shields are earned 1 at a time: every 4 consecutive good days earn 1 shield.
+  Max 1 shield held at a time — must use it before earning the next.
+- A shield bridges 1 missed day, keeping the effective streak alive.
+  After using a shield, the 4-day counter resets.
+- current_streak  = raw consecutive good days (no shield help) from today back.
+- effective_streak = streak computed by the forward simulation (shields applied).
+- Today grace: if today is not good yet, skip without penalty (day not over).
+
+The simulation walks every day from started_at, but a day that is over never
+changes again unless a log is back-dated. get_streak() therefore persists the
+simulation state after the last closed day in habit_streak_checkpoints:
+
+    as_of         last day folded into the state (≤ yesterday, ≤ ends_at)
+    min_required  the 50% floor the state was computed with
+    good_digest   md5 of the good days up to as_of
+    state         the simulation variables (see new_state)
+
+and only simulates the open days after it. A back-dated edit that changes
+whether a closed day counts changes the digest, so the checkpoint is ignored
+and rebuilt on the next read; a changed habit count changes min_required.
+The digest is taken from the same rows the state was computed from, so a
+write racing the checkpoint save can't leave a stale checkpoint behind.
+
+Property test against the original simulation: scripts/test_shield_streak.py
+"""
+import hashlib
+import json
+import logging
+from datetime import date, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+def min_required_for(total_habits: int) -> int:
+    return max(1, -(-total_habits // 2))  # ceil(total/2)
+
+
+def new_state() -> dict:
+    return {
+        "shield_bank":          0,   # 0 or 1
+        "consecutive":          0,   # good days since last shield earned or last gap
+        "effective":            0,   # current shield-protected streak
+        "max_effective":        0,   # longest shield-protected streak closed so far
+        "shields_earned":       0,
+        "shields_used":         0,
+        "shield_used_on_dates": [],
+        "current_segment":      0,   # raw run of good days (no shields)
+    }
+
+
+def advance(state: dict, by_date: dict, start: date, end: date, min_required: int, today: date) -> dict:
+    """Fold the days start..end into state (in place) and return it."""
+    d = start
+    while d <= end:
+        good = by_date.get(d, 0) >= min_required
+        if good:
+            state["effective"] += 1
+            state["consecutive"] += 1
+            state["current_segment"] += 1
+            if state["consecutive"] == 4 and state["shield_bank"] == 0:
+                state["shield_bank"] = 1
+                state["shields_earned"] += 1
+                state["consecutive"] = 0   # reset — next shield needs another 4 days
+        elif d == today:
+            pass  # grace all day until min_required is met
+        elif state["shield_bank"] > 0:
+            state["shield_bank"] -= 1
+            state["shields_used"] += 1
+            state["shield_used_on_dates"].append(d)
+            state["effective"] += 1
+            state["consecutive"] = 0       # reset after using shield
+            # current_segment does NOT increment (raw streak broken)
+        else:
+            # Streak broken (both effective and raw)
+            state["max_effective"] = max(state["max_effective"], state["effective"])
+            state["effective"] = 0
+            state["consecutive"] = 0
+            state["current_segment"] = 0
+        d += timedelta(days=1)
+    return state
+
+
+def summarize(state: dict, end_day: date, today: date) -> dict:
+    # Raw current streak only while the last segment touches today or yesterday
+    raw_current = 0
+    if state["current_segment"] > 0 and end_day in (today, today - timedelta(days=1)):
+        raw_current = state["current_segment"]
+    return {
+        "current_streak":       raw_current,                                       # raw consecutive good days
+        "effective_streak":     state["effective"],                                # shield-protected, up to today
+        "longest_streak":       max(state["max_effective"], state["effective"]),   # shield-protected longest
+        "shields_earned":       state["shields_earned"],
+        "shields_used":         state["shields_used"],
+        "shield_used_on_dates": list(state["shield_used_on_dates"]),
+    }
+
+
+def compute_shield_streak(by_date: dict, started_at: date, end_day: date, total_habits: int, today: date) -> dict:
+    """Full simulation from started_at — no checkpoint."""
+    state = advance(new_state(), by_date, started_at, end_day, min_required_for(total_habits), today)
+    return summarize(state, end_day, today)
+
+
+def good_digest(by_date: dict, min_required: int, upto: date) -> str:
+    days = sorted(d for d, n in by_date.items() if d <= upto and n >= min_required)
+    return hashlib.md5(",".join(d.isoformat() for d in days).encode()).hexdigest()
+
+
+def dump_state(state: dict) -> str:
+    return json.dumps({**state, "shield_used_on_dates": [d.isoformat() for d in state["shield_used_on_dates"]]})
+
+
+def load_state(raw) -> dict:
+    state = json.loads(raw) if isinstance(raw, str) else dict(raw)
+    state["shield_used_on_dates"] = [date.fromisoformat(d) for d in state["shield_used_on_dates"]]
+    return state
+
+
+def resume(
+    checkpoint: dict | None,
+    by_date: dict,
+    started_at: date,
+    ends_at: date,
+    end_day: date,
+    total_habits: int,
+    today: date,
+) -> tuple[dict, dict | None]:
+    """
+    Simulate up to end_day starting from checkpoint when it still matches by_date.
+    Returns (result, new checkpoint to save or None).
+    """
+    min_required = min_required_for(total_habits)
+    close = min(today - timedelta(days=1), ends_at, end_day)
+
+    state, next_day = new_state(), started_at
+    if (
+        checkpoint
+        and checkpoint["min_required"] == min_required
+        and checkpoint["as_of"] <= close
+        and checkpoint["good_digest"] == good_digest(by_date, min_required, checkpoint["as_of"])
+    ):
+        state, next_day = load_state(checkpoint["state"]), checkpoint["as_of"] + timedelta(days=1)
+
+    save = None
+    if close >= next_day:
+        advance(state, by_date, next_day, close, min_required, today)
+        next_day = close + timedelta(days=1)
+        save = {
+            "as_of":        close,
+            "min_required": min_required,
+            "good_digest":  good_digest(by_date, min_required, close),
+            "state":        dump_state(state),
+        }
+    advance(state, by_date, next_day, end_day, min_required, today)
+    return summarize(state, end_day, today), save
+
+
+async def shield_streak(
+    db: AsyncSession,
+    challenge_id: int,
+    by_date: dict,
+    started_at: date,
+    ends_at: date,
+    total_habits: int,
+    today: date,
+) -> dict:
+    """
+    Checkpointed compute_shield_streak(by_date, started_at, today, total_habits, today);
+    by_date is the challenge's habit_rollup.done_by_date().
+    """
+    checkpoint = (await db.execute(text("""
+        SELECT as_of, min_required, good_digest, state
+        FROM habit_streak_checkpoints WHERE challenge_id = :cid
+    """), {"cid": challenge_id})).mappings().first()
+    return await streak_from_checkpoint(db, challenge_id, dict(checkpoint) if checkpoint else None,
+                                        by_date, started_at, ends_at, total_habits, today)
+
+
+async def streak_from_checkpoint(
+    db: AsyncSession,
+    challenge_id: int,
+    checkpoint: dict | None,
+    by_date: dict,
+    started_at: date,
+    ends_at: date,
+    total_habits: int,
+    today: date,
+) -> dict:
+    """
+    shield_streak() for callers that loaded the checkpoint row themselves.
+    Saving an advanced checkpoint commits — callers are read paths or have
+    already committed their own writes.
+    """
+    result, save = resume(checkpoint, by_date, started_at, ends_at, today, total_habits, today)
+    if save:
+        try:
+            async with db.begin_nested():
+                await db.execute(text("""
+                    INSERT INTO habit_streak_checkpoints (challenge_id, as_of, min_required, good_digest, state)
+                    VALUES (:cid, :as_of, :min_required, :good_digest, CAST(:state AS jsonb))
+                    ON CONFLICT (challenge_id) DO UPDATE
+                        SET as_of = EXCLUDED.as_of, min_required = EXCLUDED.min_required,
+                            good_digest = EXCLUDED.good_digest, state = EXCLUDED.state, updated_at = now()
+                """), {"cid": challenge_id, **save})
+            await db.commit()
+        except Exception as e:
+            logger.warning(f"Streak checkpoint save failed for challenge {challenge_id}: {e}")
+    return result
@@ -1,112 +1,24 @@
+import json
+import logging
 from collections import defaultdict
 from datetime import date, timedelta
-from sqlalchemy import select, func
+from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from fastapi import HTTPException
 
-from app.models import HabitChallenge, ChallengeStatus, DailyLog, Habit, HabitCommitment, UserHabit, User
+from app.models import HabitChallenge, ChallengeStatus, HabitCommitment, UserHabit
 from app.schemas.habits import ChallengeCreate
+from app.services import habit_pack_ranks, habit_rollup, habit_streak, ref_cache
 from app.services.reminder_service import fire_habit_perfect_day, fire_habit_streak_milestone
 
-_STREAK_MILESTONES = {3, 7, 14, 21, 30}
-
-
-# ── Shield / streak helper ────────────────────────────────────────────────────
-
-def _compute_shield_streak(
-    by_date: dict,
-    started_at: date,
-    end_day: date,
-    total_habits: int,
-    today: date,
-) -> dict:
-    """
-    Shared shield-and-streak logic used by get_streak() and get_history().
-
-    Rules:
-    - A day "counts" if completed habits >= min_required (50% floor, min 1).
-    - Shields are earned 1 at a time: every 4 consecutive good days earn 1 shield.
-      Max 1 shield held at a time — must use it before earning the next.
-    - A shield bridges 1 missed day, keeping the effective streak alive.
-      After using a shield, the 4-day counter resets.
-    - current_streak  = raw consecutive good days (no shield help) from today back.
-    - effective_streak = streak computed by the forward simulation (shields applied).
-    - Today grace: if today has zero logs at all, skip without penalty (day not over).
-    """
-    min_required = max(1, -(-total_habits // 2))  # ceil(total/2)
-
-
-    # ── Forward simulation: effective streak and shield-protected longest streak ──
-    shield_bank = 0       # 0 or 1
-    consecutive = 0       # good days since last shield earned or last gap
-    effective = 0         # current shield-protected streak (up to today)
-    max_effective = 0     # longest shield-protected streak
-    shields_earned = 0
-    shields_used = 0
-    shield_used_on_dates: list[date] = []
-    current_segment = 0   # for current_streak (raw, no shields)
-    raw_current = 0
-
-    d = started_at
-    today_grace = False
-    while d <= end_day:
-        good = by_date.get(d, 0) >= min_required
-        today_grace = (d == today and not good)  # grace all day until min_required is met
-
-        if good:
-            effective += 1
-            consecutive += 1
-            current_segment += 1
-            if consecutive == 4 and shield_bank == 0:
-                shield_bank = 1
-                shields_earned += 1
-                consecutive = 0   # reset — next shield needs another 4 days
-        elif today_grace:
-            # Don't break streak, don't increment
-            pass
-        else:
-            # Missed day
-            if shield_bank > 0:
-                shield_bank -= 1
-                shields_used += 1
-                shield_used_on_dates.append(d)
-                effective += 1
-                consecutive = 0   # reset after using shield
-                # current_segment does NOT increment (raw streak broken)
-            else:
-                # Streak broken (both effective and raw)
-                if effective > max_effective:
-                    max_effective = effective
-                effective = 0
-                consecutive = 0
-                shield_bank = 0
-                current_segment = 0
-        d += timedelta(days=1)
-
-    # After loop, check if current streaks are the longest
-    if effective > max_effective:
-        max_effective = effective
-
-    # Raw current streak: if last segment touches today or yesterday
-    # (raw streak = consecutive good days, no shields)
-    if current_segment > 0:
-        if end_day == today or end_day == today - timedelta(days=1):
-            raw_current = current_segment
+logger = logging.getLogger(__name__)
 
-    return {
-        "current_streak":       raw_current,   # raw consecutive good days (no shields)
-        "effective_streak":     effective,     # shield-protected streak up to today
-        "longest_streak":       max_effective, # shield-protected longest streak
-        "shields_earned":       shields_earned,
-        "shields_used":         shields_used,
-        "shield_used_on_dates": shield_used_on_dates,
-    }
+_STREAK_MILESTONES = {3, 7, 14, 21, 30}
 
 
-async def _get_habit(db: AsyncSession, slug: str) -> Habit:
-    result = await db.execute(select(Habit).where(Habit.slug == slug))
-    h = result.scalar_one_or_none()
+async def _get_habit(db: AsyncSession, slug: str) -> dict:
+    h = await ref_cache.habit_by_slug(db, slug)
     if not h:
         raise HTTPException(404, f"Habit '{slug}' not found")
     return h
@@ -128,7 +40,8 @@ async def create_challenge(db: AsyncSession, user_id: str, body: ChallengeCreate
             HabitChallenge.status == ChallengeStatus.active,
         )
     )
-    for existing in result.scalars().all():
+    abandoned = result.scalars().all()
+    for existing in abandoned:
         existing.status = ChallengeStatus.abandoned
 
     today = date.today()
@@ -144,13 +57,14 @@ async def create_challenge(db: AsyncSession, user_id: str, body: ChallengeCreate
     order = 0
     for slug in body.habit_slugs:
         habit = await _get_habit(db, slug)
-        db.add(HabitCommitment(challenge_id=challenge.id, habit_id=habit.id, sort_order=order))
+        db.add(HabitCommitment(challenge_id=challenge.id, habit_id=habit["id"], sort_order=order))
         order += 1
 
     for uid in body.custom_habit_ids:
         db.add(HabitCommitment(challenge_id=challenge.id, user_habit_id=uid, sort_order=order))
         order += 1
 
+    await habit_pack_ranks.refresh(db, [c.id for c in abandoned] + [challenge.id])
     await db.commit()
     await db.refresh(challenge)
     return challenge
@@ -162,7 +76,6 @@ async def get_active_challenge(db: AsyncSession, user_id: str) -> HabitChallenge
         .options(
             selectinload(HabitChallenge.commitments).selectinload(HabitCommitment.habit),
             selectinload(HabitChallenge.commitments).selectinload(HabitCommitment.user_habit),
-            selectinload(HabitChallenge.commitments).selectinload(HabitCommitment.logs),
         )
         .where(
             HabitChallenge.user_id == user_id,
@@ -175,326 +88,676 @@ async def get_active_challenge(db: AsyncSession, user_id: str) -> HabitChallenge
     return c
 
 
+# A challenge's commitments, in sort order, per challenge_id: commitment id plus
+# habit_id (built-in) or the custom habit's name/emoji. Commitments are fixed
+# once the challenge is created and custom habits can't be renamed, or deleted
+# while their challenge is active, so entries never go stale; the map is only
+# bounded. Built-in habit fields come from ref_cache at read time (the catalog
+# is editable). Per process — each worker fills its own.
+_COMMITMENT_META: dict[int, list[dict]] = {}
+_COMMITMENT_META_MAX = 4096
+
+
+def _habit_data(meta: dict, habits: dict[int, dict]) -> dict:
+    if meta["is_custom"]:
+        return {**meta, "has_counter": False}
+    h = habits[meta["habit_id"]]
+    return {
+        "commitment_id": meta["commitment_id"],
+        "is_custom": False,
+        "habit_id": meta["habit_id"],
+        "name": h["label"],
+        "slug": h["slug"],
+        "description": h["description"],
+        "why": h["why"],
+        "impact": h["impact"],
+        "category": h["category"],
+        "tier": h["tier"],
+        "has_counter": h["has_counter"],
+        "unit": h["unit"],
+        "target": h["target"],
+    }
+
+
+async def _commitment_meta(db: AsyncSession, challenge_id: int) -> list[dict]:
+    meta = _COMMITMENT_META.get(challenge_id)
+    if meta is None:
+        rows = (await db.execute(
+            select(
+                HabitCommitment.id, HabitCommitment.habit_id, HabitCommitment.user_habit_id,
+                UserHabit.name, UserHabit.emoji,
+            )
+            .outerjoin(UserHabit, UserHabit.id == HabitCommitment.user_habit_id)
+            .where(HabitCommitment.challenge_id == challenge_id)
+            .order_by(HabitCommitment.sort_order)
+        )).all()
+        meta = [
+            {"commitment_id": cid, "is_custom": True, "user_habit_id": uhid, "name": name, "emoji": emoji}
+            if uhid is not None else
+            {"commitment_id": cid, "is_custom": False, "habit_id": hid}
+            for cid, hid, uhid, name, emoji in rows
+        ]
+        if len(_COMMITMENT_META) >= _COMMITMENT_META_MAX:
+            _COMMITMENT_META.pop(next(iter(_COMMITMENT_META)))  # oldest entry
+        _COMMITMENT_META[challenge_id] = meta
+    return meta
+
+
+async def _habits_by_id(db: AsyncSession, meta: list[dict]) -> dict[int, dict]:
+    habits = {h["id"]: h for h in await ref_cache.get(db, "habits")}
+    if any(not m["is_custom"] and m["habit_id"] not in habits for m in meta):
+        ref_cache.invalidate("habits")  # added since the catalog was loaded
+        habits = {h["id"]: h for h in await ref_cache.get(db, "habits")}
+    return habits
+
+
 async def get_today(db: AsyncSession, user_id: str, target_date: date | None = None) -> dict:
-    challenge = await get_active_challenge(db, user_id)
     today = target_date or date.today()
+    # The active challenge and just this day's logs — independent of the cycle day
+    rows = (await db.execute(text("""
+        SELECT hc.id AS challenge_id, hc.started_at,
+               dl.commitment_id, dl.id AS log_id, dl.completed, dl.value
+        FROM habit_challenges hc
+        LEFT JOIN habit_commitments hcm ON hcm.challenge_id = hc.id
+        LEFT JOIN daily_logs dl         ON dl.commitment_id = hcm.id AND dl.logged_date = :day
+        WHERE hc.user_id = :uid AND hc.status = 'active'
+        ORDER BY hc.id DESC
+    """), {"uid": user_id, "day": today})).mappings().all()
+    if not rows:
+        raise HTTPException(404, "No active challenge")
+    challenge_id, started_at = rows[0]["challenge_id"], rows[0]["started_at"]
+    logs = {r["commitment_id"]: r for r in rows if r["log_id"] is not None and r["challenge_id"] == challenge_id}
+
+    meta = await _commitment_meta(db, challenge_id)
+    habits = await _habits_by_id(db, meta)
     habits_today = []
-    for c in sorted(challenge.commitments, key=lambda x: x.sort_order):
-        log = next((l for l in c.logs if l.logged_date == today), None)
-        if c.user_habit:
-            habit_data = {
-                "commitment_id": c.id,
-                "is_custom": True,
-                "user_habit_id": c.user_habit_id,
-                "name": c.user_habit.name,
-                "emoji": c.user_habit.emoji,
-                "has_counter": False,
-            }
-        else:
-            h = c.habit
-            habit_data = {
-                "commitment_id": c.id,
-                "is_custom": False,
-                "habit_id": c.habit_id,
-                "name": h.label,
-                "slug": h.slug,
-                "description": h.description,
-                "why": h.why,
-                "impact": h.impact,
-                "category": h.category,
-                "tier": h.tier,
-                "has_counter": h.has_counter,
-                "unit": h.unit,
-                "target": h.target,
-            }
+    for m in meta:
+        habit_data = _habit_data(m, habits)
+        log = logs.get(habit_data["commitment_id"])
         habits_today.append({
-            "commitment_id": c.id,
+            "commitment_id": habit_data["commitment_id"],
             "habit": habit_data,
-            "completed": log.completed if log else False,
-            "value": log.value if log else None,
-            "log_id": log.id if log else None,
+            "completed": log["completed"] if log else False,
+            "value": log["value"] if log else None,
+            "log_id": log["log_id"] if log else None,
         })
     return {
-        "challenge_id": challenge.id,
+        "challenge_id": challenge_id,
         "date": today,
-        "day_number": (today - challenge.started_at).days + 1,
+        "day_number": (today - started_at).days + 1,
         "habits": habits_today,
         "completed_count": sum(1 for h in habits_today if h["completed"]),
         "total_count": len(habits_today),
     }
 
 
-async def upsert_log(db: AsyncSession, user_id: str, commitment_id: int,
-                     logged_date: date, completed: bool, value: int | None) -> dict:
-    result = await db.execute(
-        select(HabitCommitment)
-        .join(HabitChallenge)
-        .where(HabitCommitment.id == commitment_id, HabitChallenge.user_id == user_id)
+# One round trip for a habit tap, or a batch of them: ownership check, log
+# upserts, rollup bumps and everything the streak needs (checkpoint + the
+# challenge's day rollups), one row per input log.
+#   - old locks existing logs so the rollup deltas use their real previous values
+#   - brand-new logs are inserted ON CONFLICT DO NOTHING: losing that race to a
+#     concurrent tap on the same habit returns no log for that input and the
+#     caller re-runs just those inputs, this time through the update path
+#   - days is read from the statement snapshot, so it lacks these writes — the
+#     caller patches the touched days with done_day
+_UPSERT_LOGS_SQL = """
+    WITH input AS (
+        SELECT * FROM unnest(CAST(:cms AS int[]), CAST(:days AS date[]),
+                             CAST(:completed AS boolean[]), CAST(:vals AS int[]))
+                      AS t(cm, day, completed, value)
+    ),
+    own AS (
+        SELECT i.*, hcm.challenge_id
+        FROM input i
+        JOIN habit_commitments hcm ON hcm.id = i.cm
+        JOIN habit_challenges hc   ON hc.id = hcm.challenge_id
+        WHERE hc.user_id = :uid
+    ),
+    ch AS (
+        SELECT hc.id, hc.started_at, hc.ends_at,
+               (SELECT COUNT(*) FROM habit_commitments t WHERE t.challenge_id = hc.id) AS total,
+               (SELECT row_to_json(cp) FROM habit_streak_checkpoints cp WHERE cp.challenge_id = hc.id) AS checkpoint,
+               (SELECT json_agg(json_build_array(r.day, r.done)) FROM habit_day_rollup r
+                WHERE r.challenge_id = hc.id AND r.done > 0) AS days
+        FROM habit_challenges hc
+        WHERE hc.id IN (SELECT challenge_id FROM own)
+    ),
+    old AS (
+        SELECT dl.id, dl.commitment_id, dl.logged_date, dl.completed
+        FROM daily_logs dl JOIN own ON own.cm = dl.commitment_id AND own.day = dl.logged_date
+        FOR UPDATE OF dl
+    ),
+    updated AS (
+        UPDATE daily_logs dl SET completed = own.completed, value = own.value
+        FROM old JOIN own ON own.cm = old.commitment_id AND own.day = old.logged_date
+        WHERE dl.id = old.id
+        RETURNING dl.id, dl.commitment_id, dl.logged_date, dl.completed, dl.value, dl.logged_at
+    ),
+    inserted AS (
+        INSERT INTO daily_logs (commitment_id, logged_date, completed, value)
+        SELECT own.cm, own.day, own.completed, own.value FROM own
+        WHERE NOT EXISTS (SELECT 1 FROM old WHERE old.commitment_id = own.cm AND old.logged_date = own.day)
+        ON CONFLICT (commitment_id, logged_date) DO NOTHING
+        RETURNING id, commitment_id, logged_date, completed, value, logged_at
+    ),
+    log AS (
+        SELECT * FROM updated UNION ALL SELECT * FROM inserted
+    ),
+    delta AS (
+        SELECT own.challenge_id, own.day,
+               SUM(own.completed::int - COALESCE(old.completed::int, 0)) AS d
+        FROM own
+        JOIN log      ON log.commitment_id = own.cm AND log.logged_date = own.day
+        LEFT JOIN old ON old.commitment_id = own.cm AND old.logged_date = own.day
+        GROUP BY own.challenge_id, own.day
+    ),
+    rolled AS (
+        -- done carries the raw delta into EXCLUDED; a new day row's delta is never negative
+        INSERT INTO habit_day_rollup (challenge_id, day, done, total)
+        SELECT delta.challenge_id, delta.day, delta.d, ch.total
+        FROM delta JOIN ch ON ch.id = delta.challenge_id
+        ON CONFLICT (challenge_id, day) DO UPDATE
+            SET done       = GREATEST(habit_day_rollup.done + EXCLUDED.done, 0),
+                total      = EXCLUDED.total,
+                updated_at = now()
+        RETURNING challenge_id, day, done
+    ),
+    uncached AS (
+        DELETE FROM habit_cycle_cache WHERE challenge_id IN (SELECT challenge_id FROM own)
     )
-    commitment = result.scalar_one_or_none()
-    if not commitment:
-        raise HTTPException(404, "Commitment not found")
-
-    log_result = await db.execute(
-        select(DailyLog).where(
-            DailyLog.commitment_id == commitment_id,
-            DailyLog.logged_date == logged_date,
-        )
-    )
-    log = log_result.scalar_one_or_none()
+    SELECT own.cm AS input_cm, own.day AS input_day, own.challenge_id,
+           ch.started_at, ch.ends_at, ch.total, ch.checkpoint, ch.days,
+           log.id, log.commitment_id, log.logged_date, log.completed, log.value, log.logged_at,
+           rolled.done AS done_day
+    FROM own
+    JOIN ch          ON ch.id = own.challenge_id
+    LEFT JOIN log    ON log.commitment_id = own.cm AND log.logged_date = own.day
+    LEFT JOIN rolled ON rolled.challenge_id = own.challenge_id AND rolled.day = own.day
+"""
 
-    if log:
-        log.completed = completed
-        log.value = value
-    else:
-        log = DailyLog(commitment_id=commitment_id, logged_date=logged_date,
-                       completed=completed, value=value)
-        db.add(log)
 
-    await db.commit()
-    await db.refresh(log)
+def _json(raw):
+    return json.loads(raw) if isinstance(raw, str) else raw
 
-    # Fetch challenge_id for this commitment
-    cm_result = await db.execute(
-        select(HabitCommitment).where(HabitCommitment.id == commitment_id)
-    )
-    cm = cm_result.scalar_one()
-    challenge_id = cm.challenge_id
 
-    # Compute streak details after logging
-    streak = await get_streak(db, challenge_id, user_id)
+async def _write_logs(db: AsyncSession, user_id: str, items: list[tuple]) -> list:
+    """
+    Apply (commitment_id, logged_date, completed, value) items in one transaction
+    and commit. Every commitment must belong to the user — otherwise nothing is
+    written and 404 is raised. Returns one row per item, in item order.
+    """
+    # Last write wins for repeated (commitment, day) pairs, as with separate taps
+    latest = {(cm, day): (cm, day, completed, value) for cm, day, completed, value in items}
+    pending = list(latest.values())
+    rows: dict[tuple, dict] = {}
+    for _ in range(2):
+        result = (await db.execute(text(_UPSERT_LOGS_SQL), {
+            "uid":       user_id,
+            "cms":       [i[0] for i in pending],
+            "days":      [i[1] for i in pending],
+            "completed": [i[2] for i in pending],
+            "vals":      [i[3] for i in pending],
+        })).mappings().all()
+        if len(result) < len(pending):
+            await db.rollback()
+            raise HTTPException(404, "Commitment not found")
+        for r in result:
+            # A retry sees the first round's writes — refresh the shared per-day/per-challenge columns
+            for kept in rows.values():
+                if kept["challenge_id"] == r["challenge_id"]:
+                    kept["days"], kept["checkpoint"] = r["days"], r["checkpoint"]
+                    if kept["input_day"] == r["input_day"] and r["done_day"] is not None:
+                        kept["done_day"] = r["done_day"]
+            if r["id"] is not None:
+                rows[(r["input_cm"], r["input_day"])] = dict(r)
+        # Inputs whose first-ever insert lost to a concurrent tap — now they're updates
+        pending = [i for i in pending if (i[0], i[1]) not in rows]
+        if not pending:
+            break
+    if pending:
+        await db.rollback()
+        raise HTTPException(409, "Habit log changed concurrently, please retry")
+    await habit_pack_ranks.refresh(db, [r["challenge_id"] for r in rows.values()])
+    await db.commit()
+    return [rows[key] for key in latest]
+
 
-    # Real-time push notifications
-    if completed:
-        total_result = await db.execute(
-            select(func.count()).where(HabitCommitment.challenge_id == challenge_id)
-        )
-        total_habits = total_result.scalar() or 0
-
-        done_result = await db.execute(
-            select(func.count())
-            .select_from(DailyLog)
-            .join(HabitCommitment, DailyLog.commitment_id == HabitCommitment.id)
-            .where(
-                HabitCommitment.challenge_id == challenge_id,
-                DailyLog.logged_date == logged_date,
-                DailyLog.completed == True,
-            )
+async def _streaks_for(db: AsyncSession, rows: list[dict], today: date) -> dict[int, dict]:
+    """Streak payload per challenge touched by rows — computed once per challenge."""
+    streaks: dict[int, dict] = {}
+    for r in rows:
+        cid = r["challenge_id"]
+        if cid in streaks:
+            continue
+        by_date = {date.fromisoformat(d): n for d, n in (_json(r["days"]) or [])}
+        for t in rows:
+            if t["challenge_id"] == cid and t["done_day"] is not None:
+                if t["done_day"] > 0:
+                    by_date[t["input_day"]] = t["done_day"]
+                else:
+                    by_date.pop(t["input_day"], None)
+        checkpoint = _json(r["checkpoint"])
+        if checkpoint:
+            checkpoint["as_of"] = date.fromisoformat(checkpoint["as_of"])
+        ss = await habit_streak.streak_from_checkpoint(
+            db, cid, checkpoint, by_date, r["started_at"], r["ends_at"], r["total"], today,
         )
-        done_today = done_result.scalar() or 0
+        streaks[cid] = _streak_payload(cid, ss, by_date, r["started_at"], r["total"], today)
+    return streaks
+
+
+async def _celebrate(db: AsyncSession, user_id: str, rows: list[dict], streaks: dict[int, dict]) -> None:
+    """At most one push for a write: perfect day wins over a streak milestone."""
+    completed = [r for r in rows if r["completed"]]
+    perfect = next((r for r in completed if r["total"] and (r["done_day"] or 0) >= r["total"]), None)
+    if perfect:
+        await fire_habit_perfect_day(db, user_id, perfect["challenge_id"])
+        return
+    for r in completed:
+        effective = streaks[r["challenge_id"]].get("effective_streak", 0)
+        if effective in _STREAK_MILESTONES:
+            await fire_habit_streak_milestone(db, user_id, effective)
+            return
 
-        if total_habits > 0 and done_today >= total_habits:
-            await fire_habit_perfect_day(db, user_id, challenge_id)
-        elif streak.get("effective_streak", 0) in _STREAK_MILESTONES:
-            await fire_habit_streak_milestone(db, user_id, streak["effective_streak"])
 
+def _log_out(r: dict, streak: dict) -> dict:
     return {
-        "id": log.id,
-        "commitment_id": log.commitment_id,
-        "logged_date": log.logged_date,
-        "completed": log.completed,
-        "value": log.value,
-        "logged_at": log.logged_at,
+        "id": r["id"],
+        "commitment_id": r["commitment_id"],
+        "logged_date": r["logged_date"],
+        "completed": r["completed"],
+        "value": r["value"],
+        "logged_at": r["logged_at"],
         **streak,
     }
 
 
+async def upsert_log(db: AsyncSession, user_id: str, commitment_id: int,
+                     logged_date: date, completed: bool, value: int | None) -> dict:
+    rows = await _write_logs(db, user_id, [(commitment_id, logged_date, completed, value)])
+    streaks = await _streaks_for(db, rows, date.today())
+    await _celebrate(db, user_id, rows, streaks)
+    return _log_out(rows[0], streaks[rows[0]["challenge_id"]])
+
+
+async def upsert_logs(db: AsyncSession, user_id: str, items: list[tuple]) -> list[dict]:
+    """
+    Batch of upsert_log calls — (commitment_id, logged_date, completed, value)
+    items applied in one transaction. The streak is computed once per challenge
+    and at most one celebration push goes out. Returns the upsert_log payload
+    per log (repeats of the same habit/day collapse to the last one).
+    """
+    rows = await _write_logs(db, user_id, items)
+    streaks = await _streaks_for(db, rows, date.today())
+    await _celebrate(db, user_id, rows, streaks)
+    return [_log_out(r, streaks[r["challenge_id"]]) for r in rows]
+
+
 async def get_leaderboard(
     db: AsyncSession,
     days: int = 7,
     department_id: str | None = None,
     current_user_id: str | None = None,
-) -> list[dict]:
-    from sqlalchemy.orm import selectinload
+    limit: int | None = None,
+    offset: int = 0,
+    around_me: int | None = None,
+) -> dict:
+    """
+    Habit leaderboard, aggregated in SQL — one row per active challenge.
+
+    Only the active challenges' day rollups are read (started_at..today:
+    enough for both windows and the streak); Python just shapes the rows.
+    Slicing: limit/offset pages from the top, or around_me=N returns N rows
+    either side of the current user. Ranks are always board-wide.
+
+    Returns {"entries": [...], "total": <board size>, "my_rank": <int | None>}.
+    """
     today = date.today()
     period_start = today - timedelta(days=days - 1)
     prev_start   = period_start - timedelta(days=days)
     prev_end     = period_start - timedelta(days=1)
 
-    q = (
-        select(HabitChallenge)
-        .options(
-            selectinload(HabitChallenge.user),
-            selectinload(HabitChallenge.commitments).selectinload(HabitCommitment.logs),
-        )
-        .where(HabitChallenge.status == ChallengeStatus.active)
-    )
+    params: dict = {
+        "today": today, "start": period_start, "prev_start": prev_start, "prev_end": prev_end,
+        "me": current_user_id, "offset": offset, "limit": limit, "around": around_me,
+    }
+    dept_filter = ""
     if department_id:
-        q = q.join(User, User.id == HabitChallenge.user_id).where(
-            User.department_id == department_id
-        )
-    result = await db.execute(q)
-    challenges = result.scalars().all()
-
-    def compute_stats(challenge, start: date, end: date) -> dict:
-        total_habits = len(challenge.commitments)
-        actual_start = max(start, challenge.started_at)
-        actual_end   = min(end, today)
-        if not total_habits or actual_start > actual_end:
-            return {"completion_pct": 0.0, "completed": 0, "possible": 0, "streak": 0}
-        days_count = (actual_end - actual_start).days + 1
-        possible   = total_habits * days_count
-        completed  = sum(
-            1 for cm in challenge.commitments
-            for log in cm.logs
-            if actual_start <= log.logged_date <= actual_end and log.completed
+        dept_filter = "AND u.department_id = :dept"
+        params["dept"] = department_id
+
+    if around_me is not None:
+        # Centre on my rank; if I'm not on the board, the top 2N+1
+        slice_sql = """
+            WHERE rank BETWEEN COALESCE((SELECT rank FROM ranked WHERE user_id = CAST(:me AS uuid) LIMIT 1), 1) - :around
+                           AND COALESCE((SELECT rank FROM ranked WHERE user_id = CAST(:me AS uuid) LIMIT 1), :around + 1) + :around
+            ORDER BY rank
+        """
+    else:
+        slice_sql = "ORDER BY rank OFFSET :offset" + (" LIMIT :limit" if limit else "")
+
+    rows = (await db.execute(text(f"""
+        WITH ch AS (
+            SELECT hc.id AS challenge_id, hc.user_id, hc.started_at,
+                   COALESCE(u.name, u.email) AS name, u.profile_pic_url,
+                   (SELECT COUNT(*) FROM habit_commitments hcm WHERE hcm.challenge_id = hc.id) AS total_habits
+            FROM habit_challenges hc
+            JOIN users u ON u.id = hc.user_id
+            WHERE hc.status = 'active' {dept_filter}
+        ),
+        daily AS (
+            SELECT r.challenge_id, r.day AS logged_date, r.done
+            FROM ch
+            JOIN habit_day_rollup r ON r.challenge_id = ch.challenge_id
+            WHERE r.done > 0
+              AND r.day >= ch.started_at AND r.day <= :today
+        ),
+        good AS (
+            -- days meeting the 50% floor; islands of consecutive days share grp
+            SELECT d.challenge_id, d.logged_date,
+                   d.logged_date - (ROW_NUMBER() OVER (PARTITION BY d.challenge_id ORDER BY d.logged_date))::int AS grp
+            FROM daily d JOIN ch ON ch.challenge_id = d.challenge_id
+            WHERE d.done >= GREATEST(1, (ch.total_habits + 1) / 2)
+        ),
+        streaks AS (
+            SELECT challenge_id, COUNT(*) AS streak
+            FROM good
+            GROUP BY challenge_id, grp
+            HAVING MAX(logged_date) = :today
+        ),
+        stats AS (
+            SELECT ch.challenge_id, ch.user_id, ch.name, ch.profile_pic_url,
+                   COALESCE(SUM(d.done) FILTER (WHERE d.logged_date >= :start), 0) AS completed,
+                   COALESCE(SUM(d.done) FILTER (WHERE d.logged_date BETWEEN :prev_start AND :prev_end), 0) AS prev_completed,
+                   ch.total_habits * GREATEST((CAST(:today AS date) - GREATEST(CAST(:start AS date), ch.started_at)) + 1, 0) AS possible,
+                   ch.total_habits * GREATEST((CAST(:prev_end AS date) - GREATEST(CAST(:prev_start AS date), ch.started_at)) + 1, 0) AS prev_possible,
+                   COALESCE(MAX(s.streak), 0) AS streak
+            FROM ch
+            LEFT JOIN daily d   ON d.challenge_id = ch.challenge_id
+            LEFT JOIN streaks s ON s.challenge_id = ch.challenge_id
+            GROUP BY ch.challenge_id, ch.user_id, ch.name, ch.profile_pic_url, ch.total_habits, ch.started_at
+        ),
+        ranked AS (
+            SELECT stats.*,
+                   ROUND(completed * 100.0 / GREATEST(possible, 1), 1)           AS completion_pct,
+                   ROW_NUMBER() OVER (ORDER BY ROUND(completed * 100.0 / GREATEST(possible, 1), 1) DESC,
+                                               completed DESC, challenge_id)   AS rank,
+                   ROW_NUMBER() OVER (ORDER BY ROUND(prev_completed * 100.0 / GREATEST(prev_possible, 1), 1) DESC,
+                                               completed DESC, challenge_id)   AS prev_rank,
+                   COUNT(*) OVER ()                                             AS total
+            FROM stats
         )
-        by_date: dict[date, int] = defaultdict(int)
-        for cm in challenge.commitments:
-            for log in cm.logs:
-                if log.completed:
-                    by_date[log.logged_date] += 1
-        streak = 0
-        d = today
-        min_required = max(1, -(-total_habits // 2))  # ceil(total/2)
-        while d >= challenge.started_at:
-            if by_date.get(d, 0) >= min_required:
-                streak += 1
-                d -= timedelta(days=1)
-            else:
-                break
-        return {
-            "completion_pct": round(completed / max(possible, 1) * 100, 1),
-            "completed":      completed,
-            "possible":       possible,
-            "streak":         streak,
+        SELECT ranked.*,
+               (SELECT rank FROM ranked r2 WHERE r2.user_id = CAST(:me AS uuid) ORDER BY rank LIMIT 1) AS my_rank
+        FROM ranked
+        {slice_sql}
+    """), params)).mappings().all()
+
+    entries = [
+        {
+            "rank":            int(r["rank"]),
+            "rank_change":     int(r["prev_rank"]) - int(r["rank"]),  # positive = moved UP
+            "user_id":         str(r["user_id"]),
+            "name":            r["name"],
+            "profile_pic_url": r["profile_pic_url"],
+            "challenge_id":    r["challenge_id"],
+            "is_me":           str(r["user_id"]) == current_user_id,
+            "completion_pct":  float(r["completion_pct"]),
+            "completed":       int(r["completed"]),
+            "possible":        int(r["possible"]),
+            "streak":          int(r["streak"]),
         }
+        for r in rows
+    ]
+    if rows:
+        total, my_rank = int(rows[0]["total"]), rows[0]["my_rank"]
+    else:
+        # Offset past the end — still report the board size
+        total = (await db.execute(text(f"""
+            SELECT COUNT(*) FROM habit_challenges hc JOIN users u ON u.id = hc.user_id
+            WHERE hc.status = 'active' {dept_filter}
+        """), params)).scalar() or 0
+        my_rank = None
+    return {"entries": entries, "total": total, "my_rank": int(my_rank) if my_rank else None}
+
+
+# ── History ───────────────────────────────────────────────────────────────────
+# GET /history pages through cycle summaries (rollup only); the per-habit and
+# per-day breakdown is GET /history/{id}. A cycle that is closed — not active
+# and past ends_at — no longer changes, so its summary and detail are kept in
+# habit_cycle_cache. Log writes (_UPSERT_LOGS_SQL) and rollup rebuilds drop the
+# challenge's row, which covers back-dated edits and custom-habit deletes.
+# The cached detail keeps habit ids only; catalog fields (label, slug, ...) are
+# filled from ref_cache on every read, so catalog edits show up there too.
+
+_HISTORY_SQL = """
+    SELECT hc.id, hc.pack_id, hc.status, hc.started_at, hc.ends_at,
+           (SELECT COUNT(*) FROM habit_commitments t WHERE t.challenge_id = hc.id) AS total,
+           cc.summary, {detail}
+    FROM habit_challenges hc
+    LEFT JOIN habit_cycle_cache cc ON cc.challenge_id = hc.id
+    WHERE hc.user_id = :uid {where}
+    ORDER BY hc.started_at DESC, hc.id DESC
+    {limit}
+"""
+
+
+def _is_closed(c, today: date) -> bool:
+    # Cacheable once nothing in the summary can change. On ends_at + 1 the
+    # cycle is already completed, but its last day is still "yesterday" and
+    # keeps current_streak alive — it only settles at 0 the day after.
+    return c["status"] != ChallengeStatus.active and c["ends_at"] < today - timedelta(days=1)
+
+
+def _cycle_summary(c, by_date: dict, today: date) -> dict:
+    total_habits = c["total"]
+    total_days = (c["ends_at"] - c["started_at"]).days + 1
+    days_elapsed = min((today - c["started_at"]).days + 1, total_days)
+    perfect_days = sum(1 for v in by_date.values() if v >= total_habits) if total_habits else 0
+    end = min(today, c["ends_at"])
+    ss = habit_streak.compute_shield_streak(by_date, c["started_at"], end, total_habits, today)
+    return {
+        "id":                   c["id"],
+        "pack_id":              c["pack_id"],
+        "status":               c["status"],
+        "started_at":           c["started_at"],
+        "ends_at":              c["ends_at"],
+        "habit_count":          total_habits,
+        "total_days":           total_days,
+        "days_elapsed":         days_elapsed,
+        "perfect_days":         perfect_days,
+        "completion_pct":       round(perfect_days / max(days_elapsed, 1) * 100, 1),
+        "current_streak":       ss["current_streak"],    # raw streak (no shields)
+        "longest_streak":       ss["longest_streak"],
+        "shields_earned":       ss["shields_earned"],
+        "shields_used":         ss["shields_used"],
+        "effective_streak":     ss["effective_streak"],
+        "shield_used_on_dates": ss["shield_used_on_dates"],
+    }
 
-    entries = []
-    for challenge in challenges:
-        user = challenge.user
-        if not user:
-            continue
-        curr = compute_stats(challenge, period_start, today)
-        prev = compute_stats(challenge, prev_start, prev_end)
-        entries.append({
-            "user_id":         str(user.id),
-            "name":            user.name or user.email,
-            "profile_pic_url": user.profile_pic_url,
-            "challenge_id":    challenge.id,
-            "is_me":           str(user.id) == current_user_id,
-            "_prev_pct":       prev["completion_pct"],
-            **curr,
-        })
 
-    # Sort: best completion %, then total habits completed as tiebreaker
-    entries.sort(key=lambda x: (-x["completion_pct"], -x["completed"]))
-    for i, e in enumerate(entries):
-        e["rank"] = i + 1
+async def _cache_cycles(db: AsyncSession, rows: list[dict]) -> None:
+    """Upsert habit_cycle_cache rows ({challenge_id, summary, detail|None}) and commit."""
+    try:
+        async with db.begin_nested():
+            await db.execute(text("""
+                INSERT INTO habit_cycle_cache (challenge_id, summary, detail)
+                VALUES (:challenge_id, CAST(:summary AS jsonb), CAST(:detail AS jsonb))
+                ON CONFLICT (challenge_id) DO UPDATE
+                    SET summary    = EXCLUDED.summary,
+                        detail     = COALESCE(EXCLUDED.detail, habit_cycle_cache.detail),
+                        updated_at = now()
+            """), [{
+                "challenge_id": r["challenge_id"],
+                "summary":      json.dumps(r["summary"], default=str),
+                "detail":       json.dumps(r["detail"], default=str) if r.get("detail") else None,
+            } for r in rows])
+        await db.commit()
+    except Exception as e:
+        logger.warning(f"History cache save failed for challenges {[r['challenge_id'] for r in rows]}: {e}")
+
+
+async def get_challenge_history(
+    db: AsyncSession,
+    user_id: str,
+    limit: int = 10,
+    before_id: int | None = None,
+) -> dict:
+    """Cycle summaries, newest first, keyset-paginated on (started_at, id)."""
+    where = ""
+    params = {"uid": user_id, "lim": limit + 1}
+    if before_id is not None:
+        where = "AND (hc.started_at, hc.id) < (SELECT started_at, id FROM habit_challenges WHERE id = :before)"
+        params["before"] = before_id
+    rows = (await db.execute(
+        text(_HISTORY_SQL.format(detail="NULL AS detail", where=where, limit="LIMIT :lim")), params,
+    )).mappings().all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
 
-    # Rank change vs previous period
-    prev_sorted  = sorted(entries, key=lambda x: (-x["_prev_pct"], -x["completed"]))
-    prev_rank_map = {e["user_id"]: i + 1 for i, e in enumerate(prev_sorted)}
-    for e in entries:
-        prev_rank        = prev_rank_map.get(e["user_id"], e["rank"])
-        e["rank_change"] = prev_rank - e["rank"]  # positive = moved UP
-        del e["_prev_pct"]
+    today = date.today()
+    missing = [r["id"] for r in rows if r["summary"] is None or not _is_closed(r, today)]
+    done_map: dict[int, dict[date, int]] = defaultdict(dict)
+    if missing:
+        rollup = await db.execute(text("""
+            SELECT challenge_id, day, done FROM habit_day_rollup
+            WHERE challenge_id = ANY(CAST(:ids AS int[])) AND done > 0
+        """), {"ids": missing})
+        for cid, day, done in rollup.all():
+            done_map[cid][day] = done
+
+    items, to_cache = [], []
+    for r in rows:
+        if r["summary"] is not None and _is_closed(r, today):
+            items.append(_json(r["summary"]))
+            continue
+        summary = _cycle_summary(r, done_map[r["id"]], today)
+        items.append(summary)
+        if _is_closed(r, today):
+            to_cache.append({"challenge_id": r["id"], "summary": summary})
+    if to_cache:
+        await _cache_cycles(db, to_cache)
 
-    return entries
+    return {
+        "items":          items,
+        "has_more":       has_more,
+        "next_before_id": rows[-1]["id"] if has_more else None,
+    }
 
 
-async def get_challenge_history(db: AsyncSession, user_id: str) -> list[dict]:
-    result = await db.execute(
-        select(HabitChallenge)
-        .options(
-            selectinload(HabitChallenge.commitments).selectinload(HabitCommitment.habit),
-            selectinload(HabitChallenge.commitments).selectinload(HabitCommitment.logs),
-        )
-        .where(HabitChallenge.user_id == user_id)
-        .order_by(HabitChallenge.started_at.desc())
-    )
-    challenges = result.scalars().all()
+async def get_challenge_detail(db: AsyncSession, user_id: str, challenge_id: int) -> dict:
+    """One cycle with per-habit stats and the per-day × per-habit matrix."""
+    c = (await db.execute(
+        text(_HISTORY_SQL.format(detail="cc.detail", where="AND hc.id = :cid", limit="")),
+        {"uid": user_id, "cid": challenge_id},
+    )).mappings().first()
+    if not c:
+        raise HTTPException(404, "Challenge not found")
 
     today = date.today()
-    history = []
-
-    for challenge in challenges:
-        total_habits = len(challenge.commitments)
-        total_days = (challenge.ends_at - challenge.started_at).days + 1
-        days_elapsed = min((today - challenge.started_at).days + 1, total_days)
-
-        by_date: dict[date, int] = defaultdict(int)
-        habit_entries = []
-        # log_map[commitment_id][logged_date] = log
-        log_map: dict[int, dict[date, object]] = defaultdict(dict)
-        sorted_commitments = sorted(challenge.commitments, key=lambda x: x.sort_order)
-
-        for commitment in sorted_commitments:
-            completed_days = sum(1 for log in commitment.logs if log.completed)
-            habit_entries.append({
-                "commitment_id": commitment.id,
-                "habit": commitment.habit,
-                "days_completed": completed_days,
-                "days_total": days_elapsed,
-                "completion_pct": round(completed_days / max(days_elapsed, 1) * 100, 1),
-            })
-            for log in commitment.logs:
-                log_map[commitment.id][log.logged_date] = log
-                if log.completed:
-                    by_date[log.logged_date] += 1
-
-        perfect_days = sum(1 for v in by_date.values() if v >= total_habits) if total_habits else 0
-
-        # SHIELD LOGIC — delegated to shared helper
-        end = min(today, challenge.ends_at)
-        ss = _compute_shield_streak(by_date, challenge.started_at, end, total_habits, today)
-        shields_earned       = ss["shields_earned"]
-        shields_used         = ss["shields_used"]
-        shield_used_on_dates = ss["shield_used_on_dates"]
-        effective_streak     = ss["effective_streak"]
-        current              = ss["current_streak"]    # raw streak (no shields)
-        longest              = ss["longest_streak"]
-
-        # Build per-day breakdown
-        daily_logs = []
-        d = challenge.started_at
-        end_day = min(today, challenge.ends_at)
-        while d <= end_day:
-            day_habits = []
-            completed_count = 0
-            for cm in sorted_commitments:
-                log = log_map[cm.id].get(d)
-                completed = log.completed if log else False
-                if completed:
-                    completed_count += 1
-                day_habits.append({
-                    "commitment_id": cm.id,
-                    "habit_slug":    cm.habit.slug,
-                    "habit_label":   cm.habit.label,
-                    "completed":     completed,
-                    "value":         log.value if log else None,
-                })
-            daily_logs.append({
-                "date":            d,
-                "day_number":      (d - challenge.started_at).days + 1,
-                "habits":          day_habits,
-                "all_completed":   completed_count == total_habits,
-                "completed_count": completed_count,
-                "total_count":     total_habits,
+    cached = _json(c["detail"]) if c["detail"] is not None else None
+    # Entries cached before catalog fields were dropped from the cache carry
+    # "habit" instead of "habit_id" — rebuild those once
+    if cached is not None and _is_closed(c, today) and all("habit_id" in h for h in cached["habits"]):
+        return await _hydrate_detail(db, cached)
+
+    meta = await _commitment_meta(db, challenge_id)
+    logs = (await db.execute(text("""
+        SELECT dl.commitment_id, dl.logged_date, dl.completed, dl.value
+        FROM daily_logs dl
+        JOIN habit_commitments hcm ON hcm.id = dl.commitment_id
+        WHERE hcm.challenge_id = :cid
+    """), {"cid": challenge_id})).mappings().all()
+    by_date = await habit_rollup.done_by_date(db, challenge_id)
+
+    summary = _cycle_summary(c, by_date, today)
+    days_elapsed = summary["days_elapsed"]
+    total_habits = c["total"]
+
+    # log_map[commitment_id][logged_date] = log
+    log_map: dict[int, dict[date, dict]] = defaultdict(dict)
+    for log in logs:
+        log_map[log["commitment_id"]][log["logged_date"]] = log
+
+    habit_entries = []
+    for m in meta:
+        completed_days = sum(1 for log in log_map[m["commitment_id"]].values() if log["completed"])
+        habit_entries.append({
+            "commitment_id":  m["commitment_id"],
+            "habit_id":       m.get("habit_id"),
+            "custom_name":    m.get("name"),
+            "days_completed": completed_days,
+            "days_total":     days_elapsed,
+            "completion_pct": round(completed_days / max(days_elapsed, 1) * 100, 1),
+        })
+
+    # Per-day breakdown — counts from the rollup, cells from the logs
+    daily_logs = []
+    d = c["started_at"]
+    end_day = min(today, c["ends_at"])
+    while d <= end_day:
+        day_habits = []
+        for m in meta:
+            log = log_map[m["commitment_id"]].get(d)
+            day_habits.append({
+                "commitment_id": m["commitment_id"],
+                "completed":     log["completed"] if log else False,
+                "value":         log["value"] if log else None,
             })
-            d += timedelta(days=1)
-
-        history.append({
-            "id": challenge.id,
-            "pack_id": challenge.pack_id,
-            "status": challenge.status,
-            "started_at": challenge.started_at,
-            "ends_at": challenge.ends_at,
-            "total_days": total_days,
-            "days_elapsed": days_elapsed,
-            "perfect_days": perfect_days,
-            "completion_pct": round(perfect_days / max(days_elapsed, 1) * 100, 1),
-            "current_streak": current,
-            "longest_streak": longest,
-            "shields_earned": shields_earned,
-            "shields_used": shields_used,
-            "effective_streak": effective_streak,
-            "shield_used_on_dates": shield_used_on_dates,
-            "habits": habit_entries,
-            "daily_logs": daily_logs,
+        completed_count = by_date.get(d, 0)
+        daily_logs.append({
+            "date":            d,
+            "day_number":      (d - c["started_at"]).days + 1,
+            "habits":          day_habits,
+            "all_completed":   completed_count == total_habits,
+            "completed_count": completed_count,
+            "total_count":     total_habits,
         })
+        d += timedelta(days=1)
 
-    return history
+    detail = {**summary, "habits": habit_entries, "daily_logs": daily_logs}
+    if _is_closed(c, today):
+        await _cache_cycles(db, [{"challenge_id": challenge_id, "summary": summary, "detail": detail}])
+    return await _hydrate_detail(db, detail)
+
+
+async def _hydrate_detail(db: AsyncSession, detail: dict) -> dict:
+    """Fill a detail's habit / habit_slug / habit_label from the ref_cache catalog."""
+    habits = await _habits_by_id(db, [
+        {"is_custom": h["habit_id"] is None, "habit_id": h["habit_id"]} for h in detail["habits"]
+    ])
+    by_commitment = {}
+    entries = []
+    for h in detail["habits"]:
+        habit = habits[h["habit_id"]] if h["habit_id"] is not None else None
+        by_commitment[h["commitment_id"]] = (
+            (habit["slug"], habit["label"]) if habit else (None, h["custom_name"])
+        )
+        entries.append({
+            "commitment_id":  h["commitment_id"],
+            "habit":          habit,
+            "days_completed": h["days_completed"],
+            "days_total":     h["days_total"],
+            "completion_pct": h["completion_pct"],
+        })
+    return {
+        **detail,
+        "habits": entries,
+        "daily_logs": [
+            {**day, "habits": [
+                {
+                    "commitment_id": cell["commitment_id"],
+                    "habit_slug":    by_commitment[cell["commitment_id"]][0],
+                    "habit_label":   by_commitment[cell["commitment_id"]][1],
+                    "completed":     cell["completed"],
+                    "value":         cell["value"],
+                }
+                for cell in day["habits"]
+            ]}
+            for day in detail["daily_logs"]
+        ],
+    }
 
 
 async def get_streak(db: AsyncSession, challenge_id: int, user_id: str) -> dict:
@@ -517,24 +780,18 @@ async def get_streak(db: AsyncSession, challenge_id: int, user_id: str) -> dict:
         return {"challenge_id": challenge_id, "current_streak": 0,
                 "longest_streak": 0, "perfect_days": 0, "completion_pct": 0.0}
 
-    logs_result = await db.execute(
-        select(DailyLog).where(
-            DailyLog.commitment_id.in_([c.id for c in commitments]),
-            DailyLog.completed == True,
-        )
-    )
-    logs = logs_result.scalars().all()
-
-    by_date: dict[date, int] = defaultdict(int)
-    for log in logs:
-        by_date[log.logged_date] += 1
+    by_date = await habit_rollup.done_by_date(db, challenge_id)
 
     today = date.today()
-    days_elapsed = (today - challenge.started_at).days + 1
-    perfect_days = sum(1 for v in by_date.values() if v >= total)
+    ss = await habit_streak.shield_streak(db, challenge_id, by_date, challenge.started_at,
+                                         challenge.ends_at, total, today)
+    return _streak_payload(challenge_id, ss, by_date, challenge.started_at, total, today)
 
-    ss = _compute_shield_streak(by_date, challenge.started_at, today, total, today)
 
+def _streak_payload(challenge_id: int, ss: dict, by_date: dict, started_at: date,
+                    total: int, today: date) -> dict:
+    days_elapsed = (today - started_at).days + 1
+    perfect_days = sum(1 for v in by_date.values() if v >= total)
     return {
         "challenge_id":         challenge_id,
         "current_streak":       ss["current_streak"],
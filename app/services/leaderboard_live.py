@@ -0,0 +1,129 @@
+"""
+Live leaderboard deltas — pushed over /ws to clients subscribed to a challenge.
+
+After a step write (POST /api/steps/add, Google Fit upsert) the writer calls
+leaderboard_changed(challenge_ids). Per challenge, publishing is debounced:
+a burst of writes within _DEBOUNCE_S produces one ranking query and one
+message. The message carries only the rows that moved since the last publish
+from this process:
+
+    {"type": "leaderboard_delta", "challenge_id": "...", "full": false,
+     "rows": [{"user_id": "...", "rank": 3, "total_steps": 84120}, ...]}
+
+Clients upsert rows by user_id into the leaderboard they fetched. The first
+publish for a challenge after a restart has no baseline and is sent with
+"full": true (every participant, possibly split over several messages).
+
+Transport: pg_notify('challenge_<id>', …). ws.py LISTENs on that channel while
+any local socket is subscribed to topic "challenge:<id>", so every worker
+delivers to its own subscribers.
+"""
+import asyncio
+import json
+import logging
+from datetime import date
+
+from sqlalchemy import text
+
+from app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "challenge_"
+
+_DEBOUNCE_S = 2.0
+_NOTIFY_MAX_BYTES = 7500  # pg_notify payload limit is 8000 bytes
+
+# challenge_id → {user_id: (rank, total_steps)} as last published
+_last: dict[str, dict[str, tuple[int, int]]] = {}
+_jobs: dict[str, asyncio.Task] = {}
+_dirty: set[str] = set()
+
+
+def leaderboard_changed(challenge_ids) -> None:
+    """Schedule a debounced delta publish for each challenge. Never blocks."""
+    for cid in {str(c) for c in challenge_ids}:
+        _dirty.add(cid)
+        job = _jobs.get(cid)
+        if job is None or job.done():
+            _jobs[cid] = asyncio.create_task(_publish_job(cid))
+
+
+async def _publish_job(challenge_id: str) -> None:
+    try:
+        while True:
+            await asyncio.sleep(_DEBOUNCE_S)
+            # Writes landing after this point re-mark the challenge → one more pass
+            _dirty.discard(challenge_id)
+            try:
+                await _publish(challenge_id)
+            except Exception as e:
+                logger.error(f"[leaderboard] publish failed for {challenge_id}: {e}", exc_info=True)
+            if challenge_id not in _dirty:
+                break
+    finally:
+        _jobs.pop(challenge_id, None)
+
+
+async def _publish(challenge_id: str) -> None:
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(text("""
+            WITH totals AS (
+                SELECT cp.user_id, COALESCE(SUM(ds.steps), 0) AS total_steps
+                FROM challenges c
+                JOIN challenge_participants cp
+                    ON cp.challenge_id = c.id AND cp.left_at IS NULL
+                LEFT JOIN daily_steps ds
+                    ON ds.user_id = cp.user_id
+                    AND ds.day >= c.start_date
+                    AND ds.day <= LEAST(c.end_date, :today)
+                WHERE c.id = :cid
+                GROUP BY cp.user_id
+            )
+            SELECT user_id, total_steps,
+                   ROW_NUMBER() OVER (ORDER BY total_steps DESC, user_id ASC) AS rank
+            FROM totals
+        """), {"cid": challenge_id, "today": date.today()})).mappings().all()
+
+        current = {str(r["user_id"]): (int(r["rank"]), int(r["total_steps"])) for r in rows}
+        previous = _last.get(challenge_id)
+        _last[challenge_id] = current
+
+        full = previous is None
+        moved = [
+            {"user_id": uid, "rank": rank, "total_steps": total}
+            for uid, (rank, total) in current.items()
+            if full or previous.get(uid) != (rank, total)
+        ]
+        if not moved and not full:
+            return
+
+        moved.sort(key=lambda r: r["rank"])
+        for payload in _chunks(challenge_id, moved, full):
+            await db.execute(text("SELECT pg_notify(:ch, :payload)"),
+                             {"ch": CHANNEL_PREFIX + challenge_id, "payload": payload})
+        await db.commit()
+        logger.info(f"[leaderboard] {challenge_id}: published {len(moved)} rows (full={full})")
+
+
+def _chunks(challenge_id: str, rows: list[dict], full: bool) -> list[str]:
+    """Split into NOTIFY-sized messages (a large full snapshot may need several)."""
+    overhead = len(_message(challenge_id, [], full))
+    out: list[str] = []
+    batch: list[dict] = []
+    size = overhead
+    for row in rows:
+        row_size = len(json.dumps(row, separators=(",", ":"))) + 1
+        if batch and size + row_size > _NOTIFY_MAX_BYTES:
+            out.append(_message(challenge_id, batch, full))
+            batch, size = [], overhead
+        batch.append(row)
+        size += row_size
+    if batch or not out:
+        out.append(_message(challenge_id, batch, full))
+    return out
+
+
+def _message(challenge_id: str, rows: list[dict], full: bool) -> str:
+    return json.dumps({"type": "leaderboard_delta", "challenge_id": challenge_id,
+                       "full": full, "rows": rows}, separators=(",", ":"))
@@ -28,6 +28,8 @@ from typing import Any
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 
+from app.services.ws_replay import inbox_event
+
 logger = logging.getLogger(__name__)
 
 # ── Retention policy ──────────────────────────────────────────────────────────
@@ -45,6 +47,8 @@ _EXPIRY_DAYS: dict[str, int | None] = {
 }
 _DEFAULT_EXPIRY_DAYS = 30
 
+_NOTIFY_MAX_BYTES = 7500  # pg_notify payload limit is 8000 bytes
+
 
 async def write_inbox(
     db: AsyncSession,
@@ -65,22 +69,22 @@ async def write_inbox(
     Never raises — errors are logged silently so a failing inbox write
     never breaks the surrounding push or API response.
 
+    Also queues an "inbox" event on the user's WebSocket channel; pg_notify is
+    transactional, so it is delivered when the caller commits (and dropped
+    on rollback). Missed events are replayed on reconnect — see ws_replay.py.
+
     The caller must commit the session after calling this function.
     """
     try:
-        expiry_days = _EXPIRY_DAYS.get(type, _DEFAULT_EXPIRY_DAYS)
-        expires_at = (
-            datetime.now(timezone.utc) + timedelta(days=expiry_days)
-            if expiry_days is not None
-            else None
-        )
-        await db.execute(text("""
+        expires_at = _expires_at(type)
+        row = (await db.execute(text("""
             INSERT INTO notification_inbox
                 (user_id, type, actor_user_id, actor_name, template_key,
                  payload, action_url, push_title, push_body, expires_at)
             VALUES
                 (:user_id, :type, :actor_user_id, :actor_name, :template_key,
                  CAST(:payload AS jsonb), :action_url, :push_title, :push_body, :expires_at)
+            RETURNING id, type, template_key, payload, action_url, actor_name, created_at
         """), {
             "user_id":       str(user_id),
             "type":          type,
@@ -92,8 +96,83 @@ async def write_inbox(
             "push_title":    push_title,
             "push_body":     push_body,
             "expires_at":    expires_at,
-        })
+        })).mappings().first()
+
+        await db.execute(text("SELECT pg_notify(:ch, :payload)"),
+                         {"ch": f"user_{user_id}", "payload": _ws_event(row)})
     except Exception as exc:
         logger.error(
             "write_inbox failed for user=%s type=%s: %s", user_id, type, exc
         )
+
+
+async def write_inbox_many(db: AsyncSession, items: list[dict[str, Any]]) -> int:
+    """
+    Bulk write_inbox for scheduled jobs — one INSERT and one NOTIFY statement
+    for any number of rows instead of two round trips each.
+
+    Each item takes the same keys as write_inbox's keyword arguments
+    (user_id, type, template_key, payload required). Same contract otherwise:
+    never raises, the caller commits. Returns the number of rows written.
+    """
+    if not items:
+        return 0
+    cols: dict[str, list] = {k: [] for k in (
+        "user_id", "type", "actor_user_id", "actor_name", "template_key",
+        "payload", "action_url", "push_title", "push_body", "expires_at",
+    )}
+    for it in items:
+        cols["user_id"].append(str(it["user_id"]))
+        cols["type"].append(it["type"])
+        cols["actor_user_id"].append(str(it["actor_user_id"]) if it.get("actor_user_id") else None)
+        cols["actor_name"].append(it.get("actor_name"))
+        cols["template_key"].append(it["template_key"])
+        cols["payload"].append(json.dumps(it["payload"]))
+        cols["action_url"].append(it.get("action_url"))
+        cols["push_title"].append(it.get("push_title"))
+        cols["push_body"].append(it.get("push_body"))
+        cols["expires_at"].append(_expires_at(it["type"]))
+
+    try:
+        rows = (await db.execute(text("""
+            INSERT INTO notification_inbox
+                (user_id, type, actor_user_id, actor_name, template_key,
+                 payload, action_url, push_title, push_body, expires_at)
+            SELECT t.user_id, t.type, t.actor_user_id, t.actor_name, t.template_key,
+                   CAST(t.payload AS jsonb), t.action_url, t.push_title, t.push_body, t.expires_at
+            FROM unnest(
+                CAST(:user_id AS uuid[]), CAST(:type AS text[]), CAST(:actor_user_id AS uuid[]),
+                CAST(:actor_name AS text[]), CAST(:template_key AS text[]), CAST(:payload AS text[]),
+                CAST(:action_url AS text[]), CAST(:push_title AS text[]), CAST(:push_body AS text[]),
+                CAST(:expires_at AS timestamptz[])
+            ) AS t(user_id, type, actor_user_id, actor_name, template_key,
+                   payload, action_url, push_title, push_body, expires_at)
+            RETURNING id, user_id, type, template_key, payload, action_url, actor_name, created_at
+        """), cols)).mappings().all()
+
+        await db.execute(text("""
+            SELECT pg_notify(c, p) FROM unnest(CAST(:chs AS text[]), CAST(:payloads AS text[])) AS t(c, p)
+        """), {
+            "chs":      [f"user_{r['user_id']}" for r in rows],
+            "payloads": [_ws_event(r) for r in rows],
+        })
+        return len(rows)
+    except Exception as exc:
+        logger.error("write_inbox_many failed for %d rows: %s", len(items), exc)
+        return 0
+
+
+def _expires_at(type: str) -> datetime | None:
+    expiry_days = _EXPIRY_DAYS.get(type, _DEFAULT_EXPIRY_DAYS)
+    if expiry_days is None:
+        return None
+    return datetime.now(timezone.utc) + timedelta(days=expiry_days)
+
+
+def _ws_event(row) -> str:
+    """NOTIFY payload for a new inbox row (see ws_replay.inbox_event)."""
+    event = json.dumps(inbox_event(row))
+    if len(event.encode()) > _NOTIFY_MAX_BYTES:
+        # Too big for NOTIFY — the client fetches the row by id
+        event = json.dumps({"type": "inbox", "id": row["id"], "inbox_type": row["type"]})
+    return event
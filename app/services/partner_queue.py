@@ -0,0 +1,101 @@
+"""
+Partner matching queue — POST /api/partners/find-random.
+
+partner_queue holds one row per waiting user, keyed by department and ordered
+by enqueued_at. Matching claims the oldest waiter with
+
+    SELECT … FOR UPDATE SKIP LOCKED LIMIT 1
+
+so a claim never grabs or blocks on a waiter another transaction still holds. The pick is an index range
+scan on (department_id, enqueued_at); the "already has an active pair" check
+probes the partial indexes on accountability_partners (status approved /
+pending) instead of scanning every pair.
+
+Every matcher — find-random, the weekly rotation, the admin shuffle — takes
+the per-department advisory lock (lock_department) before its checks, so a
+user can't be claimed or paired twice by two of them at once, and two users
+arriving together at an empty queue pair with each other instead of both
+queueing. find-random is therefore serialised per department; it holds the
+lock only for a few index probes and one insert.
+
+users.seeking_partner / seeking_since mirror queue membership for the API.
+"""
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_PAIR_STATUSES = ("approved", "pending")
+
+# Uses the partial indexes ix_partners_active_requester / ix_partners_active_partner
+NO_ACTIVE_PAIR_SQL = """
+    NOT EXISTS (SELECT 1 FROM accountability_partners ap
+                WHERE ap.requester_id = {col} AND ap.status IN ('approved', 'pending'))
+    AND NOT EXISTS (SELECT 1 FROM accountability_partners ap
+                    WHERE ap.partner_id = {col} AND ap.status IN ('approved', 'pending'))
+"""
+
+
+async def has_active_pair(db: AsyncSession, user_id: str) -> bool:
+    return not (await db.execute(text(
+        "SELECT " + NO_ACTIVE_PAIR_SQL.format(col="CAST(:uid AS uuid)")
+    ), {"uid": user_id})).scalar()
+
+
+async def claim_waiter(db: AsyncSession, department_id: str, user_id: str):
+    """
+    Remove and return the oldest waiter in the department (id, name), or None.
+    The row stays locked until the caller's transaction ends.
+    """
+    return (await db.execute(text(f"""
+        WITH picked AS (
+            SELECT q.user_id
+            FROM partner_queue q
+            WHERE q.department_id = :dept
+              AND q.user_id <> :uid
+              AND {NO_ACTIVE_PAIR_SQL.format(col="q.user_id")}
+            ORDER BY q.enqueued_at
+            LIMIT 1
+            FOR UPDATE OF q SKIP LOCKED
+        ),
+        claimed AS (
+            DELETE FROM partner_queue q USING picked
+            WHERE q.user_id = picked.user_id
+            RETURNING q.user_id
+        )
+        SELECT u.id, u.name
+        FROM claimed JOIN users u ON u.id = claimed.user_id
+    """), {"dept": department_id, "uid": user_id})).mappings().first()
+
+
+async def lock_department(db: AsyncSession, department_id: str) -> None:
+    """Serialise partner matching within one department (held until commit)."""
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext('partner_queue:' || :dept))"),
+                     {"dept": department_id})
+
+
+async def enqueue(db: AsyncSession, user_id: str, department_id: str) -> None:
+    await db.execute(text("""
+        INSERT INTO partner_queue (user_id, department_id)
+        VALUES (:uid, :dept)
+        ON CONFLICT (user_id) DO NOTHING
+    """), {"uid": user_id, "dept": department_id})
+    await db.execute(text("""
+        UPDATE users SET seeking_partner = true, seeking_since = COALESCE(seeking_since, now())
+        WHERE id = :uid
+    """), {"uid": user_id})
+
+
+async def leave_queue(db: AsyncSession, *user_ids: str) -> int:
+    """Take users out of the queue (matched, cancelled, paired manually). Returns rows removed."""
+    ids = [str(u) for u in user_ids]
+    removed = (await db.execute(text(
+        "DELETE FROM partner_queue WHERE user_id = ANY(CAST(:ids AS uuid[])) RETURNING user_id"
+    ), {"ids": ids})).all()
+    await db.execute(text("""
+        UPDATE users SET seeking_partner = false, seeking_since = NULL
+        WHERE id = ANY(CAST(:ids AS uuid[])) AND seeking_partner
+    """), {"ids": ids})
+    return len(removed)
@@ -0,0 +1,284 @@
+"""
+Weekly partner rotation — Monday 07:00 IST, plus the admin "shuffle department".
+
+One pass for every department instead of one query per expired pair:
+
+  1. Close out pairs whose keep vote has ended: both voted keep → renew,
+     anything else → completed (messages get their 30-day expiry).
+  2. Lock the affected departments (partner_queue.lock_department, the lock
+     find-random takes), then load their matching pool in one query:
+     users without an active pair who were just freed or are waiting in
+     partner_queue (opt-outs excluded). If a department's pool is odd, one
+     active unpaired user is drawn in so nobody who wants a partner is left
+     over — the same "assign from the dept active pool" the old job did.
+  3. Load recent pair history for the pool in one query and compute a full
+     matching per department in memory (compute_matching): active users pair
+     with active users first, and anyone paired within _HISTORY_DAYS is only
+     re-paired when there is no other choice ("within" counts from approved_at,
+     so a re-activated old pair is recent again).
+  4. Bulk-insert the new pairs (skipping any user who has a pair by now), bulk-write the inbox rows, commit — a handful
+     of statements whatever the department size.
+  5. Web pushes go out after the commit so the transaction stays short.
+
+Freed or queued users left without a partner (odd pool) go back into
+partner_queue, so the next find-random caller picks them up.
+"""
+import logging
+import random
+from datetime import date
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import PushSubscription
+from app.services import partner_queue
+from app.services.notification_service import write_inbox_many
+from app.services.reminder_service import _push_all
+
+logger = logging.getLogger(__name__)
+
+_HISTORY_DAYS = 56   # don't repeat a partner from the last 8 weeks unless unavoidable
+_SCAN_AHEAD = 50     # candidates inspected per user before accepting a repeat
+
+# "Active" = logged steps or a habit in the last 7 days, or joined this week.
+# last_streak_update is the latest day with steps (step_streak.py) — no daily_steps scan.
+ACTIVE_SQL = """(
+    u.last_streak_update >= current_date - 7
+    OR u.created_at >= now() - INTERVAL '7 days'
+    OR EXISTS (
+        SELECT 1 FROM daily_logs dl
+        JOIN   habit_commitments hcm ON hcm.id = dl.commitment_id
+        JOIN   habit_challenges  hc  ON hc.id  = hcm.challenge_id
+        WHERE  hc.user_id = u.id AND dl.logged_date >= current_date - 7
+    )
+)"""
+
+
+def compute_matching(
+    pool: list[dict],
+    recent: set[frozenset],
+    rng: random.Random | None = None,
+) -> tuple[list[tuple[str, str]], list[str]]:
+    """
+    Pair up one department's pool. pool items need "id" and "is_active";
+    recent holds frozenset({a, b}) of pairs to avoid.
+    Returns (pairs, unmatched ids).
+    """
+    rng = rng or random
+    active   = [str(u["id"]) for u in pool if u["is_active"]]
+    inactive = [str(u["id"]) for u in pool if not u["is_active"]]
+    rng.shuffle(active)
+    rng.shuffle(inactive)
+
+    # Reversed so the next user to place is at the end — pops and deletes near
+    # the tail are cheap even for thousands of users
+    remaining = (active + inactive)[::-1]
+    pairs: list[tuple[str, str]] = []
+    while len(remaining) >= 2:
+        user = remaining.pop()
+        pick = len(remaining) - 1   # fallback: next in line, even if a repeat
+        for idx in range(len(remaining) - 1, max(len(remaining) - 1 - _SCAN_AHEAD, -1), -1):
+            if frozenset((user, remaining[idx])) not in recent:
+                pick = idx
+                break
+        pairs.append((user, remaining.pop(pick)))
+    return pairs, remaining
+
+
+async def _load_pool(db: AsyncSession, dept_ids: list[str], freed: list[str]) -> list[dict]:
+    rows = (await db.execute(text(f"""
+        SELECT u.id, u.name, u.department_id,
+               {ACTIVE_SQL} AS is_active,
+               (u.id = ANY(CAST(:freed AS uuid[])) OR q.user_id IS NOT NULL) AS wants_partner
+        FROM users u
+        LEFT JOIN partner_queue q ON q.user_id = u.id
+        WHERE u.department_id = ANY(CAST(:depts AS uuid[]))
+          AND NOT u.partner_opt_out
+          AND {partner_queue.NO_ACTIVE_PAIR_SQL.format(col="u.id")}
+    """), {"depts": dept_ids, "freed": freed})).mappings().all()
+    return [dict(r) for r in rows if r["is_active"] or r["wants_partner"]]
+
+
+async def load_recent_pairs(db: AsyncSession, user_ids: list[str]) -> set[frozenset]:
+    rows = (await db.execute(text("""
+        SELECT requester_id, partner_id
+        FROM accountability_partners
+        WHERE (requester_id = ANY(CAST(:ids AS uuid[])) OR partner_id = ANY(CAST(:ids AS uuid[])))
+          AND COALESCE(approved_at, created_at) >= now() - make_interval(days => :days)
+    """), {"ids": user_ids, "days": _HISTORY_DAYS})).all()
+    return {frozenset((str(a), str(b))) for a, b in rows}
+
+
+async def insert_pairs(
+    db: AsyncSession,
+    pairs: list[tuple[str, str]],
+    week_start: date,
+    assigned_by: str | None = None,
+) -> list[tuple[str, str]]:
+    """
+    Bulk-create approved auto pairs (re-activating an old row for the same two
+    users). A pair where either user has meanwhile got an active pair is
+    skipped. Returns the pairs created.
+    """
+    if not pairs:
+        return []
+    rows = (await db.execute(text(f"""
+        INSERT INTO accountability_partners
+            (requester_id, partner_id, status, assignment_type, assigned_by, approved_at, week_start)
+        SELECT a, b, 'approved', 'auto', CAST(:admin AS uuid), now(), :ws
+        FROM unnest(CAST(:reqs AS uuid[]), CAST(:pars AS uuid[])) AS t(a, b)
+        WHERE {partner_queue.NO_ACTIVE_PAIR_SQL.format(col="t.a")}
+          AND {partner_queue.NO_ACTIVE_PAIR_SQL.format(col="t.b")}
+        ON CONFLICT (requester_id, partner_id) DO UPDATE
+            SET status = 'approved', assignment_type = 'auto', assigned_by = EXCLUDED.assigned_by,
+                approved_at = now(), week_start = EXCLUDED.week_start,
+                requester_keep = NULL, partner_keep = NULL, keep_deadline = NULL
+        RETURNING requester_id, partner_id
+    """), {
+        "reqs": [a for a, _ in pairs], "pars": [b for _, b in pairs],
+        "admin": assigned_by, "ws": week_start,
+    })).all()
+    return [(str(a), str(b)) for a, b in rows]
+
+
+async def expire_pair_messages(db: AsyncSession, pair_ids: list[int]) -> None:
+    await db.execute(text("""
+        UPDATE partner_messages
+        SET expires_at = now() + INTERVAL '30 days'
+        WHERE pair_id = ANY(CAST(:ids AS bigint[])) AND expires_at IS NULL
+    """), {"ids": pair_ids})
+
+
+async def run_weekly_partner_rotation(db: AsyncSession) -> int:
+    """
+    Monday 07:00 IST job — rotate or renew partner pairs.
+
+    For each pair where keep_deadline has passed:
+      - Both voted keep=True  → renew (update week_start, reset votes)
+      - Any other outcome     → complete old pair; both users go into the
+                                department-wide matching
+    Returns the number of expired pairs processed.
+    """
+    today = date.today()
+
+    expired = (await db.execute(text("""
+        SELECT ap.id, ap.requester_id, ap.partner_id,
+               ap.requester_keep, ap.partner_keep,
+               u1.department_id AS dept_id,
+               u1.name AS req_name, u2.name AS par_name
+        FROM   accountability_partners ap
+        JOIN   users u1 ON u1.id = ap.requester_id
+        JOIN   users u2 ON u2.id = ap.partner_id
+        WHERE  ap.status = 'approved'
+          AND  ap.keep_deadline IS NOT NULL
+          AND  ap.keep_deadline < now()
+        FOR UPDATE OF ap
+    """))).mappings().all()
+
+    renew, rotate = [], []
+    for p in expired:
+        (renew if p["requester_keep"] is True and p["partner_keep"] is True else rotate).append(p)
+
+    if renew:
+        await db.execute(text("""
+            UPDATE accountability_partners
+            SET week_start = :ws, requester_keep = NULL, partner_keep = NULL, keep_deadline = NULL
+            WHERE id = ANY(CAST(:ids AS bigint[]))
+        """), {"ws": today, "ids": [p["id"] for p in renew]})
+
+    if rotate:
+        rotate_ids = [p["id"] for p in rotate]
+        await db.execute(text("""
+            UPDATE accountability_partners SET status = 'completed'
+            WHERE id = ANY(CAST(:ids AS bigint[]))
+        """), {"ids": rotate_ids})
+        await expire_pair_messages(db, rotate_ids)
+
+    freed = [str(uid) for p in rotate for uid in (p["requester_id"], p["partner_id"])]
+    dept_ids = {str(p["dept_id"]) for p in rotate} | {
+        str(r[0]) for r in (await db.execute(text("SELECT DISTINCT department_id FROM partner_queue"))).all()
+    }
+
+    # ── matching ──────────────────────────────────────────────────────────────
+    # Same lock as find-random, so nobody in the pool is paired or claimed
+    # from the queue behind our back; sorted so concurrent lockers can't deadlock
+    for dept_id in sorted(dept_ids):
+        await partner_queue.lock_department(db, dept_id)
+    pool = await _load_pool(db, sorted(dept_ids), freed) if dept_ids else []
+    recent = await load_recent_pairs(db, [str(u["id"]) for u in pool]) if pool else set()
+    names = {str(u["id"]): (u["name"] or "Someone").split()[0] for u in pool}
+
+    by_dept: dict[str, list[dict]] = {}
+    for u in pool:
+        by_dept.setdefault(str(u["department_id"]), []).append(u)
+    by_dept = {d: m for d, m in by_dept.items() if any(u["wants_partner"] for u in m)}
+
+    new_pairs: list[tuple[str, str]] = []
+    requeue: list[tuple[str, str]] = []
+    for dept_id, members in by_dept.items():
+        wanting = [u for u in members if u["wants_partner"]]
+        if len(wanting) % 2:
+            extras = [u for u in members if not u["wants_partner"]]
+            if extras:
+                wanting.append(random.choice(extras))
+        pairs, unmatched = compute_matching(wanting, recent)
+        new_pairs += pairs
+        requeue += [(uid, dept_id) for uid in unmatched]
+
+    created = await insert_pairs(db, new_pairs, today)
+    if len(created) < len(new_pairs):
+        logger.warning(f"Weekly partner rotation: {len(new_pairs) - len(created)} pair(s) skipped, a user already had a partner")
+    new_pairs = created
+    await partner_queue.leave_queue(db, *[uid for pair in new_pairs for uid in pair])
+    for uid, dept_id in requeue:
+        await partner_queue.enqueue(db, uid, dept_id)
+
+    # ── notifications ─────────────────────────────────────────────────────────
+    inbox: list[dict] = []
+    pushes: list[tuple[str, str, dict]] = []   # (user_id, job, message)
+    for p in renew:
+        for uid, partner_name in (
+            (str(p["requester_id"]), (p["par_name"] or "partner").split()[0]),
+            (str(p["partner_id"]),   (p["req_name"] or "partner").split()[0]),
+        ):
+            inbox.append({"user_id": uid, "type": "partner_renewed", "template_key": "partner_renewed_v1",
+                          "payload": {"partner_name": partner_name}, "action_url": "/socialapp/partners"})
+            pushes.append((uid, "partner_renewed", {
+                "title": f"Continuing with {partner_name}!",
+                "body":  "You both voted to keep going. Let's have a great week!",
+                "url":   "/socialapp/partners",
+            }))
+    for a, b in new_pairs:
+        for uid, other in ((a, b), (b, a)):
+            inbox.append({"user_id": uid, "type": "partner_rotated", "template_key": "partner_rotated_v1",
+                          "payload": {"partner_name": names[other], "partner_id": other},
+                          "action_url": "/socialapp/partners"})
+            pushes.append((uid, "partner_rotated", {
+                "title": f"Meet your new partner: {names[other]}!",
+                "body":  "Your accountability partner for this week is ready. Say hi!",
+                "url":   "/socialapp/partners",
+            }))
+    await write_inbox_many(db, inbox)
+    await db.commit()
+
+    logger.info(
+        "Weekly partner rotation: %d expired pairs (%d renewed), %d new pairs across %d depts, %d re-queued",
+        len(expired), len(renew), len(new_pairs), len(by_dept), len(requeue),
+    )
+
+    # ── web push, outside the transaction ─────────────────────────────────────
+    if pushes:
+        subs = (await db.execute(select(PushSubscription).where(
+            PushSubscription.user_id.in_({uid for uid, _, _ in pushes})
+        ))).scalars().all()
+        subs_by_user: dict[str, list] = {}
+        for sub in subs:
+            subs_by_user.setdefault(str(sub.user_id), []).append(sub)
+        for uid, job, message in pushes:
+            if subs_by_user.get(uid):
+                try:
+                    await _push_all(db, subs_by_user[uid], message, job=job, user_id=uid)
+                except Exception as e:
+                    logger.error(f"Partner rotation push failed for {uid}: {e}")
+
+    return len(expired)
@@ -0,0 +1,165 @@
+"""
+Cross-process presence registry — who has an open WebSocket on *any* worker.
+
+ws.py only knows its own sockets. Delivery paths (partners.py send_message,
+find_random_partner, …) pick pg_notify vs web push via is_online(), so with
+more than one worker they must also see users connected elsewhere.
+
+Two layers:
+  ws_presence (UNLOGGED table) — one row per (user_id, worker_id), heartbeated
+      every _HEARTBEAT_S. Rows not refreshed within _TTL_S are dead (crashed
+      worker) and are swept. Source of truth; survives a worker restart.
+  "ws_presence" NOTIFY channel — a worker announces connect / last-disconnect
+      immediately, so other workers don't wait for the next heartbeat.
+
+Each process keeps a read cache (_remote: user_id → worker_ids) rebuilt from
+the table on every heartbeat and patched by the NOTIFYs — is_online_elsewhere()
+is a dict lookup, never a query.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+
+from sqlalchemy import text
+
+from app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_CHANNEL = "ws_presence"
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+_HEARTBEAT_S = 15
+_TTL_S = 45
+
+_local: set[str] = set()                  # users with a socket on this worker
+_remote: dict[str, set[str]] = {}         # user_id → other workers holding a socket
+_heartbeat: asyncio.Task | None = None
+# Connect / disconnect announcements go out one at a time, in order — a quick
+# connect + disconnect must not reach other workers reversed
+_publish_queue: asyncio.Queue | None = None
+_publisher: asyncio.Task | None = None
+
+
+def is_online_elsewhere(user_id: str) -> bool:
+    return bool(_remote.get(user_id))
+
+
+def set_local(user_id: str, online: bool) -> None:
+    """Called by ws.py on a user's first socket connect / last socket disconnect."""
+    if online:
+        _local.add(user_id)
+    else:
+        _local.discard(user_id)
+    global _publish_queue, _publisher
+    if _publish_queue is None:
+        _publish_queue = asyncio.Queue()
+    _publish_queue.put_nowait((user_id, online))
+    if _publisher is None or _publisher.done():
+        _publisher = asyncio.create_task(_publish_loop())
+
+
+async def _publish_loop() -> None:
+    while True:
+        user_id, online = await _publish_queue.get()
+        await _publish(user_id, online)
+
+
+async def _publish(user_id: str, online: bool) -> None:
+    try:
+        async with AsyncSessionLocal() as db:
+            if online:
+                await db.execute(text("""
+                    INSERT INTO ws_presence (user_id, worker_id, last_seen)
+                    VALUES (:uid, :w, now())
+                    ON CONFLICT (user_id, worker_id) DO UPDATE SET last_seen = now()
+                """), {"uid": user_id, "w": WORKER_ID})
+            else:
+                await db.execute(text(
+                    "DELETE FROM ws_presence WHERE user_id = :uid AND worker_id = :w"
+                ), {"uid": user_id, "w": WORKER_ID})
+            await db.execute(text("SELECT pg_notify(:ch, :payload)"), {
+                "ch": PRESENCE_CHANNEL,
+                "payload": json.dumps({"u": user_id, "w": WORKER_ID, "on": online}),
+            })
+            await db.commit()
+    except Exception as e:
+        logger.warning(f"[presence] publish failed for {user_id}: {e}")
+
+
+def on_presence_notify(connection, pid, channel: str, payload: str) -> None:
+    """LISTEN callback for PRESENCE_CHANNEL (registered by ws.py)."""
+    try:
+        msg = json.loads(payload)
+    except json.JSONDecodeError:
+        return
+    if msg.get("w") == WORKER_ID:
+        return
+    workers = _remote.setdefault(msg["u"], set())
+    if msg.get("on"):
+        workers.add(msg["w"])
+    else:
+        workers.discard(msg["w"])
+        if not workers:
+            _remote.pop(msg["u"], None)
+
+
+async def heartbeat_once() -> None:
+    """Refresh this worker's rows, sweep dead ones, rebuild the remote cache."""
+    global _remote
+    async with AsyncSessionLocal() as db:
+        if _local:
+            await db.execute(text("""
+                INSERT INTO ws_presence (user_id, worker_id, last_seen)
+                SELECT u, :w, now() FROM unnest(CAST(:uids AS uuid[])) u
+                ON CONFLICT (user_id, worker_id) DO UPDATE SET last_seen = now()
+            """), {"w": WORKER_ID, "uids": list(_local)})
+        # Our rows for users who have since disconnected (a lost _publish)
+        await db.execute(text("""
+            DELETE FROM ws_presence
+            WHERE worker_id = :w AND NOT (user_id = ANY(CAST(:uids AS uuid[])))
+        """), {"w": WORKER_ID, "uids": list(_local)})
+        await db.execute(text(
+            "DELETE FROM ws_presence WHERE last_seen < now() - make_interval(secs => :ttl)"
+        ), {"ttl": _TTL_S})
+        rows = (await db.execute(text(
+            "SELECT user_id, worker_id FROM ws_presence WHERE worker_id <> :w"
+        ), {"w": WORKER_ID})).all()
+        await db.commit()
+
+    remote: dict[str, set[str]] = {}
+    for uid, worker in rows:
+        remote.setdefault(str(uid), set()).add(worker)
+    _remote = remote
+
+
+async def _heartbeat_loop() -> None:
+    while True:
+        try:
+            await heartbeat_once()
+        except Exception as e:
+            logger.warning(f"[presence] heartbeat failed: {e}")
+        await asyncio.sleep(_HEARTBEAT_S)
+
+
+def start_heartbeat() -> None:
+    global _heartbeat
+    if _heartbeat is None or _heartbeat.done():
+        _heartbeat = asyncio.create_task(_heartbeat_loop())
+
+
+async def stop_heartbeat() -> None:
+    """App shutdown — stop heartbeating and drop this worker's rows."""
+    if _heartbeat:
+        _heartbeat.cancel()
+    if _publisher:
+        _publisher.cancel()
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("DELETE FROM ws_presence WHERE worker_id = :w"), {"w": WORKER_ID})
+            await db.commit()
+    except Exception as e:
+        logger.warning(f"[presence] cleanup on shutdown failed: {e}")
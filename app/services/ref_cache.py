@@ -0,0 +1,172 @@
+"""
+Process-local cache of reference data — catalogs that hot paths read on every
+request but that change rarely:
+
+    habits            habit library (GET /api/habits, challenge creation)
+    goal_definitions  GET /goal-definitions
+    departments       /me, signup
+    challenges        step challenges with their metrics and department ids
+
+Each catalog is loaded lazily on first use and kept with an ETag (hash of its
+contents), so catalog endpoints can answer If-None-Match with 304.
+
+Invalidation: statement triggers on the underlying tables (migration 0036)
+pg_notify("ref_cache", <catalog>) — on commit, from any writer, including
+migrations and manual SQL. Every worker LISTENs over the shared listener
+connection (app/api/ws.py start_ref_cache) and drops the catalog; the next
+read reloads it. NOTIFYs sent while that connection is down are lost, so
+entries also expire after _TTL_S.
+
+Cached values are shared between requests — callers must not mutate them.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Awaitable, Callable
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Challenge, ChallengeDepartment, ChallengeMetrics, Department, GoalDefinition, Habit
+from app.schemas.goal_definitions import GoalDefinitionResponse
+from app.schemas.habits import HabitOut
+
+logger = logging.getLogger(__name__)
+
+REF_CACHE_CHANNEL = "ref_cache"
+_TTL_S = 300
+
+
+async def _load_habits(db: AsyncSession) -> list[dict]:
+    rows = (await db.execute(select(Habit).order_by(Habit.id))).scalars().all()
+    return [HabitOut.model_validate(h).model_dump(mode="json") for h in rows]
+
+
+async def _load_goal_definitions(db: AsyncSession) -> list[dict]:
+    rows = (await db.execute(select(GoalDefinition).order_by(GoalDefinition.key))).scalars().all()
+    return [GoalDefinitionResponse.model_validate(g).model_dump(mode="json") for g in rows]
+
+
+async def _load_departments(db: AsyncSession) -> list[dict]:
+    rows = (await db.execute(select(Department.id, Department.name).order_by(Department.name))).all()
+    return [{"id": str(i), "name": n} for i, n in rows]
+
+
+async def _load_challenges(db: AsyncSession) -> list[dict]:
+    challenges = (await db.execute(select(Challenge).order_by(Challenge.start_date))).scalars().all()
+    metrics = (await db.execute(select(ChallengeMetrics))).scalars().all()
+    depts = (await db.execute(select(ChallengeDepartment.challenge_id, ChallengeDepartment.department_id))).all()
+
+    metrics_by: dict[str, list[dict]] = {}
+    for m in metrics:
+        metrics_by.setdefault(str(m.challenge_id), []).append({
+            "id":           str(m.id),
+            "challenge_id": str(m.challenge_id),
+            "metric_key":   m.metric_key,
+            "target_value": m.target_value,
+            "rule_type":    m.rule_type,
+        })
+    depts_by: dict[str, list[str]] = {}
+    for cid, did in depts:
+        depts_by.setdefault(str(cid), []).append(str(did))
+
+    return [
+        {
+            "id":                 str(c.id),
+            "title":              c.title,
+            "description":        c.description,
+            "period":             c.period,
+            "scope":              c.scope,
+            "start_date":         c.start_date,
+            "end_date":           c.end_date,
+            "status":             c.status,
+            "min_goals_required": c.min_goals_required,
+            "created_by":         str(c.created_by) if c.created_by else None,
+            "created_at":         c.created_at,
+            "metrics":            metrics_by.get(str(c.id), []),
+            "department_ids":     depts_by.get(str(c.id), []),
+        }
+        for c in challenges
+    ]
+
+
+_LOADERS: dict[str, Callable[[AsyncSession], Awaitable[list[dict]]]] = {
+    "habits":           _load_habits,
+    "goal_definitions": _load_goal_definitions,
+    "departments":      _load_departments,
+    "challenges":       _load_challenges,
+}
+
+_entries: dict[str, tuple[list[dict], str, float]] = {}      # catalog → (data, etag, loaded_at)
+_generation: dict[str, int] = {name: 0 for name in _LOADERS}  # bumped by every invalidation
+_locks: dict[str, asyncio.Lock] = {}
+
+
+async def get(db: AsyncSession, name: str) -> list[dict]:
+    """The catalog's rows, loading them on a miss."""
+    entry = _entries.get(name)
+    if entry and time.monotonic() - entry[2] < _TTL_S:
+        return entry[0]
+    async with _locks.setdefault(name, asyncio.Lock()):
+        entry = _entries.get(name)
+        if entry and time.monotonic() - entry[2] < _TTL_S:
+            return entry[0]
+        generation = _generation[name]
+        data = await _LOADERS[name](db)
+        etag = 'W/"' + hashlib.md5(json.dumps(data, default=str, sort_keys=True).encode()).hexdigest() + '"'
+        # An invalidation during the load may have raced a newer commit — serve, don't keep
+        if _generation[name] == generation:
+            _entries[name] = (data, etag, time.monotonic())
+        return data
+
+
+async def etag(db: AsyncSession, name: str) -> str:
+    await get(db, name)
+    entry = _entries.get(name)
+    return entry[1] if entry else ""
+
+
+async def not_modified(db: AsyncSession, name: str, request: Request, response: Response) -> Response | None:
+    """
+    Set the catalog's ETag on response; returns a 304 to send instead when the
+    client's If-None-Match already has it.
+    """
+    tag = await etag(db, name)
+    if not tag:
+        return None
+    response.headers["ETag"] = tag
+    if tag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"ETag": tag})
+    return None
+
+
+def invalidate(name: str) -> None:
+    if name in _generation:
+        _generation[name] += 1
+        _entries.pop(name, None)
+
+
+def on_ref_cache_notify(connection, pid, channel: str, payload: str) -> None:
+    """LISTEN callback for REF_CACHE_CHANNEL (registered by ws.py)."""
+    invalidate(payload)
+
+
+# ── lookups ───────────────────────────────────────────────────────────────────
+
+async def habit_by_slug(db: AsyncSession, slug: str) -> dict | None:
+    return next((h for h in await get(db, "habits") if h["slug"] == slug), None)
+
+
+async def department(db: AsyncSession, department_id) -> dict | None:
+    return next((d for d in await get(db, "departments") if d["id"] == str(department_id)), None)
+
+
+async def department_by_name(db: AsyncSession, name: str) -> dict | None:
+    return next((d for d in await get(db, "departments") if d["name"] == name), None)
+
+
+async def challenge(db: AsyncSession, challenge_id) -> dict | None:
+    return next((c for c in await get(db, "challenges") if c["id"] == str(challenge_id)), None)
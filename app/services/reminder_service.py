@@ -10,6 +10,8 @@ from app.models import (
     DailyPushCount,
 )
 from app.services.push_notify import send_web_push, PushResult
+from app.services import habit_pack_ranks
+from app.services.step_streak import live_streak
 import logging
 
 logger = logging.getLogger(__name__)
@@ -222,6 +224,15 @@ async def _had_steps_recently(db: AsyncSession, user_id: str, days: int = 3) ->
     return result.scalar_one_or_none() is not None
 
 
+def _had_steps_since(user: User, today: date, days: int = 3) -> bool:
+    """
+    _had_steps_recently() from the stored streak state — last_streak_update is
+    the user's latest day with steps. Only valid once today is known to be empty.
+    """
+    last = user.last_streak_update
+    return last is not None and last >= today - timedelta(days=days)
+
+
 def _is_nudge_day(now: datetime) -> bool:
     """Inactive users get nudges only 4x/week — Mon, Wed, Fri, Sun."""
     return now.weekday() in (0, 2, 4, 6)  # Mon=0 Wed=2 Fri=4 Sun=6
@@ -622,11 +633,11 @@ async def send_step_reminders(db: AsyncSession):
             steps = await _steps_today(db, user.id, now.date())
             if steps > 0:
                 continue  # already logged — no nudge
-            streak = getattr(user, "global_current_streak", 0) or 0
+            streak = live_streak(user.global_current_streak, user.last_streak_update, now.date())
             if streak > 0:
                 continue  # streak users got the 8 PM alert — don't double-fire
             # Inactive cap: no steps in 3 days → only nudge on Mon/Wed/Fri/Sun
-            active = await _had_steps_recently(db, user.id)
+            active = _had_steps_since(user, now.date())
             if not active and not _is_nudge_day(now):
                 continue
             if not await _try_claim_push_slot(db, user.id):
@@ -661,16 +672,16 @@ async def send_streak_at_risk(db: AsyncSession):
     notified = 0
     for user in users:
         try:
-            streak = getattr(user, "global_current_streak", 0) or 0
-            if streak == 0:
-                continue
             tz  = ZoneInfo(user.timezone or "Asia/Kolkata")
             now = datetime.now(tz)
+            streak = live_streak(user.global_current_streak, user.last_streak_update, now.date())
+            if streak == 0:
+                continue
             steps = await _steps_today(db, user.id, now.date())
             if steps > 0:
                 continue
             # Inactive cap (rare for streak holders, but guard anyway)
-            active = await _had_steps_recently(db, user.id)
+            active = _had_steps_since(user, now.date())
             if not active and not _is_nudge_day(now):
                 continue
             if not await _try_claim_push_slot(db, user.id):
@@ -840,12 +851,8 @@ async def send_habit_morning_reminder(db: AsyncSession):
     for row in rows.mappings():
         try:
             done_row = await db.execute(text("""
-                SELECT COUNT(*) AS done
-                FROM daily_logs dl
-                JOIN habit_commitments hcm ON hcm.id = dl.commitment_id
-                WHERE hcm.challenge_id = :cid
-                  AND dl.logged_date   = :today
-                  AND dl.completed     = true
+                SELECT done FROM habit_day_rollup
+                WHERE challenge_id = :cid AND day = :today
             """), {"cid": row["challenge_id"], "today": today})
             if (done_row.scalar() or 0) > 0:
                 continue  # already logged something today
@@ -887,11 +894,8 @@ async def send_habit_evening_nudge(db: AsyncSession):
             (SELECT COUNT(*) FROM habit_commitments hcm2 WHERE hcm2.challenge_id = hc.id)
                 AS total_habits,
             COALESCE((
-                SELECT COUNT(*) FROM daily_logs dl
-                JOIN habit_commitments hcm ON hcm.id = dl.commitment_id
-                WHERE hcm.challenge_id = hc.id
-                  AND dl.logged_date   = :today
-                  AND dl.completed     = true
+                SELECT r.done FROM habit_day_rollup r
+                WHERE r.challenge_id = hc.id AND r.day = :today
             ), 0) AS done_today
         FROM users u
         JOIN habit_challenges hc ON hc.user_id = u.id
@@ -1029,15 +1033,13 @@ async def send_weekly_summary(db: AsyncSession):
 
             habit_row = await db.execute(text("""
                 SELECT
-                    COUNT(DISTINCT hcm.id)                                    AS total_habits,
-                    COALESCE(SUM(CASE WHEN dl.completed THEN 1 ELSE 0 END), 0) AS done_count
-                FROM habit_challenges hc
-                JOIN habit_commitments hcm ON hcm.challenge_id = hc.id
-                LEFT JOIN daily_logs dl
-                    ON dl.commitment_id  = hcm.id
-                    AND dl.logged_date  >= :start
-                    AND dl.logged_date  <= :today
-                WHERE hc.user_id = :uid AND hc.status = 'active'
+                    (SELECT COUNT(*) FROM habit_commitments hcm
+                     JOIN habit_challenges hc ON hc.id = hcm.challenge_id
+                     WHERE hc.user_id = :uid AND hc.status = 'active')           AS total_habits,
+                    COALESCE((SELECT SUM(r.done) FROM habit_day_rollup r
+                              JOIN habit_challenges hc ON hc.id = r.challenge_id
+                              WHERE hc.user_id = :uid AND hc.status = 'active'
+                                AND r.day >= :start AND r.day <= :today), 0)     AS done_count
             """), {"uid": str(user.id), "start": week_start, "today": today})
             h = habit_row.mappings().first()
             habit_pct = 0
@@ -1209,14 +1211,15 @@ async def send_habit_cycle_summary(db: AsyncSession):
             # ── 7-day completion stats ────────────────────────────────────
             stats_row = await db.execute(text("""
                 SELECT
-                    COUNT(DISTINCT hcm.id)                                         AS total_habits,
-                    COALESCE(SUM(CASE WHEN dl.completed THEN 1 ELSE 0 END), 0)     AS done_count
-                FROM habit_commitments hcm
-                LEFT JOIN daily_logs dl
-                    ON  dl.commitment_id = hcm.id
-                    AND dl.logged_date   >= :start
-                    AND dl.logged_date   <= :today
-                WHERE hcm.challenge_id = :cid
+                    t.total_habits,
+                    COALESCE(SUM(r.done), 0)                                           AS done_count,
+                    COUNT(r.day) FILTER (WHERE t.total_habits > 0 AND r.done = t.total_habits) AS perfect_days
+                FROM (SELECT COUNT(*) AS total_habits FROM habit_commitments WHERE challenge_id = :cid) t
+                LEFT JOIN habit_day_rollup r
+                    ON  r.challenge_id = :cid
+                    AND r.day >= :start
+                    AND r.day <= :today
+                GROUP BY t.total_habits
             """), {"cid": challenge_id, "start": started_at, "today": today})
             s = stats_row.mappings().first() or {}
             total_habits = int(s.get("total_habits") or 0)
@@ -1225,23 +1228,7 @@ async def send_habit_cycle_summary(db: AsyncSession):
             habit_pct    = round(done_count / possible * 100) if possible else 0
 
             # Perfect days: days where every habit was completed
-            perfect_row = await db.execute(text("""
-                SELECT COUNT(*) AS perfect_days
-                FROM (
-                    SELECT dl.logged_date
-                    FROM habit_commitments hcm
-                    JOIN daily_logs dl
-                        ON  dl.commitment_id = hcm.id
-                        AND dl.logged_date   >= :start
-                        AND dl.logged_date   <= :today
-                        AND dl.completed
-                    WHERE hcm.challenge_id = :cid
-                    GROUP BY dl.logged_date
-                    HAVING COUNT(*) = :total_habits
-                ) t
-            """), {"cid": challenge_id, "start": started_at, "today": today,
-                   "total_habits": total_habits})
-            perfect_days = int(perfect_row.scalar() or 0)
+            perfect_days = int(s.get("perfect_days") or 0)
 
             # ── Push notification ─────────────────────────────────────────
             if not await _try_claim_push_slot(db, uid):
@@ -1292,6 +1279,7 @@ async def send_habit_cycle_summary(db: AsyncSession):
                 SET status = 'completed'
                 WHERE id = :cid
             """), {"cid": challenge_id})
+            await habit_pack_ranks.refresh(db, [challenge_id])
             await db.commit()
 
         except Exception as e:
@@ -1537,146 +1525,6 @@ async def send_partner_keep_or_change_prompts(db: AsyncSession) -> int:
     return notified
 
 
-async def run_weekly_partner_rotation(db: AsyncSession) -> int:
-    """
-    Monday 07:00 IST job — rotate or renew partner pairs.
-
-    For each pair where keep_deadline has passed:
-      - Both voted keep=True  → renew (update week_start, reset votes)
-      - Any other outcome     → complete old pair, assign new partner from dept active pool
-    """
-    from app.services.notification_service import write_inbox
-    from sqlalchemy import select as sa_select
-    import random as _random
-
-    today = date.today()
-
-    expired_pairs = (await db.execute(text("""
-        SELECT ap.id,
-               ap.requester_id, ap.partner_id,
-               ap.requester_keep, ap.partner_keep,
-               u1.department_id AS dept_id,
-               u1.name AS req_name, u2.name AS par_name
-        FROM   accountability_partners ap
-        JOIN   users u1 ON u1.id = ap.requester_id
-        JOIN   users u2 ON u2.id = ap.partner_id
-        WHERE  ap.status = 'approved'
-          AND  ap.keep_deadline IS NOT NULL
-          AND  ap.keep_deadline < now()
-    """))).mappings().all()
-
-    rotated = 0
-
-    for p in expired_pairs:
-        both_keep = p["requester_keep"] is True and p["partner_keep"] is True
-
-        if both_keep:
-            # Renew: reset votes and push week forward
-            await db.execute(text("""
-                UPDATE accountability_partners
-                SET week_start     = :ws,
-                    requester_keep = NULL,
-                    partner_keep   = NULL,
-                    keep_deadline  = NULL
-                WHERE id = :pid
-            """), {"ws": today, "pid": p["id"]})
-
-            for uid, partner_name in (
-                (str(p["requester_id"]), (p["par_name"] or "partner").split()[0]),
-                (str(p["partner_id"]),   (p["req_name"] or "partner").split()[0]),
-            ):
-                subs = await _get_subscriptions(db, uid)
-                await _push_all(db, subs, {
-                    "title": f"Continuing with {partner_name}!",
-                    "body":  "You both voted to keep going. Let's have a great week!",
-                    "url":   "/socialapp/partners",
-                }, job="partner_renewed", user_id=uid)
-                await write_inbox(
-                    db, user_id=uid, type="partner_renewed",
-                    template_key="partner_renewed_v1",
-                    payload={"partner_name": partner_name},
-                    action_url="/socialapp/partners",
-                )
-        else:
-            # Rotate: mark old pair completed, assign new partner
-            await db.execute(text("""
-                UPDATE accountability_partners SET status = 'completed' WHERE id = :pid
-            """), {"pid": p["id"]})
-            await db.execute(text("""
-                UPDATE partner_messages
-                SET expires_at = now() + INTERVAL '30 days'
-                WHERE pair_id = :pid AND expires_at IS NULL
-            """), {"pid": p["id"]})
-
-            dept_id = str(p["dept_id"])
-            # Find active users in dept not already paired, excluding the current pair members
-            active_candidates = (await db.execute(text("""
-                SELECT u.id, u.name
-                FROM users u
-                WHERE u.department_id = :dept
-                  AND u.id NOT IN (:req, :par)
-                  AND u.id NOT IN (
-                      SELECT requester_id FROM accountability_partners WHERE status = 'approved'
-                      UNION
-                      SELECT partner_id   FROM accountability_partners WHERE status = 'approved'
-                  )
-                  AND (
-                      EXISTS (SELECT 1 FROM daily_steps ds WHERE ds.user_id = u.id AND ds.day >= current_date - 7)
-                      OR EXISTS (
-                          SELECT 1 FROM daily_logs dl
-                          JOIN   habit_commitments hcm ON hcm.id = dl.commitment_id
-                          JOIN   habit_challenges  hc  ON hc.id  = hcm.challenge_id
-                          WHERE  hc.user_id = u.id AND dl.logged_date >= current_date - 7
-                      )
-                      OR u.created_at >= now() - INTERVAL '7 days'
-                  )
-                ORDER BY random()
-                LIMIT 1
-            """), {"dept": dept_id, "req": str(p["requester_id"]), "par": str(p["partner_id"])})).mappings().all()
-
-            # Re-pair each user from the old pair
-            for uid, old_partner_name in (
-                (str(p["requester_id"]), (p["par_name"] or "partner").split()[0]),
-                (str(p["partner_id"]),   (p["req_name"] or "partner").split()[0]),
-            ):
-                new_candidate = active_candidates[0] if active_candidates else None
-
-                if new_candidate:
-                    new_partner_id   = str(new_candidate["id"])
-                    new_partner_name = (new_candidate["name"] or "Someone").split()[0]
-
-                    await db.execute(text("""
-                        INSERT INTO accountability_partners
-                            (requester_id, partner_id, status, assignment_type, approved_at, week_start)
-                        VALUES (:a, :b, 'approved', 'auto', now(), :ws)
-                        ON CONFLICT (requester_id, partner_id) DO UPDATE
-                            SET status = 'approved', assignment_type = 'auto',
-                                approved_at = now(), week_start = :ws
-                    """), {"a": uid, "b": new_partner_id, "ws": today})
-
-                    subs = await _get_subscriptions(db, uid)
-                    await _push_all(db, subs, {
-                        "title": f"Meet your new partner: {new_partner_name}!",
-                        "body":  "Your accountability partner for this week is ready. Say hi!",
-                        "url":   "/socialapp/partners",
-                    }, job="partner_rotated", user_id=uid)
-                    await write_inbox(
-                        db, user_id=uid, type="partner_rotated",
-                        template_key="partner_rotated_v1",
-                        payload={"partner_name": new_partner_name, "partner_id": new_partner_id},
-                        action_url="/socialapp/partners",
-                    )
-                else:
-                    # No available partner — notify admin via inbox (best effort)
-                    logger.warning("No available partner for user %s after rotation", uid)
-
-        rotated += 1
-
-    await db.commit()
-    logger.info("Weekly partner rotation: processed %d pairs", rotated)
-    return rotated
-
-
 async def cleanup_expired_partner_messages(db: AsyncSession) -> int:
     """Nightly job — delete partner_messages where expires_at < now()."""
     result = await db.execute(text("""
@@ -15,9 +15,9 @@ from app.services.reminder_service import (
     send_habit_cycle_summary,
     send_body_scan_reminders,
     send_partner_keep_or_change_prompts,
-    run_weekly_partner_rotation,
     cleanup_expired_partner_messages,
 )
+from app.services.partner_rotation import run_weekly_partner_rotation
 from app.services.ai_insight import generate_nightly_insights
 import logging
 
@@ -207,6 +207,28 @@ scheduler.add_job(
 )
 logger.info("Job configured: rank snapshot @ 00:05 IST daily")
 
+
+# 1b. Habit pack rank freeze — 00:05 IST. Rebuilds habit_pack_ranks and
+# freezes rank_yesterday; habit writes keep the live rank current in between.
+async def habit_pack_rank_freeze_job():
+    from app.services.habit_pack_ranks import freeze
+    async with AsyncSessionLocal() as db:
+        try:
+            n = await freeze(db)
+            await db.commit()
+            logger.info(f"Habit pack rank freeze: {n} members")
+        except Exception as e:
+            logger.error(f"Error in habit pack rank freeze job: {e}", exc_info=True)
+
+
+scheduler.add_job(
+    habit_pack_rank_freeze_job,
+    CronTrigger(hour=0, minute=5, timezone="Asia/Kolkata"),
+    id='habit_pack_rank_freeze',
+    replace_existing=True,
+)
+logger.info("Job configured: habit pack rank freeze @ 00:05 IST daily")
+
 # 2. Streak-at-risk alert — 20:00 (8 PM) IST
 scheduler.add_job(
     check_streak_at_risk,
@@ -321,6 +343,31 @@ scheduler.add_job(
 )
 logger.info("Job configured: nightly AI insight generation @ 03:06  IST daily")
 
+# 8b. AI cache pre-warm — 02:30 IST. Regenerates coach reports and recommendations
+# for active users whose cached copy expires within 24h, so the daytime
+# stale-while-revalidate path is the exception rather than the rule.
+async def ai_prewarm_job():
+    from app.services.ai_coach import prewarm_expiring_coach_reports
+    from app.services.ai_recommendations import prewarm_expiring_recommendations
+    async with AsyncSessionLocal() as db:
+        try:
+            await prewarm_expiring_coach_reports(db)
+        except Exception as e:
+            logger.error(f"Error in coach pre-warm job: {e}", exc_info=True)
+        try:
+            await prewarm_expiring_recommendations(db)
+        except Exception as e:
+            logger.error(f"Error in recommendation pre-warm job: {e}", exc_info=True)
+
+
+scheduler.add_job(
+    ai_prewarm_job,
+    CronTrigger(hour=2, minute=30, timezone="Asia/Kolkata"),
+    id='ai_cache_prewarm',
+    replace_existing=True,
+)
+logger.info("Job configured: AI coach/recommendation pre-warm @ 02:30 IST daily")
+
 # 9. Habit cycle completion summary — 21:30 IST (challenges ending today)
 async def habit_cycle_summary_job():
     async with AsyncSessionLocal() as db:
@@ -418,7 +465,7 @@ for _gfit_hour, _gfit_id in [
 logger.info("Job configured: Google Fit step sync @ 08:05 / 13:05 / 18:05 / 23:05 IST daily")
 
 # 13. Nightly data cleanup — 00:10 IST daily
-# Deletes expired notification_inbox rows, old partner_nudge_events, and old push_logs.
+# Deletes expired notification_inbox rows, old partner_nudge_events, old push_logs and old ai_calls.
 async def nightly_cleanup_job():
     try:
         from app.db.session import AsyncSessionLocal
@@ -436,10 +483,15 @@ async def nightly_cleanup_job():
             r3 = await db.execute(text(
                 "DELETE FROM push_logs WHERE sent_at < now() - INTERVAL '30 days'"
             ))
+            # AI call accounting older than 90 days
+            r4 = await db.execute(text(
+                "DELETE FROM ai_calls WHERE called_at < now() - INTERVAL '90 days'"
+            ))
             await db.commit()
             logger.info(
                 f"Nightly cleanup: inbox={r1.rowcount} expired, "
-                f"nudge_events={r2.rowcount} old, push_logs={r3.rowcount} old"
+                f"nudge_events={r2.rowcount} old, push_logs={r3.rowcount} old, "
+                f"ai_calls={r4.rowcount} old"
             )
     except Exception as e:
         logger.error(f"Error in nightly cleanup job: {e}", exc_info=True)
@@ -0,0 +1,147 @@
+"""
+Global step streak — users.global_current_streak / global_longest_streak.
+
+A streak day is any day with steps > 0. The stored state is the latest run:
+
+    global_current_streak  length of the run ending at last_streak_update
+    last_streak_update     last day of that run (= latest day with steps > 0)
+    global_longest_streak  longest run ever
+
+Every step write calls update_global_streak() in the same transaction
+(POST /api/steps/add), or update_global_streak_days() for several days at
+once (Google Fit upsert). Only a day flipping between 0 and positive can
+change a run: positive → positive (a re-sync) is a no-op, logging today or
+the day after the run is O(1) on the users row, and a flip in the past
+(backfill, correction to 0) recomputes that user from daily_steps.
+
+The run is only "current" while it ends today or yesterday; readers go
+through live_streak() so a stale run reads as 0 without a nightly reset.
+
+Bulk rebuild (after import / first deploy): scripts/rebuild_global_streaks.py
+"""
+import logging
+from datetime import date, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+def live_streak(current: int | None, last_day: date | None, today: date) -> int:
+    """Stored streak if the run is still alive (ends today or yesterday), else 0."""
+    if not current or last_day is None or last_day < today - timedelta(days=1):
+        return 0
+    return current
+
+
+async def update_global_streak(db: AsyncSession, user_id: str, day: date, steps: int, prev_steps: int) -> None:
+    """
+    Apply one daily_steps write (prev_steps → steps; 0 for a new row) to the
+    user's global streak. Runs in the caller's transaction; the caller commits.
+    """
+    if (steps > 0) == ((prev_steps or 0) > 0):
+        return                           # no 0 ↔ positive flip → no run changes
+
+    row = (await db.execute(text("""
+        SELECT global_current_streak AS cur, last_streak_update AS last_day
+        FROM users WHERE id = :uid
+        FOR UPDATE
+    """), {"uid": str(user_id)})).mappings().first()
+    if row is None:
+        return
+
+    cur, last_day = row["cur"] or 0, row["last_day"]
+
+    if steps > 0:
+        if last_day is None or day > last_day + timedelta(days=1):
+            cur = 1                      # gap → new run
+        elif day == last_day + timedelta(days=1):
+            cur += 1                     # extends the run
+        elif day == last_day:
+            return                       # run already counts this day
+        else:
+            await _recompute(db, user_id)  # filled a day inside the history
+            return
+    else:
+        if last_day is None or day > last_day:
+            return                       # nothing after the run to break
+        await _recompute(db, user_id)    # zeroed a day the run may depend on
+        return
+
+    await db.execute(text("""
+        UPDATE users
+        SET global_current_streak = :cur,
+            global_longest_streak = GREATEST(global_longest_streak, :cur),
+            last_streak_update    = :day
+        WHERE id = :uid
+    """), {"uid": str(user_id), "cur": cur, "day": day})
+
+
+async def update_global_streak_days(db: AsyncSession, user_id: str, days: dict[date, tuple[int, int]]) -> None:
+    """
+    Apply several daily_steps writes ({day: (prev_steps, steps)}, already
+    executed) to the user's global streak. Flips on or after the stored run's
+    last day go through update_global_streak() in day order; a flip before it
+    recomputes once. Runs in the caller's transaction; the caller commits.
+    """
+    flips = sorted(d for d, (prev, steps) in days.items() if (steps > 0) != ((prev or 0) > 0))
+    if not flips:
+        return
+
+    last_day = (await db.execute(text("""
+        SELECT last_streak_update FROM users WHERE id = :uid FOR UPDATE
+    """), {"uid": str(user_id)})).scalar()
+    if last_day is not None and flips[0] < last_day:
+        await _recompute(db, user_id)
+        return
+
+    for d in flips:
+        prev, steps = days[d]
+        await update_global_streak(db, user_id, d, steps, prev)
+
+
+async def _recompute(db: AsyncSession, user_id: str) -> None:
+    await db.flush()  # the pending daily_steps change must be visible to the scan
+    await rebuild_global_streaks(db, user_id)
+
+
+async def rebuild_global_streaks(db: AsyncSession, user_id: str | None = None) -> int:
+    """
+    Recompute streak columns from daily_steps — one user, or everyone.
+    Users without any step day are reset to 0. Returns rows updated.
+    The caller commits.
+    """
+    steps_filter = "AND user_id = :uid" if user_id else ""
+    users_filter = "AND u.id = :uid" if user_id else ""
+    params = {"uid": str(user_id)} if user_id else {}
+
+    result = await db.execute(text(f"""
+        WITH days AS (
+            SELECT user_id, day,
+                   day - (ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day))::int AS grp
+            FROM daily_steps
+            WHERE steps > 0 {steps_filter}
+        ),
+        runs AS (
+            SELECT user_id, MAX(day) AS last_day, COUNT(*) AS len
+            FROM days
+            GROUP BY user_id, grp
+        ),
+        per_user AS (
+            SELECT DISTINCT ON (user_id)
+                   user_id, last_day, len AS cur,
+                   MAX(len) OVER (PARTITION BY user_id) AS longest
+            FROM runs
+            ORDER BY user_id, last_day DESC
+        )
+        UPDATE users u
+        SET global_current_streak = COALESCE(p.cur, 0),
+            global_longest_streak = COALESCE(p.longest, 0),
+            last_streak_update    = p.last_day
+        FROM users u2
+        LEFT JOIN per_user p ON p.user_id = u2.id
+        WHERE u2.id = u.id
+        {users_filter}
+    """), params)
+    return result.rowcount
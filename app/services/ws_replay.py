@@ -0,0 +1,121 @@
+"""
+Reconnect replay for /ws — catch a client up on what it missed while offline.
+
+Cursor: "<message_id>.<inbox_id>" — the highest partner_messages.id and
+notification_inbox.id the client has seen. Both are BIGSERIAL, so "missed"
+is a keyset query per table (receiver_id/user_id, id > cursor) on the
+(user, id) indexes from 0029_ws_replay_indexes.
+
+Every connect gets a "cursor" event; clients store it and advance it from the
+ids on live events (chat_message.message_id, inbox.id). On reconnect they
+pass ?since=<cursor> and receive the missed rows as the same event shapes
+the live path sends (plus "replay": true), then "replay_done".
+
+If more than _REPLAY_LIMIT rows are missing per table the replay is cut off
+and "truncated": true tells the client to fall back to a full reload.
+"""
+import json
+import logging
+
+from sqlalchemy import text
+
+from app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+_REPLAY_LIMIT = 200
+
+
+def parse_cursor(cursor: str | None) -> tuple[int, int] | None:
+    if not cursor:
+        return None
+    try:
+        msg_id, inbox_id = cursor.split(".", 1)
+        return int(msg_id), int(inbox_id)
+    except ValueError:
+        return None
+
+
+def format_cursor(msg_id: int, inbox_id: int) -> str:
+    return f"{msg_id}.{inbox_id}"
+
+
+async def current_cursor(user_id: str) -> str:
+    """Cursor pointing at "now" — for clients connecting without ?since."""
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(text("""
+            SELECT
+                (SELECT COALESCE(MAX(id), 0) FROM partner_messages   WHERE receiver_id = :uid) AS msg_id,
+                (SELECT COALESCE(MAX(id), 0) FROM notification_inbox WHERE user_id     = :uid) AS inbox_id
+        """), {"uid": user_id})).mappings().first()
+    return format_cursor(row["msg_id"], row["inbox_id"])
+
+
+async def replay_since(user_id: str, since: tuple[int, int]) -> tuple[list[dict], str, bool]:
+    """
+    Missed events after `since`, oldest first.
+    Returns (events, new_cursor, truncated).
+    """
+    msg_after, inbox_after = since
+    async with AsyncSessionLocal() as db:
+        messages = (await db.execute(text("""
+            SELECT pm.id, pm.pair_id, pm.sender_id, u.name AS sender_name, pm.body, pm.sent_at
+            FROM partner_messages pm
+            JOIN users u ON u.id = pm.sender_id
+            WHERE pm.receiver_id = :uid AND pm.id > :after
+              AND (pm.expires_at IS NULL OR pm.expires_at > now())
+            ORDER BY pm.id
+            LIMIT :lim
+        """), {"uid": user_id, "after": msg_after, "lim": _REPLAY_LIMIT + 1})).mappings().all()
+
+        inbox = (await db.execute(text("""
+            SELECT id, type, template_key, payload, action_url, actor_name, created_at
+            FROM notification_inbox
+            WHERE user_id = :uid AND id > :after
+              AND (expires_at IS NULL OR expires_at > now())
+            ORDER BY id
+            LIMIT :lim
+        """), {"uid": user_id, "after": inbox_after, "lim": _REPLAY_LIMIT + 1})).mappings().all()
+
+    truncated = len(messages) > _REPLAY_LIMIT or len(inbox) > _REPLAY_LIMIT
+    messages, inbox = messages[:_REPLAY_LIMIT], inbox[:_REPLAY_LIMIT]
+
+    events = [
+        (m["sent_at"], {
+            "type":        "chat_message",
+            "pair_id":     m["pair_id"],
+            "message_id":  m["id"],
+            "sender_id":   str(m["sender_id"]),
+            "sender_name": (m["sender_name"] or "Partner").split()[0],
+            "body":        m["body"],
+            "replay":      True,
+        })
+        for m in messages
+    ] + [
+        (n["created_at"], {**inbox_event(n), "replay": True})
+        for n in inbox
+    ]
+    events.sort(key=lambda e: e[0])
+
+    cursor = format_cursor(
+        messages[-1]["id"] if messages else msg_after,
+        inbox[-1]["id"] if inbox else inbox_after,
+    )
+    return [e for _, e in events], cursor, truncated
+
+
+def inbox_event(row) -> dict:
+    """WS event for one notification_inbox row (live and replay use the same shape)."""
+    payload = row["payload"]
+    if isinstance(payload, str):  # asyncpg hands jsonb back as text
+        payload = json.loads(payload)
+    return {
+        "type":         "inbox",
+        "id":           row["id"],
+        "inbox_type":   row["type"],
+        "template_key": row["template_key"],
+        "payload":      payload,
+        "action_url":   row["action_url"],
+        "actor_name":   row["actor_name"],
+        "created_at":   row["created_at"].isoformat() if row["created_at"] else None,
+    }
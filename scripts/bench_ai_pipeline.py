@@ -0,0 +1,326 @@
+"""
+Offline AI pipeline benchmark — runs the real AI code paths against the fake provider.
+
+Seeds a synthetic population (a "bench-ai" department with N users, 30 days of
+steps, an active habit challenge and a few body scans each), then times:
+
+  insight — ai_insight.generate_nightly_insights  (single-user mode, per bench user)
+  coach   — ai_coach.get_coach_report             (cache cleared first → fresh generation)
+  body    — ai_recommendations.get_body_insight   (cache cleared first → fresh generation)
+
+For each phase it reports throughput, wall time, per-user latency (p50/p95),
+summed DB time (cursor execute) vs summed provider time, and the fallback rate.
+AI_PROVIDER is forced to "fake" — no network, no tokens. Only bench users are
+touched; real users are never passed to the generators.
+
+Usage (from the project root, needs DATABASE_URL):
+
+  # 200 users, 8 concurrent sessions, 800 ms ± 300 ms fake latency, 5% injected errors
+  python scripts/bench_ai_pipeline.py --users 200 --concurrency 8 --latency-ms 800 --jitter-ms 300 --error-rate 0.05
+
+  # only the coach phase, re-using an already seeded population
+  python scripts/bench_ai_pipeline.py --phases coach --no-seed
+
+  # remove the synthetic population
+  python scripts/bench_ai_pipeline.py --cleanup
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Parse first so the fake-provider settings are in the environment before
+# app.core.config builds its Settings object.
+parser = argparse.ArgumentParser(description="Benchmark the AI pipelines against the fake provider")
+parser.add_argument("--users",       type=int,   default=100,  help="synthetic population size")
+parser.add_argument("--concurrency", type=int,   default=4,    help="concurrent DB sessions per phase")
+parser.add_argument("--latency-ms",  type=int,   default=1200, help="fake provider mean latency")
+parser.add_argument("--jitter-ms",   type=int,   default=400,  help="fake provider latency jitter (±)")
+parser.add_argument("--error-rate",  type=float, default=0.0,  help="share of provider calls that fail")
+parser.add_argument("--seed",        type=int,   default=0,    help="fake provider seed")
+parser.add_argument("--phases",      default="insight,coach,body", help="comma-separated subset of insight,coach,body")
+parser.add_argument("--no-seed",     action="store_true", help="skip seeding; use existing bench users")
+parser.add_argument("--cleanup",     action="store_true", help="delete the synthetic population and exit")
+args = parser.parse_args()
+
+os.environ["AI_PROVIDER"]               = "fake"
+os.environ["AI_FAKE_LATENCY_MS"]        = str(args.latency_ms)
+os.environ["AI_FAKE_LATENCY_JITTER_MS"] = str(args.jitter_ms)
+os.environ["AI_FAKE_ERROR_RATE"]        = str(args.error_rate)
+os.environ["AI_FAKE_SEED"]              = str(args.seed)
+
+# ── make sure project root is importable ─────────────────────────────────────
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# ── silence SQLAlchemy query logging (echo=True is set in session.py) ─────────
+import logging
+logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+logging.getLogger("sqlalchemy.pool").setLevel(logging.WARNING)
+logging.getLogger("app").setLevel(logging.CRITICAL)
+import app.db.session as _db_session
+_db_session.engine.echo = False
+
+from sqlalchemy import event, text
+
+from app.db.session import AsyncSessionLocal, engine
+from app.services import ai_coach, ai_fake, ai_insight, ai_recommendations
+
+_BENCH_DEPT  = "bench-ai"
+_EMAIL_LIKE  = "bench-ai-%@bench.local"
+
+
+# ── instrumentation ───────────────────────────────────────────────────────────
+
+class _Timers:
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.db_s = 0.0
+        self.db_queries = 0
+        self.provider_s = 0.0
+        self.provider_calls = 0
+        self.fallbacks = 0
+
+
+T = _Timers()
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_bench_t0", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after(conn, cursor, statement, parameters, context, executemany):
+    T.db_s += time.perf_counter() - conn.info["_bench_t0"].pop()
+    T.db_queries += 1
+
+
+def _timed_provider(fn):
+    async def wrapper(*a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return await fn(*a, **kw)
+        finally:
+            T.provider_s += time.perf_counter() - t0
+            T.provider_calls += 1
+    return wrapper
+
+
+def _counted_fallback(fn):
+    def wrapper(*a, **kw):
+        T.fallbacks += 1
+        return fn(*a, **kw)
+    return wrapper
+
+
+# Callers import fake_complete lazily and reference the fallbacks by module
+# global, so patching the module attributes is enough.
+ai_fake.fake_complete                 = _timed_provider(ai_fake.fake_complete)
+ai_insight._fallback                  = _counted_fallback(ai_insight._fallback)
+ai_coach._fallback_report             = _counted_fallback(ai_coach._fallback_report)
+ai_recommendations._fallback_body     = _counted_fallback(ai_recommendations._fallback_body)
+
+
+# ── synthetic population ──────────────────────────────────────────────────────
+
+async def seed(n: int) -> list[str]:
+    async with AsyncSessionLocal() as db:
+        dept_id = (await db.execute(text(
+            "SELECT id FROM departments WHERE name = :n"), {"n": _BENCH_DEPT})).scalar()
+        if dept_id is None:
+            dept_id = (await db.execute(text(
+                "INSERT INTO departments (name) VALUES (:n) RETURNING id"), {"n": _BENCH_DEPT})).scalar()
+
+        await db.execute(text("""
+            INSERT INTO users (email, name, password_hash, department_id, age, gender, activity_level, height_cm)
+            SELECT 'bench-ai-' || g || '@bench.local', 'Bench ' || g, 'x', :dept,
+                   25 + g % 30, CASE WHEN g % 2 = 0 THEN 'male' ELSE 'female' END, 'moderate', 160 + g % 25
+            FROM generate_series(1, :n) g
+            ON CONFLICT (email) DO NOTHING
+        """), {"dept": dept_id, "n": n})
+
+        user_ids = [str(r[0]) for r in (await db.execute(text(
+            "SELECT id FROM users WHERE email LIKE :p ORDER BY email LIMIT :n"),
+            {"p": _EMAIL_LIKE, "n": n})).all()]
+
+        await db.execute(text("""
+            INSERT INTO daily_steps (user_id, day, steps)
+            SELECT u, current_date - d, (abs(hashtext(u::text || d)) % 12000)
+            FROM unnest(CAST(:ids AS uuid[])) u, generate_series(0, 29) d
+            ON CONFLICT (user_id, day) DO NOTHING
+        """), {"ids": user_ids})
+
+        await db.execute(text("""
+            INSERT INTO body_metrics (user_id, recorded_date, weight_kg, body_fat_pct, visceral_fat,
+                                      skeletal_muscle_pct, metabolic_age, bmr_kcal, hydration_pct)
+            SELECT u, current_date - d * 14, 60 + abs(hashtext(u::text)) % 40, 18 + d, 8 + d,
+                   30 - d, 35 + d, 1600, 52
+            FROM unnest(CAST(:ids AS uuid[])) u, generate_series(0, 2) d
+            WHERE NOT EXISTS (SELECT 1 FROM body_metrics bm WHERE bm.user_id = u)
+        """), {"ids": user_ids})
+
+        habit_ids = [r[0] for r in (await db.execute(text(
+            "SELECT id FROM habits ORDER BY id LIMIT 4"))).all()]
+        if habit_ids:
+            await db.execute(text("""
+                INSERT INTO habit_challenges (user_id, status, started_at, ends_at)
+                SELECT u, 'active', current_date - 10, current_date + 10
+                FROM unnest(CAST(:ids AS uuid[])) u
+                WHERE NOT EXISTS (SELECT 1 FROM habit_challenges hc WHERE hc.user_id = u)
+            """), {"ids": user_ids})
+            await db.execute(text("""
+                INSERT INTO habit_commitments (challenge_id, habit_id, sort_order)
+                SELECT hc.id, h, 0
+                FROM habit_challenges hc, unnest(CAST(:hids AS int[])) h
+                WHERE hc.user_id = ANY(CAST(:ids AS uuid[]))
+                ON CONFLICT DO NOTHING
+            """), {"ids": user_ids, "hids": habit_ids})
+            await db.execute(text("""
+                INSERT INTO daily_logs (commitment_id, logged_date, completed)
+                SELECT hcm.id, current_date - d, (abs(hashtext(hcm.id::text || d)) % 3) > 0
+                FROM habit_commitments hcm
+                JOIN habit_challenges hc ON hc.id = hcm.challenge_id
+                CROSS JOIN generate_series(1, 10) d
+                WHERE hc.user_id = ANY(CAST(:ids AS uuid[]))
+                ON CONFLICT DO NOTHING
+            """), {"ids": user_ids})
+
+        await db.commit()
+        return user_ids
+
+
+async def existing_users(n: int) -> list[str]:
+    async with AsyncSessionLocal() as db:
+        return [str(r[0]) for r in (await db.execute(text(
+            "SELECT id FROM users WHERE email LIKE :p ORDER BY email LIMIT :n"),
+            {"p": _EMAIL_LIKE, "n": n})).all()]
+
+
+async def cleanup() -> None:
+    async with AsyncSessionLocal() as db:
+        ids = [str(r[0]) for r in (await db.execute(text(
+            "SELECT id FROM users WHERE email LIKE :p"), {"p": _EMAIL_LIKE})).all()]
+        for table in ("daily_steps", "body_metrics"):
+            await db.execute(text(f"DELETE FROM {table} WHERE user_id = ANY(CAST(:ids AS uuid[]))"), {"ids": ids})
+        await db.execute(text("DELETE FROM users WHERE id = ANY(CAST(:ids AS uuid[]))"), {"ids": ids})
+        await db.execute(text("DELETE FROM departments WHERE name = :n"), {"n": _BENCH_DEPT})
+        await db.commit()
+    print(f"Removed {len(ids)} bench users.")
+
+
+# ── phases ────────────────────────────────────────────────────────────────────
+
+async def _clear(table_sql: str, user_ids: list[str]) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(text(table_sql), {"ids": user_ids})
+        await db.commit()
+
+
+async def _insight(db, uid):
+    await ai_insight.generate_nightly_insights(db, user_id=uid)
+
+
+async def _coach(db, uid):
+    await ai_coach.get_coach_report(db, uid)
+
+
+async def _body(db, uid):
+    await ai_recommendations.get_body_insight(db, uid)
+
+
+PHASES = {
+    "insight": (_insight, "DELETE FROM ai_insights WHERE user_id = ANY(CAST(:ids AS uuid[])) AND insight_date = current_date"),
+    "coach":   (_coach,   "DELETE FROM ai_coach_reports WHERE user_id = ANY(CAST(:ids AS uuid[]))"),
+    "body":    (_body,    "DELETE FROM ai_recommendations WHERE user_id = ANY(CAST(:ids AS uuid[])) AND type = 'body_insight'"),
+}
+
+
+async def run_phase(name: str, user_ids: list[str], concurrency: int) -> dict:
+    fn, clear_sql = PHASES[name]
+    await _clear(clear_sql, user_ids)
+
+    sem = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one(uid: str) -> None:
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                async with AsyncSessionLocal() as db:
+                    await fn(db, uid)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - t0)
+
+    T.reset()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(uid) for uid in user_ids))
+    wall = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "phase":       name,
+        "users":       len(user_ids),
+        "wall_s":      wall,
+        "throughput":  len(user_ids) / wall if wall else 0.0,
+        "p50_s":       statistics.median(latencies) if latencies else 0.0,
+        "p95_s":       latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else (latencies[-1] if latencies else 0.0),
+        "db_s":        T.db_s,
+        "db_queries":  T.db_queries,
+        "provider_s":  T.provider_s,
+        "provider_n":  T.provider_calls,
+        "fallbacks":   T.fallbacks,
+        "errors":      errors,
+    }
+
+
+def _print(results: list[dict]) -> None:
+    print()
+    print(f"{'phase':8} {'users':>6} {'wall s':>8} {'users/s':>8} {'p50 s':>7} {'p95 s':>7} "
+          f"{'db s':>8} {'queries':>8} {'prov s':>8} {'calls':>6} {'db %':>6} {'fallback':>9} {'errors':>6}")
+    print("─" * 112)
+    for r in results:
+        busy = r["db_s"] + r["provider_s"]
+        db_pct = r["db_s"] / busy * 100 if busy else 0.0
+        fb_rate = r["fallbacks"] / r["users"] * 100 if r["users"] else 0.0
+        print(f"{r['phase']:8} {r['users']:>6} {r['wall_s']:>8.2f} {r['throughput']:>8.2f} "
+              f"{r['p50_s']:>7.3f} {r['p95_s']:>7.3f} {r['db_s']:>8.2f} {r['db_queries']:>8} "
+              f"{r['provider_s']:>8.2f} {r['provider_n']:>6} {db_pct:>5.1f}% {fb_rate:>8.1f}% {r['errors']:>6}")
+    print()
+    print("db s / prov s are summed across concurrent sessions; db % = db / (db + provider).")
+
+
+async def main() -> None:
+    if args.cleanup:
+        await cleanup()
+        return
+
+    user_ids = await existing_users(args.users) if args.no_seed else await seed(args.users)
+    if not user_ids:
+        print("No bench users found — run without --no-seed first.")
+        sys.exit(1)
+
+    print(f"Population: {len(user_ids)} users  |  concurrency={args.concurrency}  |  "
+          f"fake latency={args.latency_ms}±{args.jitter_ms} ms  error rate={args.error_rate:.0%}")
+
+    results = []
+    for name in [p.strip() for p in args.phases.split(",") if p.strip()]:
+        if name not in PHASES:
+            print(f"Unknown phase '{name}' — choose from {', '.join(PHASES)}")
+            sys.exit(1)
+        print(f"Running {name} …")
+        results.append(await run_phase(name, user_ids, args.concurrency))
+
+    _print(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
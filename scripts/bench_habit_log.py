@@ -0,0 +1,255 @@
+"""
+Habit tap benchmark — POST /api/habit-challenges/logs (habits_service.upsert_log).
+
+Seeds one bench user with an active challenge (--habits habits, --day days in,
+with history) on a habit pack shared with --pack-members other members, then
+toggles random habits for today --taps times per mode and reports per-tap
+latency (p50 / p95 / mean) and SQL statements per tap.
+
+Modes
+-----
+  legacy  — the pre-rollup upsert_log: ORM ownership check, log lookup, commit,
+            refresh, commitment re-select, get_streak (challenge, commitments,
+            every completed log, full simulation), two perfect-day counts
+  current — habits_service.upsert_log: one CTE statement (ownership, log upsert,
+            rollup bump, checkpoint + day rollups), pack-rank refresh (lock and
+            re-rank of the populated pack when the tap changes good days),
+            commit, checkpointed streak
+
+Each mode taps on a freshly seeded challenge (legacy taps don't maintain
+habit_day_rollup). Celebration pushes are disabled for both modes.
+
+Usage (from project root, needs DATABASE_URL):
+  python scripts/bench_habit_log.py
+  python scripts/bench_habit_log.py --taps 500 --day 18 --habits 6
+  python scripts/bench_habit_log.py --pack-members 5000
+  python scripts/bench_habit_log.py --cleanup
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# ── silence SQLAlchemy query logging (echo=True is set in session.py) ─────────
+import logging
+logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+logging.getLogger("sqlalchemy.pool").setLevel(logging.WARNING)
+logging.getLogger("app").setLevel(logging.CRITICAL)
+import app.db.session as _db_session
+_db_session.engine.echo = False
+
+from fastapi import HTTPException
+from sqlalchemy import event, func, select, text
+
+from app.db.session import AsyncSessionLocal, engine
+from app.models import DailyLog, HabitChallenge, HabitCommitment
+from app.services import habit_pack_ranks, habit_rollup, habit_streak, habits_service
+
+_EMAIL = "bench-habit-log@bench.local"
+_MEMBER_EMAILS = "bench-habit-pack-%@bench.local"
+_DEPT = "bench-habit-log"
+_PACK = "bench-pack"
+
+# Measure the write path only — no celebration pushes / inbox rows
+async def _no_push(*a, **kw):
+    return None
+habits_service.fire_habit_perfect_day = _no_push
+habits_service.fire_habit_streak_milestone = _no_push
+
+_statements = 0
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global _statements
+    _statements += 1
+
+
+# ── legacy path (upsert_log + get_streak before the rollup) ───────────────────
+
+async def _legacy_get_streak(db, challenge_id: int, user_id: str) -> dict:
+    challenge = (await db.execute(select(HabitChallenge).where(
+        HabitChallenge.id == challenge_id, HabitChallenge.user_id == user_id,
+    ))).scalar_one_or_none()
+    if not challenge:
+        raise HTTPException(404, "Challenge not found")
+    commitments = (await db.execute(
+        select(HabitCommitment).where(HabitCommitment.challenge_id == challenge_id)
+    )).scalars().all()
+    total = len(commitments)
+    logs = (await db.execute(select(DailyLog).where(
+        DailyLog.commitment_id.in_([c.id for c in commitments]), DailyLog.completed == True,
+    ))).scalars().all()
+    by_date: dict[date, int] = defaultdict(int)
+    for log in logs:
+        by_date[log.logged_date] += 1
+    today = date.today()
+    ss = habit_streak.compute_shield_streak(by_date, challenge.started_at, today, total, today)
+    perfect_days = sum(1 for v in by_date.values() if v >= total)
+    return {"challenge_id": challenge_id, "perfect_days": perfect_days, **ss}
+
+
+async def _legacy_upsert_log(db, user_id: str, commitment_id: int, logged_date: date,
+                             completed: bool, value: int | None) -> dict:
+    commitment = (await db.execute(
+        select(HabitCommitment).join(HabitChallenge)
+        .where(HabitCommitment.id == commitment_id, HabitChallenge.user_id == user_id)
+    )).scalar_one_or_none()
+    if not commitment:
+        raise HTTPException(404, "Commitment not found")
+    log = (await db.execute(select(DailyLog).where(
+        DailyLog.commitment_id == commitment_id, DailyLog.logged_date == logged_date,
+    ))).scalar_one_or_none()
+    if log:
+        log.completed = completed
+        log.value = value
+    else:
+        log = DailyLog(commitment_id=commitment_id, logged_date=logged_date, completed=completed, value=value)
+        db.add(log)
+    await db.commit()
+    await db.refresh(log)
+    cm = (await db.execute(select(HabitCommitment).where(HabitCommitment.id == commitment_id))).scalar_one()
+    streak = await _legacy_get_streak(db, cm.challenge_id, user_id)
+    if completed:
+        (await db.execute(select(func.count()).where(HabitCommitment.challenge_id == cm.challenge_id))).scalar()
+        (await db.execute(
+            select(func.count()).select_from(DailyLog)
+            .join(HabitCommitment, DailyLog.commitment_id == HabitCommitment.id)
+            .where(HabitCommitment.challenge_id == cm.challenge_id,
+                   DailyLog.logged_date == logged_date, DailyLog.completed == True)
+        )).scalar()
+    return {"id": log.id, **streak}
+
+
+MODES = {
+    "legacy":  _legacy_upsert_log,
+    "current": habits_service.upsert_log,
+}
+
+
+# ── bench user ────────────────────────────────────────────────────────────────
+
+async def _seed_challenges(db, user_ids: list[str], habits: int, day: int) -> list[int]:
+    """One active pack challenge per user, `day` days in with ~75% history. Returns challenge ids."""
+    await db.execute(text("DELETE FROM habit_challenges WHERE user_id = ANY(CAST(:u AS uuid[]))"), {"u": user_ids})
+    cids = list((await db.execute(text("""
+        INSERT INTO habit_challenges (user_id, pack_id, status, started_at, ends_at)
+        SELECT u, :pack, 'active', current_date - CAST(:d AS int), current_date - CAST(:d AS int) + 20
+        FROM unnest(CAST(:u AS uuid[])) u
+        RETURNING id
+    """), {"u": user_ids, "pack": _PACK, "d": day - 1})).scalars().all())
+    cms = list((await db.execute(text("""
+        INSERT INTO habit_commitments (challenge_id, habit_id, sort_order)
+        SELECT c, h.id, ROW_NUMBER() OVER (PARTITION BY c ORDER BY h.id)
+        FROM unnest(CAST(:c AS int[])) c, (SELECT id FROM habits ORDER BY id LIMIT :n) h
+        RETURNING id
+    """), {"c": cids, "n": habits})).scalars().all())
+    await db.execute(text("""
+        INSERT INTO daily_logs (commitment_id, logged_date, completed)
+        SELECT cm, current_date - d, random() < 0.75
+        FROM unnest(CAST(:cms AS int[])) cm, generate_series(1, :d) d
+    """), {"cms": cms, "d": day - 1})
+    await habit_rollup.rebuild_habit_rollup(db, cids)
+    return cids
+
+
+async def seed(habits: int, day: int, members: int) -> tuple[str, int, list[int]]:
+    """
+    Fresh bench challenge on a pack with `members` other members, ranked.
+    Returns (user, challenge, commitments).
+    """
+    async with AsyncSessionLocal() as db:
+        dept_id = (await db.execute(text("SELECT id FROM departments WHERE name = :n"), {"n": _DEPT})).scalar()
+        if dept_id is None:
+            dept_id = (await db.execute(text(
+                "INSERT INTO departments (name) VALUES (:n) RETURNING id"), {"n": _DEPT})).scalar()
+        await db.execute(text("""
+            INSERT INTO users (email, name, password_hash, department_id)
+            VALUES (:e, 'Bench Habit', 'x', :dept) ON CONFLICT (email) DO NOTHING
+        """), {"e": _EMAIL, "dept": dept_id})
+        await db.execute(text("""
+            INSERT INTO users (email, name, password_hash, department_id)
+            SELECT 'bench-habit-pack-' || g || '@bench.local', 'Pack ' || g, 'x', :dept
+            FROM generate_series(1, :n) g
+            ON CONFLICT (email) DO NOTHING
+        """), {"n": members, "dept": dept_id})
+        uid = str((await db.execute(text("SELECT id FROM users WHERE email = :e"), {"e": _EMAIL})).scalar())
+        member_ids = [str(r) for r in (await db.execute(text(
+            "SELECT id FROM users WHERE email LIKE :p ORDER BY email LIMIT :n"
+        ), {"p": _MEMBER_EMAILS, "n": members})).scalars().all()]
+        cids = await _seed_challenges(db, [uid] + member_ids, habits, day)
+        await habit_pack_ranks.refresh(db, cids)
+        await db.commit()
+        cid = (await db.execute(text(
+            "SELECT id FROM habit_challenges WHERE user_id = :u"), {"u": uid})).scalar()
+        cms = list((await db.execute(text(
+            "SELECT id FROM habit_commitments WHERE challenge_id = :c ORDER BY sort_order"), {"c": cid},
+        )).scalars().all())
+    return uid, cid, cms
+
+
+async def cleanup() -> None:
+    async with AsyncSessionLocal() as db:
+        n = (await db.execute(text(
+            "DELETE FROM users WHERE email = :e OR email LIKE :p"), {"e": _EMAIL, "p": _MEMBER_EMAILS},
+        )).rowcount
+        await db.execute(text("DELETE FROM departments WHERE name = :n"), {"n": _DEPT})
+        await db.commit()
+    print(f"Removed {n} bench user(s).")
+
+
+async def run_mode(name: str, uid: str, cms: list[int], taps: int) -> dict:
+    fn = MODES[name]
+    rng = random.Random(0)
+    state = {cm: False for cm in cms}
+    latencies, statements = [], []
+    async with AsyncSessionLocal() as db:
+        for _ in range(taps):
+            cm = rng.choice(cms)
+            state[cm] = not state[cm]
+            before = _statements
+            t0 = time.perf_counter()
+            await fn(db, uid, cm, date.today(), state[cm], None)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            statements.append(_statements - before)
+    latencies.sort()
+    return {
+        "p50":  statistics.median(latencies),
+        "p95":  latencies[int(len(latencies) * 0.95) - 1],
+        "mean": statistics.fmean(latencies),
+        "stmts": statistics.fmean(statements),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Time habit taps: legacy vs current upsert_log")
+    parser.add_argument("--taps",    type=int, default=200)
+    parser.add_argument("--habits",  type=int, default=5)
+    parser.add_argument("--day",     type=int, default=15, help="day of the 21-day cycle to tap on")
+    parser.add_argument("--pack-members", type=int, default=1000, help="other active members of the bench pack")
+    parser.add_argument("--modes",   default="legacy,current")
+    parser.add_argument("--cleanup", action="store_true", help="remove the bench users and exit")
+    args = parser.parse_args()
+
+    if args.cleanup:
+        await cleanup()
+        return
+
+    print(f"{'mode':<9} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'stmts/tap':>10}")
+    for name in args.modes.split(","):
+        uid, cid, cms = await seed(args.habits, args.day, args.pack_members)
+        r = await run_mode(name, uid, cms, args.taps)
+        print(f"{name:<9} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['mean']:>8.2f} {r['stmts']:>10.1f}")
+    await cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
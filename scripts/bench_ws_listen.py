@@ -0,0 +1,204 @@
+"""
+WebSocket LISTEN benchmark — per-socket listener connections vs the shared listener.
+
+Simulates N connected app sessions (in-process fake sockets, no HTTP) and
+measures, for each mode:
+
+  backends   — Postgres backends held by this process (pg_stat_activity)
+  setup s    — time to register all N sockets
+  idle cpu   — process CPU over an idle window, as % of one core
+  fan-out    — pg_notify to M random users → delivery latency p50 / p95
+
+Modes
+-----
+  legacy  — the old ws.py design: one asyncpg.connect + LISTEN per socket and a
+            1 Hz `while user_id in _online: await asyncio.sleep(1)` loop each
+  shared  — app.api.ws._listener: one connection, one LISTEN per user,
+            per-socket send queues (presence publishing disabled)
+
+Legacy mode at 5k sockets will usually exceed max_connections — failed
+connects are counted and reported rather than aborting the run.
+
+Usage (from project root, needs DATABASE_URL):
+  python scripts/bench_ws_listen.py --sockets 1000 5000
+  python scripts/bench_ws_listen.py --sockets 1000 --modes shared --idle 60 --notifies 500
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+logging.basicConfig(level=logging.WARNING)
+
+import asyncpg
+
+import app.api.ws as ws
+from app.core.config import settings
+from app.services import presence
+
+# Measure the listener only — don't write ws_presence rows for simulated users
+presence.set_local = lambda user_id, online: None
+
+_DSN = settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
+
+
+class _FakeSocket:
+    """Stands in for a WebSocket — records delivery latency of bench payloads."""
+
+    def __init__(self, latencies: list[float]):
+        self._latencies = latencies
+
+    async def send_text(self, text: str) -> None:
+        msg = json.loads(text)
+        if "t0" in msg:
+            self._latencies.append(time.perf_counter() - msg["t0"])
+
+
+async def _backends(probe: asyncpg.Connection) -> int:
+    return await probe.fetchval(
+        "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()"
+    )
+
+
+# ── legacy: copy of the pre-multiplexer per-socket listener ───────────────────
+
+async def _legacy_listen(user_id: str, sock: _FakeSocket, online: dict, ready: list, failures: list) -> None:
+    conn = None
+    try:
+        conn = await asyncpg.connect(_DSN)
+
+        async def on_notify(connection, pid, channel, payload):
+            await sock.send_text(payload)
+
+        await conn.add_listener(f"user_{user_id}", on_notify)
+        ready.append(user_id)
+        while user_id in online:
+            await asyncio.sleep(1)
+    except Exception as exc:
+        failures.append(str(exc))
+    finally:
+        if conn:
+            await conn.close()
+
+
+async def _setup_legacy(user_ids, latencies):
+    online, ready, failures = {}, [], []
+    tasks = []
+    for uid in user_ids:
+        online[uid] = True
+        tasks.append(asyncio.create_task(_legacy_listen(uid, _FakeSocket(latencies), online, ready, failures)))
+    # wait until every socket has either connected or failed (max 60 s)
+    deadline = time.perf_counter() + 60
+    while len(ready) + len(failures) < len(user_ids) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+
+    async def teardown():
+        online.clear()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return teardown, failures
+
+
+async def _setup_shared(user_ids, latencies):
+    failures = []
+    socks = []
+    for uid in user_ids:
+        socks.append(ws._register(uid, _FakeSocket(latencies)))
+        try:
+            await ws._listener.subscribe(uid)
+        except Exception as exc:
+            failures.append(str(exc))
+
+    async def teardown():
+        for sock in socks:
+            ws._unregister(sock)
+            await ws._listener.unsubscribe(sock.user_id)
+        await ws._listener.close()
+        ws._listener = ws._Listener()
+
+    return teardown, failures
+
+
+# ── run one (mode, N) combination ─────────────────────────────────────────────
+
+async def run(mode: str, n: int, idle_s: float, notifies: int) -> dict:
+    user_ids = [str(uuid.uuid4()) for _ in range(n)]
+    latencies: list[float] = []
+    probe = await asyncpg.connect(_DSN)
+    sender = await asyncpg.connect(_DSN)
+    try:
+        base = await _backends(probe)
+
+        t0 = time.perf_counter()
+        setup = _setup_legacy if mode == "legacy" else _setup_shared
+        teardown, failures = await setup(user_ids, latencies)
+        setup_s = time.perf_counter() - t0
+        backends = await _backends(probe) - base
+
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        await asyncio.sleep(idle_s)
+        idle_cpu_pct = (time.process_time() - cpu0) / (time.perf_counter() - wall0) * 100
+
+        for uid in random.choices(user_ids, k=notifies):
+            await sender.execute("SELECT pg_notify($1, $2)", f"user_{uid}",
+                                 json.dumps({"type": "bench", "t0": time.perf_counter()}))
+        await asyncio.sleep(2)
+
+        await teardown()
+    finally:
+        await probe.close()
+        await sender.close()
+
+    latencies.sort()
+    return {
+        "mode":      mode,
+        "sockets":   n,
+        "failed":    len(failures),
+        "backends":  backends,
+        "setup_s":   setup_s,
+        "idle_cpu":  idle_cpu_pct,
+        "delivered": len(latencies),
+        "sent":      notifies,
+        "p50_ms":    statistics.median(latencies) * 1000 if latencies else None,
+        "p95_ms":    latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000 if latencies else None,
+    }
+
+
+def _fmt_ms(v):
+    return f"{v:8.1f}" if v is not None else "       —"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-socket vs shared LISTEN connections")
+    parser.add_argument("--sockets",  type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--modes",    default="legacy,shared")
+    parser.add_argument("--idle",     type=float, default=30, help="idle CPU sampling window, seconds")
+    parser.add_argument("--notifies", type=int, default=200, help="pg_notify calls for the fan-out test")
+    args = parser.parse_args()
+
+    results = []
+    for n in args.sockets:
+        for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+            print(f"Running {mode} @ {n} sockets …")
+            results.append(await run(mode, n, args.idle, args.notifies))
+
+    print()
+    print(f"{'mode':7} {'sockets':>8} {'failed':>7} {'backends':>9} {'setup s':>8} {'idle cpu':>9} "
+          f"{'delivered':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    print("─" * 84)
+    for r in results:
+        print(f"{r['mode']:7} {r['sockets']:>8} {r['failed']:>7} {r['backends']:>9} {r['setup_s']:>8.2f} "
+              f"{r['idle_cpu']:>8.1f}% {r['delivered']:>4}/{r['sent']:<5} {_fmt_ms(r['p50_ms'])} {_fmt_ms(r['p95_ms'])}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -521,27 +521,20 @@ async def push_to_user(user_id):
 async def sync_googlefit_month(user_id: str = None):
     """
     Backfill Google Fit steps for every day from the 1st of the current month up to today.
-    For each day, fetches from Google Fit and saves to DB if steps > 0 (skips 0-step days).
+    One range request per user to Google Fit, saved in one transaction (skips 0-step days).
     If user_id is provided, syncs only that user; otherwise syncs all connected users.
     """
-    from app.services.google_fit import _refresh_access_token, _fetch_steps_for_date, _upsert_steps
+    from app.services.google_fit import _refresh_access_token, _fetch_steps_range, _upsert_steps_bulk
     from app.core.security import decrypt_token, encrypt_token
     from app.db.session import AsyncSessionLocal
     from sqlalchemy import select
     from app.models import UserGoogleFitToken
-    from datetime import datetime, timezone, timedelta
+    from datetime import datetime, timezone
     import httpx
 
     today = date.today()
     month_start = today.replace(day=1)
 
-    # Build list of dates: month_start .. today (inclusive)
-    days = []
-    d = month_start
-    while d <= today:
-        days.append(d)
-        d += timedelta(days=1)
-
     # Fetch users to process
     conn = await asyncpg.connect(DB_URL)
     if user_id:
@@ -557,60 +550,55 @@ async def sync_googlefit_month(user_id: str = None):
         print("No Google Fit users found.")
         return
 
-    print(f"Backfilling {len(days)} days ({month_start} → {today}) for {len(rows)} user(s)...\n")
+    print(f"Backfilling {(today - month_start).days + 1} days ({month_start} → {today}) for {len(rows)} user(s)...\n")
 
-    for row in rows:
-        uid = str(row['user_id'])
-        print(f"--- User {uid} ---")
-        async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient() as client:
+        for row in rows:
+            uid = str(row['user_id'])
+            print(f"--- User {uid} ---")
             try:
                 refresh_token = decrypt_token(row['refresh_token'])
                 new_access, new_expires = await _refresh_access_token(client, refresh_token)
+                steps_by_day = await _fetch_steps_range(client, new_access, month_start, today)
             except Exception as e:
-                print(f"  ❌  Token refresh failed: {e}")
+                print(f"  ❌  Google Fit request failed: {e}")
                 continue
 
-            saved = 0
-            skipped = 0
             db_conn = await asyncpg.connect(DB_URL)
-            for day in days:
-                try:
-                    steps = await _fetch_steps_for_date(client, new_access, day)
-                    # Check existing DB value
-                    existing = await db_conn.fetchval(
-                        "SELECT steps FROM daily_steps WHERE user_id = $1 AND day = $2",
-                        uid, day
-                    )
-                    if steps > 0:
-                        async with AsyncSessionLocal() as db:
-                            await _upsert_steps(db, uid, steps, target_date=day)
-                        prev = existing if existing is not None else "none"
-                        print(f"  ✅  {day}  →  {steps} steps saved  (was: {prev} in DB)")
-                        saved += 1
-                    else:
-                        prev = existing if existing is not None else "none"
-                        print(f"  ⏭️   {day}  →  0 steps from API, skipped  (DB has: {prev})")
-                        skipped += 1
-                except Exception as e:
-                    print(f"  ❌  {day}  →  error: {e}")
+            existing = dict(await db_conn.fetch(
+                "SELECT day, steps FROM daily_steps WHERE user_id = $1 AND day BETWEEN $2 AND $3",
+                uid, month_start, today
+            ))
             await db_conn.close()
 
-            # Persist refreshed token
             try:
                 async with AsyncSessionLocal() as db:
-                    result = await db.execute(
+                    stored = (await db.execute(
                         select(UserGoogleFitToken).where(UserGoogleFitToken.user_id == uid)
-                    )
-                    stored = result.scalar_one_or_none()
+                    )).scalar_one_or_none()
                     if stored:
                         stored.access_token = encrypt_token(new_access)
                         stored.expires_at = new_expires
                         stored.updated_at = datetime.now(timezone.utc)
+                    changed = await _upsert_steps_bulk(db, uid, steps_by_day)
+                    if not changed:
                         await db.commit()
             except Exception as e:
-                print(f"  ⚠️   Token save failed: {e}")
+                print(f"  ❌  Save failed: {e}")
+                continue
 
-            print(f"  Summary: {saved} saved, {skipped} skipped (0 steps)\n")
+            skipped = 0
+            for day, steps in steps_by_day.items():
+                prev = existing.get(day, "none")
+                if day in changed:
+                    print(f"  ✅  {day}  →  {steps} steps saved  (was: {prev} in DB)")
+                elif steps > 0:
+                    print(f"  =   {day}  →  {steps} steps, unchanged")
+                else:
+                    print(f"  ⏭️   {day}  →  0 steps from API, skipped  (DB has: {prev})")
+                    skipped += 1
+
+            print(f"  Summary: {len(changed)} saved, {skipped} skipped (0 steps)\n")
 
     print("✅  Month backfill complete.")
 
@@ -0,0 +1,80 @@
+"""
+Rebuild users.global_current_streak / global_longest_streak / last_streak_update
+from daily_steps (see app/services/step_streak.py).
+
+Step writes keep these columns up to date incrementally; run this once after
+deploying the streak engine, after bulk imports into daily_steps, or with
+--dry-run to check the stored values for drift.
+
+Usage (from the project root):
+  python scripts/rebuild_global_streaks.py
+  python scripts/rebuild_global_streaks.py --user-id <UUID>
+  python scripts/rebuild_global_streaks.py --dry-run      # report drift, change nothing
+"""
+
+import asyncio
+import argparse
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from app.db.session import AsyncSessionLocal
+from app.services.step_streak import rebuild_global_streaks
+
+
+_SNAPSHOT = """
+    SELECT id, email, global_current_streak AS cur, global_longest_streak AS longest,
+           last_streak_update AS last_day
+    FROM users {where}
+"""
+
+
+async def _snapshot(db, user_id: str | None) -> dict:
+    where = "WHERE id = :uid" if user_id else ""
+    rows = (await db.execute(text(_SNAPSHOT.format(where=where)),
+                             {"uid": user_id} if user_id else {})).mappings().all()
+    return {str(r["id"]): r for r in rows}
+
+
+async def main(user_id: str | None, dry_run: bool) -> None:
+    async with AsyncSessionLocal() as db:
+        before = await _snapshot(db, user_id)
+
+        t0 = time.perf_counter()
+        updated = await rebuild_global_streaks(db, user_id)
+        elapsed = time.perf_counter() - t0
+
+        after = await _snapshot(db, user_id)
+        drift = [
+            (before[uid], after[uid]) for uid in after
+            if uid in before
+            and (before[uid]["cur"], before[uid]["longest"], before[uid]["last_day"])
+             != (after[uid]["cur"], after[uid]["longest"], after[uid]["last_day"])
+        ]
+
+        for old, new in drift[:50]:
+            print(f"  {old['email']:<40} current {old['cur']:>4} → {new['cur']:<4} "
+                  f"longest {old['longest']:>4} → {new['longest']:<4} "
+                  f"last day {old['last_day']} → {new['last_day']}")
+        if len(drift) > 50:
+            print(f"  … and {len(drift) - 50} more")
+
+        if dry_run:
+            await db.rollback()
+            print(f"\nDry run: {len(drift)} of {updated} users differ from daily_steps "
+                  f"({elapsed:.2f}s). Nothing written.")
+        else:
+            await db.commit()
+            print(f"\nRebuilt {updated} users in {elapsed:.2f}s — {len(drift)} changed.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild global step streaks from daily_steps")
+    parser.add_argument("--user-id", help="Rebuild a single user")
+    parser.add_argument("--dry-run", action="store_true", help="Report drift, roll back")
+    args = parser.parse_args()
+    asyncio.run(main(args.user_id, args.dry_run))
@@ -0,0 +1,73 @@
+"""
+Rebuild habit_day_rollup from daily_logs (see app/services/habit_rollup.py).
+
+Habit log writes keep the rollup up to date incrementally; run this once after
+deploying it (the migration also backfills), after bulk edits to daily_logs,
+or with --dry-run to check the stored rows for drift.
+
+Usage (from the project root):
+  python scripts/rebuild_habit_rollup.py
+  python scripts/rebuild_habit_rollup.py --challenge-id 42
+  python scripts/rebuild_habit_rollup.py --dry-run      # report drift, change nothing
+"""
+
+import asyncio
+import argparse
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from app.db.session import AsyncSessionLocal
+from app.services.habit_rollup import rebuild_habit_rollup
+
+
+_SNAPSHOT = """
+    SELECT challenge_id, day, done, total
+    FROM habit_day_rollup {where}
+"""
+
+
+async def _snapshot(db, challenge_id: int | None) -> dict:
+    where = "WHERE challenge_id = :cid" if challenge_id else ""
+    rows = (await db.execute(text(_SNAPSHOT.format(where=where)),
+                             {"cid": challenge_id} if challenge_id else {})).mappings().all()
+    return {(r["challenge_id"], r["day"]): (r["done"], r["total"]) for r in rows}
+
+
+async def main(challenge_id: int | None, dry_run: bool) -> None:
+    async with AsyncSessionLocal() as db:
+        before = await _snapshot(db, challenge_id)
+
+        t0 = time.perf_counter()
+        written = await rebuild_habit_rollup(db, [challenge_id] if challenge_id else None)
+        elapsed = time.perf_counter() - t0
+
+        after = await _snapshot(db, challenge_id)
+        drift = sorted(k for k in before.keys() | after.keys() if before.get(k) != after.get(k))
+
+        for cid, day in drift[:50]:
+            old, new = before.get((cid, day)), after.get((cid, day))
+            fmt = lambda v: f"{v[0]}/{v[1]}" if v else "—"
+            print(f"  challenge {cid:<8} {day}  done/total {fmt(old):>7} → {fmt(new)}")
+        if len(drift) > 50:
+            print(f"  … and {len(drift) - 50} more")
+
+        if dry_run:
+            await db.rollback()
+            print(f"\nDry run: {len(drift)} of {written} rollup rows differ from daily_logs "
+                  f"({elapsed:.2f}s). Nothing written.")
+        else:
+            await db.commit()
+            print(f"\nRebuilt {written} rollup rows in {elapsed:.2f}s — {len(drift)} changed.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild habit_day_rollup from daily_logs")
+    parser.add_argument("--challenge-id", type=int, help="Rebuild a single challenge")
+    parser.add_argument("--dry-run", action="store_true", help="Report drift, roll back")
+    args = parser.parse_args()
+    asyncio.run(main(args.challenge_id, args.dry_run))
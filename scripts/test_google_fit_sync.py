@@ -0,0 +1,252 @@
+"""
+Concurrency test for the Google Fit sync (app/services/google_fit.py).
+
+Starts a local stand-in for the Google OAuth token endpoint and the Fitness
+aggregate endpoint (uvicorn on 127.0.0.1), points the sync at it, and runs
+the fetch stage for N simulated users through the real shared-client /
+semaphore / per-user-timeout / write-batch path. The stand-in adds latency
+to every call and plays a mix of accounts:
+
+  ok       — token refresh + step fetches succeed
+  revoked  — token refresh answers 401 (invalid_grant)
+  slow     — step fetch hangs past the per-user timeout
+  flaky    — step fetch answers 500
+
+Write batches are recorded instead of written (no DB needed). Checks:
+
+  - every user ends in exactly one outcome, matching its account kind
+  - ok users carry the stand-in's step counts for every sync date, fetched
+    in a single aggregate request
+  - only ok / revoked users reach a write batch, none twice, batches <= --batch
+  - users in flight never exceed --concurrency
+  - slow accounts don't stall the run (wall time well under the serial time)
+
+Usage (from project root):
+  python scripts/test_google_fit_sync.py
+  python scripts/test_google_fit_sync.py --users 300 --concurrency 32 --latency-ms 150
+  python scripts/test_google_fit_sync.py --revoked 0.1 --slow 0.02 --flaky 0.02 --timeout 2
+"""
+
+import argparse
+import asyncio
+import random
+import socket
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# ── silence SQLAlchemy query logging (echo=True is set in session.py) ─────────
+import logging
+logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+logging.getLogger("sqlalchemy.pool").setLevel(logging.WARNING)
+logging.getLogger("app").setLevel(logging.CRITICAL)
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+import app.db.session as _db_session
+from app.core.config import settings
+from app.core.security import encrypt_token
+from app.services import google_fit
+
+_db_session.engine.echo = False
+
+
+def _steps_for(user_no: int, start_ms: int) -> int:
+    """Deterministic step count the stand-in reports for a user and day."""
+    return 1000 + (user_no * 7919 + start_ms // 86_400_000) % 9000
+
+
+class StandIn:
+    """Stand-in Google API. Refresh tokens look like rt-<user_no>-<kind>."""
+
+    def __init__(self, latency_ms: int, jitter_ms: int, hang_s: float):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.hang_s = hang_s
+        self.requests = 0
+        self.aggregate_calls: dict[str, int] = {}   # user_no → aggregate requests answered
+        self.app = self._build()
+
+    async def _lag(self) -> None:
+        ms = max(0, self.latency_ms + random.randint(-self.jitter_ms, self.jitter_ms))
+        await asyncio.sleep(ms / 1000)
+
+    def _build(self) -> FastAPI:
+        api = FastAPI()
+
+        @api.post("/token")
+        async def token(request: Request):
+            form = await request.form()
+            _, user_no, kind = form["refresh_token"].split("-")
+            self.requests += 1
+            await self._lag()
+            if kind == "revoked":
+                return JSONResponse({"error": "invalid_grant"}, status_code=401)
+            return {"access_token": f"at-{user_no}-{kind}", "expires_in": 3599}
+
+        @api.post("/fitness/v1/users/me/dataset:aggregate")
+        async def aggregate(request: Request):
+            _, user_no, kind = request.headers["authorization"].removeprefix("Bearer ").split("-")
+            body = await request.json()
+            self.requests += 1
+            await self._lag()
+            if kind == "slow":
+                await asyncio.sleep(self.hang_s)
+            if kind == "flaky":
+                return JSONResponse({"error": "backendError"}, status_code=500)
+            self.aggregate_calls[user_no] = self.aggregate_calls.get(user_no, 0) + 1
+            day_ms = body["bucketByTime"]["durationMillis"]
+            return {"bucket": [
+                {
+                    "startTimeMillis": str(ms),
+                    "endTimeMillis": str(ms + day_ms),
+                    "dataset": [{"point": [{"value": [{"intVal": _steps_for(int(user_no), ms)}]}]}],
+                }
+                for ms in range(body["startTimeMillis"], body["endTimeMillis"], day_ms)
+            ]}
+
+        return api
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run the Google Fit sync against a local stand-in API and check its invariants")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=settings.GOOGLE_FIT_SYNC_CONCURRENCY)
+    parser.add_argument("--batch", type=int, default=settings.GOOGLE_FIT_SYNC_WRITE_BATCH)
+    parser.add_argument("--timeout", type=float, default=2.0, help="per-user timeout (s)")
+    parser.add_argument("--latency-ms", type=int, default=100)
+    parser.add_argument("--jitter-ms", type=int, default=50)
+    parser.add_argument("--revoked", type=float, default=0.1, help="share of revoked accounts")
+    parser.add_argument("--slow", type=float, default=0.03, help="share of accounts that hang")
+    parser.add_argument("--flaky", type=float, default=0.03, help="share of accounts that get a 500")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    settings.GOOGLE_FIT_SYNC_CONCURRENCY = args.concurrency
+    settings.GOOGLE_FIT_SYNC_WRITE_BATCH = args.batch
+    settings.GOOGLE_FIT_SYNC_USER_TIMEOUT_S = args.timeout
+
+    # ── stand-in server ───────────────────────────────────────────────────────
+    stand_in = StandIn(args.latency_ms, args.jitter_ms, hang_s=args.timeout * 3)
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(stand_in.app, host="127.0.0.1", port=port, log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    google_fit._GOOGLE_TOKEN_URL = f"http://127.0.0.1:{port}/token"
+    google_fit._GOOGLE_FIT_AGGREGATE_URL = f"http://127.0.0.1:{port}/fitness/v1/users/me/dataset:aggregate"
+
+    # ── simulated accounts ────────────────────────────────────────────────────
+    kinds: dict[str, str] = {}
+    tokens: list[tuple[str, str]] = []
+    for i in range(args.users):
+        r = random.random()
+        kind = (
+            "revoked" if r < args.revoked else
+            "slow"    if r < args.revoked + args.slow else
+            "flaky"   if r < args.revoked + args.slow + args.flaky else
+            "ok"
+        )
+        user_id = str(uuid.uuid4())
+        kinds[user_id] = kind
+        tokens.append((user_id, encrypt_token(f"rt-{i}-{kind}")))
+    user_no = {uid: i for i, (uid, _) in enumerate(tokens)}
+
+    # Morning run → today and yesterday
+    dates = google_fit._sync_dates(datetime.now(timezone(timedelta(hours=5, minutes=30))).replace(hour=8))
+
+    batches: list[list[dict]] = []
+    in_flight = {"now": 0, "max": 0}
+
+    # Count users between semaphore acquire and release (a timed-out user is
+    # cancelled here even while the stand-in is still holding its request)
+    fetch_user = google_fit._fetch_user
+
+    async def counting_fetch_user(*a, **kw):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        try:
+            return await fetch_user(*a, **kw)
+        finally:
+            in_flight["now"] -= 1
+
+    google_fit._fetch_user = counting_fetch_user
+
+    async def record_batch(results: list[dict]) -> None:
+        batches.append(list(results))
+
+    # ── run ───────────────────────────────────────────────────────────────────
+    started = time.monotonic()
+    async with google_fit._http_client() as client:
+        counts = await google_fit._fetch_all(client, tokens, dates, record_batch)
+    elapsed = time.monotonic() - started
+
+    server.should_exit = True
+    await serve_task
+
+    # ── checks ────────────────────────────────────────────────────────────────
+    problems: list[str] = []
+    expected = {"ok": 0, "revoked": 0, "error": 0, "timeout": 0}
+    outcome_of = {"ok": "ok", "revoked": "revoked", "flaky": "error", "slow": "timeout"}
+    for kind in kinds.values():
+        expected[outcome_of[kind]] += 1
+    if counts != expected:
+        problems.append(f"outcome counts {counts} != expected {expected}")
+
+    written = [r for b in batches for r in b]
+    seen = [r["user_id"] for r in written]
+    if len(seen) != len(set(seen)):
+        problems.append(f"{len(seen) - len(set(seen))} user(s) written more than once")
+    want_written = {uid for uid, k in kinds.items() if k in ("ok", "revoked")}
+    if set(seen) != want_written:
+        problems.append(f"written users differ: {len(set(seen) ^ want_written)} mismatched")
+    if any(len(b) > args.batch for b in batches):
+        problems.append(f"a write batch exceeds --batch {args.batch}")
+
+    for r in written:
+        if r["status"] != outcome_of[kinds[r["user_id"]]]:
+            problems.append(f"user {r['user_id']} ({kinds[r['user_id']]}) written as {r['status']}")
+        if r["status"] == "ok":
+            for d in dates:
+                if r["steps"].get(d) != _steps_for(user_no[r["user_id"]], google_fit._ist_ms(d)):
+                    problems.append(f"user {r['user_id']} {d}: steps {r['steps'].get(d)} are wrong")
+
+    if any(n != 1 for n in stand_in.aggregate_calls.values()):
+        problems.append("a user needed more than one aggregate request for the sync dates")
+
+    if in_flight["max"] > args.concurrency:
+        problems.append(f"{in_flight['max']} users in flight > concurrency {args.concurrency}")
+
+    # One user serially: token refresh, then the date fetches; hung accounts cost the timeout
+    per_user = 2 * args.latency_ms / 1000
+    serial_s = per_user * args.users + args.timeout * expected["timeout"]
+    if args.concurrency > 1 and elapsed > serial_s / 2:
+        problems.append(f"run took {elapsed:.1f}s — not much faster than serial (~{serial_s:.1f}s)")
+
+    print(
+        f"users={args.users} concurrency={args.concurrency} http2={google_fit._HTTP2}  "
+        f"{elapsed:.2f}s (serial ~{serial_s:.1f}s)  requests={stand_in.requests}  "
+        f"max in flight={in_flight['max']}  batches={len(batches)}"
+    )
+    print("  " + "  ".join(f"{k}={v}" for k, v in counts.items()))
+    for p in problems[:20]:
+        print(f"  ✗ {p}")
+    print("OK" if not problems else f"FAIL ({len(problems)} problem(s))")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,186 @@
+"""
+Concurrency test for POST /api/partners/find-random (app/services/partner_queue.py).
+
+Seeds N users in a throwaway department, then fires find_random_partner for
+all of them at the same moment — each call on its own session, exactly as
+concurrent HTTP requests would run. Repeats for several rounds (pairs are
+dissolved between rounds) and checks after each one:
+
+  - nobody is in more than one active pair
+  - every caller ended up either paired or queued (no lost users)
+  - at most one user is left waiting (N odd) — concurrent callers pair with
+    each other instead of all queueing
+  - partner_queue and users.seeking_partner agree
+
+Usage (from project root, needs DATABASE_URL):
+  python scripts/test_partner_queue.py
+  python scripts/test_partner_queue.py --users 41 --rounds 20
+  python scripts/test_partner_queue.py --cleanup
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# ── silence SQLAlchemy query logging (echo=True is set in session.py) ─────────
+import logging
+logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+logging.getLogger("sqlalchemy.pool").setLevel(logging.WARNING)
+logging.getLogger("app").setLevel(logging.CRITICAL)
+
+from fastapi import HTTPException
+from sqlalchemy import select, text
+
+import app.db.session as _db_session
+from app.db.session import AsyncSessionLocal
+from app.models import User
+from app.api.partners import find_random_partner
+
+_db_session.engine.echo = False
+
+_TEST_DEPT = "test-partner-queue"
+_EMAIL_LIKE = "test-pq-%@bench.local"
+
+
+async def seed(n: int) -> tuple[str, list[str]]:
+    async with AsyncSessionLocal() as db:
+        dept_id = (await db.execute(text(
+            "SELECT id FROM departments WHERE name = :n"), {"n": _TEST_DEPT})).scalar()
+        if dept_id is None:
+            dept_id = (await db.execute(text(
+                "INSERT INTO departments (name) VALUES (:n) RETURNING id"), {"n": _TEST_DEPT})).scalar()
+        await db.execute(text("""
+            INSERT INTO users (email, name, password_hash, department_id)
+            SELECT 'test-pq-' || g || '@bench.local', 'Queue ' || g, 'x', :dept
+            FROM generate_series(1, :n) g
+            ON CONFLICT (email) DO NOTHING
+        """), {"dept": dept_id, "n": n})
+        ids = [str(r[0]) for r in (await db.execute(text(
+            "SELECT id FROM users WHERE email LIKE :p ORDER BY email LIMIT :n"
+        ), {"p": _EMAIL_LIKE, "n": n})).all()]
+        await db.commit()
+    return str(dept_id), ids
+
+
+async def reset(user_ids: list[str]) -> None:
+    """Dissolve all test pairs, empty the queue — a clean slate for the next round."""
+    async with AsyncSessionLocal() as db:
+        params = {"ids": user_ids}
+        await db.execute(text("""
+            DELETE FROM partner_messages WHERE pair_id IN (
+                SELECT id FROM accountability_partners
+                WHERE requester_id = ANY(CAST(:ids AS uuid[])) OR partner_id = ANY(CAST(:ids AS uuid[])))
+        """), params)
+        await db.execute(text("""
+            DELETE FROM accountability_partners
+            WHERE requester_id = ANY(CAST(:ids AS uuid[])) OR partner_id = ANY(CAST(:ids AS uuid[]))
+        """), params)
+        await db.execute(text("DELETE FROM partner_queue WHERE user_id = ANY(CAST(:ids AS uuid[]))"), params)
+        await db.execute(text("DELETE FROM notification_inbox WHERE user_id = ANY(CAST(:ids AS uuid[]))"), params)
+        await db.execute(text("""
+            UPDATE users SET seeking_partner = false, seeking_since = NULL
+            WHERE id = ANY(CAST(:ids AS uuid[]))
+        """), params)
+        await db.commit()
+
+
+async def _call(user_id: str, start: asyncio.Event) -> str:
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.id == user_id))).scalar_one()
+        await start.wait()
+        try:
+            resp = await find_random_partner(db=db, user=user)
+            return {201: "matched", 202: "queued"}.get(resp.status_code, str(resp.status_code))
+        except HTTPException as exc:
+            return f"http_{exc.status_code}"
+        except Exception as exc:
+            return f"error:{type(exc).__name__}"
+
+
+async def check(user_ids: list[str]) -> list[str]:
+    """Invariant violations for the current state (empty list = OK)."""
+    problems = []
+    async with AsyncSessionLocal() as db:
+        params = {"ids": user_ids}
+        pairs = (await db.execute(text("""
+            SELECT requester_id, partner_id FROM accountability_partners
+            WHERE status IN ('approved', 'pending')
+              AND (requester_id = ANY(CAST(:ids AS uuid[])) OR partner_id = ANY(CAST(:ids AS uuid[])))
+        """), params)).all()
+        queued = {str(r[0]) for r in (await db.execute(text(
+            "SELECT user_id FROM partner_queue WHERE user_id = ANY(CAST(:ids AS uuid[]))"), params)).all()}
+        flagged = {str(r[0]) for r in (await db.execute(text(
+            "SELECT id FROM users WHERE id = ANY(CAST(:ids AS uuid[])) AND seeking_partner"), params)).all()}
+
+    memberships = Counter(str(u) for pair in pairs for u in pair)
+    doubled = [u for u, c in memberships.items() if c > 1]
+    if doubled:
+        problems.append(f"{len(doubled)} users in more than one active pair")
+    paired = set(memberships)
+    if paired & queued:
+        problems.append(f"{len(paired & queued)} users both paired and queued")
+    lost = set(user_ids) - paired - queued
+    if lost:
+        problems.append(f"{len(lost)} users neither paired nor queued")
+    if len(queued) > len(user_ids) % 2:
+        problems.append(f"{len(queued)} users left waiting (expected {len(user_ids) % 2})")
+    if queued != flagged:
+        problems.append(f"partner_queue ({len(queued)}) and users.seeking_partner ({len(flagged)}) disagree")
+    return problems
+
+
+async def cleanup() -> None:
+    async with AsyncSessionLocal() as db:
+        ids = [str(r[0]) for r in (await db.execute(text(
+            "SELECT id FROM users WHERE email LIKE :p"), {"p": _EMAIL_LIKE})).all()]
+    await reset(ids)
+    async with AsyncSessionLocal() as db:
+        await db.execute(text("DELETE FROM users WHERE id = ANY(CAST(:ids AS uuid[]))"), {"ids": ids})
+        await db.execute(text("DELETE FROM departments WHERE name = :n"), {"n": _TEST_DEPT})
+        await db.commit()
+    print(f"Removed {len(ids)} test users.")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Fire simultaneous find-random calls and check the queue invariants")
+    parser.add_argument("--users",   type=int, default=15, help="simultaneous callers (≤ DB pool size for true overlap)")
+    parser.add_argument("--rounds",  type=int, default=10)
+    parser.add_argument("--cleanup", action="store_true", help="remove test users and exit")
+    args = parser.parse_args()
+
+    if args.cleanup:
+        await cleanup()
+        return
+
+    _, user_ids = await seed(args.users)
+    failed = 0
+    for rnd in range(1, args.rounds + 1):
+        await reset(user_ids)
+        start = asyncio.Event()
+        tasks = [asyncio.create_task(_call(uid, start)) for uid in user_ids]
+        await asyncio.sleep(0.5)   # let every task load its user and park on the event
+        t0 = time.perf_counter()
+        start.set()
+        outcomes = Counter(await asyncio.gather(*tasks))
+        elapsed = time.perf_counter() - t0
+
+        problems = await check(user_ids)
+        failed += bool(problems)
+        status = "OK  " if not problems else "FAIL"
+        summary = "  ".join(f"{k}={v}" for k, v in sorted(outcomes.items()))
+        print(f"round {rnd:>3}  {status}  {elapsed * 1000:7.1f} ms  {summary}")
+        for p in problems:
+            print(f"            ✗ {p}")
+
+    await reset(user_ids)
+    print(f"\n{args.rounds - failed}/{args.rounds} rounds passed.")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
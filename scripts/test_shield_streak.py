@@ -0,0 +1,194 @@
+"""
+Property test for the checkpointed shield streak (app/services/habit_streak.py).
+
+Replays random habit histories day by day the way production sees them: each
+"today" resumes from the checkpoint persisted the previous time (round-tripped
+through JSON like the jsonb column), while logs for today change during the
+day and back-dated edits and habit-count changes land at random. Every result
+is compared with the original from-scratch simulation, kept verbatim below as
+_reference_shield_streak. No database needed.
+
+Usage (from project root):
+  python scripts/test_shield_streak.py
+  python scripts/test_shield_streak.py --histories 5000 --seed 7
+"""
+
+import argparse
+import random
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services import habit_streak
+
+
+# ── Original implementation (habits_service._compute_shield_streak) ─────────
+
+def _reference_shield_streak(
+    by_date: dict,
+    started_at: date,
+    end_day: date,
+    total_habits: int,
+    today: date,
+) -> dict:
+    """
+    Shared shield-and-streak logic used by get_streak() and get_history().
+
+    Rules:
+    - A day "counts" if completed habits >= min_required (50% floor, min 1).
+    - Shields are earned 1 at a time: every 4 consecutive good days earn 1 shield.
+      Max 1 shield held at a time — must use it before earning the next.
+    - A shield bridges 1 missed day, keeping the effective streak alive.
+      After using a shield, the 4-day counter resets.
+    - current_streak  = raw consecutive good days (no shield help) from today back.
+    - effective_streak = streak computed by the forward simulation (shields applied).
+    - Today grace: if today has zero logs at all, skip without penalty (day not over).
+    """
+    min_required = max(1, -(-total_habits // 2))  # ceil(total/2)
+
+
+    # ── Forward simulation: effective streak and shield-protected longest streak ──
+    shield_bank = 0       # 0 or 1
+    consecutive = 0       # good days since last shield earned or last gap
+    effective = 0         # current shield-protected streak (up to today)
+    max_effective = 0     # longest shield-protected streak
+    shields_earned = 0
+    shields_used = 0
+    shield_used_on_dates: list[date] = []
+    current_segment = 0   # for current_streak (raw, no shields)
+    raw_current = 0
+
+    d = started_at
+    today_grace = False
+    while d <= end_day:
+        good = by_date.get(d, 0) >= min_required
+        today_grace = (d == today and not good)  # grace all day until min_required is met
+
+        if good:
+            effective += 1
+            consecutive += 1
+            current_segment += 1
+            if consecutive == 4 and shield_bank == 0:
+                shield_bank = 1
+                shields_earned += 1
+                consecutive = 0   # reset — next shield needs another 4 days
+        elif today_grace:
+            # Don't break streak, don't increment
+            pass
+        else:
+            # Missed day
+            if shield_bank > 0:
+                shield_bank -= 1
+                shields_used += 1
+                shield_used_on_dates.append(d)
+                effective += 1
+                consecutive = 0   # reset after using shield
+                # current_segment does NOT increment (raw streak broken)
+            else:
+                # Streak broken (both effective and raw)
+                if effective > max_effective:
+                    max_effective = effective
+                effective = 0
+                consecutive = 0
+                shield_bank = 0
+                current_segment = 0
+        d += timedelta(days=1)
+
+    # After loop, check if current streaks are the longest
+    if effective > max_effective:
+        max_effective = effective
+
+    # Raw current streak: if last segment touches today or yesterday
+    # (raw streak = consecutive good days, no shields)
+    if current_segment > 0:
+        if end_day == today or end_day == today - timedelta(days=1):
+            raw_current = current_segment
+
+    return {
+        "current_streak":       raw_current,   # raw consecutive good days (no shields)
+        "effective_streak":     effective,     # shield-protected streak up to today
+        "longest_streak":       max_effective, # shield-protected longest streak
+        "shields_earned":       shields_earned,
+        "shields_used":         shields_used,
+        "shield_used_on_dates": shield_used_on_dates,
+    }
+
+
+# ── Harness ───────────────────────────────────────────────────────────────────
+
+def _random_history(rng: random.Random, started_at: date, days: int, total: int) -> dict:
+    p_good = rng.choice([0.3, 0.6, 0.85, 0.95])
+    by_date = {}
+    for i in range(days):
+        if rng.random() < p_good:
+            by_date[started_at + timedelta(days=i)] = rng.randint(1, total)
+        elif rng.random() < 0.5:
+            by_date[started_at + timedelta(days=i)] = rng.randint(0, max(total // 2 - 1, 0))
+    return by_date
+
+
+def run_history(rng: random.Random) -> tuple[int, list[str]]:
+    """Replay one challenge; returns (calls checked, mismatch descriptions)."""
+    started_at = date(2026, 1, 1) + timedelta(days=rng.randint(0, 300))
+    ends_at = started_at + timedelta(days=20)
+    total = rng.randint(1, 8)
+    span = rng.randint(1, 35)                          # may run past ends_at
+    full = _random_history(rng, started_at, span, total)
+
+    stored = None                                      # what habit_streak_checkpoints holds
+    calls, problems = 0, []
+    for offset in range(span):
+        today = started_at + timedelta(days=offset)
+        by_date = {d: n for d, n in full.items() if d < today}
+
+        # Back-dated edit or habit-count change before today's reads
+        if offset and rng.random() < 0.15:
+            past = started_at + timedelta(days=rng.randint(0, offset - 1))
+            full[past] = by_date[past] = rng.randint(0, total)
+        if rng.random() < 0.03:
+            total = max(1, total + rng.choice([-1, 1]))
+
+        # Several reads during the day while today's logs come in
+        for done_today in sorted({0, rng.randint(0, total), full.get(today, 0)}):
+            by_date[today] = done_today
+            for end_day in (today, min(today, ends_at)):   # get_streak / history
+                expected = _reference_shield_streak(by_date, started_at, end_day, total, today)
+                checkpoint = dict(stored) if stored and end_day == today else None
+                got, save = habit_streak.resume(checkpoint, by_date, started_at, ends_at,
+                                                end_day, total, today)
+                if end_day == today and save:
+                    stored = dict(save)                # state is already the JSON text
+                calls += 1
+                if got != expected:
+                    problems.append(
+                        f"start={started_at} today={today} end={end_day} total={total} "
+                        f"cp={checkpoint and checkpoint['as_of']}\n    expected {expected}\n    got      {got}"
+                    )
+        full[today] = by_date[today]
+    return calls, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checkpointed vs original shield-streak simulation")
+    parser.add_argument("--histories", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 30)
+    rng = random.Random(seed)
+    calls, failures = 0, []
+    for _ in range(args.histories):
+        n, problems = run_history(rng)
+        calls += n
+        failures += problems
+
+    for f in failures[:10]:
+        print(f"  ✗ {f}")
+    print(f"\nseed={seed}: {args.histories} histories, {calls} streak reads, {len(failures)} mismatches.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -203,12 +203,14 @@ async def show_messages(pair_id):
             return
 
         rows = (await db.execute(text("""
-            SELECT pm.id, pm.body, pm.sent_at, pm.read_at, pm.expires_at,
+            SELECT pm.id, pm.body, pm.sent_at, pm.expires_at,
+                   pm.id <= COALESCE(cr.last_read_id, 0) AS is_read,
                    u.name AS sender_name
             FROM partner_messages pm
             JOIN users u ON u.id = pm.sender_id
+            LEFT JOIN partner_chat_reads cr ON cr.pair_id = pm.pair_id AND cr.user_id = pm.receiver_id
             WHERE pm.pair_id = :pid
-            ORDER BY pm.sent_at DESC
+            ORDER BY pm.id DESC
             LIMIT 20
         """), {"pid": int(pair_id)})).mappings().all()
 
@@ -219,7 +221,7 @@ async def show_messages(pair_id):
 
         for r in reversed(rows):
             ts      = str(r["sent_at"])[:16]
-            read    = f"  {DIM}read{RESET}" if r["read_at"] else ""
+            read    = f"  {DIM}read{RESET}" if r["is_read"] else ""
             expires = f"  {YELLOW}expires {str(r['expires_at'])[:10]}{RESET}" if r["expires_at"] else ""
             print(f"  {DIM}{ts}{RESET}  {BOLD}{r['sender_name']:<16}{RESET}  {r['body'][:60]}{read}{expires}")
         print()